@@ -11,11 +11,11 @@ Usage:
 
 import os
 import sqlite3
-import time
 from pathlib import Path
 import argparse
 from datetime import datetime
-import shutil
+
+from benchmark_queries import print_report, run_benchmark
 
 # Load environment variables if python-dotenv is available
 try:
@@ -37,10 +37,16 @@ if not DB_PATH.is_absolute():
 # SQL migrations directory
 MIGRATIONS_DIR = PROJECT_ROOT / "db" / "migrations"
 SQL_SCRIPT = MIGRATIONS_DIR / "001_indexes.sql"
+# Generata da index_advisor.py (opzionale)
+ADVISED_SCRIPT = MIGRATIONS_DIR / "004_advised_indexes.sql"
 
 # Backup directory
 BACKUP_DIR = PROJECT_ROOT / "db" / "backups"
 
+# Ripetizioni del benchmark prima/dopo (catalogo di benchmark_queries.py)
+BENCH_REPEAT = 20
+BENCH_WARMUP = 3
+
 
 def create_backup(db_path: Path) -> Path:
     """Crea backup del database."""
@@ -49,28 +55,18 @@ def create_backup(db_path: Path) -> Path:
     backup_path = BACKUP_DIR / f"milano_unified_backup_{timestamp}.db"
     
     print(f"📦 Creazione backup...")
-    shutil.copy2(db_path, backup_path)
+    # Backup API: copia consistente anche se il DB è aperto dal server o dalla pipeline
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    target = sqlite3.connect(str(backup_path))
+    source.backup(target)
+    source.close()
+    target.close()
     backup_size = backup_path.stat().st_size / (1024 * 1024)  # MB
     print(f"✅ Backup creato: {backup_path} ({backup_size:.2f} MB)")
     
     return backup_path
 
 
-def test_query_performance(conn: sqlite3.Connection, query: str, description: str) -> float:
-    """Testa performance di una query."""
-    start = time.time()
-    try:
-        cursor = conn.execute(query)
-        results = cursor.fetchall()
-        elapsed = time.time() - start
-        print(f"   {description}: {elapsed:.4f}s ({len(results)} righe)")
-        return elapsed
-    except sqlite3.OperationalError as e:
-        elapsed = time.time() - start
-        print(f"   {description}: SKIP - tabella non esistente")
-        return elapsed
-
-
 def get_database_stats(conn: sqlite3.Connection, db_path: Path = None) -> dict:
     """Ottieni statistiche database."""
     stats = {}
@@ -110,6 +106,30 @@ def list_applied_indexes(conn: sqlite3.Connection) -> list:
     return cursor.fetchall()
 
 
+def apply_advised_indexes(conn: sqlite3.Connection, script: Path = ADVISED_SCRIPT) -> int:
+    """Applica la migrazione generata statement per statement, saltando le tabelle assenti.
+
+    Returns:
+        Numero di statement applicati
+    """
+    applied = 0
+    statement = ""
+    for line in script.read_text(encoding='utf-8').splitlines():
+        if line.startswith('--'):
+            continue
+        statement += line + "\n"
+        if not sqlite3.complete_statement(statement):
+            continue
+        try:
+            conn.execute(statement)
+            applied += 1
+        except sqlite3.OperationalError as e:
+            print(f"   ⚠ {statement.strip()[:80]}...: {e}")
+        statement = ""
+    conn.commit()
+    return applied
+
+
 def apply_optimizations(db_path: Path, test_mode: bool = False) -> bool:
     """Applica ottimizzazioni al database.
     
@@ -145,25 +165,8 @@ def apply_optimizations(db_path: Path, test_mode: bool = False) -> bool:
     print("🔍 TEST PERFORMANCE PRIMA DEGLI INDICI")
     print("="*70)
     
-    test_queries = [
-        (
-            "SELECT * FROM dim_nil WHERE id_nil = 1",
-            "Query 1: Filtra per id_nil"
-        ),
-        (
-            "SELECT * FROM dim_nil WHERE nil LIKE 'C%'",
-            "Query 2: Filtra per nil (prefix)"
-        ),
-        (
-            "SELECT COUNT(*) FROM fact_demografia GROUP BY id_nil",
-            "Query 3: Aggrega demografia per NIL"
-        ),
-    ]
-    
-    times_before = []
-    for query, desc in test_queries:
-        t = test_query_performance(conn, query, desc)
-        times_before.append(t)
+    report_before = run_benchmark(conn, repeat=BENCH_REPEAT, warmup=BENCH_WARMUP)
+    print_report(report_before)
     
     if test_mode:
         print("\n⚠️  MODALITÀ TEST - Nessuna modifica applicata")
@@ -187,6 +190,10 @@ def apply_optimizations(db_path: Path, test_mode: bool = False) -> bool:
         print(f"⚠️  Errore creazione indici: {e}")
         conn.close()
         return False
+
+    if ADVISED_SCRIPT.exists():
+        applied = apply_advised_indexes(conn)
+        print(f"✅ Indici consigliati applicati: {applied} statement da {ADVISED_SCRIPT.name}")
     
     # Statistiche DOPO
     print("\n" + "="*70)
@@ -216,33 +223,29 @@ def apply_optimizations(db_path: Path, test_mode: bool = False) -> bool:
     print("🚀 TEST PERFORMANCE DOPO GLI INDICI")
     print("="*70)
     
-    times_after = []
-    for query, desc in test_queries:
-        t = test_query_performance(conn, query, desc)
-        times_after.append(t)
+    report_after = run_benchmark(conn, repeat=BENCH_REPEAT, warmup=BENCH_WARMUP)
+    print_report(report_after)
     
-    # Report miglioramenti
+    # Report miglioramenti (p50 per route)
     print("\n" + "="*70)
     print("📈 MIGLIORAMENTI PERFORMANCE")
     print("="*70)
     
-    valid_comparisons = 0
-    total_improvement = 0
-    
-    for i, ((query, desc), t_before, t_after) in enumerate(zip(test_queries, times_before, times_after), 1):
-        if t_before > 0.0001:  # Evita divisione per numeri molto piccoli
-            improvement = ((t_before - t_after) / t_before * 100)
-            print(f"Query {i}:")
-            print(f"   Prima:  {t_before:.4f}s")
-            print(f"   Dopo:   {t_after:.4f}s")
-            print(f"   Miglioramento: {improvement:+.1f}%")
-            print()
-            total_improvement += improvement
-            valid_comparisons += 1
+    improvements = []
+    for route, after in report_after["routes"].items():
+        before = report_before["routes"].get(route, {})
+        if "p50_ms" not in after or "p50_ms" not in before or before["p50_ms"] <= 0:
+            continue
+        improvement = (before["p50_ms"] - after["p50_ms"]) / before["p50_ms"] * 100
+        print(f"{route}:")
+        print(f"   Prima:  {before['p50_ms']:.3f} ms (p95 {before['p95_ms']:.3f})")
+        print(f"   Dopo:   {after['p50_ms']:.3f} ms (p95 {after['p95_ms']:.3f})")
+        print(f"   Miglioramento: {improvement:+.1f}%")
+        print()
+        improvements.append(improvement)
     
-    if valid_comparisons > 0:
-        avg_improvement = total_improvement / valid_comparisons
-        print(f"🎯 Miglioramento medio: {avg_improvement:+.1f}%")
+    if improvements:
+        print(f"🎯 Miglioramento medio: {sum(improvements) / len(improvements):+.1f}%")
     
     # Registra applicazione ottimizzazioni
     try:
@@ -258,6 +261,11 @@ def apply_optimizations(db_path: Path, test_mode: bool = False) -> bool:
             INSERT OR REPLACE INTO _migrations (migration_name, applied_at, success)
             VALUES (?, ?, ?)
         """, ('001_indexes', datetime.now().isoformat(), True))
+        if ADVISED_SCRIPT.exists():
+            conn.execute("""
+                INSERT OR REPLACE INTO _migrations (migration_name, applied_at, success)
+                VALUES (?, ?, ?)
+            """, (ADVISED_SCRIPT.stem, datetime.now().isoformat(), True))
         conn.commit()
     except Exception as e:
         print(f"⚠️  Errore registrazione migrazione: {e}")
@@ -269,7 +277,7 @@ def apply_optimizations(db_path: Path, test_mode: bool = False) -> bool:
     print("✅ OTTIMIZZAZIONE COMPLETATA!")
     print("="*70)
     print("\nProssimi passi:")
-    print(f"1. Esegui VACUUM per recuperare spazio: sqlite3 {db_path} 'VACUUM;'")
+    print(f"1. Compatta e aggiorna le statistiche: python finalize_database.py --db {db_path}")
     print("2. Testa le tue query abituali")
     print("3. Monitora performance nel tempo")
     
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Benchmark delle query SQL dietro le route API più pesanti.
+
+Riesegue un catalogo delle query reali di server/index.js (quartieri,
+timeseries/compare, nil/:id/complete-profile, data-overview) sul DB:
+- warm-up + N ripetizioni cronometrate con perf_counter_ns
+- p50 / p95 / p99 per query e per route (somma delle query della route)
+- EXPLAIN QUERY PLAN di ogni query, con evidenza delle SCAN complete
+- report JSON salvabile come baseline; con una baseline, una regressione
+  di p95 oltre la soglia fa uscire lo script con codice 1
+
+Uso:
+    python benchmark_queries.py [--db PATH] [--repeat N] [--warmup N]
+    python benchmark_queries.py --save-baseline
+    python benchmark_queries.py --baseline PATH --threshold 0.25
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Paths
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+REPORTS_DIR = PROJECT_ROOT / "data_pipeline" / "reports"
+REPORT_PATH = REPORTS_DIR / "query_benchmark.json"
+BASELINE_PATH = REPORTS_DIR / "query_benchmark_baseline.json"
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not DB_PATH.is_absolute():
+    DB_PATH = PROJECT_ROOT / DB_PATH
+
+DEFAULT_REPEAT = 50
+DEFAULT_WARMUP = 5
+# Regressione: p95 oltre baseline * (1 + soglia) e oltre il delta minimo
+DEFAULT_THRESHOLD = 0.25
+MIN_DELTA_MS = 0.05
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Catalogo
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class BenchmarkQuery:
+    """Query di una route API, con parametri fissi o risolti da params_sql."""
+    route: str
+    name: str
+    sql: str
+    params: Tuple = ()
+    # Query eseguita una volta (fuori dal cronometro) la cui prima riga fornisce i parametri
+    params_sql: Optional[str] = None
+
+
+# NIL e quartiere di riferimento per le route parametriche
+BENCH_NIL_ID = 1
+BENCH_QUARTIERE_PATTERN = "%DUOMO%"
+
+QUERY_CATALOG: Tuple[BenchmarkQuery, ...] = (
+    # GET /api/quartieri
+    BenchmarkQuery("quartieri", "prezzi_ultimo_semestre", """
+        SELECT Quartiere, Prezzo_Acquisto_Medio_EUR_mq, Prezzo_Locazione_Medio_EUR_mq
+        FROM prezzi_medi_quartiere
+        WHERE Semestre = (SELECT MAX(Semestre) FROM prezzi_medi_quartiere)
+        ORDER BY Prezzo_Acquisto_Medio_EUR_mq DESC
+    """),
+    BenchmarkQuery("quartieri", "prezzi_semestre_precedente", """
+        SELECT Quartiere, Prezzo_Acquisto_Medio_EUR_mq, Prezzo_Locazione_Medio_EUR_mq
+        FROM prezzi_medi_quartiere
+        WHERE Semestre = (
+            SELECT MAX(Semestre) FROM prezzi_medi_quartiere
+            WHERE Semestre < (SELECT MAX(Semestre) FROM prezzi_medi_quartiere)
+        )
+    """),
+
+    # GET /api/timeseries/compare
+    BenchmarkQuery("timeseries/compare", "ricerca_quartiere", """
+        SELECT DISTINCT Quartiere FROM prezzi_medi_quartiere
+        WHERE UPPER(Quartiere) LIKE UPPER(?)
+        LIMIT 1
+    """, (BENCH_QUARTIERE_PATTERN,)),
+    BenchmarkQuery("timeseries/compare", "serie_quartiere", """
+        SELECT Quartiere, Semestre, Prezzo_Acquisto_Medio_EUR_mq, Prezzo_Locazione_Medio_EUR_mq
+        FROM prezzi_medi_quartiere
+        WHERE Quartiere = ?
+        ORDER BY Semestre ASC
+    """, params_sql="SELECT Quartiere FROM prezzi_medi_quartiere ORDER BY Quartiere LIMIT 1"),
+
+    # GET /api/nil/:id/complete-profile
+    BenchmarkQuery("nil/:id/complete-profile", "dim_nil", "SELECT nil FROM dim_nil WHERE id_nil = ?", (BENCH_NIL_ID,)),
+    BenchmarkQuery("nil/:id/complete-profile", "qualita_vita",
+                   "SELECT * FROM nil_qualita_vita WHERE id_nil = ?", (BENCH_NIL_ID,)),
+    BenchmarkQuery("nil/:id/complete-profile", "ranking",
+                   "SELECT * FROM vw_nil_ranking WHERE id_nil = ?", (BENCH_NIL_ID,)),
+    BenchmarkQuery("nil/:id/complete-profile", "farmacie",
+                   "SELECT COUNT(*) AS c FROM ds_08_servizi_sanitari_farmacie_milano WHERE id_nil = ? OR id_nil = ?",
+                   (str(BENCH_NIL_ID), BENCH_NIL_ID)),
+    BenchmarkQuery("nil/:id/complete-profile", "medici",
+                   "SELECT COUNT(*) AS c FROM ds_08_servizi_sanitari_medici_medicina_generale "
+                   "WHERE (id_nil = ? OR id_nil = ?) AND attivo = 1",
+                   (str(BENCH_NIL_ID), BENCH_NIL_ID)),
+    BenchmarkQuery("nil/:id/complete-profile", "servizi_sociali",
+                   "SELECT COUNT(*) AS c FROM ds_09_servizi_sociali_servizi_sociali_2014 "
+                   "WHERE nil = ? OR nil = ? OR denominazione_nil LIKE ?",
+                   params_sql=f"SELECT '{BENCH_NIL_ID}', {BENCH_NIL_ID}, "
+                              f"'%' || substr(nil || ' ', 1, instr(nil || ' ', ' ') - 1) || '%' "
+                              f"FROM dim_nil WHERE id_nil = {BENCH_NIL_ID}"),
+    BenchmarkQuery("nil/:id/complete-profile", "biblioteche",
+                   "SELECT COUNT(*) AS c FROM ds_11_biblioteche_biblioteche_rionali WHERE UPPER(nil) = UPPER(?)",
+                   params_sql=f"SELECT nil FROM dim_nil WHERE id_nil = {BENCH_NIL_ID}"),
+    BenchmarkQuery("nil/:id/complete-profile", "architetture",
+                   "SELECT COUNT(*) AS c FROM ds_10_cultura_musei_architetture_storiche WHERE id_nil = ? OR id_nil = ?",
+                   (str(BENCH_NIL_ID), BENCH_NIL_ID)),
+    BenchmarkQuery("nil/:id/complete-profile", "pubblici_esercizi",
+                   "SELECT COUNT(*) AS c FROM ds_13_economia_commercio_pubblici_esercizi WHERE id_nil = ? OR id_nil = ?",
+                   (str(BENCH_NIL_ID), BENCH_NIL_ID)),
+    BenchmarkQuery("nil/:id/complete-profile", "botteghe_storiche",
+                   "SELECT COUNT(*) AS c FROM ds_13_economia_commercio_botteghe_storiche WHERE id_nil = ? OR id_nil = ?",
+                   (str(BENCH_NIL_ID), BENCH_NIL_ID)),
+
+    # GET /api/data-overview
+    BenchmarkQuery("data-overview", "prezzi_ultimo_semestre", """
+        SELECT AVG(Prezzo_Acquisto_Medio_EUR_mq) AS prezzoMedio, COUNT(DISTINCT Quartiere) AS totaleQuartieri
+        FROM prezzi_medi_quartiere
+        WHERE Semestre = ?
+    """, params_sql="SELECT MAX(Semestre) FROM prezzi_medi_quartiere"),
+    BenchmarkQuery("data-overview", "indicatori_demografici",
+                   "SELECT indicatore, valore FROM indicatori_demografici WHERE anno = ? LIMIT 5",
+                   params_sql="SELECT COALESCE(MAX(anno), 2023) FROM indicatori_demografici"),
+    BenchmarkQuery("data-overview", "popolazione_famiglie", """
+        SELECT COUNT(DISTINCT NIL) AS quartieri, SUM(Famiglie) AS totaleFamiglie
+        FROM popolazione_famiglie_tipologia_quartiere
+        WHERE Anno = ?
+    """, params_sql="SELECT COALESCE(MAX(Anno), 2023) FROM popolazione_famiglie_tipologia_quartiere"),
+    BenchmarkQuery("data-overview", "contribuenti", """
+        SELECT indicatore, valore
+        FROM contribuenti_categorie
+        WHERE anno = ?
+          AND indicatore IN (
+            'Contribuenti',
+            'Reddito imponibile (euro)',
+            'Contribuenti con reddito da fabbricati',
+            'Reddito da fabbricati (euro)'
+          )
+    """, params_sql="SELECT MAX(anno) FROM contribuenti_categorie"),
+    BenchmarkQuery("data-overview", "indice_prezzi", """
+        SELECT anno, trimestre, indice, variazione_percentuale
+        FROM indice_prezzi_abitazioni
+        WHERE categoria_abitazioni = 'H1 - tutte le voci'
+        ORDER BY anno DESC, trimestre DESC
+        LIMIT 1
+    """),
+    BenchmarkQuery("data-overview", "trasporto_pubblico", """
+        SELECT
+          SUM(COALESCE(numero_linee, 0)) AS linee_totali,
+          SUM(COALESCE(lunghezza_rete, 0)) AS lunghezza_totale,
+          SUM(CASE WHEN linee = 'Metropolitana' THEN COALESCE(numero_linee, 0) ELSE 0 END) AS linee_metro,
+          SUM(CASE WHEN linee = 'Metropolitana' THEN COALESCE(lunghezza_rete, 0) ELSE 0 END) AS lunghezza_metro
+        FROM trasporto_pubblico_locale
+        WHERE anno = ?
+    """, params_sql="SELECT MAX(anno) FROM trasporto_pubblico_locale"),
+    BenchmarkQuery("data-overview", "fact_servizi", """
+        SELECT
+          SUM(COALESCE(numero_scuole, 0)) AS totaleScuole,
+          SUM(COALESCE(numero_mercati, 0)) AS totaleMercati,
+          AVG(COALESCE(indice_verde_medio, 0)) AS indiceVerdeMedio
+        FROM fact_servizi
+        WHERE id_tempo = (SELECT MAX(id_tempo) FROM fact_servizi)
+    """),
+    BenchmarkQuery("data-overview", "nil_qualita_vita", """
+        SELECT
+          SUM(popolazione_totale) AS popolazioneTotale,
+          AVG(pct_stranieri) AS pctStranieriMedia,
+          AVG(densita_abitanti_km2) AS densitaMedia,
+          SUM(famiglie_registrate) AS totaleFamiglieNil,
+          SUM(famiglie_unipersonali) AS famiglieUnipersonali,
+          AVG(indice_qualita_vita) AS indiceQualitaVitaMedia,
+          COUNT(*) AS totaleNil
+        FROM nil_qualita_vita
+    """),
+) + tuple(
+    # Conteggi dei dataset servizi/commercio/cultura/mobilità
+    BenchmarkQuery("data-overview", f"count_{table}", f"SELECT COUNT(*) AS count FROM {table}")
+    for table in (
+        "ds_05_servizi_essenziali_mercati_comunali_coperti",
+        "ds_05_servizi_essenziali_mercati_settimanali_scoperti",
+        "ds_08_servizi_sanitari_farmacie_milano",
+        "ds_08_servizi_sanitari_medici_medicina_generale",
+        "ds_09_servizi_sociali_servizi_sociali_2014",
+        "ds_13_economia_commercio_esercizi_vicinato",
+        "ds_13_economia_commercio_pubblici_esercizi",
+        "ds_13_economia_commercio_media_grande_distribuzione",
+        "ds_13_economia_commercio_botteghe_storiche",
+        "ds_13_economia_commercio_coworking",
+        "ds_10_cultura_musei_architetture_storiche",
+        "ds_10_cultura_musei_beni_culturali_siti",
+        "ds_11_biblioteche_biblioteche_rionali",
+        "ds_07_mobilita_trasporti_colonnine_ricarica_elettrica",
+        "ds_14_sicurezza_beni_immobili_confiscati",
+    )
+)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Esecuzione
+# ─────────────────────────────────────────────────────────────────────────────
+
+def percentiles(samples_ns: Sequence[int]) -> Dict[str, float]:
+    """min / p50 / p95 / p99 / media in millisecondi."""
+    ms = np.asarray(samples_ns, dtype=float) / 1e6
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "min_ms": float(ms.min()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: Sequence) -> List[str]:
+    """Righe di EXPLAIN QUERY PLAN (colonna detail)."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params))]
+
+
+def full_scans(plan: Sequence[str]) -> List[str]:
+    """Passi del piano che leggono una tabella per intero (SCAN senza indice)."""
+    return [
+        step for step in plan
+        if step.startswith("SCAN") and "USING" not in step and not step.startswith(("SCAN (", "SCAN CONSTANT ROW"))
+    ]
+
+
+def bench_query(
+    conn: sqlite3.Connection, query: BenchmarkQuery, repeat: int, warmup: int
+) -> Dict[str, object]:
+    """
+    Cronometra una query del catalogo.
+
+    Returns:
+        Risultato con status "ok" (statistiche, righe, piano) o "skipped" (motivo)
+    """
+    result: Dict[str, object] = {"route": query.route, "name": query.name}
+    try:
+        params = query.params
+        if query.params_sql:
+            row = conn.execute(query.params_sql).fetchone()
+            params = tuple(row) if row else ()
+        plan = query_plan(conn, query.sql, params)
+    except sqlite3.Error as e:
+        result.update(status="skipped", reason=str(e))
+        return result
+
+    for _ in range(warmup):
+        conn.execute(query.sql, params).fetchall()
+
+    samples: List[int] = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        rows = len(conn.execute(query.sql, params).fetchall())
+        samples.append(time.perf_counter_ns() - start)
+
+    result.update(status="ok", rows=rows, plan=plan, full_scans=full_scans(plan), **percentiles(samples))
+    result["samples_ns"] = samples
+    return result
+
+
+def run_benchmark(
+    conn: sqlite3.Connection,
+    queries: Sequence[BenchmarkQuery] = QUERY_CATALOG,
+    repeat: int = DEFAULT_REPEAT,
+    warmup: int = DEFAULT_WARMUP,
+) -> Dict[str, object]:
+    """
+    Esegue il catalogo e aggrega per route.
+
+    Il tempo di una route è la somma, ripetizione per ripetizione, delle sue
+    query eseguite (le query saltate non contribuiscono).
+
+    Returns:
+        Report: metadati, risultati per query e per route
+    """
+    results = [bench_query(conn, q, repeat, warmup) for q in queries]
+
+    routes: Dict[str, Dict[str, object]] = {}
+    for route in dict.fromkeys(q.route for q in queries):
+        measured = [r for r in results if r["route"] == route and r["status"] == "ok"]
+        skipped = [r["name"] for r in results if r["route"] == route and r["status"] == "skipped"]
+        entry: Dict[str, object] = {"queries": len(measured), "skipped": skipped}
+        if measured:
+            totals = np.sum([r["samples_ns"] for r in measured], axis=0)
+            entry.update(percentiles(totals))
+        routes[route] = entry
+
+    for r in results:
+        r.pop("samples_ns", None)
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "sqlite_version": sqlite3.sqlite_version,
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "warmup": warmup,
+        "routes": routes,
+        "queries": results,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Baseline
+# ─────────────────────────────────────────────────────────────────────────────
+
+def compare_with_baseline(
+    report: Dict[str, object],
+    baseline: Dict[str, object],
+    threshold: float = DEFAULT_THRESHOLD,
+    min_delta_ms: float = MIN_DELTA_MS,
+) -> Tuple[List[str], List[str]]:
+    """
+    Confronta p95 di query e route con la baseline.
+
+    Returns:
+        (regressioni, piani di esecuzione cambiati)
+    """
+    regressions: List[str] = []
+    plan_changes: List[str] = []
+
+    def check(label: str, current: Dict[str, object], previous: Dict[str, object]) -> None:
+        if "p95_ms" not in current or "p95_ms" not in previous:
+            return
+        now, before = current["p95_ms"], previous["p95_ms"]
+        if now > before * (1 + threshold) and now - before > min_delta_ms:
+            regressions.append(f"{label}: p95 {before:.3f} → {now:.3f} ms ({(now / before - 1) * 100:+.0f}%)")
+
+    for route, entry in report["routes"].items():
+        if route in baseline.get("routes", {}):
+            check(f"route {route}", entry, baseline["routes"][route])
+
+    previous_queries = {(q["route"], q["name"]): q for q in baseline.get("queries", [])}
+    for query in report["queries"]:
+        previous = previous_queries.get((query["route"], query["name"]))
+        if not previous or query["status"] != "ok" or previous.get("status") != "ok":
+            continue
+        check(f"{query['route']} / {query['name']}", query, previous)
+        if query["plan"] != previous.get("plan"):
+            plan_changes.append(f"{query['route']} / {query['name']}")
+
+    return regressions, plan_changes
+
+
+def print_report(report: Dict[str, object]) -> None:
+    """Tabella p50/p95/p99 per route e query più lente."""
+    print(f"\n{'Route':<28} {'query':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, entry in report["routes"].items():
+        if "p50_ms" not in entry:
+            print(f"{route:<28} {0:>5} {'—':>9} {'—':>9} {'—':>9}")
+            continue
+        print(f"{route:<28} {entry['queries']:>5} {entry['p50_ms']:>9.3f} "
+              f"{entry['p95_ms']:>9.3f} {entry['p99_ms']:>9.3f}")
+
+    measured = [q for q in report["queries"] if q["status"] == "ok"]
+    slowest = sorted(measured, key=lambda q: q["p95_ms"], reverse=True)[:5]
+    if slowest:
+        print("\nQuery più lente (p95):")
+        for q in slowest:
+            scans = f"  SCAN: {', '.join(q['full_scans'])}" if q["full_scans"] else ""
+            print(f"  {q['p95_ms']:>8.3f} ms  {q['route']} / {q['name']}{scans}")
+
+    skipped = [q for q in report["queries"] if q["status"] == "skipped"]
+    if skipped:
+        print(f"\n  ⚠ {len(skipped)} query saltate (tabelle o colonne mancanti)")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark delle query delle route API")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Ripetizioni cronometrate")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="Esecuzioni di warm-up")
+    parser.add_argument("--route", action="append", help="Limita alle route indicate")
+    parser.add_argument("--output", type=str, default=str(REPORT_PATH), help="Report JSON")
+    parser.add_argument("--baseline", type=str, default=str(BASELINE_PATH), help="Baseline JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="Salva il run come nuova baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Regressione tollerata su p95 (0.25 = +25%%)")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"❌ Database non trovato: {db_path}")
+        return 1
+
+    queries = [q for q in QUERY_CATALOG if not args.route or q.route in args.route]
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    report = run_benchmark(conn, queries, args.repeat, args.warmup)
+    conn.close()
+    report["database"] = str(db_path)
+
+    print_report(report)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n  ✓ Report: {output}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"  ✓ Baseline salvata: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print("  ⚠ Nessuna baseline: esegui con --save-baseline per crearla")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions, plan_changes = compare_with_baseline(report, baseline, args.threshold)
+    for change in plan_changes:
+        print(f"  ⚠ Piano di esecuzione cambiato: {change}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regressioni oltre +{args.threshold * 100:.0f}% rispetto alla baseline:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+
+    print(f"  ✓ Nessuna regressione oltre +{args.threshold * 100:.0f}% rispetto alla baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
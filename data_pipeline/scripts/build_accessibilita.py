@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Calcola metriche di prossimità ai servizi per NIL (fact_accessibilita).
+
+Per ogni categoria di servizio (scuole, farmacie, stazioni, colonnine)
+costruisce un indice spaziale sui punti e calcola, in modo vettoriale,
+la distanza dal servizio più vicino per ogni punto origine:
+- centroidi delle sezioni di censimento, pesati per popolazione
+- in assenza delle sezioni, una griglia regolare di punti dentro ogni NIL
+
+Le distanze vengono aggregate per NIL e salvate in fact_accessibilita,
+così le API leggono valori precalcolati senza calcoli a runtime.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from spatial_join import NilIndex, assign_points, load_nil_index, read_points, table_columns
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Costanti
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Categoria -> tabella sorgente con coordinate.
+# Non esiste un dataset fermate metro: le stazioni ferroviarie sono il proxy.
+SERVICE_TABLES: Dict[str, str] = {
+    "scuole": "ds_06_istruzione_famiglie_edifici_scolastici_2020_2021",
+    "farmacie": "ds_08_servizi_sanitari_farmacie_milano",
+    "stazioni": "ds_07_mobilita_trasporti_stazioni_ferroviarie",
+    "colonnine_ricarica": "ds_07_mobilita_trasporti_colonnine_ricarica_elettrica",
+}
+
+SEZIONI_TABLE = "ds_00_base_geografica_sezioni_censimento_2011"
+POPULATION_COLUMNS = ("pop_2011", "popolazione", "p1", "pop_tot", "pop")
+
+# Soglia "servizio a distanza pedonale" (metri)
+WALKING_DISTANCE_M = 500.0
+
+# Passo della griglia di fallback (metri)
+GRID_STEP_M = 250.0
+
+EARTH_RADIUS_M = 6_371_008.8
+# Latitudine di riferimento per la proiezione locale (Milano)
+REFERENCE_LAT = 45.4642
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Geometria
+# ─────────────────────────────────────────────────────────────────────────────
+
+def project_meters(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Proiezione equirettangolare locale in metri.
+
+    Alla scala del Comune l'errore rispetto a una proiezione UTM è
+    inferiore allo 0.1%, senza dipendenze aggiuntive.
+    """
+    scale = np.cos(np.radians(REFERENCE_LAT))
+    x = EARTH_RADIUS_M * np.radians(np.asarray(lon, dtype=float)) * scale
+    y = EARTH_RADIUS_M * np.radians(np.asarray(lat, dtype=float))
+    return x, y
+
+
+def nearest_distances(
+    origin_x: np.ndarray,
+    origin_y: np.ndarray,
+    target_x: np.ndarray,
+    target_y: np.ndarray,
+) -> np.ndarray:
+    """Distanza (metri) dal punto target più vicino per ogni origine."""
+    if len(target_x) == 0:
+        return np.full(len(origin_x), np.nan)
+    tree = STRtree(shapely.points(target_x, target_y))
+    origin_idx, distances = tree.query_nearest(
+        shapely.points(origin_x, origin_y), return_distance=True, all_matches=False
+    )
+    result = np.full(len(origin_x), np.nan)
+    result[origin_idx[0]] = distances
+    return result
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Punti origine
+# ─────────────────────────────────────────────────────────────────────────────
+
+def census_origins(conn: sqlite3.Connection, index: NilIndex) -> Optional[pd.DataFrame]:
+    """
+    Centroidi delle sezioni di censimento con peso popolazione.
+
+    Returns:
+        DataFrame (id_nil, lon, lat, peso) oppure None se le sezioni mancano
+    """
+    columns = table_columns(conn, SEZIONI_TABLE)
+    if "geometry" not in columns:
+        return None
+
+    pop_col = next((c for c in POPULATION_COLUMNS if c in columns), None)
+    select_pop = f', "{pop_col}" AS peso' if pop_col else ""
+    df = pd.read_sql(f'SELECT geometry{select_pop} FROM "{SEZIONI_TABLE}"', conn)
+    if df.empty:
+        return None
+
+    geometries = shapely.from_geojson(df["geometry"].astype(str).to_numpy(), on_invalid="ignore")
+    valid = ~shapely.is_missing(geometries)
+    points = shapely.point_on_surface(geometries[valid])
+
+    origins = pd.DataFrame({
+        "lon": shapely.get_x(points),
+        "lat": shapely.get_y(points),
+        "peso": pd.to_numeric(df.loc[valid, "peso"], errors="coerce").to_numpy() if pop_col else 1.0,
+    })
+    origins["id_nil"] = assign_points(index, origins["lon"].to_numpy(), origins["lat"].to_numpy())
+    origins = origins[origins["id_nil"].notna()]
+    origins["peso"] = origins["peso"].fillna(0.0).clip(lower=0.0)
+
+    # Sezioni disabitate non pesano; se nessuna sezione ha popolazione usa peso uniforme
+    if origins["peso"].sum() <= 0:
+        origins["peso"] = 1.0
+    return origins if not origins.empty else None
+
+
+def grid_origins(index: NilIndex, step_m: float = GRID_STEP_M) -> pd.DataFrame:
+    """Griglia regolare di punti campione dentro i NIL (peso uniforme)."""
+    lon_min, lat_min, lon_max, lat_max = shapely.total_bounds(index.geometries)
+    step_lat = np.degrees(step_m / EARTH_RADIUS_M)
+    step_lon = step_lat / np.cos(np.radians(REFERENCE_LAT))
+
+    lon_grid, lat_grid = np.meshgrid(
+        np.arange(lon_min + step_lon / 2, lon_max, step_lon),
+        np.arange(lat_min + step_lat / 2, lat_max, step_lat),
+    )
+    origins = pd.DataFrame({"lon": lon_grid.ravel(), "lat": lat_grid.ravel(), "peso": 1.0})
+    origins["id_nil"] = assign_points(index, origins["lon"].to_numpy(), origins["lat"].to_numpy())
+    origins = origins[origins["id_nil"].notna()]
+
+    # NIL troppo piccoli per la griglia: usa un punto interno
+    missing = np.setdiff1d(index.ids, origins["id_nil"].to_numpy())
+    if len(missing):
+        mask = np.isin(index.ids, missing)
+        inner = shapely.point_on_surface(index.geometries[mask])
+        origins = pd.concat([
+            origins,
+            pd.DataFrame({
+                "lon": shapely.get_x(inner),
+                "lat": shapely.get_y(inner),
+                "peso": 1.0,
+                "id_nil": index.ids[mask].astype(float),
+            }),
+        ], ignore_index=True)
+    return origins
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Aggregazione
+# ─────────────────────────────────────────────────────────────────────────────
+
+def aggregate_by_nil(origins: pd.DataFrame, distances: np.ndarray) -> pd.DataFrame:
+    """Aggrega le distanze per NIL con media pesata e quota entro soglia."""
+    df = pd.DataFrame({
+        "id_nil": origins["id_nil"].to_numpy().astype(int),
+        "peso": origins["peso"].to_numpy(),
+        "distanza": distances,
+    })
+    df = df[df["distanza"].notna()]
+    df["peso_distanza"] = df["peso"] * df["distanza"]
+    df["peso_entro_soglia"] = df["peso"] * (df["distanza"] <= WALKING_DISTANCE_M)
+
+    grouped = df.groupby("id_nil").agg(
+        peso=("peso", "sum"),
+        peso_distanza=("peso_distanza", "sum"),
+        peso_entro_soglia=("peso_entro_soglia", "sum"),
+        distanza_min_m=("distanza", "min"),
+        distanza_max_m=("distanza", "max"),
+        n_origini=("distanza", "size"),
+    ).reset_index()
+
+    weight = grouped["peso"].where(grouped["peso"] > 0)
+    grouped["distanza_media_m"] = grouped["peso_distanza"] / weight
+    grouped["quota_entro_500m"] = grouped["peso_entro_soglia"] / weight * 100
+    return grouped[[
+        "id_nil",
+        "distanza_media_m",
+        "distanza_min_m",
+        "distanza_max_m",
+        "quota_entro_500m",
+        "n_origini",
+    ]]
+
+
+def build_fact_accessibilita(conn: sqlite3.Connection) -> Optional[pd.DataFrame]:
+    """
+    Calcola fact_accessibilita e la salva nel DB.
+
+    Returns:
+        DataFrame scritto, oppure None se mancano le geometrie NIL
+    """
+    index = load_nil_index(conn)
+    if index is None:
+        return None
+
+    origins = census_origins(conn, index)
+    fonte = "sezioni_censimento"
+    if origins is None:
+        origins = grid_origins(index)
+        fonte = "griglia_nil"
+    origin_x, origin_y = project_meters(origins["lon"].to_numpy(), origins["lat"].to_numpy())
+
+    frames = []
+    for categoria, table in SERVICE_TABLES.items():
+        points = read_points(conn, table)
+        if points is None:
+            continue
+        points = points.dropna(subset=["lon", "lat"])
+        if points.empty:
+            continue
+
+        target_x, target_y = project_meters(points["lon"].to_numpy(), points["lat"].to_numpy())
+        distances = nearest_distances(origin_x, origin_y, target_x, target_y)
+        frame = aggregate_by_nil(origins, distances)
+        frame.insert(1, "categoria", categoria)
+        frame["fonte_origini"] = fonte
+        frames.append(frame)
+
+    conn.execute("DROP TABLE IF EXISTS fact_accessibilita")
+    conn.execute(
+        """
+        CREATE TABLE fact_accessibilita (
+            id_nil INTEGER NOT NULL,
+            categoria TEXT NOT NULL,
+            distanza_media_m REAL,
+            distanza_min_m REAL,
+            distanza_max_m REAL,
+            quota_entro_500m REAL,
+            n_origini INTEGER,
+            fonte_origini TEXT,
+            PRIMARY KEY (id_nil, categoria)
+        )
+        """
+    )
+    if not frames:
+        return pd.DataFrame()
+
+    fact = pd.concat(frames, ignore_index=True)
+    fact.to_sql("fact_accessibilita", conn, if_exists="append", index=False)
+    return fact
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calcola distanze dai servizi per NIL (fact_accessibilita)")
+    parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parent.parent
+    db_path = project_root / args.db
+
+    conn = sqlite3.connect(db_path)
+    fact = build_fact_accessibilita(conn)
+    conn.commit()
+    conn.close()
+
+    if fact is None:
+        print("dim_nil senza geometrie: fact_accessibilita non calcolata")
+        return
+    for categoria, group in fact.groupby("categoria"):
+        print(f"  ✓ {categoria}: {len(group)} NIL, distanza media {group['distanza_media_m'].mean():.0f} m")
+
+
+if __name__ == "__main__":
+    main()
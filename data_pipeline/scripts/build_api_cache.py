@@ -0,0 +1,812 @@
+#!/usr/bin/env python3
+"""
+Risposte API per-NIL precalcolate (api_response_cache).
+
+Le route /api/nil/:id/* di server/index.js ricalcolano gli stessi aggregati
+a ogni richiesta. Questo modulo riproduce in Python il payload di ciascuna
+route e lo salva come JSON minificato in api_response_cache, con un ETag
+derivato dal contenuto: il server risponde con una lettura per chiave
+primaria e ripiega sulla route solo se la risposta manca.
+
+Ogni builder restituisce il payload della risposta 200, oppure None quando
+la route risponderebbe 404; gli errori SQLite (tabelle assenti) lasciano la
+risposta fuori dalla cache, così resta alla route gestirla.
+
+Uso:
+    python build_api_cache.py [--db PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+Payload = Dict[str, Any]
+
+CACHE_TABLE = "api_response_cache"
+
+# Database path from environment or default
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not DB_PATH.is_absolute():
+    DB_PATH = PROJECT_ROOT / DB_PATH
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Semantica JavaScript
+# ─────────────────────────────────────────────────────────────────────────────
+
+def js_truthy(value: Any) -> bool:
+    """Truthiness JavaScript (0, '', null, NaN sono falsy)."""
+    if value is None or value == "" or value is False:
+        return False
+    if isinstance(value, (int, float)):
+        return value != 0 and not math.isnan(value)
+    return True
+
+
+def js_or(value: Any, default: Any) -> Any:
+    """Equivalente di `value || default`."""
+    return value if js_truthy(value) else default
+
+
+def num(value: Any) -> float:
+    """Coercizione numerica di null (null → 0) come negli operatori aritmetici JS."""
+    return 0 if value is None else value
+
+
+def js_round(value: float) -> int:
+    """Math.round: arrotonda .5 verso +∞."""
+    return math.floor(value + 0.5)
+
+
+def to_fixed(value: float, digits: int) -> float:
+    """parseFloat(value.toFixed(digits)): arrotondamento half-up sul valore esatto."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return value
+    quantum = Decimal(1).scaleb(-digits)
+    return float(Decimal(value).quantize(quantum, rounding=ROUND_HALF_UP))
+
+
+def js_parse_int(value: Any) -> Optional[int]:
+    """parseInt: None se non interpretabile (NaN)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if math.isfinite(value) else None
+    match = re.match(r"\s*([+-]?\d+)", str(value))
+    return int(match.group(1)) if match else None
+
+
+def json_value(value: Any) -> Any:
+    """Normalizza i valori come JSON.stringify (float interi senza .0, NaN → null)."""
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return int(value)
+        return value
+    if isinstance(value, dict):
+        return {k: json_value(v) for k, v in value.items() if v is not UNDEFINED}
+    if isinstance(value, (list, tuple)):
+        return [json_value(v) for v in value]
+    return value
+
+
+class _Undefined:
+    """Valore `undefined`: la chiave viene omessa dal JSON."""
+
+
+UNDEFINED = _Undefined()
+
+
+def dumps(payload: Any) -> str:
+    """Serializzazione compatta come res.json()."""
+    return json.dumps(json_value(payload), ensure_ascii=False, separators=(",", ":"))
+
+
+def etag_for(body: str) -> str:
+    """ETag forte derivato dal contenuto."""
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Accesso dati
+# ─────────────────────────────────────────────────────────────────────────────
+
+def fetch_one(conn: sqlite3.Connection, sql: str, params: Tuple = ()) -> Optional[Dict[str, Any]]:
+    row = conn.execute(sql, params).fetchone()
+    return dict(row) if row is not None else None
+
+
+def fetch_all(conn: sqlite3.Connection, sql: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+    return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def count(conn: sqlite3.Connection, table: str, nil_id: int) -> int:
+    """COUNT(*) per id_nil, che nei ds_* può essere testo o intero."""
+    row = conn.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE id_nil = ? OR id_nil = ?", (str(nil_id), nil_id)
+    ).fetchone()
+    return row[0] or 0
+
+
+def api_relation(conn: sqlite3.Connection, view: str) -> str:
+    """Snapshot mv_api_* se materializzato, altrimenti la vista vw_api_*."""
+    table = "mv_" + view[len("vw_"):]
+    found = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return table if found else view
+
+
+def nil_name(conn: sqlite3.Connection, nil_id: int) -> Optional[str]:
+    row = conn.execute("SELECT nil FROM dim_nil WHERE id_nil = ?", (nil_id,)).fetchone()
+    return row[0] if row else None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Builder per endpoint (stessa logica delle route in server/index.js)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def build_servizi_sanitari(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    num_farmacie = count(conn, "ds_08_servizi_sanitari_farmacie_milano", nil_id)
+    farmacie_list = fetch_all(conn, """
+        SELECT descrizione_farmacia, indirizzo, cap
+        FROM ds_08_servizi_sanitari_farmacie_milano
+        WHERE id_nil = ? OR id_nil = ?
+    """, (str(nil_id), nil_id))
+    medici = fetch_one(conn, """
+        SELECT
+            COUNT(*) as count,
+            COUNT(CASE WHEN tipomedico = 'MEDICO DI MEDICINA GENERALE' THEN 1 END) as medici_base,
+            COUNT(CASE WHEN tipomedico = 'PEDIATRA DI LIBERA SCELTA' THEN 1 END) as pediatri
+        FROM ds_08_servizi_sanitari_medici_medicina_generale
+        WHERE (id_nil = ? OR id_nil = ?) AND attivo = 1
+    """, (str(nil_id), nil_id)) or {}
+    popolazione = fetch_one(conn, "SELECT popolazione_totale FROM nil_qualita_vita WHERE id_nil = ?", (nil_id,))
+
+    pop = js_or((popolazione or {}).get("popolazione_totale"), 0)
+    num_medici = js_or(medici.get("count"), 0)
+
+    abitanti_per_farmacia = js_round(pop / num_farmacie) if num_farmacie > 0 else None
+    abitanti_per_medico = js_round(pop / num_medici) if num_medici > 0 else None
+
+    score = 0
+    if js_truthy(abitanti_per_farmacia):
+        score += 50 if abitanti_per_farmacia <= 3000 else 35 if abitanti_per_farmacia <= 5000 else 20
+    if js_truthy(abitanti_per_medico):
+        score += 50 if abitanti_per_medico <= 1000 else 35 if abitanti_per_medico <= 1500 else 20
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "farmacie": {"totale": num_farmacie, "lista": farmacie_list[:10]},
+        "medici": {
+            "totale": num_medici,
+            "mediciBase": js_or(medici.get("medici_base"), 0),
+            "pediatri": js_or(medici.get("pediatri"), 0),
+        },
+        "popolazione": pop,
+        "rapporti": {
+            "abitantiPerFarmacia": abitanti_per_farmacia,
+            "abitantiPerMedico": abitanti_per_medico,
+        },
+        "scoreHealthcare": score,
+        "qualitaServizio": "Ottimo" if score >= 80 else "Buono" if score >= 50 else "Migliorabile",
+    }
+
+
+def build_servizi_sociali(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    params = (str(nil_id), nil_id, f"%{name.split(' ')[0]}%")
+    by_area = fetch_all(conn, """
+        SELECT area_attivita, COUNT(*) as count
+        FROM ds_09_servizi_sociali_servizi_sociali_2014
+        WHERE nil = ? OR nil = ? OR denominazione_nil LIKE ?
+        GROUP BY area_attivita
+        ORDER BY count DESC
+    """, params)
+    by_target = fetch_all(conn, """
+        SELECT fascia_utenza, COUNT(*) as count
+        FROM ds_09_servizi_sociali_servizi_sociali_2014
+        WHERE nil = ? OR nil = ? OR denominazione_nil LIKE ?
+        GROUP BY fascia_utenza
+        ORDER BY count DESC
+    """, params)
+    totale = sum(s["count"] for s in by_area)
+
+    popolazione = fetch_one(conn, "SELECT popolazione_totale FROM nil_qualita_vita WHERE id_nil = ?", (nil_id,))
+    pop = js_or((popolazione or {}).get("popolazione_totale"), 0)
+    per_1000 = to_fixed((totale / pop) * 1000, 2) if pop > 0 else 0
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "totaleServizi": totale,
+        "serviziPerArea": by_area,
+        "serviziPerTarget": by_target,
+        "popolazione": pop,
+        "serviziPer1000Abitanti": per_1000,
+        "qualitaCopertura": "Alta" if per_1000 >= 3 else "Media" if per_1000 >= 1 else "Bassa",
+    }
+
+
+def build_cultura(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    biblioteche = conn.execute(
+        "SELECT COUNT(*) FROM ds_11_biblioteche_biblioteche_rionali WHERE UPPER(nil) = UPPER(?)", (name,)
+    ).fetchone()[0] or 0
+    archivi = count(conn, "ds_11_biblioteche_biblioteche_archivi", nil_id)
+    architetture = count(conn, "ds_10_cultura_musei_architetture_storiche", nil_id)
+    beni_culturali = count(conn, "ds_10_cultura_musei_beni_culturali_siti", nil_id)
+    musei = count(conn, "ds_10_cultura_musei_beni_patrimonio_musei", nil_id)
+
+    totale = biblioteche + archivi + architetture + beni_culturali + musei
+    score = min(100, totale * 10)
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "biblioteche": biblioteche,
+        "archivi": archivi,
+        "architetture": architetture,
+        "beniCulturali": beni_culturali,
+        "musei": musei,
+        "totale": totale,
+        "scoreCultura": score,
+        "livelloCultura": "Alto" if score >= 50 else "Medio" if score >= 20 else "Basso",
+    }
+
+
+def build_commercio(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    num_pubblici = count(conn, "ds_13_economia_commercio_pubblici_esercizi", nil_id)
+    num_vicinato = count(conn, "ds_13_economia_commercio_esercizi_vicinato", nil_id)
+    num_botteghe = count(conn, "ds_13_economia_commercio_botteghe_storiche", nil_id)
+    coworking = count(conn, "ds_13_economia_commercio_coworking", nil_id)
+    gdo = count(conn, "ds_13_economia_commercio_media_grande_distribuzione", nil_id)
+    edicole = count(conn, "ds_13_economia_commercio_edicole", nil_id)
+
+    popolazione = fetch_one(
+        conn, "SELECT popolazione_totale, area_km2 FROM nil_qualita_vita WHERE id_nil = ?", (nil_id,)
+    ) or {}
+    pop = js_or(popolazione.get("popolazione_totale"), 0)
+    area = js_or(popolazione.get("area_km2"), 1)
+
+    totale = num_pubblici + num_vicinato + gdo
+    densita = to_fixed(totale / area, 1) if area > 0 else 0
+    per_1000 = to_fixed((totale / pop) * 1000, 1) if pop > 0 else 0
+    score = min(100, (num_pubblici * 0.5) + (num_vicinato * 0.3) + (num_botteghe * 5) + coworking * 10)
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "pubbliciEsercizi": num_pubblici,
+        "eserciziVicinato": num_vicinato,
+        "bottegheStoriche": num_botteghe,
+        "coworking": coworking,
+        "grandeDistribuzione": gdo,
+        "edicole": edicole,
+        "totaleCommercio": totale,
+        "densitaCommerciale": densita,
+        "commercioPer1000Ab": per_1000,
+        "scoreVitalita": to_fixed(score, 1),
+        "livelloVitalita": "Alto" if score >= 60 else "Medio" if score >= 30 else "Basso",
+    }
+
+
+def build_sicurezza(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    beni_confiscati = conn.execute(
+        "SELECT COUNT(*) FROM ds_14_sicurezza_beni_immobili_confiscati"
+    ).fetchone()[0] or 0
+    # La route legge anche l'area dal nil_qualita_vita (errore se manca la tabella)
+    conn.execute("SELECT area_km2 FROM nil_qualita_vita WHERE id_nil = ?", (nil_id,)).fetchone()
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "note": "Dati sicurezza disponibili solo a livello comunale",
+        "beniConfiscatiCitta": beni_confiscati,
+        "dataAvailableAtNilLevel": False,
+    }
+
+
+def build_complete_profile(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    qualita_vita = fetch_one(conn, "SELECT * FROM nil_qualita_vita WHERE id_nil = ?", (nil_id,))
+    ranking = fetch_one(conn, "SELECT * FROM vw_nil_ranking WHERE id_nil = ?", (nil_id,))
+
+    medici = conn.execute("""
+        SELECT COUNT(*) FROM ds_08_servizi_sanitari_medici_medicina_generale
+        WHERE (id_nil = ? OR id_nil = ?) AND attivo = 1
+    """, (str(nil_id), nil_id)).fetchone()[0] or 0
+    servizi_sociali = conn.execute("""
+        SELECT COUNT(*) FROM ds_09_servizi_sociali_servizi_sociali_2014
+        WHERE nil = ? OR nil = ? OR denominazione_nil LIKE ?
+    """, (str(nil_id), nil_id, f"%{name.split(' ')[0]}%")).fetchone()[0] or 0
+    biblioteche = conn.execute(
+        "SELECT COUNT(*) FROM ds_11_biblioteche_biblioteche_rionali WHERE UPPER(nil) = UPPER(?)", (name,)
+    ).fetchone()[0] or 0
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "qualitaVita": qualita_vita if qualita_vita is not None else UNDEFINED,
+        "ranking": ranking if ranking is not None else UNDEFINED,
+        "servizi": {
+            "farmacie": count(conn, "ds_08_servizi_sanitari_farmacie_milano", nil_id),
+            "medici": medici,
+            "serviziSociali": servizi_sociali,
+            "biblioteche": biblioteche,
+            "architetture": count(conn, "ds_10_cultura_musei_architetture_storiche", nil_id),
+            "pubbliciEsercizi": count(conn, "ds_13_economia_commercio_pubblici_esercizi", nil_id),
+            "bottegheStoriche": count(conn, "ds_13_economia_commercio_botteghe_storiche", nil_id),
+        },
+    }
+
+
+def build_detail(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    """GET /api/nil/:id (ricerca per ID numerico)."""
+    if not 0 < nil_id <= 88:
+        return None
+    row = fetch_one(conn, "SELECT * FROM vw_nil_analisi_completa WHERE id_nil = ? LIMIT 1", (nil_id,))
+    if row is None:
+        return None
+
+    ranking = fetch_one(conn, """
+        SELECT ranking_iqv, ranking_verde, ranking_popolazione
+        FROM vw_nil_ranking
+        WHERE nil = ?
+    """, (row["nil"],)) or {}
+    cluster = fetch_one(conn, "SELECT cluster_id, cluster_nome FROM nil_clusters WHERE nil = ?", (row["nil"],)) or {}
+
+    return {
+        **row,
+        "ranking": ranking,
+        "cluster_id": js_or(cluster.get("cluster_id"), row.get("cluster_id", UNDEFINED)),
+        "cluster_nome": js_or(cluster.get("cluster_nome"), row.get("cluster_nome", UNDEFINED)),
+    }
+
+
+def build_servizi(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    result = None
+    try:
+        result = fetch_one(conn, f"SELECT * FROM {api_relation(conn, 'vw_api_servizi_nil')} WHERE id_nil = ?", (nil_id,))
+    except sqlite3.Error:
+        pass
+    if result is None:
+        try:
+            result = fetch_one(conn, """
+                SELECT dn.id_nil, dn.nil_name, fs.num_scuole, fs.num_mercati, fs.indice_verde_urbano
+                FROM dim_nil dn
+                LEFT JOIN fact_servizi fs ON dn.id_nil = fs.id_nil
+                WHERE dn.id_nil = ?
+            """, (nil_id,))
+        except sqlite3.Error:
+            return None
+    if result is None:
+        return None
+
+    try:
+        result["accessibilita"] = fetch_all(conn, """
+            SELECT categoria, distanza_media_m, distanza_max_m, quota_entro_500m
+            FROM fact_accessibilita
+            WHERE id_nil = ?
+        """, (nil_id,))
+    except sqlite3.Error:
+        pass
+    return result
+
+
+def build_serie_storica(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    try:
+        rows = fetch_all(conn, "SELECT * FROM cube_nil_anno WHERE id_nil = ? ORDER BY id_tempo", (nil_id,))
+    except sqlite3.Error:
+        return None
+    if not rows:
+        return None
+    return {"id_nil": nil_id, "totale": len(rows), "data": rows}
+
+
+def build_ambiente(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    result = None
+    try:
+        result = fetch_one(conn, f"SELECT * FROM {api_relation(conn, 'vw_api_ambiente_nil')} WHERE id_nil = ?", (nil_id,))
+    except sqlite3.Error:
+        pass
+    if result is None:
+        try:
+            result = fetch_one(conn, """
+                SELECT dn.id_nil, dn.nil_name, fs.indice_verde_urbano as indice_verde
+                FROM dim_nil dn
+                LEFT JOIN fact_servizi fs ON dn.id_nil = fs.id_nil
+                WHERE dn.id_nil = ?
+            """, (nil_id,))
+        except sqlite3.Error:
+            return None
+    return result
+
+
+MEZZO_SHORT = {
+    "A piedi o in bicicletta": "Piedi/Bici",
+    "Mezzi pubblici": "Pubblici",
+    "Auto privata": "Auto",
+    "Altri mezzi": "Altro",
+}
+MEZZO_COLORE = {
+    "Mezzi pubblici": "#3b82f6",
+    "Auto privata": "#ef4444",
+    "A piedi o in bicicletta": "#22c55e",
+}
+
+
+def build_mobilita(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    rows = fetch_all(conn, """
+        SELECT mezzi_di_trasporto_prevalente, valore
+        FROM ds_07_mobilita_trasporti_mezzi_trasporto_prevalente_nil_2011
+        WHERE UPPER(nil) = UPPER(?)
+        ORDER BY valore DESC
+    """, (name,))
+    if not rows:
+        rows = fetch_all(conn, """
+            SELECT mezzi_di_trasporto_prevalente, valore
+            FROM ds_07_mobilita_trasporti_mezzi_trasporto_prevalente_nil_2011
+            WHERE UPPER(nil) LIKE UPPER(?) || '%'
+            ORDER BY valore DESC
+        """, (re.split(r"[\s-]", name)[0],))
+    if not rows:
+        return None
+
+    totale = sum(js_or(r["valore"], 0) for r in rows)
+    mobilita = [
+        {
+            "mezzo": r["mezzi_di_trasporto_prevalente"],
+            "mezzoShort": MEZZO_SHORT.get(r["mezzi_di_trasporto_prevalente"], r["mezzi_di_trasporto_prevalente"]),
+            "valore": r["valore"],
+            "percentuale": to_fixed((num(r["valore"]) / totale) * 100, 1) if totale > 0 else 0,
+            "colore": MEZZO_COLORE.get(r["mezzi_di_trasporto_prevalente"], "#6b7280"),
+        }
+        for r in rows
+    ]
+
+    def pct(short: str) -> float:
+        found = next((m for m in mobilita if m["mezzoShort"] == short), None)
+        return js_or(found["percentuale"] if found else None, 0)
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "data": mobilita,
+        "totale": totale,
+        "mezzo_prevalente": mobilita[0]["mezzo"] if mobilita else None,
+        "pctSostenibile": to_fixed(pct("Piedi/Bici") + pct("Pubblici"), 1),
+        "anno": 2011,
+    }
+
+
+TITOLO_SHORT = {
+    "Nessun titolo o licenza elementare": "Elementare",
+    "Licenza di scuola media inferiore o di avviamento professionale": "Media",
+    "Diploma di scuola secondaria superiore": "Diploma",
+    "Titoli universitari o para-universitari": "Laurea",
+}
+
+
+def build_istruzione(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    rows = fetch_all(conn, """
+        SELECT titolo_di_studio, valori
+        FROM ds_06_istruzione_famiglie_titolo_studio_residenti_nil_2011
+        WHERE UPPER(nil) = UPPER(?)
+    """, (name,))
+    if not rows:
+        rows = fetch_all(conn, """
+            SELECT titolo_di_studio, valori
+            FROM ds_06_istruzione_famiglie_titolo_studio_residenti_nil_2011
+            WHERE UPPER(nil) LIKE UPPER(?)
+        """, (f"{name.split(' ')[0]}%",))
+    if not rows:
+        return {"nilId": nil_id, "nilName": name, "data": [], "totale": 0}
+
+    totale = sum(js_or(r["valori"], 0) for r in rows)
+    data = [
+        {
+            "categoria": r["titolo_di_studio"],
+            "categoriaShort": TITOLO_SHORT.get(r["titolo_di_studio"], r["titolo_di_studio"]),
+            "valore": r["valori"],
+            "percentuale": to_fixed((num(r["valori"]) / totale) * 100, 1) if totale > 0 else 0,
+        }
+        for r in rows
+        if r["titolo_di_studio"] != "Minori di 6 anni"
+    ]
+    laureati = next((d for d in data if d["categoriaShort"] == "Laurea"), None)
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "data": data,
+        "totale": totale,
+        "pctLaureati": js_or(laureati["percentuale"] if laureati else None, 0),
+        "anno": 2011,
+    }
+
+
+COMPOSIZIONE_FAMIGLIE = [
+    ("1", "numero_di_residenti_1_residente", "#3b82f6"),
+    ("2", "2_residenti", "#8b5cf6"),
+    ("3", "3_residenti", "#ec4899"),
+    ("4", "4_residenti", "#f59e0b"),
+    ("5+", "5_o_piu_residenti", "#22c55e"),
+]
+
+
+def build_stock_abitativo(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    name = nil_name(conn, nil_id)
+    if name is None:
+        return None
+
+    pattern = f"%{name.split(' ')[0]}%"
+    abitazioni = fetch_one(conn, """
+        SELECT *
+        FROM ds_03_stock_abitativo_abitazioni_occupate_nil_2011
+        WHERE nil_nuclei_di_identita_locale LIKE ?
+        LIMIT 1
+    """, (pattern,))
+    try:
+        nuovi = fetch_one(conn, """
+            SELECT
+                COUNT(DISTINCT anno_ritiro) as fabbricati,
+                SUM(numero_abitazioni) as abitazioni,
+                SUM(superficie_utile_abitabile) as superficie,
+                SUM(volume_totale_v_p) as volume
+            FROM ds_03_stock_abitativo_nuovi_fabbricati_residenziali_2010_2023
+            WHERE UPPER(nil) LIKE UPPER(?)
+        """, (pattern,)) or {}
+    except sqlite3.Error:
+        nuovi = {}
+
+    composizione = []
+    if abitazioni:
+        composizione = [
+            {"residenti": label, "valore": js_or(js_parse_int(abitazioni.get(column)), 0), "colore": colore}
+            for label, column, colore in COMPOSIZIONE_FAMIGLIE
+        ]
+    totale = sum(c["valore"] for c in composizione)
+    composizione = [
+        {**c, "percentuale": to_fixed((c["valore"] / totale) * 100, 1) if totale > 0 else 0}
+        for c in composizione
+    ]
+
+    return {
+        "nilId": nil_id,
+        "nilName": name,
+        "composizioneFamiglie": composizione,
+        "totaleAbitazioni": totale,
+        "famiglieSingole": js_or((abitazioni or {}).get("una_sola_famiglia"), 0),
+        "famiglieCoabitanti": js_or((abitazioni or {}).get("famiglie_coabitanti"), 0),
+        "nuoviEdifici": {
+            "fabbricati": js_or(nuovi.get("fabbricati"), 0),
+            "abitazioni": js_or(nuovi.get("abitazioni"), 0),
+            "superficieMq": js_or(nuovi.get("superficie"), 0),
+            "volumeMc": js_or(nuovi.get("volume"), 0),
+            "periodo": "2010-2023",
+        },
+        "anno": 2011,
+    }
+
+
+def build_investor_metrics(conn: sqlite3.Connection, nil_id: int) -> Optional[Payload]:
+    nil = fetch_one(conn, "SELECT * FROM vw_nil_analisi_completa WHERE id_nil = ?", (nil_id,))
+    if nil is None:
+        return None
+    ranking = fetch_one(conn, "SELECT * FROM vw_nil_ranking WHERE id_nil = ?", (nil_id,)) or {}
+    avg = fetch_one(conn, """
+        SELECT
+            AVG(popolazione_totale) as pop_media,
+            AVG(densita_abitanti_km2) as densita_media,
+            AVG(pct_stranieri) as stranieri_media,
+            AVG(indice_verde_medio) as verde_medio,
+            AVG(indice_qualita_vita) as iqv_medio,
+            AVG(saldo_totale) as saldo_medio
+        FROM nil_qualita_vita
+        WHERE indice_qualita_vita IS NOT NULL
+    """) or {}
+
+    iqv = num(nil.get("indice_qualita_vita"))
+    saldo = num(nil.get("saldo_totale"))
+    trend_score = min(100, 50 + saldo / 10) if saldo > 0 else max(0, 50 + saldo / 10)
+    servizi_score = min(100, js_or(nil.get("numero_scuole"), 0) * 10 + js_or(nil.get("numero_mercati"), 0) * 5)
+    verde_score = min(100, js_or(nil.get("indice_verde_medio"), 0) * 5)
+    investor_score = js_or(iqv, 0) * 0.4 + trend_score * 0.3 + servizi_score * 0.2 + verde_score * 0.1
+
+    risk_level, risk_color = "Medio", "#f59e0b"
+    if saldo > 100 and iqv > 50:
+        risk_level, risk_color = "Basso", "#22c55e"
+    elif saldo < -100 or iqv < 30:
+        risk_level, risk_color = "Alto", "#ef4444"
+
+    growth = "Moderato"
+    if num(nil.get("nuovi_fabbricati_residenziali")) > 0 and saldo > 50:
+        growth = "Alto"
+    elif saldo < -50:
+        growth = "Basso"
+
+    def delta_percent(value: Any, media: Any) -> float:
+        if not js_truthy(media):
+            return 0
+        return to_fixed(((num(value) - media) / media) * 100, 1)
+
+    return {
+        "nilId": nil_id,
+        "nil": nil.get("nil"),
+        "investorScore": to_fixed(investor_score, 1),
+        "riskLevel": risk_level,
+        "riskColor": risk_color,
+        "growthPotential": growth,
+        "ranking": {
+            "qualitaVita": js_or(ranking.get("ranking_iqv"), None),
+            "verde": js_or(ranking.get("ranking_verde"), None),
+            "popolazione": js_or(ranking.get("ranking_popolazione"), None),
+            "totaleNil": 88,
+        },
+        "confrontoMilano": {
+            "popolazione": {
+                "nil": nil.get("popolazione_totale"),
+                "media": js_round(js_or(avg.get("pop_media"), 0)),
+                "delta": num(nil.get("popolazione_totale")) - js_or(avg.get("pop_media"), 0),
+            },
+            "densita": {
+                "nil": nil.get("densita_abitanti_km2"),
+                "media": js_or(avg.get("densita_media"), 0),
+                "deltaPercent": delta_percent(nil.get("densita_abitanti_km2"), avg.get("densita_media")),
+            },
+            "stranieri": {
+                "nil": nil.get("pct_stranieri"),
+                "media": js_or(avg.get("stranieri_media"), 0),
+                "delta": to_fixed(num(nil.get("pct_stranieri")) - js_or(avg.get("stranieri_media"), 0), 1),
+            },
+            "verde": {
+                "nil": nil.get("indice_verde_medio"),
+                "media": js_or(avg.get("verde_medio"), 0),
+                "deltaPercent": delta_percent(nil.get("indice_verde_medio"), avg.get("verde_medio")),
+            },
+            "qualitaVita": {
+                "nil": nil.get("indice_qualita_vita"),
+                "media": js_or(avg.get("iqv_medio"), 0),
+                "deltaPercent": delta_percent(nil.get("indice_qualita_vita"), avg.get("iqv_medio")),
+            },
+        },
+    }
+
+
+# endpoint (suffisso route /api/nil/:id/<endpoint>, "" = /api/nil/:id) -> builder
+ENDPOINTS: Dict[str, Callable[[sqlite3.Connection, int], Optional[Payload]]] = {
+    "": build_detail,
+    "servizi-sanitari": build_servizi_sanitari,
+    "servizi-sociali": build_servizi_sociali,
+    "cultura": build_cultura,
+    "commercio": build_commercio,
+    "sicurezza": build_sicurezza,
+    "complete-profile": build_complete_profile,
+    "servizi": build_servizi,
+    "serie-storica": build_serie_storica,
+    "ambiente": build_ambiente,
+    "mobilita": build_mobilita,
+    "istruzione": build_istruzione,
+    "stock-abitativo": build_stock_abitativo,
+    "investor-metrics": build_investor_metrics,
+}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cache
+# ─────────────────────────────────────────────────────────────────────────────
+
+def iter_responses(conn: sqlite3.Connection, stats: Dict[str, Any]) -> Iterator[Tuple[str, str, str, str]]:
+    """Genera (endpoint, key, etag, body) per ogni NIL ed endpoint disponibile."""
+    nil_ids = [int(row[0]) for row in conn.execute("SELECT id_nil FROM dim_nil ORDER BY id_nil")]
+    for endpoint, builder in ENDPOINTS.items():
+        try:
+            payloads = [(nil_id, builder(conn, nil_id)) for nil_id in nil_ids]
+        except sqlite3.Error as e:
+            # La route risponderebbe 500: l'endpoint resta fuori dalla cache
+            stats["skipped"][endpoint] = str(e)
+            continue
+        for nil_id, payload in payloads:
+            if payload is None:
+                continue
+            body = dumps(payload)
+            yield endpoint, str(nil_id), etag_for(body), body
+
+
+def build_api_response_cache(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """
+    Ricostruisce api_response_cache. Il chiamante gestisce il commit.
+
+    Returns:
+        Statistiche: righe scritte, endpoint saltati con il motivo, durata
+    """
+    start = time.perf_counter()
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+            endpoint TEXT NOT NULL,
+            key TEXT NOT NULL,
+            etag TEXT NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (endpoint, key)
+        ) WITHOUT ROWID
+    """)
+
+    stats: Dict[str, Any] = {"rows": 0, "skipped": {}}
+    # I builder leggono le righe per nome; la connessione del chiamante resta com'era
+    row_factory = conn.row_factory
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = list(iter_responses(conn, stats))
+    finally:
+        conn.row_factory = row_factory
+    conn.execute(f"DELETE FROM {CACHE_TABLE}")
+    conn.executemany(f"INSERT INTO {CACHE_TABLE} (endpoint, key, etag, body) VALUES (?, ?, ?, ?)", rows)
+
+    stats["rows"] = len(rows)
+    stats["bytes"] = sum(len(r[3].encode("utf-8")) for r in rows)
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precalcola le risposte API per-NIL")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    stats = build_api_response_cache(conn)
+    conn.commit()
+    conn.close()
+
+    print(f"  ✓ {CACHE_TABLE}: {stats['rows']} risposte, "
+          f"{stats['bytes'] / 1024:,.1f} KB in {stats['elapsed']:.2f}s")
+    for endpoint, reason in stats["skipped"].items():
+        print(f"  ⚠ /api/nil/:id/{endpoint} non precalcolato: {reason}")
+
+
+if __name__ == "__main__":
+    main()
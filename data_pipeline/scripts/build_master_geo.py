@@ -1,31 +1,61 @@
 #!/usr/bin/env python3
 """
 Crea Master GeoJSON/CSV a partire da dim_nil + fact tables (ultimo anno disponibile).
+
+Costruisce inoltre il cubo NIL×anno (cube_nil_anno) con tutte le fact tables
+in formato wide e le variazioni anno su anno precalcolate, salvato nel DB e,
+se pyarrow è disponibile, come Parquet partizionato per anno.
+
+Oltre a GeoJSON/CSV il master viene scritto in formati interrogabili senza
+caricare l'intero file:
+- GeoParquet (ordinato per curva di Hilbert, con bbox e statistiche per row group)
+- FlatGeobuf (con indice spaziale R-tree impacchettato)
 """
 
 from __future__ import annotations
 
 import argparse
-import json
+import shutil
 import sqlite3
 from pathlib import Path
-from typing import Optional
+from typing import List
 
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import shape
+import shapely
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+CUBE_TABLE = "cube_nil_anno"
+CUBE_KEYS = ["id_nil", "id_tempo"]
 
+# Righe per row group GeoParquet: gruppi piccoli rendono efficaci i filtri bbox
+PARQUET_ROW_GROUP_SIZE = 16
 
-def parse_geometry(value: Optional[str]):
-    if value is None:
-        return None
-    if isinstance(value, dict):
-        return shape(value)
-    try:
-        payload = json.loads(value)
-        return shape(payload) if payload else None
-    except Exception:
-        return None
+# Suffissi per colonne omonime fra fact tables (es. id_tempo, id_tempo_imm)
+FACT_SUFFIXES = ("_demo", "_imm", "_serv")
+
+# Misure che sono rapporti o indici: nei duplicati NIL×anno si mediano invece di sommarle.
+# Le densità (densita_*) restano fuori: le righe duplicate condividono l'area
+# del NIL, quindi si sommano come la popolazione e restano coerenti con essa.
+RATE_PREFIXES = ("pct_", "indice_", "tasso_", "quota_")
+RATE_SUFFIXES = ("_medio", "_media")
+# Le percentuali si ricalcolano pesandole sulla popolazione di ciascuna riga
+RATE_WEIGHT = "popolazione_totale"
+
+
+def read_dim_nil(conn: sqlite3.Connection) -> gpd.GeoDataFrame:
+    """Legge dim_nil convertendo la colonna GeoJSON in un'unica chiamata vettoriale."""
+    dim_nil = pd.read_sql("SELECT * FROM dim_nil", conn)
+    # NULL arriva come NaN: from_geojson accetta solo stringhe o None
+    raw = dim_nil["geometry"].astype(object)
+    geometry = shapely.from_geojson(raw.where(raw.notna(), None).to_numpy(), on_invalid="ignore")
+    return gpd.GeoDataFrame(dim_nil.drop(columns="geometry"), geometry=geometry, crs="EPSG:4326")
 
 
 def latest_snapshot(df: pd.DataFrame, key: str = "id_tempo") -> pd.DataFrame:
@@ -35,6 +65,164 @@ def latest_snapshot(df: pd.DataFrame, key: str = "id_tempo") -> pd.DataFrame:
     return df[df[key] == latest].copy()
 
 
+def join_latest_facts(gdf: gpd.GeoDataFrame, facts: List[pd.DataFrame]) -> gpd.GeoDataFrame:
+    """
+    Aggiunge a dim_nil l'ultimo anno di ogni fact table con un solo join su indice.
+
+    Le colonne già presenti ricevono il suffisso della fact table (FACT_SUFFIXES).
+    Più righe per lo stesso NIL vengono aggregate con collapse_duplicates,
+    come nel cubo, invece di tenerne una a caso.
+    """
+    columns = set(gdf.columns)
+    frames = []
+    for fact, suffix in zip(facts, FACT_SUFFIXES):
+        fact = latest_snapshot(fact)
+        if fact.empty:
+            continue
+        duplicates = int(fact["id_nil"].duplicated().sum())
+        if duplicates:
+            print(f"  ⚠ {duplicates} righe duplicate per NIL nell'ultimo anno: aggregate")
+            fact = collapse_duplicates(fact)
+        fact = fact.set_index("id_nil")
+        fact = fact.rename(columns={c: f"{c}{suffix}" for c in fact.columns if c in columns})
+        columns.update(fact.columns)
+        frames.append(fact)
+
+    if not frames:
+        return gdf
+    joined = gdf.join(pd.concat(frames, axis=1), on="id_nil")
+
+    # GeoJSON non supporta datetime: conversione preventiva a stringa
+    for col in joined.columns:
+        if pd.api.types.is_datetime64_any_dtype(joined[col]):
+            joined[col] = joined[col].astype(str)
+    return joined
+
+
+def write_columnar_outputs(gdf: gpd.GeoDataFrame, output_dir: Path) -> List[Path]:
+    """
+    Scrive il master come GeoParquet e FlatGeobuf.
+
+    Le righe sono ordinate per distanza di Hilbert, così NIL vicini finiscono
+    nello stesso row group e le statistiche bbox permettono di saltare gli altri.
+    """
+    valid = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    if valid.empty:
+        return []
+    ordered = valid.iloc[valid.hilbert_distance().argsort()].reset_index(drop=True)
+
+    written = []
+    if PYARROW_AVAILABLE:
+        parquet_path = output_dir / "master_nil_core.parquet"
+        ordered.to_parquet(
+            parquet_path,
+            index=False,
+            compression="zstd",
+            write_covering_bbox=True,
+            row_group_size=PARQUET_ROW_GROUP_SIZE,
+        )
+        written.append(parquet_path)
+
+    fgb_path = output_dir / "master_nil_core.fgb"
+    ordered.to_file(fgb_path, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+    written.append(fgb_path)
+    return written
+
+
+def is_rate(column: str) -> bool:
+    return column.startswith(RATE_PREFIXES) or column.endswith(RATE_SUFFIXES)
+
+
+def collapse_duplicates(fact: pd.DataFrame) -> pd.DataFrame:
+    """
+    Una riga per (id_nil, id_tempo), aggregando le misure colonna per colonna.
+
+    I conteggi e le densità si sommano; i rapporti (is_rate) si mediano, e le percentuali
+    pct_* sono pesate su RATE_WEIGHT quando la fact table lo contiene, così
+    equivalgono al rapporto ricalcolato sui totali. Le colonne non numeriche
+    diventano NaN invece di essere concatenate.
+    """
+    measures = [c for c in fact.columns if c not in CUBE_KEYS]
+    fact = fact.copy()
+    fact[measures] = fact[measures].apply(pd.to_numeric, errors="coerce")
+    if not fact.duplicated(CUBE_KEYS).any():
+        return fact.reset_index(drop=True)
+
+    grouped = fact.groupby(CUBE_KEYS)
+    counts = [c for c in measures if not is_rate(c)]
+    rates = [c for c in measures if is_rate(c)]
+    result = grouped[counts].sum(min_count=1)
+    if rates:
+        result[rates] = grouped[rates].mean()
+    if RATE_WEIGHT in fact.columns:
+        for col in (c for c in rates if c.startswith("pct_")):
+            weight = fact[RATE_WEIGHT].where(fact[col].notna() & (fact[RATE_WEIGHT] > 0))
+            weighted = (fact[col] * weight).groupby([fact[k] for k in CUBE_KEYS]).sum(min_count=1)
+            total = weight.groupby([fact[k] for k in CUBE_KEYS]).sum(min_count=1)
+            # Senza popolazione valida resta la media semplice
+            result[col] = (weighted / total).fillna(result[col])
+    return result[measures].reset_index()
+
+
+def build_nil_year_cube(facts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Unisce le fact tables in un cubo wide NIL×anno.
+
+    Per ogni misura aggiunge <misura>_delta e <misura>_delta_pct, calcolati
+    rispetto all'anno precedente disponibile per lo stesso NIL. I duplicati
+    NIL×anno sono aggregati con collapse_duplicates.
+    """
+    cube = None
+    for fact in facts:
+        if fact.empty:
+            continue
+        fact = collapse_duplicates(fact.dropna(subset=CUBE_KEYS))
+        cube = fact if cube is None else cube.merge(fact, on=CUBE_KEYS, how="outer")
+
+    if cube is None:
+        return pd.DataFrame(columns=CUBE_KEYS)
+
+    cube = cube.astype({"id_nil": "int32", "id_tempo": "int16"})
+    cube = cube.sort_values(CUBE_KEYS, ignore_index=True)
+
+    measures = [c for c in cube.columns if c not in CUBE_KEYS]
+    cube[measures] = cube[measures].apply(pd.to_numeric, errors="coerce")
+
+    grouped = cube.groupby("id_nil")[measures]
+    previous = grouped.shift(1)
+    deltas = (cube[measures] - previous).add_suffix("_delta")
+    deltas_pct = ((cube[measures] / previous.where(previous != 0) - 1) * 100).add_suffix("_delta_pct")
+    return pd.concat([cube, deltas, deltas_pct], axis=1)
+
+
+def write_nil_year_cube(conn: sqlite3.Connection, cube: pd.DataFrame, output_dir: Path) -> None:
+    """Salva il cubo nel DB e, se possibile, come Parquet partizionato per anno."""
+    columns = ", ".join(f'"{c}" REAL' for c in cube.columns if c not in CUBE_KEYS)
+    conn.execute(f"DROP TABLE IF EXISTS {CUBE_TABLE}")
+    conn.execute(
+        f"""
+        CREATE TABLE {CUBE_TABLE} (
+            id_nil INTEGER NOT NULL,
+            id_tempo INTEGER NOT NULL{', ' + columns if columns else ''},
+            PRIMARY KEY (id_nil, id_tempo)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{CUBE_TABLE}_tempo ON {CUBE_TABLE}(id_tempo)")
+    cube.to_sql(CUBE_TABLE, conn, if_exists="append", index=False)
+    conn.commit()
+
+    if PYARROW_AVAILABLE and not cube.empty:
+        parquet_dir = output_dir / CUBE_TABLE
+        shutil.rmtree(parquet_dir, ignore_errors=True)
+        # Storage colonnare compatto: float32 per tutte le misure
+        value_columns = [c for c in cube.columns if c not in CUBE_KEYS]
+        compact = cube.astype({c: "float32" for c in value_columns})
+        compact.assign(anno=cube["id_tempo"]).to_parquet(
+            parquet_dir, partition_cols=["anno"], index=False, compression="zstd"
+        )
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Costruisce master dataset geo per NIL core")
     parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
@@ -48,39 +236,31 @@ def main() -> None:
 
     conn = sqlite3.connect(db_path)
 
-    dim_nil = pd.read_sql("SELECT * FROM dim_nil", conn)
-    dim_nil["geometry"] = dim_nil["geometry"].apply(parse_geometry)
-    gdf = gpd.GeoDataFrame(dim_nil, geometry="geometry", crs="EPSG:4326")
+    gdf = read_dim_nil(conn)
 
     fact_demografia = pd.read_sql("SELECT * FROM fact_demografia", conn)
     fact_immobiliare = pd.read_sql("SELECT * FROM fact_immobiliare", conn)
     fact_servizi = pd.read_sql("SELECT * FROM fact_servizi", conn)
 
-    conn.close()
+    cube = build_nil_year_cube([fact_demografia, fact_immobiliare, fact_servizi])
+    write_nil_year_cube(conn, cube, output_dir)
 
-    fact_demografia = latest_snapshot(fact_demografia)
-    fact_immobiliare = latest_snapshot(fact_immobiliare)
-    fact_servizi = latest_snapshot(fact_servizi)
+    conn.close()
 
-    if not fact_demografia.empty:
-        gdf = gdf.merge(fact_demografia, on="id_nil", how="left", suffixes=("", "_demo"))
-    if not fact_immobiliare.empty:
-        gdf = gdf.merge(fact_immobiliare, on="id_nil", how="left", suffixes=("", "_imm"))
-    if not fact_servizi.empty:
-        gdf = gdf.merge(fact_servizi, on="id_nil", how="left", suffixes=("", "_serv"))
+    gdf = join_latest_facts(gdf, [fact_demografia, fact_immobiliare, fact_servizi])
 
     geojson_path = output_dir / "master_nil_core.geojson"
     csv_path = output_dir / "master_nil_core.csv"
 
-    try:
-        gdf.to_file(geojson_path, driver="GeoJSON")
-    except Exception:
-        for col in gdf.columns:
-            if pd.api.types.is_datetime64_any_dtype(gdf[col]):
-                gdf[col] = gdf[col].astype(str)
-        gdf.to_file(geojson_path, driver="GeoJSON")
-
+    gdf.to_file(geojson_path, driver="GeoJSON")
     gdf.drop(columns=["geometry"], errors="ignore").to_csv(csv_path, index=False)
+    written = write_columnar_outputs(gdf, output_dir)
+
+    if not PYARROW_AVAILABLE:
+        print("  ⚠ pyarrow non installato: GeoParquet e Parquet del cubo non generati "
+              "(pip install -r data_pipeline/requirements.txt)")
+    for path in written:
+        print(f"  ✓ {path.name}")
 
 
 if __name__ == "__main__":
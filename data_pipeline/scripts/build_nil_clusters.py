@@ -0,0 +1,677 @@
+#!/usr/bin/env python3
+"""
+Clustering dei NIL sulla matrice NIL x indicatori dello star schema.
+
+Popola nil_clusters e cluster_definizioni (schema di server migration 002)
+senza dipendere dal DB esterno:
+- standardizzazione z-score vettoriale, valori mancanti alla media
+- k-means (k-means++ con seed fisso, n_init ripartenze) o gerarchico Ward
+- centroidi in cluster_centroidi, silhouette in cluster_statistiche
+- gli id cluster restano stabili tra le esecuzioni (massima sovrapposizione
+  con l'assegnazione precedente), così nomi e colori non si scambiano;
+  i cluster nuovi prendono un nome neutro dal profilo del centroide
+- hash di matrice + configurazione: se i fatti non cambiano non ricalcola
+
+Parametri in config/clustering.json.
+
+Uso:
+    python build_nil_clusters.py [--db PATH] [--config PATH] [--force]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+import warnings
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils import CONFIG_DIR
+
+# Paths
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CLUSTERING_CONFIG_PATH = CONFIG_DIR / "clustering.json"
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not DB_PATH.is_absolute():
+    DB_PATH = PROJECT_ROOT / DB_PATH
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Costanti
+# ─────────────────────────────────────────────────────────────────────────────
+
+CLUSTERS_TABLE = "nil_clusters"
+DEFINITIONS_TABLE = "cluster_definizioni"
+CENTROIDS_TABLE = "cluster_centroidi"
+STATS_TABLE = "cluster_statistiche"
+CACHE_TABLE = "_nil_clusters_cache"
+
+METHODS = ("kmeans", "ward")
+
+# Indicatori per NIL dall'ultimo anno di fact_demografia e da fact_servizi.
+# Più righe per lo stesso NIL nell'anno vengono aggregate come in
+# build_master_geo.collapse_duplicates: conteggi e densità sommati (stessa
+# area), pct_stranieri pesata sulla popolazione o, in mancanza, media semplice.
+FEATURES_SQL = """
+SELECT
+    dn.id_nil,
+    dn.nil,
+    fd.densita_abitanti_km2,
+    fd.pct_stranieri,
+    fd.popolazione_totale,
+    fd.famiglie_unipersonali,
+    fd.saldo_totale,
+    fs.indice_verde_medio,
+    fs.numero_scuole,
+    fs.numero_mercati
+FROM dim_nil dn
+LEFT JOIN (
+    SELECT id_nil,
+           SUM(densita_abitanti_km2) AS densita_abitanti_km2,
+           COALESCE(
+               SUM(pct_stranieri * popolazione_totale)
+                   / SUM(CASE WHEN pct_stranieri IS NOT NULL AND popolazione_totale > 0
+                              THEN popolazione_totale END),
+               AVG(pct_stranieri)
+           ) AS pct_stranieri,
+           SUM(popolazione_totale) AS popolazione_totale,
+           SUM(famiglie_unipersonali_registrate_in_anagrafe) AS famiglie_unipersonali,
+           SUM(nati_vivi - morti + immigrati - emigrati) AS saldo_totale
+    FROM fact_demografia
+    WHERE id_tempo = (SELECT MAX(id_tempo) FROM fact_demografia)
+    GROUP BY id_nil
+) fd ON dn.id_nil = fd.id_nil
+LEFT JOIN (
+    -- fact_servizi ha una riga per anno con colonne complementari (outer merge)
+    SELECT id_nil,
+           MAX(indice_verde_medio) AS indice_verde_medio,
+           MAX(numero_scuole) AS numero_scuole,
+           MAX(numero_mercati) AS numero_mercati
+    FROM fact_servizi GROUP BY id_nil
+) fs ON dn.id_nil = fs.id_nil
+ORDER BY dn.id_nil
+"""
+
+FEATURE_COLUMNS = (
+    "densita_abitanti_km2",
+    "pct_stranieri",
+    "popolazione_totale",
+    "famiglie_unipersonali",
+    "saldo_totale",
+    "indice_verde_medio",
+    "numero_scuole",
+    "numero_mercati",
+)
+
+# Colonne di nil_clusters copiate dalla matrice (schema migration 002)
+CLUSTER_FEATURE_COLUMNS = (
+    "densita_abitanti_km2",
+    "pct_stranieri",
+    "indice_verde_medio",
+    "famiglie_unipersonali",
+    "saldo_totale",
+)
+
+# Etichette degli indicatori per i nomi dei cluster derivati dal centroide
+FEATURE_LABELS = {
+    "densita_abitanti_km2": "densità",
+    "pct_stranieri": "stranieri",
+    "popolazione_totale": "popolazione",
+    "famiglie_unipersonali": "famiglie unipersonali",
+    "saldo_totale": "saldo demografico",
+    "indice_verde_medio": "verde",
+    "numero_scuole": "scuole",
+    "numero_mercati": "mercati",
+}
+
+# Indicatori (per |z| del centroide) che compaiono nel nome del cluster
+NAME_FEATURES = 2
+
+# Colori per cluster senza definizione (oltre i 4 della migration)
+FALLBACK_COLORS = ("#607D8B", "#795548", "#009688", "#E91E63", "#CDDC39", "#3F51B5")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Configurazione
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class ClusteringConfig:
+    """Parametri del clustering NIL."""
+    method: str = "kmeans"
+    k: int = 4
+    seed: int = 42
+    n_init: int = 10
+    max_iter: int = 300
+    features: List[str] = field(default_factory=lambda: list(CLUSTER_FEATURE_COLUMNS))
+
+
+def load_clustering_config(config_path: Optional[Path] = None) -> ClusteringConfig:
+    """Carica i parametri del clustering (default se il file non esiste)."""
+    config_path = config_path or CLUSTERING_CONFIG_PATH
+
+    if not config_path.exists():
+        return ClusteringConfig()
+
+    with config_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if not isinstance(data, dict):
+        raise ValueError(f"Configurazione clustering non valida: atteso un oggetto JSON in {config_path}")
+    allowed = [f.name for f in fields(ClusteringConfig)]
+    unknown_keys = set(data) - set(allowed)
+    if unknown_keys:
+        raise ValueError(f"Parametri di clustering sconosciuti: {sorted(unknown_keys)} (ammessi: {allowed})")
+    config = ClusteringConfig(**data)
+    if config.method not in METHODS:
+        raise ValueError(f"Metodo di clustering non supportato: {config.method} (attesi: {METHODS})")
+    unknown = set(config.features) - set(FEATURE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Indicatori non disponibili: {sorted(unknown)} (disponibili: {FEATURE_COLUMNS})")
+    if config.k < 2:
+        raise ValueError("Servono almeno 2 cluster")
+    return config
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Algoritmi
+# ─────────────────────────────────────────────────────────────────────────────
+
+def standardize(matrix: np.ndarray) -> np.ndarray:
+    """z-score per colonna; valori mancanti alla media (0), colonne costanti a 0."""
+    mean = np.nanmean(matrix, axis=0)
+    std = np.nanstd(matrix, axis=0)
+    std[~(std > 0)] = 1.0
+    scaled = (matrix - mean) / std
+    return np.where(np.isnan(scaled), 0.0, scaled)
+
+
+def squared_distances(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Distanze euclidee al quadrato, matrice punti x centri."""
+    diff = points[:, None, :] - centers[None, :, :]
+    return np.einsum("ijk,ijk->ij", diff, diff)
+
+
+def kmeans_plus_plus(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Inizializzazione k-means++."""
+    centers = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        d2 = squared_distances(points, np.array(centers)).min(axis=1)
+        total = d2.sum()
+        probs = d2 / total if total > 0 else np.full(len(points), 1 / len(points))
+        centers.append(points[rng.choice(len(points), p=probs)])
+    return np.array(centers)
+
+
+def fill_empty_clusters(points: np.ndarray, labels: np.ndarray, centers: np.ndarray) -> None:
+    """
+    Assegna a ogni cluster vuoto il punto più lontano dal proprio centro, preso
+    da un cluster con almeno due elementi (in place su labels e centers).
+
+    Con punti coincidenti Lloyd può convergere lasciando un cluster vuoto,
+    con centro e inerzia non definiti.
+    """
+    k = len(centers)
+    for j in range(k):
+        if np.any(labels == j):
+            continue
+        counts = np.bincount(labels, minlength=k)
+        d2 = squared_distances(points, centers)[np.arange(len(points)), labels]
+        d2[counts[labels] < 2] = -1.0
+        far = int(d2.argmax())
+        source = labels[far]
+        labels[far] = j
+        centers[j] = points[far]
+        centers[source] = points[labels == source].mean(axis=0)
+
+
+def kmeans(
+    points: np.ndarray, k: int, seed: int, n_init: int = 10, max_iter: int = 300
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    k-means di Lloyd con k-means++ e n_init ripartenze deterministiche.
+
+    Returns:
+        (etichette, centroidi, inerzia) della ripartenza migliore
+    """
+    rng = np.random.default_rng(seed)
+    best: Optional[Tuple[np.ndarray, np.ndarray, float]] = None
+    for _ in range(n_init):
+        centers = kmeans_plus_plus(points, k, rng)
+        labels = np.full(len(points), -1)
+        for _ in range(max_iter):
+            new_labels = squared_distances(points, centers).argmin(axis=1)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            for j in range(k):
+                members = points[labels == j]
+                # Cluster vuoto: riparte dal punto più lontano dal suo centro
+                if len(members):
+                    centers[j] = members.mean(axis=0)
+                else:
+                    far = squared_distances(points, centers).min(axis=1).argmax()
+                    centers[j] = points[far]
+        fill_empty_clusters(points, labels, centers)
+        inertia = float(squared_distances(points, centers)[np.arange(len(points)), labels].sum())
+        if best is None or inertia < best[2]:
+            best = (labels, centers.copy(), inertia)
+    return best
+
+
+def ward(points: np.ndarray, k: int) -> np.ndarray:
+    """
+    Clustering gerarchico agglomerativo di Ward fino a k cluster.
+
+    Aggiornamento delle distanze con Lance-Williams sulla matrice n x n.
+
+    Returns:
+        Etichette per punto
+    """
+    n = len(points)
+    sizes = np.ones(n)
+    dist = squared_distances(points, points)
+    np.fill_diagonal(dist, np.inf)
+    active = np.ones(n, dtype=bool)
+    labels = np.arange(n)
+
+    for _ in range(n - k):
+        masked = np.where(active[:, None] & active[None, :], dist, np.inf)
+        i, j = np.unravel_index(np.argmin(masked), masked.shape)
+        i, j = min(i, j), max(i, j)
+        si, sj, s = sizes[i], sizes[j], sizes
+        merged = ((si + s) * dist[i] + (sj + s) * dist[j] - s * dist[i, j]) / (si + sj + s)
+        dist[i, :] = merged
+        dist[:, i] = merged
+        dist[i, i] = np.inf
+        sizes[i] = si + sj
+        active[j] = False
+        labels[labels == j] = i
+
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels
+
+
+def silhouette_samples(points: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Silhouette per punto (0 per i cluster con un solo elemento)."""
+    dist = np.sqrt(squared_distances(points, points))
+    clusters = np.unique(labels)
+    # Distanza media da ogni cluster, matrice punti x cluster
+    onehot = (labels[:, None] == clusters[None, :]).astype(float)
+    counts = onehot.sum(axis=0)
+    sums = dist @ onehot
+
+    own = np.searchsorted(clusters, labels)
+    own_counts = counts[own]
+    a = np.where(own_counts > 1, sums[np.arange(len(points)), own] / np.maximum(own_counts - 1, 1), 0.0)
+    means = sums / counts
+    means[np.arange(len(points)), own] = np.inf
+    b = means.min(axis=1)
+    s = (b - a) / np.maximum(a, b)
+    return np.where(own_counts > 1, s, 0.0)
+
+
+def align_labels(labels: np.ndarray, previous: np.ndarray, k: int) -> np.ndarray:
+    """
+    Rinumera i cluster per massimizzare la sovrapposizione con l'assegnazione precedente.
+
+    Senza assegnazione precedente i cluster sono ordinati per dimensione decrescente.
+    """
+    known = (previous >= 0) & (previous < k)
+    if not known.any():
+        order = sorted(range(k), key=lambda c: (-np.sum(labels == c), c))
+        mapping = {old: new for new, old in enumerate(order)}
+    else:
+        overlap = np.zeros((k, k), dtype=int)
+        np.add.at(overlap, (labels[known], previous[known]), 1)
+        if k <= 8:
+            best = max(
+                itertools.permutations(range(k)),
+                key=lambda perm: overlap[np.arange(k), list(perm)].sum(),
+            )
+            mapping = dict(enumerate(best))
+        else:
+            mapping = {}
+            for old, new in sorted(np.ndindex(overlap.shape), key=lambda ij: -overlap[ij]):
+                if old not in mapping and new not in mapping.values():
+                    mapping[old] = new
+    return np.array([mapping[label] for label in labels])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Persistenza
+# ─────────────────────────────────────────────────────────────────────────────
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    """Crea le tabelle dei cluster se non esistono."""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CLUSTERS_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nil TEXT NOT NULL,
+            densita_abitanti_km2 REAL,
+            pct_stranieri REAL,
+            indice_verde_medio REAL,
+            famiglie_unipersonali INTEGER,
+            saldo_totale INTEGER,
+            cluster_id INTEGER NOT NULL,
+            cluster_nome TEXT,
+            data_aggiornamento TEXT DEFAULT (datetime('now')),
+            UNIQUE(nil)
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DEFINITIONS_TABLE} (
+            cluster_id INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            descrizione TEXT,
+            colore TEXT
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CENTROIDS_TABLE} (
+            cluster_id INTEGER NOT NULL,
+            indicatore TEXT NOT NULL,
+            valore REAL,
+            valore_std REAL,
+            PRIMARY KEY (cluster_id, indicatore)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+            cluster_id INTEGER PRIMARY KEY,
+            num_nil INTEGER,
+            silhouette_media REAL,
+            inerzia REAL
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+            name TEXT PRIMARY KEY,
+            input_hash TEXT NOT NULL,
+            method TEXT,
+            k INTEGER,
+            silhouette REAL,
+            inertia REAL,
+            updated_at TEXT
+        )
+        """
+    )
+
+
+def load_features(conn: sqlite3.Connection, features: List[str]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Matrice NIL x indicatori dallo star schema.
+
+    Returns:
+        (id_nil, nomi NIL, matrice float con NaN per i valori mancanti)
+    """
+    cursor = conn.execute(FEATURES_SQL)
+    columns = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    names = [r[1] for r in rows]
+    positions = [columns.index(f) for f in features]
+    matrix = np.array([[r[p] for p in positions] for r in rows], dtype=float).reshape(len(rows), len(features))
+    return ids, names, matrix
+
+
+def input_hash(ids: np.ndarray, names: List[str], matrix: np.ndarray, config: ClusteringConfig) -> str:
+    """Hash di matrice, nomi NIL e configurazione."""
+    digest = hashlib.sha256(json.dumps(asdict(config), sort_keys=True).encode("utf-8"))
+    digest.update(ids.tobytes())
+    digest.update("\n".join(str(n) for n in names).encode("utf-8"))
+    digest.update(np.ascontiguousarray(matrix).tobytes())
+    return digest.hexdigest()
+
+
+def previous_labels(conn: sqlite3.Connection, names: List[str]) -> np.ndarray:
+    """Assegnazione corrente di nil_clusters per nome NIL (-1 se assente)."""
+    current = dict(conn.execute(f"SELECT nil, cluster_id FROM {CLUSTERS_TABLE}").fetchall())
+    return np.array([current.get(name, -1) for name in names], dtype=int)
+
+
+def describe_centroid(cluster_id: int, features: List[str], std_centroid: np.ndarray) -> Tuple[str, str]:
+    """
+    Nome e descrizione neutri dal profilo standardizzato del centroide.
+
+    Il nome riporta gli NAME_FEATURES indicatori più lontani dalla media
+    (es. "Cluster 2: densità ↑, verde ↓"), la descrizione tutti gli z-score.
+    """
+    order = np.argsort(-np.abs(std_centroid), kind="stable")[:NAME_FEATURES]
+    nome = f"Cluster {cluster_id}: " + ", ".join(
+        f"{FEATURE_LABELS.get(features[i], features[i])} {'↑' if std_centroid[i] >= 0 else '↓'}" for i in order
+    )
+    descrizione = "Profilo del centroide (z-score): " + ", ".join(
+        f"{FEATURE_LABELS.get(f, f)} {z:+.2f}" for f, z in zip(features, std_centroid)
+    )
+    return nome, descrizione
+
+
+def write_clusters(
+    conn: sqlite3.Connection,
+    names: List[str],
+    raw: np.ndarray,
+    features: List[str],
+    labels: np.ndarray,
+    scaled: np.ndarray,
+    silhouette: np.ndarray,
+    k: int,
+    relabel: Optional[List[int]] = None,
+) -> None:
+    """
+    Scrive assegnazioni, definizioni, centroidi e statistiche per k cluster.
+
+    I cluster in relabel (senza NIL nell'assegnazione precedente, es. al primo
+    run) ricevono nome e descrizione da describe_centroid: gli id seguono la
+    dimensione dei cluster, non il significato delle definizioni esistenti
+    (migration 002), che altrimenti etichetterebbero cluster arbitrari.
+
+    Le definizioni oltre k (run precedenti con più cluster) vengono rimosse,
+    così vw_cluster_stats non mostra cluster senza NIL. Tutte le scritture
+    stanno in un SAVEPOINT: se una fallisce resta l'assegnazione precedente.
+    """
+    conn.execute("SAVEPOINT write_clusters")
+    try:
+        _write_clusters(conn, names, raw, features, labels, scaled, silhouette, k, relabel or [])
+    except BaseException:
+        conn.execute("ROLLBACK TO write_clusters")
+        conn.execute("RELEASE write_clusters")
+        raise
+    conn.execute("RELEASE write_clusters")
+
+
+def _write_clusters(
+    conn: sqlite3.Connection,
+    names: List[str],
+    raw: np.ndarray,
+    features: List[str],
+    labels: np.ndarray,
+    scaled: np.ndarray,
+    silhouette: np.ndarray,
+    k: int,
+    relabel: List[int],
+) -> None:
+    conn.execute(f"DELETE FROM {DEFINITIONS_TABLE} WHERE cluster_id >= ?", (k,))
+    for cluster_id in range(k):
+        conn.execute(
+            f"INSERT OR IGNORE INTO {DEFINITIONS_TABLE} (cluster_id, nome, descrizione, colore) VALUES (?, ?, ?, ?)",
+            (cluster_id, f"Cluster {cluster_id}", None, FALLBACK_COLORS[cluster_id % len(FALLBACK_COLORS)]),
+        )
+    for cluster_id in relabel:
+        members = labels == cluster_id
+        if members.any():
+            conn.execute(
+                f"UPDATE {DEFINITIONS_TABLE} SET nome = ?, descrizione = ? WHERE cluster_id = ?",
+                (*describe_centroid(cluster_id, features, scaled[members].mean(axis=0)), cluster_id),
+            )
+    definitions = dict(conn.execute(f"SELECT cluster_id, nome FROM {DEFINITIONS_TABLE}").fetchall())
+
+    def value(row: int, column: str) -> Optional[float]:
+        if column not in features:
+            return None
+        v = raw[row, features.index(column)]
+        return None if np.isnan(v) else float(v)
+
+    conn.execute(f"DELETE FROM {CLUSTERS_TABLE}")
+    conn.executemany(
+        f"""
+        INSERT INTO {CLUSTERS_TABLE} (nil, {", ".join(CLUSTER_FEATURE_COLUMNS)}, cluster_id, cluster_nome)
+        VALUES (?, {", ".join("?" for _ in CLUSTER_FEATURE_COLUMNS)}, ?, ?)
+        """,
+        [
+            [name] + [value(i, c) for c in CLUSTER_FEATURE_COLUMNS] + [int(labels[i]), definitions[int(labels[i])]]
+            for i, name in enumerate(names)
+        ],
+    )
+
+    conn.execute(f"DELETE FROM {CENTROIDS_TABLE}")
+    conn.execute(f"DELETE FROM {STATS_TABLE}")
+    for cluster_id in range(k):
+        members = labels == cluster_id
+        if not members.any():
+            # Cluster vuoto: nessun centroide, statistiche a zero
+            conn.execute(
+                f"INSERT INTO {STATS_TABLE} (cluster_id, num_nil, silhouette_media, inerzia) VALUES (?, 0, NULL, 0)",
+                (cluster_id,),
+            )
+            continue
+        with warnings.catch_warnings():
+            # Indicatori tutti mancanti nel cluster: centroide NULL
+            warnings.simplefilter("ignore", RuntimeWarning)
+            raw_centroid = np.nanmean(raw[members], axis=0)
+        std_centroid = scaled[members].mean(axis=0)
+        conn.executemany(
+            f"INSERT INTO {CENTROIDS_TABLE} (cluster_id, indicatore, valore, valore_std) VALUES (?, ?, ?, ?)",
+            [
+                (cluster_id, f, None if np.isnan(rv) else float(rv), float(sv))
+                for f, rv, sv in zip(features, raw_centroid, std_centroid)
+            ],
+        )
+        inertia = float(((scaled[members] - std_centroid) ** 2).sum())
+        conn.execute(
+            f"INSERT INTO {STATS_TABLE} (cluster_id, num_nil, silhouette_media, inerzia) VALUES (?, ?, ?, ?)",
+            (cluster_id, int(members.sum()), float(silhouette[members].mean()), inertia),
+        )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stage
+# ─────────────────────────────────────────────────────────────────────────────
+
+def build_nil_clusters(
+    conn: sqlite3.Connection,
+    config: Optional[ClusteringConfig] = None,
+    force: bool = False,
+) -> Dict[str, object]:
+    """
+    Calcola i cluster NIL e aggiorna le tabelle (no-op se input invariato).
+
+    Args:
+        conn: Connessione al DB con lo star schema
+        config: Parametri (default: config/clustering.json)
+        force: Ricalcola anche se l'hash di input non è cambiato
+
+    Returns:
+        Statistiche: status (updated/cached/skipped), n_nil, k, silhouette, inertia, elapsed
+    """
+    start = time.perf_counter()
+    config = config or load_clustering_config()
+    ensure_tables(conn)
+
+    ids, names, raw = load_features(conn, config.features)
+    if len(ids) <= config.k:
+        return {"status": "skipped", "reason": f"{len(ids)} NIL per {config.k} cluster"}
+
+    digest = input_hash(ids, names, raw, config)
+    cached = conn.execute(
+        f"SELECT input_hash, silhouette, inertia FROM {CACHE_TABLE} WHERE name = ?", (CLUSTERS_TABLE,)
+    ).fetchone()
+    if not force and cached and cached[0] == digest:
+        return {
+            "status": "cached", "n_nil": len(ids), "k": config.k,
+            "silhouette": cached[1], "inertia": cached[2],
+            "elapsed": time.perf_counter() - start,
+        }
+
+    scaled = standardize(raw)
+    if config.method == "kmeans":
+        labels, _, _ = kmeans(scaled, config.k, config.seed, config.n_init, config.max_iter)
+    else:
+        labels = ward(scaled, config.k)
+    previous = previous_labels(conn, names)
+    labels = align_labels(labels, previous, config.k)
+    # Cluster senza NIL nell'assegnazione precedente: nome dal centroide
+    relabel = sorted(set(range(config.k)) - set(previous[previous >= 0].tolist()))
+
+    silhouette = silhouette_samples(scaled, labels)
+    # Somma per cluster presente: un cluster vuoto non ha centro
+    inertia = float(sum(
+        ((scaled[labels == c] - scaled[labels == c].mean(axis=0)) ** 2).sum()
+        for c in np.unique(labels)
+    ))
+
+    write_clusters(conn, names, raw, config.features, labels, scaled, silhouette, config.k, relabel)
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO {CACHE_TABLE} (name, input_hash, method, k, silhouette, inertia, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (CLUSTERS_TABLE, digest, config.method, config.k, float(silhouette.mean()), inertia,
+         datetime.now().isoformat()),
+    )
+
+    return {
+        "status": "updated",
+        "n_nil": len(ids),
+        "k": config.k,
+        "silhouette": float(silhouette.mean()),
+        "inertia": inertia,
+        "sizes": np.bincount(labels, minlength=config.k).tolist(),
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Clustering dei NIL sugli indicatori dello star schema")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--config", type=str, default=str(CLUSTERING_CONFIG_PATH), help="Parametri clustering")
+    parser.add_argument("--force", action="store_true", help="Ricalcola anche se i dati non sono cambiati")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    stats = build_nil_clusters(conn, load_clustering_config(Path(args.config)), args.force)
+    conn.commit()
+    conn.close()
+
+    if stats["status"] == "skipped":
+        print(f"  ⚠ Clustering saltato: {stats['reason']}")
+        return
+    label = "invariati" if stats["status"] == "cached" else "aggiornati"
+    print(f"  ✓ {CLUSTERS_TABLE} {label}: {stats['n_nil']} NIL in {stats['k']} cluster, "
+          f"silhouette {stats['silhouette']:.3f} ({stats['elapsed']:.2f}s)")
+    if "sizes" in stats:
+        print(f"  ✓ NIL per cluster: {stats['sizes']}")
+
+
+if __name__ == "__main__":
+    main()
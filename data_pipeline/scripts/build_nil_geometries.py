@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Precalcola geometrie NIL semplificate a più livelli di dettaglio (dim_nil_geometry).
+
+dim_nil.geometry contiene i confini a piena risoluzione. Per le viste mappa
+a scala cittadina servono molti meno vertici: per ogni livello le geometrie
+vengono semplificate preservando la topologia condivisa fra NIL adiacenti
+(niente buchi o sovrapposizioni sui confini) e le coordinate vengono
+quantizzate su una griglia regolare. Senza coverage_simplify (shapely < 2.1)
+o con confini sorgente non combacianti la semplificazione è per geometria
+e i confini condivisi non sono garantiti (vedi simplify_coverage).
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import MultiPolygon, Polygon
+from shapely.geometry.base import BaseGeometry
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Livelli di dettaglio
+# ─────────────────────────────────────────────────────────────────────────────
+
+# livello -> (tolleranza semplificazione, passo griglia), in gradi WGS84.
+# A Milano 0.0001° ≈ 8 m in longitudine e 11 m in latitudine.
+LEVELS: Dict[str, Tuple[float, float]] = {
+    "low": (0.0005, 0.0001),       # vista città
+    "medium": (0.0001, 0.00001),   # vista municipio
+    "high": (0.00002, 0.000001),   # vista quartiere
+}
+
+TABLE = "dim_nil_geometry"
+
+# Type id shapely di Polygon e MultiPolygon
+POLYGONAL_TYPES = (3, 6)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Parti poligonali
+# ─────────────────────────────────────────────────────────────────────────────
+
+def polygon_parts(geometry: BaseGeometry) -> List[Polygon]:
+    """Poligoni contenuti in una geometria, anche dentro collezioni annidate."""
+    if isinstance(geometry, Polygon):
+        return [geometry]
+    return [p for part in getattr(geometry, "geoms", []) for p in polygon_parts(part)]
+
+
+def polygonal(geometries: np.ndarray) -> np.ndarray:
+    """
+    Riduce ogni geometria alla sua parte poligonale.
+
+    make_valid e set_precision possono restituire GeometryCollection con
+    linee o punti residui (confini degeneri, spicchi collassati sulla
+    griglia): restano solo i poligoni, come Polygon o MultiPolygon.
+    Senza poligoni il risultato è un Polygon vuoto.
+    """
+    geometries = np.array(geometries, dtype=object)
+    other = ~np.isin(shapely.get_type_id(geometries), POLYGONAL_TYPES) & ~shapely.is_missing(geometries)
+    for i in np.flatnonzero(other):
+        parts = [p for p in polygon_parts(geometries[i]) if not p.is_empty]
+        if not parts:
+            geometries[i] = Polygon()
+        else:
+            geometries[i] = parts[0] if len(parts) == 1 else MultiPolygon(parts)
+    return geometries
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Semplificazione
+# ─────────────────────────────────────────────────────────────────────────────
+
+def simplify_coverage(geometries: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Semplifica un insieme di poligoni adiacenti.
+
+    Con shapely >= 2.1 usa coverage_simplify, che semplifica una sola volta
+    ogni confine condiviso. Altrimenti (o se i confini sorgente non combaciano)
+    ripiega su simplify per geometria, che NON preserva i confini condivisi:
+    fra NIL adiacenti possono comparire piccoli buchi o sovrapposizioni.
+    Il ripiego viene segnalato con un avviso.
+    """
+    if not hasattr(shapely, "coverage_simplify"):
+        reason = f"shapely {shapely.__version__} senza coverage_simplify (serve >= 2.1)"
+    elif not shapely.coverage_is_valid(geometries):
+        reason = "confini sorgente non combacianti"
+    else:
+        return shapely.coverage_simplify(geometries, tolerance, simplify_boundary=True)
+    print(f"  ⚠ Semplificazione per geometria ({reason}): confini condivisi non preservati")
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+def build_level(geometries: np.ndarray, tolerance: float, grid_size: float) -> np.ndarray:
+    """Semplifica e quantizza le geometrie di un livello, mantenendo solo i poligoni."""
+    simplified = simplify_coverage(polygonal(geometries), tolerance)
+    quantized = polygonal(shapely.set_precision(simplified, grid_size))
+    # Poligoni troppo piccoli per la griglia: mantieni la versione non quantizzata
+    empty = shapely.is_empty(quantized)
+    quantized[empty] = simplified[empty]
+    return quantized
+
+
+def build_dim_nil_geometry(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Costruisce dim_nil_geometry da dim_nil.
+
+    Returns:
+        DataFrame con statistiche vertici per livello
+    """
+    df = pd.read_sql("SELECT id_nil, geometry FROM dim_nil WHERE geometry IS NOT NULL", conn)
+    geometries = shapely.from_geojson(df["geometry"].astype(str).to_numpy(), on_invalid="ignore")
+    valid = ~shapely.is_missing(geometries)
+    ids = df.loc[valid, "id_nil"].astype(int).to_numpy()
+    geometries = polygonal(shapely.make_valid(geometries[valid]))
+
+    conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    conn.execute(
+        f"""
+        CREATE TABLE {TABLE} (
+            id_nil INTEGER NOT NULL,
+            level TEXT NOT NULL,
+            geom TEXT NOT NULL,
+            PRIMARY KEY (level, id_nil)
+        )
+        """
+    )
+
+    stats = [{
+        "level": "full",
+        "vertici": int(shapely.get_num_coordinates(geometries).sum()),
+        "bytes": int(df.loc[valid, "geometry"].str.len().sum()),
+    }]
+    for level, (tolerance, grid_size) in LEVELS.items():
+        simplified = build_level(geometries, tolerance, grid_size)
+        geojson = shapely.to_geojson(simplified)
+        conn.executemany(
+            f"INSERT INTO {TABLE} (id_nil, level, geom) VALUES (?, ?, ?)",
+            zip(ids.tolist(), [level] * len(ids), geojson.tolist()),
+        )
+        stats.append({
+            "level": level,
+            "vertici": int(shapely.get_num_coordinates(simplified).sum()),
+            "bytes": int(sum(len(g) for g in geojson)),
+        })
+
+    return pd.DataFrame(stats)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precalcola geometrie NIL semplificate (dim_nil_geometry)")
+    parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parent.parent
+    db_path = project_root / args.db
+
+    conn = sqlite3.connect(db_path)
+    stats = build_dim_nil_geometry(conn)
+    conn.commit()
+    conn.close()
+
+    full = stats.iloc[0]
+    for _, row in stats.iterrows():
+        ratio = row["vertici"] / full["vertici"] * 100 if full["vertici"] else 0
+        print(f"  ✓ {row['level']:<7} {row['vertici']:>8,} vertici ({ratio:5.1f}%)  {row['bytes'] / 1024:8.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
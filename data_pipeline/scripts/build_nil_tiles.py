@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Genera una piramide di vector tile (MVT) dei NIL, zoom 10–16.
+
+Le geometrie di dim_nil (semplificate per livello da dim_nil_geometry, se
+presente) vengono unite agli indicatori dell'ultimo anno e tagliate in tile
+Web Mercator. L'output è una directory {z}/{x}/{y}.pbf oppure un file
+MBTiles; le tile vengono generate in parallelo su più processi.
+
+Richiede mapbox-vector-tile (pip install mapbox-vector-tile).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import math
+import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from build_master_geo import join_latest_facts, read_dim_nil
+
+try:
+    import mapbox_vector_tile
+    MVT_AVAILABLE = True
+except ImportError:
+    MVT_AVAILABLE = False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Costanti
+# ─────────────────────────────────────────────────────────────────────────────
+
+LAYER_NAME = "nil"
+MIN_ZOOM = 10
+MAX_ZOOM = 16
+
+# Risoluzione interna della tile e margine per evitare artefatti ai bordi
+EXTENT = 4096
+BUFFER = 64
+
+# Livello di dim_nil_geometry usato per ogni zoom (build_nil_geometries.py)
+ZOOM_LEVELS: Dict[int, str] = {10: "low", 11: "low", 12: "medium", 13: "medium"}
+DEFAULT_LEVEL = "high"
+
+# Colonne di servizio escluse dalle proprietà delle feature
+EXCLUDED_PROPERTIES = {"geometry", "nil_norm", "shape_area", "shape_length"}
+
+WEB_MERCATOR_HALF = 20037508.342789244
+
+TileKey = Tuple[int, int, int]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Geometria tile
+# ─────────────────────────────────────────────────────────────────────────────
+
+def to_web_mercator(geometries: np.ndarray) -> np.ndarray:
+    """Proietta geometrie WGS84 in Web Mercator (EPSG:3857)."""
+    def project(coords: np.ndarray) -> np.ndarray:
+        lon = np.radians(coords[:, 0])
+        lat = np.radians(np.clip(coords[:, 1], -85.0511, 85.0511))
+        x = lon * 6378137.0
+        y = np.log(np.tan(np.pi / 4 + lat / 2)) * 6378137.0
+        return np.column_stack([x, y])
+
+    return shapely.transform(geometries, project)
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Bounds Web Mercator della tile XYZ (y dall'alto)."""
+    size = 2 * WEB_MERCATOR_HALF / (1 << z)
+    min_x = -WEB_MERCATOR_HALF + x * size
+    max_y = WEB_MERCATOR_HALF - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def tiles_for_bounds(bounds: Sequence[float], z: int) -> Iterator[TileKey]:
+    """Tile XYZ che coprono un bbox WGS84."""
+    lon_min, lat_min, lon_max, lat_max = bounds
+    n = 1 << z
+
+    def tile_x(lon: float) -> int:
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def tile_y(lat: float) -> int:
+        lat_rad = math.radians(lat)
+        value = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+        return min(n - 1, max(0, int(value)))
+
+    for x in range(tile_x(lon_min), tile_x(lon_max) + 1):
+        for y in range(tile_y(lat_max), tile_y(lat_min) + 1):
+            yield z, x, y
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Feature
+# ─────────────────────────────────────────────────────────────────────────────
+
+def feature_properties(gdf: pd.DataFrame) -> List[Dict[str, object]]:
+    """Proprietà scalari per feature, senza valori mancanti (non codificabili in MVT)."""
+    columns = [c for c in gdf.columns if c not in EXCLUDED_PROPERTIES]
+    records = []
+    for row in gdf[columns].to_dict(orient="records"):
+        props = {}
+        for key, value in row.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            if isinstance(value, (np.integer, np.floating)):
+                value = value.item()
+            props[key] = value
+        records.append(props)
+    return records
+
+
+def field_types(props: Sequence[Dict[str, object]]) -> Dict[str, str]:
+    """Tipo TileJSON per proprietà (Number, Boolean, String se misto o testuale)."""
+    seen: Dict[str, set] = {}
+    for record in props:
+        for key, value in record.items():
+            if isinstance(value, bool):
+                kind = "Boolean"
+            elif isinstance(value, (int, float)):
+                kind = "Number"
+            else:
+                kind = "String"
+            seen.setdefault(key, set()).add(kind)
+    return {key: kinds.pop() if len(kinds) == 1 else "String" for key, kinds in sorted(seen.items())}
+
+
+def load_level_geometries(conn: sqlite3.Connection, ids: np.ndarray, full: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Geometrie semplificate per livello, allineate a ids; vuoto se la tabella manca.
+
+    I NIL senza geometria (o con GeoJSON non valido) in un livello usano la
+    geometria completa, così non spariscono dalle tile di quello zoom.
+    """
+    try:
+        df = pd.read_sql("SELECT id_nil, level, geom FROM dim_nil_geometry", conn)
+    except Exception:
+        return {}
+
+    levels = {}
+    for level, group in df.groupby("level"):
+        geoms = pd.Series(
+            shapely.from_geojson(group["geom"].to_numpy(), on_invalid="ignore"),
+            index=group["id_nil"].astype(int).to_numpy(),
+        )
+        geoms = geoms.reindex(ids).to_numpy(dtype=object, copy=True)
+        missing = np.array([not isinstance(g, shapely.Geometry) for g in geoms], dtype=bool)
+        geoms[missing] = full[missing]
+        levels[level] = geoms
+    return levels
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker
+# ─────────────────────────────────────────────────────────────────────────────
+
+_WORKER_LAYERS: Dict[str, Tuple[np.ndarray, STRtree]] = {}
+_WORKER_IDS: Optional[np.ndarray] = None
+_WORKER_PROPS: List[Dict[str, object]] = []
+
+
+def _init_worker(level_wkb: Dict[str, List[Optional[bytes]]], ids: List[int], props: List[Dict[str, object]]) -> None:
+    """Ricostruisce geometrie e indici spaziali una volta per processo."""
+    global _WORKER_IDS, _WORKER_PROPS
+    _WORKER_LAYERS.clear()
+    for level, wkb in level_wkb.items():
+        geoms = shapely.from_wkb(np.array(wkb, dtype=object))
+        _WORKER_LAYERS[level] = (geoms, STRtree(geoms))
+    _WORKER_IDS = np.asarray(ids)
+    _WORKER_PROPS = props
+
+
+def render_tile(key: TileKey) -> Tuple[TileKey, Optional[bytes]]:
+    """Codifica una tile MVT; None se la tile non contiene NIL."""
+    z, x, y = key
+    geoms, tree = _WORKER_LAYERS.get(ZOOM_LEVELS.get(z, DEFAULT_LEVEL)) or _WORKER_LAYERS["full"]
+
+    bounds = tile_bounds(z, x, y)
+    margin = (bounds[2] - bounds[0]) * BUFFER / EXTENT
+    clip_box = (bounds[0] - margin, bounds[1] - margin, bounds[2] + margin, bounds[3] + margin)
+
+    candidates = tree.query(shapely.box(*clip_box), predicate="intersects")
+    if len(candidates) == 0:
+        return key, None
+
+    clipped = shapely.clip_by_rect(geoms[candidates], *clip_box)
+    features = [
+        {"geometry": geom, "properties": _WORKER_PROPS[i], "id": int(_WORKER_IDS[i])}
+        for i, geom in zip(candidates, clipped)
+        if not geom.is_empty
+    ]
+    if not features:
+        return key, None
+
+    data = mapbox_vector_tile.encode(
+        [{"name": LAYER_NAME, "features": features}],
+        default_options={"quantize_bounds": bounds, "extents": EXTENT},
+    )
+    return key, data
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Output
+# ─────────────────────────────────────────────────────────────────────────────
+
+class DirectoryWriter:
+    """Scrive tile in {z}/{x}/{y}.pbf (non compresse)."""
+
+    def __init__(self, path: Path):
+        shutil.rmtree(path, ignore_errors=True)
+        self.path = path
+
+    def write(self, key: TileKey, data: bytes) -> None:
+        z, x, y = key
+        tile_path = self.path / str(z) / str(x) / f"{y}.pbf"
+        tile_path.parent.mkdir(parents=True, exist_ok=True)
+        tile_path.write_bytes(data)
+
+    def close(self, metadata: Dict[str, str]) -> None:
+        (self.path / "metadata.json").write_text(json.dumps(metadata, ensure_ascii=False), encoding="utf-8")
+
+
+class MBTilesWriter:
+    """Scrive tile in un file MBTiles (schema TMS, payload gzip)."""
+
+    def __init__(self, path: Path):
+        path.unlink(missing_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        self.conn.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+
+    def write(self, key: TileKey, data: bytes) -> None:
+        z, x, y = key
+        tms_y = (1 << z) - 1 - y
+        self.conn.execute(
+            "INSERT INTO tiles VALUES (?, ?, ?, ?)", (z, x, tms_y, gzip.compress(data))
+        )
+
+    def close(self, metadata: Dict[str, str]) -> None:
+        self.conn.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        self.conn.commit()
+        self.conn.close()
+
+
+def build_metadata(bounds: Sequence[float], fields: Dict[str, str], min_zoom: int, max_zoom: int) -> Dict[str, str]:
+    """Metadati MBTiles / TileJSON minimi (fields: nome -> tipo, da field_types)."""
+    center_lon = (bounds[0] + bounds[2]) / 2
+    center_lat = (bounds[1] + bounds[3]) / 2
+    vector_layers = [{
+        "id": LAYER_NAME,
+        "fields": dict(fields),
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+    }]
+    return {
+        "name": "nil_core",
+        "format": "pbf",
+        "type": "overlay",
+        "minzoom": str(min_zoom),
+        "maxzoom": str(max_zoom),
+        "bounds": ",".join(f"{v:.6f}" for v in bounds),
+        "center": f"{center_lon:.6f},{center_lat:.6f},{min_zoom + 2}",
+        "json": json.dumps({"vector_layers": vector_layers}),
+    }
+
+
+def build_tiles(
+    conn: sqlite3.Connection,
+    writer,
+    min_zoom: int = MIN_ZOOM,
+    max_zoom: int = MAX_ZOOM,
+    workers: Optional[int] = None,
+) -> Dict[int, int]:
+    """
+    Genera la piramide di tile.
+
+    Returns:
+        Numero di tile scritte per zoom
+    """
+    gdf = read_dim_nil(conn)
+    facts = [pd.read_sql(f"SELECT * FROM {t}", conn) for t in ("fact_demografia", "fact_immobiliare", "fact_servizi")]
+    gdf = join_latest_facts(gdf, facts)
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty].reset_index(drop=True)
+
+    ids = gdf["id_nil"].astype(int).to_numpy()
+    props = feature_properties(gdf)
+
+    level_geoms = {"full": gdf.geometry.to_numpy()}
+    level_geoms.update(load_level_geometries(conn, ids, level_geoms["full"]))
+    level_wkb = {
+        level: shapely.to_wkb(to_web_mercator(geoms)).tolist()
+        for level, geoms in level_geoms.items()
+    }
+
+    bounds = gdf.total_bounds.tolist()
+    keys = [key for z in range(min_zoom, max_zoom + 1) for key in tiles_for_bounds(bounds, z)]
+
+    counts = {z: 0 for z in range(min_zoom, max_zoom + 1)}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(level_wkb, ids.tolist(), props),
+    ) as executor:
+        for key, data in executor.map(render_tile, keys, chunksize=64):
+            if data is None:
+                continue
+            writer.write(key, data)
+            counts[key[0]] += 1
+
+    writer.close(build_metadata(bounds, field_types(props), min_zoom, max_zoom))
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Genera vector tile MVT dei NIL (z10–z16)")
+    parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
+    parser.add_argument("--output", default="data_clean/tiles", help="Directory tile (default: data_clean/tiles)")
+    parser.add_argument("--mbtiles", default=None, help="Scrivi un file MBTiles invece della directory")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM, help=f"Zoom minimo (default: {MIN_ZOOM})")
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM, help=f"Zoom massimo (default: {MAX_ZOOM})")
+    parser.add_argument("--workers", type=int, default=None, help="Processi paralleli (default: CPU)")
+    args = parser.parse_args()
+
+    if not MVT_AVAILABLE:
+        print("mapbox-vector-tile non disponibile: pip install mapbox-vector-tile")
+        return
+
+    project_root = Path(__file__).resolve().parent.parent
+    db_path = project_root / args.db
+    if args.mbtiles:
+        output = project_root / args.mbtiles
+        output.parent.mkdir(parents=True, exist_ok=True)
+        writer = MBTilesWriter(output)
+    else:
+        output = project_root / args.output
+        writer = DirectoryWriter(output)
+
+    conn = sqlite3.connect(db_path)
+    counts = build_tiles(conn, writer, args.min_zoom, args.max_zoom, args.workers)
+    conn.close()
+
+    for z, count in counts.items():
+        print(f"  ✓ z{z}: {count} tile")
+    print(f"  → {output}")
+
+
+if __name__ == "__main__":
+    main()
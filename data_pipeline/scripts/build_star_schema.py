@@ -2,6 +2,9 @@
 """
 Crea star schema (dim_nil, dim_tempo, fact_demografia, fact_immobiliare, fact_servizi)
 utilizzando i dataset core caricati nel DB.
+
+I dataset puntuali vengono assegnati ai NIL per geometria (spatial_join.py);
+il nome NIL testuale resta il fallback per le righe senza coordinate.
 """
 
 from __future__ import annotations
@@ -15,6 +18,8 @@ from typing import Dict, Optional
 
 import pandas as pd
 
+from spatial_join import load_spatial_assignments, run_spatial_join
+
 
 def normalize_nil(value: object) -> str:
     """
@@ -169,35 +174,59 @@ def build_fact_immobiliare(conn: sqlite3.Connection, dim_nil: pd.DataFrame) -> N
     fact.to_sql("fact_immobiliare", conn, if_exists="replace", index=False)
 
 
+def resolve_id_nil(
+    conn: sqlite3.Connection,
+    table: str,
+    df: pd.DataFrame,
+    dim_nil: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Risolve id_nil per ogni riga di un dataset.
+
+    Usa l'assegnazione spaziale (bridge_punti_nil) quando la riga ha coordinate,
+    altrimenti il match testuale sul nome NIL.
+    """
+    df["nil_norm"] = df["nil"].apply(normalize_nil)
+    df = df.merge(dim_nil[["id_nil", "nil_norm"]], on="nil_norm", how="left")
+    spatial = load_spatial_assignments(conn, table)
+    if spatial is not None and "_rowid" in df.columns:
+        df["id_nil"] = df["_rowid"].map(spatial).fillna(df["id_nil"])
+    return df
+
+
 def build_fact_servizi(conn: sqlite3.Connection, dim_nil: pd.DataFrame) -> None:
     records = []
 
     # Scuole
-    df_scuole = pd.read_sql("SELECT nil, annoscolastico FROM ds_06_istruzione_famiglie_edifici_scolastici_2020_2021", conn)
-    df_scuole["nil_norm"] = df_scuole["nil"].apply(normalize_nil)
+    table = "ds_06_istruzione_famiglie_edifici_scolastici_2020_2021"
+    df_scuole = pd.read_sql(f"SELECT rowid AS _rowid, nil, annoscolastico FROM {table}", conn)
+    df_scuole = resolve_id_nil(conn, table, df_scuole, dim_nil)
     df_scuole["anno"] = df_scuole["annoscolastico"].apply(extract_year)
-    scuole = df_scuole.groupby(["nil_norm", "anno"], dropna=True).size().reset_index(name="numero_scuole")
+    scuole = df_scuole.groupby(["id_nil", "anno"], dropna=True).size().reset_index(name="numero_scuole")
     records.append(scuole)
 
     # Mercati coperti
-    df_mc = pd.read_sql("SELECT nil FROM ds_05_servizi_essenziali_mercati_comunali_coperti", conn)
-    df_mc["nil_norm"] = df_mc["nil"].apply(normalize_nil)
+    table = "ds_05_servizi_essenziali_mercati_comunali_coperti"
+    df_mc = pd.read_sql(f"SELECT rowid AS _rowid, nil FROM {table}", conn)
+    df_mc = resolve_id_nil(conn, table, df_mc, dim_nil)
     df_mc["anno"] = 2024
-    mc = df_mc.groupby(["nil_norm", "anno"], dropna=True).size().reset_index(name="numero_mercati_coperti")
+    mc = df_mc.groupby(["id_nil", "anno"], dropna=True).size().reset_index(name="numero_mercati_coperti")
     records.append(mc)
 
     # Mercati settimanali
-    df_ms = pd.read_sql("SELECT nil FROM ds_05_servizi_essenziali_mercati_settimanali_scoperti", conn)
-    df_ms["nil_norm"] = df_ms["nil"].apply(normalize_nil)
+    table = "ds_05_servizi_essenziali_mercati_settimanali_scoperti"
+    df_ms = pd.read_sql(f"SELECT rowid AS _rowid, nil FROM {table}", conn)
+    df_ms = resolve_id_nil(conn, table, df_ms, dim_nil)
     df_ms["anno"] = 2024
-    ms = df_ms.groupby(["nil_norm", "anno"], dropna=True).size().reset_index(name="numero_mercati_settimanali")
+    ms = df_ms.groupby(["id_nil", "anno"], dropna=True).size().reset_index(name="numero_mercati_settimanali")
     records.append(ms)
 
-    # Verde urbano
-    df_verde = pd.read_sql("SELECT nil, value FROM ds_04_qualita_ambientale_indice_verde_urbano_nil_2024", conn)
-    df_verde["nil_norm"] = df_verde["nil"].apply(normalize_nil)
+    # Verde urbano (indicatore per NIL, senza coordinate puntuali)
+    table = "ds_04_qualita_ambientale_indice_verde_urbano_nil_2024"
+    df_verde = pd.read_sql(f"SELECT nil, value FROM {table}", conn)
+    df_verde = resolve_id_nil(conn, table, df_verde, dim_nil)
     df_verde["anno"] = 2024
-    verde = df_verde.groupby(["nil_norm", "anno"], dropna=True).agg(indice_verde_medio=("value", "mean")).reset_index()
+    verde = df_verde.groupby(["id_nil", "anno"], dropna=True).agg(indice_verde_medio=("value", "mean")).reset_index()
     records.append(verde)
 
     # Unione
@@ -206,12 +235,11 @@ def build_fact_servizi(conn: sqlite3.Connection, dim_nil: pd.DataFrame) -> None:
         if fact is None:
             fact = df
         else:
-            fact = fact.merge(df, on=["nil_norm", "anno"], how="outer")
+            fact = fact.merge(df, on=["id_nil", "anno"], how="outer")
 
     if fact is None:
         return
 
-    fact = fact.merge(dim_nil[["id_nil", "nil_norm"]], on="nil_norm", how="left")
     fact = fact[fact["id_nil"].notna() & fact["anno"].notna()].copy()
 
     fact["numero_mercati"] = fact[["numero_mercati_coperti", "numero_mercati_settimanali"]].sum(axis=1, skipna=True)
@@ -239,6 +267,8 @@ def main() -> None:
 
     conn = sqlite3.connect(db_path)
     dim_nil = build_dim_nil(conn)
+    run_spatial_join(conn)
+    conn.commit()
     build_dim_tempo(conn, config_path)
     build_fact_demografia(conn, dim_nil)
     build_fact_immobiliare(conn, dim_nil)
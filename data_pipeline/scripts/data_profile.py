@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Profilo colonnare di un DataFrame, calcolato in un solo passaggio.
+
+Condiviso da validators.DataValidator e generate_quality_report.DataQualityReporter:
+null, valori distinti, min/max/media, righe duplicate e memoria vengono
+calcolati una volta per tabella e riusati da validazione e report.
+
+Per le tabelle che non servono in pandas, profile_table calcola lo stesso
+profilo lato SQLite con una sola query aggregata, senza materializzare righe.
+table_fingerprint dà un'impronta economica del contenuto, per riusare i
+profili delle tabelle non modificate.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class ColumnProfile:
+    """Statistiche di una colonna (min/max/media solo per le numeriche)."""
+    name: str
+    dtype: str
+    null_count: int
+    null_pct: float
+    unique_count: int
+    numeric: bool = False
+    min: Optional[float] = None
+    max: Optional[float] = None
+    mean: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Dettaglio colonna nel formato del report qualità."""
+        stats: Dict[str, Any] = {
+            "name": self.name,
+            "dtype": self.dtype,
+            "null_count": self.null_count,
+            "null_pct": self.null_pct,
+            "unique_count": self.unique_count,
+        }
+        if self.numeric:
+            stats.update({"min": self.min, "max": self.max, "mean": self.mean})
+        return stats
+
+
+@dataclass(frozen=True)
+class DataFrameProfile:
+    """Profilo di un DataFrame: statistiche di tabella e per colonna."""
+    rows: int
+    memory_mb: float
+    null_count: int
+    duplicate_rows: int
+    columns: Dict[str, ColumnProfile] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return self.rows * len(self.columns)
+
+    @property
+    def null_percentage(self) -> float:
+        return self.null_count / self.size * 100 if self.size > 0 else 0
+
+    @property
+    def column_types(self) -> Dict[str, str]:
+        return {name: col.dtype for name, col in self.columns.items()}
+
+    @property
+    def all_null_columns(self) -> List[str]:
+        return [name for name, col in self.columns.items() if col.null_count == self.rows]
+
+    def duplicate_values(self, column: str) -> int:
+        """Valori ripetuti nella colonna (come Series.duplicated().sum(), null compresi)."""
+        col = self.columns[column]
+        return self.rows - col.unique_count - (1 if col.null_count else 0)
+
+    def table_stats(self, name: str) -> Dict[str, Any]:
+        """Statistiche di tabella nel formato del report qualità."""
+        return {
+            "name": name,
+            "rows": self.rows,
+            "columns": len(self.columns),
+            "column_names": list(self.columns),
+            "memory_mb": self.memory_mb,
+            "null_percentage": self.null_percentage,
+            "duplicate_rows": self.duplicate_rows,
+            "columns_detail": [col.to_dict() for col in self.columns.values()],
+        }
+
+
+def profile_dataframe(df: pd.DataFrame) -> DataFrameProfile:
+    """
+    Profila il DataFrame: ogni statistica è calcolata una sola volta,
+    con operazioni vettoriali sull'intero frame invece che colonna per colonna.
+    """
+    rows = len(df)
+    null_counts = df.isna().sum()
+    unique_counts = df.nunique()
+    numeric_columns = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    numeric_stats = df[numeric_columns].agg(["min", "max", "mean"]) if numeric_columns else None
+
+    columns: Dict[str, ColumnProfile] = {}
+    for name in df.columns:
+        nulls = int(null_counts[name])
+        numeric: Dict[str, Any] = {}
+        if name in numeric_columns:
+            has_values = nulls < rows
+            numeric = {
+                "numeric": True,
+                "min": float(numeric_stats.at["min", name]) if has_values else None,
+                "max": float(numeric_stats.at["max", name]) if has_values else None,
+                "mean": float(numeric_stats.at["mean", name]) if has_values else None,
+            }
+        columns[name] = ColumnProfile(
+            name=name,
+            dtype=str(df[name].dtype),
+            null_count=nulls,
+            null_pct=nulls / rows * 100 if rows else float("nan"),
+            unique_count=int(unique_counts[name]),
+            **numeric,
+        )
+
+    return DataFrameProfile(
+        rows=rows,
+        memory_mb=df.memory_usage(deep=True).sum() / (1024 * 1024),
+        null_count=int(null_counts.sum()),
+        duplicate_rows=int(df.duplicated().sum()) if rows else 0,
+        columns=columns,
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Profilo lato SQLite
+# ─────────────────────────────────────────────────────────────────────────────
+
+HLL_PRECISION = 12                 # 2^12 registri: errore standard ~1.6%
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_FUNCTION = "approx_distinct"
+MASK_64 = (1 << 64) - 1
+
+# Stima della memoria pandas (memory_usage(deep=True)) per il profilo SQL
+CELL_BYTES = 8                     # slot int64/float64/puntatore/offset
+STR_OVERHEAD_BYTES = 49            # sys.getsizeof("") in CPython
+NUMBER_OBJECT_BYTES = 28           # sys.getsizeof(1) in una colonna object
+NONE_BYTES = 16                    # sys.getsizeof(None)
+INDEX_BYTES = 132                  # RangeIndex di pd.read_sql
+
+# dtype delle colonne di sole stringhe: "str" da pandas 3, "object" prima
+STRING_DTYPE = str(pd.Series(["", None]).dtype)
+
+
+def mix64(value: int) -> int:
+    """Finalizzatore splitmix64: distribuisce uniformemente i bit di hash()."""
+    value = (value + 0x9E3779B97F4A7C15) & MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return value ^ (value >> 31)
+
+
+class ApproxDistinct:
+    """
+    Aggregato SQLite per i valori distinti (NULL esclusi, come nunique()).
+
+    Esatto finché i distinti sono al più HLL_REGISTERS, poi HyperLogLog:
+    la memoria resta limitata qualunque sia la dimensione della tabella.
+    """
+
+    def __init__(self):
+        self.values: Optional[Set[Any]] = set()
+        self.registers = bytearray(HLL_REGISTERS)
+
+    def add_hash(self, value: Any) -> None:
+        hashed = mix64(hash(value) & MASK_64)
+        index = hashed >> (64 - HLL_PRECISION)
+        rest = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def step(self, value: Any) -> None:
+        if value is None:
+            return
+        if self.values is None:
+            self.add_hash(value)
+            return
+        self.values.add(value)
+        if len(self.values) > HLL_REGISTERS:
+            for seen in self.values:
+                self.add_hash(seen)
+            self.values = None
+
+    def finalize(self) -> int:
+        if self.values is not None:
+            return len(self.values)
+        m = HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sqlite_dtype(rows: int, nulls: int, integers: int, reals: int) -> str:
+    """dtype che pd.read_sql assegnerebbe alla colonna, dai tipi dei valori."""
+    non_null = rows - nulls
+    if non_null == 0:
+        return "object"
+    if integers + reals == 0:
+        return STRING_DTYPE
+    if integers + reals < non_null:
+        return "object"
+    if reals or nulls:
+        return "float64"
+    return "int64"
+
+
+def estimated_memory(dtype: str, rows: int, nulls: int, numbers: int, text_bytes: int) -> int:
+    """Byte che la colonna occuperebbe in pandas (memory_usage(deep=True), senza indice)."""
+    if dtype not in ("object", STRING_DTYPE):
+        return CELL_BYTES * rows
+    if dtype != "object":
+        # Offset per riga più la bitmap dei null
+        return CELL_BYTES * rows + text_bytes + (-(-rows // 8) if nulls else 0)
+    texts = rows - nulls - numbers
+    return (
+        CELL_BYTES * rows
+        + text_bytes
+        + STR_OVERHEAD_BYTES * texts
+        + NUMBER_OBJECT_BYTES * numbers
+        + NONE_BYTES * nulls
+    )
+
+
+def profile_query(table: str, columns: List[str]) -> str:
+    """Una sola query aggregata: per colonna null, tipi, min/max/media, distinti e byte di testo."""
+    table_sql = quote_identifier(table)
+    select = [
+        "COUNT(*)",
+        f"(SELECT COUNT(*) FROM (SELECT DISTINCT * FROM {table_sql}))",
+    ]
+    for name in columns:
+        col = quote_identifier(name)
+        select += [
+            f"SUM({col} IS NULL)",
+            f"SUM(typeof({col}) = 'integer')",
+            f"SUM(typeof({col}) = 'real')",
+            f"MIN({col})",
+            f"MAX({col})",
+            f"AVG({col})",
+            f"{HLL_FUNCTION}({col})",
+            f"SUM(CASE WHEN typeof({col}) = 'text' THEN length(CAST({col} AS BLOB)) END)",
+        ]
+    return f"SELECT {', '.join(select)} FROM {table_sql}"
+
+
+def profile_table(conn: sqlite3.Connection, table: str) -> DataFrameProfile:
+    """
+    Profila la tabella dentro SQLite, con lo stesso risultato di
+    profile_dataframe(pd.read_sql("SELECT * FROM table")) ma memoria costante:
+    il risultato è una sola riga. I distinti sono approssimati (ApproxDistinct)
+    oltre HLL_REGISTERS valori e memory_mb è una stima della memoria pandas.
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+    conn.create_aggregate(HLL_FUNCTION, 1, ApproxDistinct)
+    row = conn.execute(profile_query(table, columns)).fetchone()
+
+    rows, distinct_rows = row[0], row[1]
+    memory_bytes = INDEX_BYTES
+    profiles: Dict[str, ColumnProfile] = {}
+    for i, name in enumerate(columns):
+        nulls, integers, reals, min_val, max_val, mean, unique, text_bytes = row[2 + 8 * i: 10 + 8 * i]
+        nulls, integers, reals = nulls or 0, integers or 0, reals or 0
+        dtype = sqlite_dtype(rows, nulls, integers, reals)
+        numeric: Dict[str, Any] = {}
+        if dtype not in ("object", STRING_DTYPE):
+            has_values = nulls < rows
+            numeric = {
+                "numeric": True,
+                "min": float(min_val) if has_values else None,
+                "max": float(max_val) if has_values else None,
+                "mean": float(mean) if has_values else None,
+            }
+        memory_bytes += estimated_memory(dtype, rows, nulls, integers + reals, text_bytes or 0)
+        profiles[name] = ColumnProfile(
+            name=name,
+            dtype=dtype,
+            null_count=nulls,
+            null_pct=nulls / rows * 100 if rows else float("nan"),
+            unique_count=unique,
+            **numeric,
+        )
+
+    return DataFrameProfile(
+        rows=rows,
+        memory_mb=memory_bytes / (1024 * 1024),
+        null_count=sum(col.null_count for col in profiles.values()),
+        duplicate_rows=rows - distinct_rows if rows else 0,
+        columns=profiles,
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Impronta del contenuto
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Righe lette per blocco da content_checksum
+CHECKSUM_BATCH = 10_000
+
+
+def content_checksum(conn: sqlite3.Connection, table: str) -> str:
+    """Checksum delle righe in ordine di rowid (di chiave primaria per le WITHOUT ROWID)."""
+    table_sql = quote_identifier(table)
+    cursor = conn.cursor()
+    # Tuple semplici anche se la connessione usa sqlite3.Row (repr non deterministico)
+    cursor.row_factory = None
+    try:
+        cursor.execute(f"SELECT * FROM {table_sql} ORDER BY rowid")
+    except sqlite3.OperationalError:
+        cursor.execute(f"SELECT * FROM {table_sql}")
+    digest = hashlib.blake2b(digest_size=16)
+    while True:
+        rows = cursor.fetchmany(CHECKSUM_BATCH)
+        if not rows:
+            break
+        digest.update(repr(rows).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def page_checksum(conn: sqlite3.Connection, table: str) -> str:
+    """
+    Checksum delle pagine della tabella (b-tree e overflow, elencate da dbstat).
+
+    Le pagine vengono lette dal file solo se il database è su file e non in
+    WAL: il cursore dbstat aperto mantiene il lock condiviso durante la
+    lettura. In memoria, in WAL (pagine recenti nel -wal) o senza dbstat il
+    layout delle pagine non basta a rilevare un UPDATE che non cambia le
+    dimensioni: si ripiega su content_checksum.
+    """
+    files = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if not files.get("main") or journal_mode.lower() == "wal":
+        return content_checksum(conn, table)
+    try:
+        cursor = conn.execute("SELECT pageno FROM dbstat WHERE name = ? ORDER BY pageno", (table,))
+    except sqlite3.OperationalError:
+        return content_checksum(conn, table)
+
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(files["main"], "rb") as f:
+        for (pageno,) in cursor:
+            f.seek((pageno - 1) * page_size)
+            digest.update(f.read(page_size))
+    return digest.hexdigest()
+
+
+def table_fingerprint(conn: sqlite3.Connection, table: str) -> str:
+    """Impronta di schema, COUNT(*), MAX(rowid) e pagine: cambia se cambia il contenuto."""
+    table_sql = quote_identifier(table)
+    schema = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    try:
+        count, max_rowid = conn.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table_sql}").fetchone()
+    except sqlite3.OperationalError:
+        # Tabelle WITHOUT ROWID
+        count, max_rowid = conn.execute(f"SELECT COUNT(*) FROM {table_sql}").fetchone()[0], None
+
+    digest = hashlib.sha256(str(schema[0] if schema else "").encode("utf-8"))
+    digest.update(f"{count}:{max_rowid}:{page_checksum(conn, table)}".encode("ascii"))
+    return digest.hexdigest()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Genera website/src/data/nilPolygons.js a partire da dim_nil.
+
+Sostituisce website/scripts/generate_nil_polygons.py:
+- legge le geometrie dal DB della pipeline invece che da percorsi locali
+- semplifica e quantizza le coordinate (build_nil_geometries.py)
+- risolve i quartieri con indici hash invece del confronto per prefisso O(n·m)
+- mantiene intatti i MultiPolygon in nilGeometries
+- scrive JSON minificato
+
+nilPolygons conserva il formato atteso dal frontend (un anello [lng, lat]
+per quartiere): per i MultiPolygon viene usato l'anello esterno più grande.
+
+Il file generato è versionato: run_pipeline.py esegue questo step solo con
+--export-polygons.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+from build_nil_geometries import LEVELS, build_level, polygon_parts
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Costanti
+# ─────────────────────────────────────────────────────────────────────────────
+
+DEFAULT_LEVEL = "medium"
+
+# quartiere_id -> nome NIL, per nomi che non corrispondono automaticamente
+MANUAL_MAPPING: Dict[str, str] = {
+    'san-siro': 'SELINUNTE',
+    'qre-gallaratese---qre-san-leonardo---lampugnano': 'GALLARATESE',
+    'niguarda---ca-granda---prato-centenaro---qre-fulvio-testi': 'NIGUARDA - CA\' GRANDA',
+    'gratosoglio---qre-missaglia---qre-terrazze': 'GRATOSOGLIO - TICINELLO',
+    'lodi---corvetto': 'LODI - CORVETTO',
+    'loreto---casoretto---nolo': 'LORETO',
+    'moncucco---san-cristoforo': 'S. CRISTOFORO',
+    'stadera---chiesa-rossa---qre-torretta---conca-fallata': 'STADERA',
+    'vigentino---qre-fatima': 'RIPAMONTI',
+    'baggio---qre-degli-olmi---qre-valsesia': 'BAGGIO',
+    'cimiano---rottole---qre-feltre': 'PARCO LAMBRO - CIMIANO',
+    'parco-forlanini---cavriano': 'PARCO FORLANINI - ORTICA',
+    'taliedo---morsenchio---qre-forlanini': 'MECENATE',
+    'greco---segnano': 'GRECO',
+    'villapizzone---cagnola---boldinasco': 'VILLAPIZZONE',
+    'quarto-oggiaro---vialba---musocco': 'QUARTO OGGIARO',
+    'porta-ticinese---conca-del-naviglio': 'TICINESE',
+    'porta-ticinese---conchetta': 'NAVIGLI',
+    'porta-garibaldi---porta-nuova': 'GARIBALDI REPUBBLICA',
+    'stazione-centrale---ponte-seveso': 'CENTRALE',
+    'buenos-aires---porta-venezia---porta-monforte': 'BUENOS AIRES - VENEZIA',
+    'padova---turro---crescenzago': 'PADOVA',
+    'gorla---precotto': 'VIALE MONZA',
+    'maciachini---maggiolina': 'MACIACHINI - MAGGIOLINA',
+    'maggiore---musocco---certosa': 'MAGGIORE - MUSOCCO',
+    'umbria---molise---calvairate': 'UMBRIA - MOLISE',
+    'monlue---ponte-lambro': 'PARCO MONLUE\' - PONTE LAMBRO',
+    'porta-vigentina---porta-lodovica': 'VIGENTINA',
+    'rogoredo---santa-giulia': 'ROGOREDO',
+    'de-angeli---monte-rosa': 'DE ANGELI - MONTE ROSA',
+    'giardini-pta-venezia': 'GIARDINI PORTA VENEZIA',
+    'magenta---s-vittore': 'MAGENTA - S. VITTORE',
+    'pta-romana': 'PORTA ROMANA',
+    'porta-magenta': 'WASHINGTON',
+    'tre-torri': 'TRE TORRI',
+    'scalo-romana': 'SCALO ROMANA',
+    'parco-dei-navigli': 'PARCO DEI NAVIGLI',
+    'stadio---ippodromi': 'S. SIRO',
+    'parco-bosco-in-citta': 'PARCO BOSCO IN CITTÀ',
+    'assiano': 'PARCO AGRICOLO SUD',
+    'morivione': 'EX OM - MORIVIONE',
+    'roserio': 'SACCO',
+    'porta-genova': 'TORTONA',
+    'cascina-merlata': 'CASCINA TRIULZA - EXPO',
+    'citta-studi': 'CITTA\' STUDI',
+    'lambrate---ortica': 'LAMBRATE',
+    'xxii-marzo': 'XXII MARZO',
+}
+
+JS_HEADER = """/**
+ * Poligoni reali dei NIL (Nuclei Identità Locale) di Milano
+ * Generato da data_pipeline/scripts/export_nil_polygons.py (dim_nil)
+ *
+ * Ogni chiave corrisponde all'ID del quartiere in quartieriData.js
+ * nilPolygons: anello esterno principale, array di coordinate [lng, lat]
+ * nilGeometries: geometria completa GeoJSON (Polygon/MultiPolygon con buchi)
+ */
+"""
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Matching nomi
+# ─────────────────────────────────────────────────────────────────────────────
+
+def normalize_name(name: str) -> str:
+    """Normalizza il nome NIL nel formato degli ID quartiere."""
+    return name.lower().strip().replace(' - ', '---').replace(' ', '-').replace("'", "").replace('.', '')
+
+
+def load_quartieri_ids(path: Path) -> List[str]:
+    """Estrae gli ID quartiere dall'array quartieriData in quartieriData.js."""
+    content = path.read_text(encoding="utf-8")
+    start = content.find('export const quartieriData = [')
+    if start == -1:
+        return []
+    start = content.find('[', start)
+
+    depth = 0
+    for offset, char in enumerate(content[start:]):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            if depth == 0:
+                quartieri = json.loads(content[start:start + offset + 1])
+                return [q['id'] for q in quartieri]
+    return []
+
+
+class NilNameIndex:
+    """
+    Indici hash per risolvere un ID quartiere in un NIL.
+
+    Stesso ordine di match di website/scripts/generate_nil_polygons.py:
+    mapping manuale, nome normalizzato identico, poi il primo NIL (nell'ordine
+    di dim_nil) il cui nome è prefisso del quartiere o inizia con la sua prima
+    parte. I prefissi sono indicizzati, così ogni quartiere costa O(len(qid))
+    invece di un confronto con tutti i NIL.
+    """
+
+    def __init__(self, names: List[str]):
+        self.by_name = {name.strip(): i for i, name in enumerate(names)}
+        self.by_normalized: Dict[str, int] = {}
+        # Ogni prefisso di ogni nome normalizzato -> primo NIL che lo possiede
+        self.by_prefix: Dict[str, int] = {}
+        for i, name in enumerate(names):
+            normalized = normalize_name(name)
+            self.by_normalized.setdefault(normalized, i)
+            for k in range(len(normalized) + 1):
+                self.by_prefix.setdefault(normalized[:k], i)
+
+    def resolve(self, qid: str) -> Optional[int]:
+        # 1. Mapping manuale
+        manual = MANUAL_MAPPING.get(qid)
+        if manual is not None and manual in self.by_name:
+            return self.by_name[manual]
+
+        # 2. Nome normalizzato identico
+        normalized = normalize_name(qid)
+        if normalized in self.by_normalized:
+            return self.by_normalized[normalized]
+
+        # 3. Match parziale: il quartiere inizia con un nome NIL, oppure un nome
+        #    NIL inizia con la prima parte del quartiere; vince il NIL che
+        #    compare per primo, come nel ciclo dello script originale
+        candidates = [self.by_normalized[qid[:k]] for k in range(len(qid) + 1) if qid[:k] in self.by_normalized]
+        head = self.by_prefix.get(qid.split('---')[0])
+        if head is not None:
+            candidates.append(head)
+        return min(candidates) if candidates else None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Geometrie
+# ─────────────────────────────────────────────────────────────────────────────
+
+def round_coordinates(geometry: BaseGeometry, decimals: int) -> BaseGeometry:
+    """Arrotonda le coordinate per eliminare residui float dopo la quantizzazione."""
+    return shapely.transform(geometry, lambda coords: np.round(coords, decimals))
+
+
+def main_ring(geometry: BaseGeometry) -> Optional[List[List[float]]]:
+    """
+    Anello esterno del poligono più grande.
+
+    Le GeometryCollection prodotte da make_valid possono contenere linee o
+    punti: si considerano solo le parti poligonali. None se non ce ne sono.
+    """
+    polygons = [p for p in polygon_parts(geometry) if not p.is_empty]
+    if not polygons:
+        return None
+    largest = max(polygons, key=lambda p: p.area)
+    return [list(c) for c in largest.exterior.coords]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Genera nilPolygons.js per il frontend da dim_nil")
+    parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
+    parser.add_argument("--website-dir", default="../website", help="Directory website (default: ../website)")
+    parser.add_argument("--level", default=DEFAULT_LEVEL, choices=sorted(LEVELS), help="Livello di dettaglio")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parent.parent
+    db_path = project_root / args.db
+    website_dir = (project_root / args.website_dir).resolve()
+    quartieri_path = website_dir / "src" / "data" / "quartieriData.js"
+    output_path = website_dir / "src" / "data" / "nilPolygons.js"
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT nil, geometry FROM dim_nil WHERE geometry IS NOT NULL").fetchall()
+    conn.close()
+
+    names = [r[0] for r in rows]
+    tolerance, grid_size = LEVELS[args.level]
+    decimals = int(round(-np.log10(grid_size)))
+    geometries = shapely.make_valid(shapely.from_geojson([r[1] for r in rows], on_invalid="ignore"))
+    geometries = build_level(geometries, tolerance, grid_size)
+
+    index = NilNameIndex(names)
+    quartieri = load_quartieri_ids(quartieri_path)
+
+    nil_polygons: Dict[str, List[List[float]]] = {}
+    nil_geometries: Dict[str, dict] = {}
+    unmatched = []
+    for qid in quartieri:
+        i = index.resolve(qid)
+        if i is None or geometries[i] is None or geometries[i].is_empty:
+            unmatched.append(qid)
+            continue
+        geometry = round_coordinates(geometries[i], decimals)
+        ring = main_ring(geometry)
+        if ring is None:
+            unmatched.append(qid)
+            continue
+        nil_polygons[qid] = ring
+        nil_geometries[qid] = json.loads(shapely.to_geojson(geometry))
+
+    compact = dict(ensure_ascii=False, separators=(",", ":"))
+    js_content = (
+        JS_HEADER
+        + "\nexport const nilPolygons = " + json.dumps(nil_polygons, **compact) + ";\n"
+        + "\nexport const nilGeometries = " + json.dumps(nil_geometries, **compact) + ";\n"
+    )
+    output_path.write_text(js_content, encoding="utf-8")
+
+    print(f"  ✓ Matchati: {len(nil_polygons)}/{len(quartieri)} quartieri")
+    for qid in unmatched:
+        print(f"  ⚠ Non matchato: {qid}")
+    print(f"  → {output_path} ({len(js_content.encode('utf-8')) / 1024:,.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Esportazione statica delle API per-NIL in website/public/data-api.
+
+Il sito in produzione legge /data-api/<path>.json (website/src/lib/api.js).
+Le risposte per-NIL sono già precalcolate in api_response_cache
+(build_api_cache.py): questo script le scrive direttamente dal DB, senza
+passare per Express, con un pool di processi.
+- JSON minificato, con file .gz e .br accanto per il serving precompresso
+- un manifest (path -> ETag) permette di riscrivere solo i file cambiati
+- i file non più presenti in cache vengono rimossi
+
+Le route non per-NIL (quartieri, timeline, statistiche...) restano a
+scripts/export-static-api.mjs, che tiene un proprio manifest
+(ROUTES_MANIFEST_NAME) per rimuovere i file non più esportati; i loro JSON
+ricevono comunque i .gz/.br.
+
+Uso:
+    python export_static_api.py [--db PATH] [--output DIR] [--workers N] [--force]
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from build_api_cache import CACHE_TABLE
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Paths
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+OUTPUT_DIR = PROJECT_ROOT / "website" / "public" / "data-api"
+MANIFEST_NAME = ".manifest.json"
+# Manifest di scripts/export-static-api.mjs
+ROUTES_MANIFEST_NAME = ".routes-manifest.json"
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not DB_PATH.is_absolute():
+    DB_PATH = PROJECT_ROOT / DB_PATH
+
+# Endpoint per-NIL usati dal sito statico ("" = /api/nil/:id)
+STATIC_ENDPOINTS = (
+    "",
+    "istruzione",
+    "mobilita",
+    "stock-abitativo",
+    "investor-metrics",
+    "servizi-sanitari",
+    "servizi-sociali",
+    "cultura",
+    "commercio",
+    "sicurezza",
+)
+
+# File per task inviato ai worker
+WRITE_BATCH = 64
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Scrittura
+# ─────────────────────────────────────────────────────────────────────────────
+
+def static_path(endpoint: str, key: str) -> str:
+    """Path relativo del file per una risposta in cache."""
+    return f"nil/{key}.json" if endpoint == "" else f"nil/{key}/{endpoint}.json"
+
+
+def sibling_paths(path: Path) -> List[Path]:
+    """File precompressi accanto al JSON."""
+    siblings = [path.with_name(path.name + ".gz")]
+    if BROTLI_AVAILABLE:
+        siblings.append(path.with_name(path.name + ".br"))
+    return siblings
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Scrive via file temporaneo + rename, così il server statico non legge file parziali."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_compressed(path: Path, data: bytes) -> None:
+    """Scrive i fratelli .gz (mtime fisso, output deterministico) e .br."""
+    write_atomic(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+    if BROTLI_AVAILABLE:
+        write_atomic(path.with_name(path.name + ".br"), brotli.compress(data, quality=11))
+
+
+def write_batch(output_dir: str, items: Sequence[Tuple[str, str]]) -> int:
+    """Worker: scrive JSON e fratelli compressi per (path relativo, body)."""
+    root = Path(output_dir)
+    for relative, body in items:
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = (body + "\n").encode("utf-8")
+        write_atomic(path, data)
+        write_compressed(path, data)
+    return len(items)
+
+
+def compress_batch(paths: Sequence[str]) -> int:
+    """Worker: comprime JSON scritti da altri export."""
+    for name in paths:
+        path = Path(name)
+        write_compressed(path, path.read_bytes())
+    return len(paths)
+
+
+def needs_compression(path: Path) -> bool:
+    """True se manca un fratello compresso o è più vecchio del JSON."""
+    mtime = path.stat().st_mtime
+    return any(not s.exists() or s.stat().st_mtime < mtime for s in sibling_paths(path))
+
+
+def batched(items: Sequence, size: int) -> List[Sequence]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Export
+# ─────────────────────────────────────────────────────────────────────────────
+
+def load_manifest(output_dir: Path) -> Dict[str, str]:
+    path = output_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def load_responses(db_path: Path) -> List[Tuple[str, str, str]]:
+    """
+    (path relativo, etag, body) delle risposte per-NIL esportabili.
+
+    Raises:
+        sqlite3.OperationalError: se il DB non è leggibile o api_response_cache manca
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    placeholders = ", ".join("?" for _ in STATIC_ENDPOINTS)
+    try:
+        rows = conn.execute(
+            f"SELECT endpoint, key, etag, body FROM {CACHE_TABLE} WHERE endpoint IN ({placeholders})",
+            STATIC_ENDPOINTS,
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(static_path(endpoint, key), etag, body) for endpoint, key, etag, body in rows]
+
+
+def export_static_api(
+    db_path: Path,
+    output_dir: Path = OUTPUT_DIR,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> Dict[str, object]:
+    """
+    Sincronizza l'albero statico con api_response_cache.
+
+    Args:
+        db_path: Database con api_response_cache
+        output_dir: Radice data-api
+        workers: Processi del pool (default: CPU disponibili)
+        force: Riscrive tutti i file ignorando il manifest
+
+    Returns:
+        Statistiche: file scritti, invariati, rimossi, compressi, durata
+    """
+    start = time.perf_counter()
+    responses = load_responses(db_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {} if force else load_manifest(output_dir)
+
+    changed = [
+        (relative, body)
+        for relative, etag, body in responses
+        if manifest.get(relative) != etag
+        or not (output_dir / relative).exists()
+        or not all(s.exists() for s in sibling_paths(output_dir / relative))
+    ]
+
+    # Risposte sparite dalla cache: rimuove JSON e fratelli compressi
+    current = {relative: etag for relative, etag, _ in responses}
+    removed = 0
+    for relative in set(manifest) - set(current):
+        path = output_dir / relative
+        for stale in (path, path.with_name(path.name + ".gz"), path.with_name(path.name + ".br")):
+            if stale.exists():
+                stale.unlink()
+        removed += 1
+
+    # JSON scritti da export-static-api.mjs senza fratelli aggiornati
+    foreign = [
+        str(path) for path in output_dir.rglob("*.json")
+        if not path.name.startswith(".")
+        and path.relative_to(output_dir).as_posix() not in current
+        and needs_compression(path)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_batch, str(output_dir), batch) for batch in batched(changed, WRITE_BATCH)]
+        futures += [pool.submit(compress_batch, batch) for batch in batched(foreign, WRITE_BATCH)]
+        for future in futures:
+            future.result()
+
+    (output_dir / MANIFEST_NAME).write_text(
+        json.dumps(current, sort_keys=True, separators=(",", ":")), encoding="utf-8"
+    )
+
+    return {
+        "written": len(changed),
+        "unchanged": len(responses) - len(changed),
+        "removed": removed,
+        "compressed": len(foreign),
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Esporta le API per-NIL in website/public/data-api")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--output", type=str, default=str(OUTPUT_DIR), help="Directory data-api")
+    parser.add_argument("--workers", type=int, default=None, help="Processi (default: CPU disponibili)")
+    parser.add_argument("--force", action="store_true", help="Riscrive tutti i file")
+    args = parser.parse_args()
+
+    try:
+        stats = export_static_api(Path(args.db), Path(args.output), args.workers, args.force)
+    except sqlite3.OperationalError as e:
+        print(f"❌ Impossibile leggere {CACHE_TABLE} da {args.db}: {e}")
+        print("   Eseguire prima build_api_cache.py (o make pipeline)")
+        return 1
+
+    print(f"  ✓ Scritti: {stats['written']}, invariati: {stats['unchanged']}, "
+          f"rimossi: {stats['removed']} ({stats['elapsed']:.2f}s)")
+    if stats["compressed"]:
+        print(f"  ✓ Compressi {stats['compressed']} JSON di export-static-api.mjs")
+    if not BROTLI_AVAILABLE:
+        print("  ⚠ brotli non installato: generati solo i file .gz")
+    print(f"  → {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Finalizzazione del database prima di servirlo.
+
+Ultimo stage della pipeline (e di publish_database.finalize_shadow):
+- VACUUM INTO una copia compatta con page_size scelto (o misurato tra i
+  candidati con --tune-page-size), senza pagine libere né frammentazione
+- ANALYZE + PRAGMA optimize sulla copia, così sqlite_stat1 (e sqlite_stat4,
+  se SQLite è compilato con STAT4) guidano i piani delle route API
+- mmap_size consigliato (dimensione del file, con un tetto) salvato in
+  _db_settings, che il server applica all'apertura
+- quick_check sulla copia, poi rename atomico sul file originale
+- report JSON con dimensione del file e p50 delle route prima/dopo
+
+Con --in-place (DB live aperto dal server) il file non viene sostituito:
+VACUUM, ANALYZE e PRAGMA optimize sul file stesso, così le connessioni già
+aperte vedono subito il risultato. VACUUM INTO + rename resta per lo shadow
+di publish_database.py.
+
+Uso:
+    python finalize_database.py [--db PATH] [--page-size 4096]
+    python finalize_database.py --tune-page-size
+    python finalize_database.py --in-place
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from benchmark_queries import REPORTS_DIR, run_benchmark
+
+# Paths
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+REPORT_PATH = REPORTS_DIR / "finalize_database.json"
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not DB_PATH.is_absolute():
+    DB_PATH = PROJECT_ROOT / DB_PATH
+
+# Tabella letta dal server all'apertura (server/index.js)
+SETTINGS_TABLE = "_db_settings"
+
+DEFAULT_PAGE_SIZE = 4096
+PAGE_SIZE_CANDIDATES = (4096, 8192, 16384)
+# Un page size diverso da quello richiesto vince solo se più veloce di almeno il 5%
+PAGE_SIZE_MIN_GAIN = 0.05
+# mmap_size consigliato: dimensione del file arrotondata al MiB, al massimo 256 MiB
+MMAP_ALIGN = 1024 * 1024
+MAX_MMAP_SIZE = 256 * 1024 * 1024
+
+# Ripetizioni del benchmark prima/dopo
+BENCH_REPEAT = 10
+BENCH_WARMUP = 2
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Compattazione
+# ─────────────────────────────────────────────────────────────────────────────
+
+def recommended_mmap_size(size_bytes: int) -> int:
+    """mmap_size che copre l'intero file (arrotondato al MiB), con un tetto."""
+    aligned = -(-size_bytes // MMAP_ALIGN) * MMAP_ALIGN
+    return min(aligned, MAX_MMAP_SIZE)
+
+
+def stat_tables(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Righe nelle tabelle sqlite_stat* presenti."""
+    names = [
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'sqlite_stat%' ORDER BY name"
+        )
+    ]
+    return {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in names}
+
+
+def route_p50(conn: sqlite3.Connection) -> Dict[str, float]:
+    report = run_benchmark(conn, repeat=BENCH_REPEAT, warmup=BENCH_WARMUP)
+    return {route: entry["p50_ms"] for route, entry in report["routes"].items() if "p50_ms" in entry}
+
+
+def vacuum_into(db_path: Path, target: Path, page_size: int) -> None:
+    """Copia compatta di db_path con il page_size richiesto."""
+    for path in (target, Path(f"{target}-journal")):
+        path.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    try:
+        # Il page_size impostato sulla connessione vale per il file creato da VACUUM INTO
+        conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        conn.execute("VACUUM INTO ?", (str(target),))
+    finally:
+        conn.close()
+
+
+def vacuum_in_place(db_path: Path, page_size: int) -> None:
+    """VACUUM sul file stesso (stesso inode) con il page_size richiesto."""
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    try:
+        # In WAL il page_size non si può cambiare: VACUUM compatta soltanto
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+            conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def optimize_copy(path: Path, in_place: bool = False) -> Dict[str, object]:
+    """
+    Statistiche del planner, mmap consigliato e verifica sulla copia compatta
+    (o sul file live, con in_place: il journal_mode resta invariato).
+
+    Raises:
+        sqlite3.DatabaseError: se quick_check non restituisce "ok"
+    """
+    conn = sqlite3.connect(str(path), timeout=30)
+    try:
+        if not in_place:
+            conn.execute("PRAGMA journal_mode = DELETE")
+        mmap_size = recommended_mmap_size(path.stat().st_size)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {SETTINGS_TABLE} (name TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            f"INSERT OR REPLACE INTO {SETTINGS_TABLE} (name, value) VALUES ('mmap_size', ?)", (str(mmap_size),)
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"quick_check fallito sulla copia compatta: {result}")
+
+        conn.execute(f"PRAGMA mmap_size = {mmap_size}")
+        return {
+            "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+            "mmap_size": mmap_size,
+            "stats": stat_tables(conn),
+            "size_bytes": path.stat().st_size,
+            "p50_ms": route_p50(conn),
+        }
+    finally:
+        conn.close()
+
+
+def finalize_database(
+    db_path: Path,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    candidates: Optional[Sequence[int]] = None,
+    log=print,
+    in_place: bool = False,
+) -> Dict[str, object]:
+    """
+    Compatta db_path con VACUUM INTO, aggiorna le statistiche e lo sostituisce.
+
+    Il file va finalizzato quando nessun altro processo vi scrive (shadow
+    della pubblicazione): il rename è atomico e i lettori già connessi
+    restano sulla versione precedente. Per il DB live usare in_place, che
+    compatta e analizza il file senza cambiarne l'inode.
+
+    Args:
+        db_path: Database da finalizzare
+        page_size: Page size della copia compatta
+        candidates: Page size da misurare in alternativa a page_size; vince la
+            copia con p50 totale minore, se più veloce di PAGE_SIZE_MIN_GAIN
+        log: Funzione di log
+        in_place: VACUUM/ANALYZE sul file stesso invece di VACUUM INTO + rename;
+            le copie servono solo a misurare i candidates
+
+    Returns:
+        Report: dimensione e p50 per route prima/dopo, page_size, mmap_size, statistiche
+    """
+    conn = sqlite3.connect(str(db_path))
+    before = {
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "freelist_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "size_bytes": db_path.stat().st_size,
+        "p50_ms": route_p50(conn),
+    }
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    # In place senza candidati non serve nessuna copia di prova
+    sizes = list(dict.fromkeys([page_size, *(candidates or ())])) if candidates or not in_place else []
+    trials: Dict[int, Dict[str, object]] = {}
+    best = page_size
+    try:
+        for size in sizes:
+            target = db_path.with_name(f"{db_path.name}.vacuum-{size}")
+            vacuum_into(db_path, target, size)
+            trials[size] = optimize_copy(target)
+            log(f"  ✓ VACUUM INTO page_size={size}: {trials[size]['size_bytes'] / 1024 / 1024:.2f} MB, "
+                f"p50 {sum(trials[size]['p50_ms'].values()):.3f} ms")
+
+        if trials:
+            total = {size: sum(trial["p50_ms"].values()) for size, trial in trials.items()}
+            best = min(total, key=total.get)
+            if total[best] > total[page_size] * (1 - PAGE_SIZE_MIN_GAIN):
+                best = page_size
+        if not in_place:
+            os.replace(db_path.with_name(f"{db_path.name}.vacuum-{best}"), db_path)
+            for suffix in ("-wal", "-shm"):
+                Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    finally:
+        for size in sizes:
+            db_path.with_name(f"{db_path.name}.vacuum-{size}").unlink(missing_ok=True)
+
+    if in_place:
+        vacuum_in_place(db_path, best)
+        after = optimize_copy(db_path, in_place=True)
+        log(f"  ✓ VACUUM in place page_size={after['page_size']}")
+    else:
+        after = trials[best]
+    if not any(name.startswith("sqlite_stat4") for name in after["stats"]):
+        log("  ⚠ SQLite senza STAT4: solo sqlite_stat1 aggiornata")
+    log(f"  ✓ {before['size_bytes'] / 1024 / 1024:.2f} → {after['size_bytes'] / 1024 / 1024:.2f} MB, "
+        f"page_size {before['page_size']} → {after['page_size']}, mmap_size consigliato {after['mmap_size']}")
+    for route, p50 in after["p50_ms"].items():
+        if route in before["p50_ms"]:
+            log(f"  {route:<28} p50 {before['p50_ms'][route]:>8.3f} → {p50:>8.3f} ms")
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "database": str(db_path),
+        "sqlite_version": sqlite3.sqlite_version,
+        "before": before,
+        "after": after,
+        "trials": {str(size): trial for size, trial in trials.items()} if candidates else {},
+    }
+
+
+def write_report(report: Dict[str, object], path: Path = REPORT_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compatta e ottimizza il database prima di servirlo")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Page size della copia compatta")
+    parser.add_argument("--tune-page-size", action="store_true",
+                        help=f"Misura i page size {', '.join(map(str, PAGE_SIZE_CANDIDATES))} e tiene il più veloce")
+    parser.add_argument("--in-place", action="store_true",
+                        help="VACUUM/ANALYZE sul file live senza sostituirlo (server in esecuzione)")
+    parser.add_argument("--report", type=str, default=str(REPORT_PATH), help="Report JSON")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"❌ Database non trovato: {db_path}")
+        return 1
+
+    candidates = PAGE_SIZE_CANDIDATES if args.tune_page_size else None
+    try:
+        report = finalize_database(db_path, args.page_size, candidates, in_place=args.in_place)
+    except sqlite3.Error as e:
+        print(f"❌ Finalizzazione fallita, database invariato: {e}")
+        return 1
+
+    report_path = Path(args.report)
+    write_report(report, report_path)
+    print(f"  ✓ Report: {report_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,11 @@ Include:
 - Statistiche per ogni dataset
 - Risultati validazione
 - Grafici e tabelle riassuntive
+- Andamento delle metriche tra le esecuzioni
+
+I profili e le validazioni per tabella sono salvati in _table_profile con
+l'impronta del contenuto (data_profile.table_fingerprint): a ogni esecuzione
+vengono ricalcolati solo per le tabelle modificate.
 """
 
 from __future__ import annotations
@@ -15,7 +20,7 @@ import json
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 
@@ -34,9 +39,30 @@ from utils import (
     ensure_directory,
     get_file_size_mb,
 )
+from data_profile import DataFrameProfile, profile_dataframe, profile_table, table_fingerprint
 from validators import DataValidator, NILValidator, create_validator
 
 
+# Tabelle principali validate dopo l'analisi
+KEY_TABLES = (
+    "dim_nil",
+    "dim_tempo",
+    "fact_demografia",
+    "fact_immobiliare",
+    "fact_servizi",
+)
+
+# Cache dei profili e serie storica delle metriche (nel database analizzato)
+PROFILE_TABLE = "_table_profile"
+HISTORY_TABLE = "_quality_history"
+RUNS_TABLE = "_quality_runs"
+REPORT_TABLES = (PROFILE_TABLE, HISTORY_TABLE, RUNS_TABLE)
+
+# Da incrementare quando cambiano profilo o validatori: invalida la cache
+PROFILE_VERSION = 1
+HISTORY_RUNS = 30                  # esecuzioni mostrate nel grafico
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Report generator
 # ─────────────────────────────────────────────────────────────────────────────
@@ -48,9 +74,11 @@ class DataQualityReporter:
         self,
         db_path: Path = DEFAULT_DB_PATH,
         output_dir: Path = REPORTS_DIR,
+        full: bool = False,
     ):
         self.db_path = db_path
         self.output_dir = ensure_directory(output_dir)
+        self.full = full
         self.logger = setup_logger("quality_reporter")
         self.report_data: Dict[str, Any] = {
             "generated_at": format_timestamp(),
@@ -58,7 +86,13 @@ class DataQualityReporter:
             "tables": [],
             "summary": {},
             "validation_results": [],
+            "history": [],
         }
+        # DataFrame e profilo delle KEY_TABLES, dall'analisi alla validazione
+        self._profiled: Dict[str, Tuple[pd.DataFrame, DataFrameProfile]] = {}
+        # Voci di _table_profile: salvate (cache) e di questa esecuzione
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
     
     def generate_report(self) -> Path:
         """Genera report completo."""
@@ -74,7 +108,8 @@ class DataQualityReporter:
             # 1. Statistiche database
             self._collect_database_stats(conn)
             
-            # 2. Analisi per tabella
+            # 2. Analisi per tabella (solo tabelle modificate)
+            self._load_profile_cache(conn)
             self._analyze_tables(conn)
             
             # 3. Validazione dati
@@ -83,6 +118,9 @@ class DataQualityReporter:
             # 4. Genera summary
             self._generate_summary()
             
+            # 5. Cache profili e serie storica
+            self._save_profile_cache(conn)
+            
         finally:
             conn.close()
         
@@ -104,6 +142,7 @@ class DataQualityReporter:
             "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'",
             conn,
         )["name"].tolist()
+        tables = [t for t in tables if t not in REPORT_TABLES]
         
         # Indici
         indices = pd.read_sql(
@@ -120,51 +159,102 @@ class DataQualityReporter:
             "index_names": indices,
         }
     
+    def _load_profile_cache(self, conn: sqlite3.Connection) -> None:
+        """Crea le tabelle di cache/storico e carica i profili salvati."""
+        try:
+            self._create_report_tables(conn)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Cache profili non disponibile: {e}")
+            return
+        if self.full:
+            return
+        
+        for table, fingerprint, stats, validation in conn.execute(
+            f"SELECT table_name, fingerprint, stats, validation FROM {PROFILE_TABLE}"
+        ):
+            self._cache[table] = {
+                "fingerprint": fingerprint,
+                "stats": json.loads(stats),
+                "validation": json.loads(validation) if validation else None,
+            }
+    
+    def _create_report_tables(self, conn: sqlite3.Connection) -> None:
+        """Tabelle di cache dei profili e serie storica delle metriche."""
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+                table_name TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                stats TEXT NOT NULL,
+                validation TEXT,
+                profiled_at TEXT
+            )
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                run_at TEXT PRIMARY KEY,
+                quality_score REAL,
+                total_tables INTEGER,
+                total_rows INTEGER,
+                tables_profiled INTEGER,
+                tables_cached INTEGER,
+                validation_failed INTEGER,
+                total_errors INTEGER,
+                total_warnings INTEGER
+            )
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+                run_at TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                rows INTEGER,
+                null_percentage REAL,
+                duplicate_rows INTEGER,
+                is_valid INTEGER,
+                errors INTEGER,
+                warnings INTEGER,
+                PRIMARY KEY (run_at, table_name)
+            )
+            """
+        )
+    
     def _analyze_tables(self, conn: sqlite3.Connection) -> None:
-        """Analizza ogni tabella."""
+        """
+        Analizza ogni tabella con un solo profilo per tabella.
+        
+        Le tabelle con la stessa impronta dell'esecuzione precedente riusano
+        il profilo salvato. Le KEY_TABLES vengono lette in pandas, perché
+        servono anche ai validatori; tutte le altre (compresi i grandi ds_*)
+        sono profilate in SQLite con una query aggregata, senza caricarne le righe.
+        """
         print_info("Analisi tabelle...")
         
         tables = self.report_data["database"]["table_names"]
         
         for table in tables:
             try:
-                df = pd.read_sql(f"SELECT * FROM {table}", conn)
+                fingerprint = f"v{PROFILE_VERSION}:{table_fingerprint(conn, table)}"
+                cached = self._cache.get(table)
+                if cached and cached["fingerprint"] == fingerprint:
+                    self._entries[table] = {**cached, "cached": True}
+                    self.report_data["tables"].append(cached["stats"])
+                    continue
                 
-                # Statistiche base
-                table_stats = {
-                    "name": table,
-                    "rows": len(df),
-                    "columns": len(df.columns),
-                    "column_names": list(df.columns),
-                    "memory_mb": df.memory_usage(deep=True).sum() / (1024 * 1024),
-                    "null_percentage": df.isnull().sum().sum() / df.size * 100 if df.size > 0 else 0,
-                    "duplicate_rows": int(df.duplicated().sum()),
+                if table in KEY_TABLES:
+                    df = pd.read_sql(f"SELECT * FROM {table}", conn)
+                    profile = profile_dataframe(df)
+                    self._profiled[table] = (df, profile)
+                else:
+                    profile = profile_table(conn, table)
+                stats = profile.table_stats(table)
+                self._entries[table] = {
+                    "fingerprint": fingerprint, "stats": stats, "validation": None, "cached": False,
                 }
-                
-                # Statistiche per colonna
-                column_stats = []
-                for col in df.columns:
-                    series = df[col]
-                    col_stat = {
-                        "name": col,
-                        "dtype": str(series.dtype),
-                        "null_count": int(series.isnull().sum()),
-                        "null_pct": series.isnull().mean() * 100,
-                        "unique_count": int(series.nunique()),
-                    }
-                    
-                    # Statistiche numeriche
-                    if pd.api.types.is_numeric_dtype(series):
-                        col_stat.update({
-                            "min": float(series.min()) if series.notna().any() else None,
-                            "max": float(series.max()) if series.notna().any() else None,
-                            "mean": float(series.mean()) if series.notna().any() else None,
-                        })
-                    
-                    column_stats.append(col_stat)
-                
-                table_stats["columns_detail"] = column_stats
-                self.report_data["tables"].append(table_stats)
+                self.report_data["tables"].append(stats)
                 
             except Exception as e:
                 self.logger.warning(f"Errore analisi tabella {table}: {e}")
@@ -172,33 +262,39 @@ class DataQualityReporter:
                     "name": table,
                     "error": str(e),
                 })
+        
+        cached = sum(1 for entry in self._entries.values() if entry["cached"])
+        print_info(f"Profili: {len(self._entries) - cached} ricalcolati, {cached} dalla cache")
     
     def _validate_data(self, conn: sqlite3.Connection) -> None:
-        """Esegue validazione dati."""
+        """Esegue validazione dati (riusando l'esito salvato per le tabelle invariate)."""
         print_info("Validazione dati...")
         
         # Valida tabelle principali
-        key_tables = [
-            "dim_nil",
-            "dim_tempo",
-            "fact_demografia",
-            "fact_immobiliare",
-            "fact_servizi",
-        ]
-        
-        for table in key_tables:
+        for table in KEY_TABLES:
+            entry = self._entries.get(table)
+            if entry and entry["cached"] and entry["validation"] is not None:
+                self.report_data["validation_results"].append(entry["validation"])
+                continue
+            
             try:
-                df = pd.read_sql(f"SELECT * FROM {table}", conn)
-                validator = create_validator(df, table)
+                if table in self._profiled:
+                    df, profile = self._profiled.pop(table)
+                else:
+                    df, profile = pd.read_sql(f"SELECT * FROM {table}", conn), None
+                validator = create_validator(df, table, profile=profile)
                 result = validator.validate()
                 
-                self.report_data["validation_results"].append({
+                validation = {
                     "table": table,
                     "is_valid": result.is_valid,
                     "errors": result.errors,
                     "warnings": result.warnings,
                     "stats": result.stats,
-                })
+                }
+                self.report_data["validation_results"].append(validation)
+                if entry:
+                    entry.update(validation=validation, cached=False)
                 
             except Exception as e:
                 self.report_data["validation_results"].append({
@@ -209,6 +305,84 @@ class DataQualityReporter:
                     "stats": {},
                 })
     
+    def _save_profile_cache(self, conn: sqlite3.Connection) -> None:
+        """
+        Salva i profili ricalcolati in _table_profile e aggiunge l'esecuzione
+        alla serie storica; carica le ultime HISTORY_RUNS per il grafico.
+        """
+        run_at = self.report_data["generated_at"]
+        summary = self.report_data["summary"]
+        validations = {v["table"]: v for v in self.report_data["validation_results"]}
+        
+        try:
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO {PROFILE_TABLE} (table_name, fingerprint, stats, validation, profiled_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        table,
+                        entry["fingerprint"],
+                        json.dumps(entry["stats"], default=str),
+                        json.dumps(entry["validation"], default=str) if entry["validation"] else None,
+                        run_at,
+                    )
+                    for table, entry in self._entries.items()
+                    if not entry["cached"]
+                ],
+            )
+            # Tabelle non più presenti nel database
+            placeholders = ", ".join("?" * len(self._entries))
+            conn.execute(
+                f"DELETE FROM {PROFILE_TABLE} WHERE table_name NOT IN ({placeholders})",
+                list(self._entries),
+            )
+            
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {RUNS_TABLE} (
+                    run_at, quality_score, total_tables, total_rows, tables_profiled,
+                    tables_cached, validation_failed, total_errors, total_warnings
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    run_at, summary["quality_score"], summary["total_tables"], summary["total_rows"],
+                    summary["tables_profiled"], summary["tables_cached"], summary["validation_failed"],
+                    summary["total_errors"], summary["total_warnings"],
+                ),
+            )
+            rows = []
+            for t in self.report_data["tables"]:
+                if "error" in t:
+                    continue
+                v = validations.get(t["name"])
+                rows.append((
+                    run_at, t["name"], t["rows"], t["null_percentage"], t["duplicate_rows"],
+                    None if v is None else int(v["is_valid"]),
+                    None if v is None else len(v["errors"]),
+                    None if v is None else len(v["warnings"]),
+                ))
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO {HISTORY_TABLE} (
+                    run_at, table_name, rows, null_percentage, duplicate_rows, is_valid, errors, warnings
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            conn.commit()
+            
+            history = pd.read_sql(
+                f"SELECT * FROM {RUNS_TABLE} ORDER BY run_at DESC LIMIT ?",
+                conn,
+                params=(HISTORY_RUNS,),
+            )
+            self.report_data["history"] = history.iloc[::-1].to_dict("records")
+        except Exception as e:
+            conn.rollback()
+            self.logger.warning(f"Cache profili non salvata: {e}")
+    
     def _generate_summary(self) -> None:
         """Genera summary report."""
         tables = self.report_data["tables"]
@@ -231,6 +405,8 @@ class DataQualityReporter:
             "total_errors": total_errors,
             "total_warnings": total_warnings,
             "quality_score": self._calculate_quality_score(),
+            "tables_profiled": sum(1 for e in self._entries.values() if not e["cached"]),
+            "tables_cached": sum(1 for e in self._entries.values() if e["cached"]),
         }
     
     def _calculate_quality_score(self) -> float:
@@ -313,6 +489,22 @@ class DataQualityReporter:
                 </tr>
                 """
         
+        # Andamento tra le esecuzioni
+        history = self.report_data.get("history", [])
+        history_rows = ""
+        for run in reversed(history[-10:]):
+            history_rows += f"""
+            <tr>
+                <td>{run['run_at']}</td>
+                <td>{run['quality_score']:.1f}</td>
+                <td>{run['total_rows']:,}</td>
+                <td>{run['total_errors']}</td>
+                <td>{run['total_warnings']}</td>
+                <td>{run['tables_profiled']} / {run['tables_cached']}</td>
+            </tr>
+            """
+        trend_svg = self._trend_svg([run["quality_score"] for run in history])
+        
         # Genera righe validazione
         validation_rows = ""
         for v in validations:
@@ -425,6 +617,31 @@ class DataQualityReporter:
             </div>
         </div>
         
+        <!-- Trend Section -->
+        <div class="card">
+            <div class="card-header">
+                <h5 class="mb-0">📈 Andamento Qualità</h5>
+            </div>
+            <div class="card-body">
+                {trend_svg}
+                <table class="table table-sm">
+                    <thead>
+                        <tr>
+                            <th>Esecuzione</th>
+                            <th>Score</th>
+                            <th>Righe</th>
+                            <th>Errori</th>
+                            <th>Warning</th>
+                            <th>Ricalcolate / Cache</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {history_rows}
+                    </tbody>
+                </table>
+            </div>
+        </div>
+        
         <!-- Database Info -->
         <div class="card">
             <div class="card-header">
@@ -449,6 +666,21 @@ class DataQualityReporter:
         """
         
         return html
+    
+    @staticmethod
+    def _trend_svg(values: List[float], width: int = 600, height: int = 80) -> str:
+        """Grafico SVG inline del quality score (0-100) per esecuzione."""
+        if len(values) < 2:
+            return ""
+        step = width / (len(values) - 1)
+        points = " ".join(
+            f"{i * step:.1f},{height - value / 100 * height:.1f}" for i, value in enumerate(values)
+        )
+        return (
+            f'<svg viewBox="0 0 {width} {height}" width="100%" height="{height}" class="mb-3">'
+            f'<polyline points="{points}" fill="none" stroke="#0d6efd" stroke-width="2"/>'
+            "</svg>"
+        )
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -459,12 +691,13 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Genera report qualità dati")
     parser.add_argument("--db", default="db/nil_core.db", help="Percorso database")
     parser.add_argument("--output", default="reports", help="Directory output")
+    parser.add_argument("--full", action="store_true", help="Ignora la cache e riprofila tutte le tabelle")
     args = parser.parse_args()
     
     db_path = PROJECT_ROOT / args.db
     output_dir = PROJECT_ROOT / args.output
     
-    reporter = DataQualityReporter(db_path, output_dir)
+    reporter = DataQualityReporter(db_path, output_dir, full=args.full)
     reporter.generate_report()
 
 
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Index advisor guidato da EXPLAIN QUERY PLAN sul carico delle route API.
+
+Al posto della lista scritta a mano in db/migrations/001_indexes.sql:
+- esegue EXPLAIN QUERY PLAN sul catalogo di benchmark_queries.py e rileva
+  i passi SCAN senza indice e USE TEMP B-TREE (ORDER BY / GROUP BY / DISTINCT)
+- ricava le colonne lette da ogni query con l'authorizer di SQLite (nomi
+  esatti, anche quelli codificati delle tabelle ds_ grezze) e propone indici
+  chiave (uguaglianze → range/ordinamento) e coprenti
+- prova ogni candidato su una copia del DB (backup API) e tiene solo quelli
+  che il piano usa davvero e che riducono il p50 delle query interessate
+- scrive una migrazione generata con i soli indici che ripagano
+
+Uso:
+    python index_advisor.py [--db PATH] [--output SQL] [--min-gain 0.10]
+    python index_advisor.py --dry-run   # solo report, nessuna migrazione
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from benchmark_queries import QUERY_CATALOG, REPORTS_DIR, BenchmarkQuery, bench_query, full_scans, query_plan
+
+# Paths
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+MIGRATIONS_DIR = PROJECT_ROOT / "db" / "migrations"
+MIGRATION_PATH = MIGRATIONS_DIR / "004_advised_indexes.sql"
+REPORT_PATH = REPORTS_DIR / "index_advisor.json"
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+DB_PATH = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not DB_PATH.is_absolute():
+    DB_PATH = PROJECT_ROOT / DB_PATH
+
+DEFAULT_REPEAT = 30
+DEFAULT_WARMUP = 3
+# Un indice ripaga se riduce il p50 delle query interessate di almeno il 10%
+# e di almeno MIN_DELTA_MS in assoluto
+DEFAULT_MIN_GAIN = 0.10
+MIN_DELTA_MS = 0.01
+# Oltre questo numero di colonne non si propone la variante coprente
+MAX_INDEX_COLUMNS = 6
+
+# Funzioni per cui si propone un indice su espressione (UPPER(col) = ?)
+EXPRESSION_FUNCTIONS = ("UPPER", "LOWER")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Analisi delle query
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class IndexCandidate:
+    """Indice proposto: tabella e chiavi (identificatori quotati o espressioni)."""
+    table: str
+    keys: Tuple[str, ...]
+
+    @property
+    def name(self) -> str:
+        parts = (self.table,) + self.keys
+        return "idx_adv_" + "_".join(re.sub(r"\W+", "_", part).strip("_").lower() for part in parts)
+
+    @property
+    def sql(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {quote(self.name)} ON {quote(self.table)} ({', '.join(self.keys)})"
+
+
+def quote(identifier: str) -> str:
+    """Identificatore SQLite quotato (le colonne dei ds_ grezzi hanno caratteri codificati)."""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def real_tables(conn: sqlite3.Connection) -> Set[str]:
+    return {
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    }
+
+
+def column_reads(conn: sqlite3.Connection, sql: str, params: Sequence) -> Dict[str, List[str]]:
+    """
+    Colonne lette dalla query, per tabella, in ordine di prima lettura.
+
+    L'authorizer riceve ogni SQLITE_READ durante la preparazione, anche
+    quelli delle tabelle sotto le viste.
+    """
+    reads: Dict[str, List[str]] = {}
+
+    def authorizer(action, table, column, _db, _source):
+        if action == sqlite3.SQLITE_READ and table and column:
+            columns = reads.setdefault(table, [])
+            if column not in columns:
+                columns.append(column)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        query_plan(conn, sql, params)
+    finally:
+        conn.set_authorizer(None)
+    tables = real_tables(conn)
+    return {table: columns for table, columns in reads.items() if table in tables}
+
+
+def plan_issues(plan: Sequence[str]) -> Dict[str, List[str]]:
+    """Tabelle lette per intero e ordinamenti in B-tree temporaneo."""
+    return {
+        "scans": [step.split()[1] for step in full_scans(plan)],
+        "temp_btree": [step for step in plan if step.startswith("USE TEMP B-TREE")],
+    }
+
+
+def column_pattern(column: str) -> str:
+    """Regex del nome di colonna, nudo o quotato, non preceduto/seguito da altri caratteri di parola."""
+    escaped = re.escape(column)
+    return rf'(?<![\w."])(?:"{escaped}"|`{escaped}`|\[{escaped}\]|{escaped})(?![\w"])'
+
+
+def classify_columns(sql: str, columns: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Ruolo delle colonne nei predicati della query.
+
+    Returns:
+        equality (col = / IN / IS), range (< > BETWEEN), order (ORDER BY,
+        GROUP BY, MIN/MAX) ed expressions (UPPER(col) = ...), ciascuno in
+        ordine di colonna
+    """
+    roles: Dict[str, List[str]] = {"equality": [], "range": [], "order": [], "expressions": []}
+    order_clauses = " ".join(
+        m.group(2) for m in re.finditer(
+            r"\b(ORDER|GROUP)\s+BY\b(.*?)(?=\bLIMIT\b|\bHAVING\b|\)|$)", sql, re.IGNORECASE | re.DOTALL
+        )
+    )
+    for column in columns:
+        col = column_pattern(column)
+        if re.search(rf"{col}\s*(?:==?|\bIN\b|\bIS\b)|(?<![<>!])==?\s*{col}", sql, re.IGNORECASE):
+            roles["equality"].append(column)
+        elif re.search(rf"{col}\s*(?:<(?!>)|>|\bBETWEEN\b)", sql, re.IGNORECASE):
+            roles["range"].append(column)
+        if re.search(col, order_clauses) or re.search(rf"\b(?:MIN|MAX)\s*\(\s*{col}\s*\)", sql, re.IGNORECASE):
+            roles["order"].append(column)
+        for function in EXPRESSION_FUNCTIONS:
+            if re.search(rf"\b{function}\s*\(\s*{col}\s*\)\s*==?", sql, re.IGNORECASE):
+                roles["expressions"].append(f"{function}({quote(column)})")
+    return roles
+
+
+def existing_index_keys(conn: sqlite3.Connection, table: str) -> List[Tuple[str, ...]]:
+    """Chiavi (colonne quotate) degli indici già presenti sulla tabella."""
+    keys = []
+    for index in conn.execute(f"PRAGMA index_list({quote(table)})").fetchall():
+        info = conn.execute(f"PRAGMA index_info({quote(index[1])})").fetchall()
+        keys.append(tuple(quote(row[2]) if row[2] is not None else "" for row in info))
+    return keys
+
+
+def propose_candidates(conn: sqlite3.Connection, query: BenchmarkQuery, params: Sequence) -> List[IndexCandidate]:
+    """
+    Indici candidati per le tabelle che la query legge per intero o ordina
+    in un B-tree temporaneo: chiave (uguaglianze, poi ordinamento o primo
+    range) e variante coprente con le altre colonne lette.
+    """
+    issues = plan_issues(query_plan(conn, query.sql, params))
+    if not issues["scans"] and not issues["temp_btree"]:
+        return []
+
+    candidates: List[IndexCandidate] = []
+    for table, columns in column_reads(conn, query.sql, params).items():
+        if table not in issues["scans"] and not issues["temp_btree"]:
+            continue
+        roles = classify_columns(query.sql, columns)
+        equality = [quote(c) for c in roles["equality"]]
+        tail = [quote(c) for c in roles["order"] if c not in roles["equality"]] or [quote(c) for c in roles["range"][:1]]
+
+        key_sets = [tuple(roles["expressions"])] if roles["expressions"] else []
+        key_sets.append(tuple(equality + tail))
+        if roles["order"] and equality:
+            # MIN/MAX o ORDER BY in una sottoquery indipendente dalle uguaglianze
+            key_sets.append(tuple(quote(c) for c in roles["order"]))
+
+        existing = existing_index_keys(conn, table)
+        for keys in key_sets:
+            if not keys or any(index[:len(keys)] == keys for index in existing):
+                continue
+            candidates.append(IndexCandidate(table, keys))
+            covering = keys + tuple(quote(c) for c in columns if quote(c) not in keys)
+            if len(covering) > len(keys) and len(covering) <= MAX_INDEX_COLUMNS:
+                candidates.append(IndexCandidate(table, covering))
+    return list(dict.fromkeys(candidates))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Prova su copia
+# ─────────────────────────────────────────────────────────────────────────────
+
+def trial_copy(conn: sqlite3.Connection, directory: str) -> sqlite3.Connection:
+    """Copia del DB in un file temporaneo (backup API), con statistiche aggiornate."""
+    trial = sqlite3.connect(str(Path(directory) / "trial.db"))
+    conn.backup(trial)
+    trial.execute("ANALYZE")
+    trial.commit()
+    return trial
+
+
+def resolve_params(conn: sqlite3.Connection, query: BenchmarkQuery) -> Optional[Tuple]:
+    """Parametri della query, o None se le tabelle mancano nel DB."""
+    try:
+        params = query.params
+        if query.params_sql:
+            row = conn.execute(query.params_sql).fetchone()
+            params = tuple(row) if row else ()
+        query_plan(conn, query.sql, params)
+        return params
+    except sqlite3.Error:
+        return None
+
+
+def measure(conn: sqlite3.Connection, queries: Sequence[BenchmarkQuery], repeat: int, warmup: int) -> Dict[str, object]:
+    """p50 totale e piani delle query."""
+    results = [bench_query(conn, q, repeat, warmup) for q in queries]
+    return {
+        "p50_ms": sum(r.get("p50_ms", 0.0) for r in results),
+        "plans": [step for r in results for step in r.get("plan", [])],
+    }
+
+
+def plan_uses(plans: Sequence[str], name: str) -> bool:
+    """
+    True se un passo del piano usa esattamente l'indice name.
+
+    Un confronto per sottostringa non basta: il nome della variante coprente
+    inizia con quello del candidato solo chiave (idx_adv_t_a / idx_adv_t_a_b).
+    """
+    pattern = re.compile(rf"\bINDEX {re.escape(name)}(?!\w)")
+    return any(pattern.search(step) for step in plans)
+
+
+def evaluate_candidates(
+    conn: sqlite3.Connection,
+    candidates: Dict[IndexCandidate, List[BenchmarkQuery]],
+    repeat: int = DEFAULT_REPEAT,
+    warmup: int = DEFAULT_WARMUP,
+    min_gain: float = DEFAULT_MIN_GAIN,
+    min_delta_ms: float = MIN_DELTA_MS,
+) -> List[Dict[str, object]]:
+    """
+    Crea un candidato alla volta sulla copia e lo tiene solo se ripaga.
+
+    La selezione è greedy: un indice accettato resta sulla copia, così i
+    candidati successivi sullo stesso carico si confrontano con il piano già
+    migliorato e non si accumulano indici ridondanti.
+    """
+    results = []
+    for candidate, queries in candidates.items():
+        before = measure(conn, queries, repeat, warmup)
+        try:
+            conn.execute(candidate.sql)
+            conn.execute(f"ANALYZE {quote(candidate.name)}")
+        except sqlite3.Error as e:
+            results.append({"index": candidate.name, "table": candidate.table, "accepted": False, "reason": str(e)})
+            continue
+        after = measure(conn, queries, repeat, warmup)
+
+        delta = before["p50_ms"] - after["p50_ms"]
+        gain = delta / before["p50_ms"] if before["p50_ms"] > 0 else 0.0
+        used = plan_uses(after["plans"], candidate.name)
+        accepted = used and gain >= min_gain and delta >= min_delta_ms
+        if not accepted:
+            conn.execute(f"DROP INDEX {quote(candidate.name)}")
+        conn.commit()
+
+        results.append({
+            "index": candidate.name,
+            "table": candidate.table,
+            "keys": list(candidate.keys),
+            "sql": candidate.sql,
+            "queries": [f"{q.route} / {q.name}" for q in queries],
+            "before_p50_ms": before["p50_ms"],
+            "after_p50_ms": after["p50_ms"],
+            "gain": gain,
+            "used_by_plan": used,
+            "accepted": accepted,
+        })
+    return results
+
+
+def prune_superseded(
+    conn: sqlite3.Connection, results: List[Dict[str, object]], queries: Sequence[BenchmarkQuery]
+) -> None:
+    """Scarta gli indici accettati che nessun piano finale usa più (sostituiti da un coprente)."""
+    plans = [step for q in queries for step in query_plan(conn, q.sql, resolve_params(conn, q))]
+    for entry in results:
+        if entry["accepted"] and not plan_uses(plans, entry["index"]):
+            conn.execute(f"DROP INDEX {quote(entry['index'])}")
+            entry.update(accepted=False, superseded=True)
+    conn.commit()
+
+
+def advise_indexes(
+    conn: sqlite3.Connection,
+    queries: Sequence[BenchmarkQuery] = QUERY_CATALOG,
+    repeat: int = DEFAULT_REPEAT,
+    warmup: int = DEFAULT_WARMUP,
+    min_gain: float = DEFAULT_MIN_GAIN,
+    min_delta_ms: float = MIN_DELTA_MS,
+) -> Dict[str, object]:
+    """
+    Analizza il catalogo, propone indici e li misura su una copia del DB.
+
+    Il DB originale non viene modificato.
+
+    Returns:
+        Report: problemi dei piani per query, candidati valutati, indici accettati
+    """
+    issues = []
+    candidates: Dict[IndexCandidate, List[BenchmarkQuery]] = {}
+    with tempfile.TemporaryDirectory(prefix="index_advisor_") as directory:
+        trial = trial_copy(conn, directory)
+        try:
+            tables_read: Dict[BenchmarkQuery, Set[str]] = {}
+            for query in queries:
+                params = resolve_params(trial, query)
+                if params is None:
+                    continue
+                tables_read[query] = set(column_reads(trial, query.sql, params))
+                found = plan_issues(query_plan(trial, query.sql, params))
+                if found["scans"] or found["temp_btree"]:
+                    issues.append({"route": query.route, "name": query.name, **found})
+                for candidate in propose_candidates(trial, query, params):
+                    candidates.setdefault(candidate, [])
+
+            # Ogni candidato si misura su tutte le query che leggono la sua tabella
+            for candidate, affected in candidates.items():
+                affected.extend(q for q, tables in tables_read.items() if candidate.table in tables)
+            results = evaluate_candidates(trial, candidates, repeat, warmup, min_gain, min_delta_ms)
+            prune_superseded(trial, results, tables_read)
+        finally:
+            trial.close()
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "sqlite_version": sqlite3.sqlite_version,
+        "repeat": repeat,
+        "min_gain": min_gain,
+        "issues": issues,
+        "candidates": results,
+        "accepted": [r for r in results if r["accepted"]],
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Migrazione generata
+# ─────────────────────────────────────────────────────────────────────────────
+
+def render_migration(report: Dict[str, object], database: str = "") -> str:
+    """Script SQL con gli indici accettati, uno statement per riga."""
+    lines = [
+        "-- ============================================================================",
+        "-- Indici proposti da data_pipeline/scripts/index_advisor.py",
+        "-- FILE GENERATO: non modificare a mano, rigenerare con `make advise-indexes`",
+        f"-- Generato: {report['generated_at']}",
+    ]
+    if database:
+        lines.append(f"-- Database: {database}")
+    lines += [
+        f"-- Soglia: p50 -{report['min_gain'] * 100:.0f}% sulle query interessate",
+        "-- ============================================================================",
+        "",
+    ]
+    for entry in report["accepted"]:
+        lines.append(
+            f"-- {entry['before_p50_ms']:.3f} → {entry['after_p50_ms']:.3f} ms "
+            f"({-entry['gain'] * 100:+.0f}%): {', '.join(entry['queries'])}"
+        )
+        lines.append(f"{entry['sql']};")
+        lines.append("")
+    lines.append("ANALYZE;")
+    return "\n".join(lines) + "\n"
+
+
+def print_advice(report: Dict[str, object]) -> None:
+    print(f"\nPiani con SCAN / TEMP B-TREE: {len(report['issues'])} query")
+    for issue in report["issues"]:
+        steps = [f"SCAN {t}" for t in issue["scans"]] + issue["temp_btree"]
+        print(f"  {issue['route']} / {issue['name']}: {'; '.join(steps)}")
+
+    print(f"\nCandidati valutati: {len(report['candidates'])}")
+    for entry in report["candidates"]:
+        if "gain" not in entry:
+            print(f"  ⚠ {entry['index']}: {entry['reason']}")
+            continue
+        mark = "✓" if entry["accepted"] else "·"
+        note = "" if entry["used_by_plan"] else "  (non usato dal piano)"
+        if entry.get("superseded"):
+            note = "  (sostituito da un indice coprente)"
+        print(f"  {mark} {entry['index']}: {entry['before_p50_ms']:.3f} → "
+              f"{entry['after_p50_ms']:.3f} ms ({-entry['gain'] * 100:+.0f}%){note}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Propone indici dal carico delle route API")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--output", type=str, default=str(MIGRATION_PATH), help="Migrazione SQL generata")
+    parser.add_argument("--report", type=str, default=str(REPORT_PATH), help="Report JSON")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Ripetizioni cronometrate")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="Esecuzioni di warm-up")
+    parser.add_argument("--min-gain", type=float, default=DEFAULT_MIN_GAIN,
+                        help="Riduzione minima del p50 (0.10 = -10%%)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo report, non scrive la migrazione")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"❌ Database non trovato: {db_path}")
+        return 1
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    report = advise_indexes(conn, repeat=args.repeat, warmup=args.warmup, min_gain=args.min_gain)
+    conn.close()
+    report["database"] = str(db_path)
+
+    print_advice(report)
+
+    report_path = Path(args.report)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n  ✓ Report: {report_path}")
+
+    if args.dry_run:
+        return 0
+    output = Path(args.output)
+    output.write_text(render_migration(report, str(db_path)), encoding="utf-8")
+    print(f"  ✓ {len(report['accepted'])} indici in {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+publish_database.py
+Pubblicazione atomica del database unificato tramite file shadow.
+
+Il server Node legge milano_unified.db mentre la pipeline lo aggiorna: per
+evitare stati intermedi e contese sui lock, la nuova generazione viene
+costruita in un file shadow (milano_unified.db.next), compattata e
+ottimizzata da finalize_database.py (VACUUM INTO, ANALYZE, mmap_size),
+verificata con i test di tests/test_pipeline.py e infine
+sostituita al file live con un rename atomico. Le generazioni precedenti
+restano in db/generations/ per un rollback immediato.
+
+Uso:
+    python publish_database.py --list             # Generazioni disponibili
+    python publish_database.py --rollback         # Ripristina la generazione precedente
+    python update_database.py --publish           # Pipeline completa su shadow + publish
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from finalize_database import finalize_database, write_report
+
+# Paths
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent.parent
+TESTS_FILE = PROJECT_ROOT / "tests" / "test_pipeline.py"
+
+DEFAULT_DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+UNIFIED_DB = Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+if not UNIFIED_DB.is_absolute():
+    UNIFIED_DB = PROJECT_ROOT / UNIFIED_DB
+
+# Generazioni precedenti mantenute per rollback
+DEFAULT_KEEP_GENERATIONS = 3
+
+
+class PublishError(Exception):
+    """Errore nella verifica o pubblicazione di una generazione."""
+
+
+def shadow_path(live_db: Path) -> Path:
+    """Path del file shadow per la prossima generazione."""
+    return live_db.with_name(live_db.name + ".next")
+
+
+def generations_dir(live_db: Path) -> Path:
+    """Directory delle generazioni precedenti."""
+    return live_db.parent / "generations"
+
+
+def list_generations(live_db: Path) -> List[Path]:
+    """Generazioni precedenti, dalla più recente."""
+    directory = generations_dir(live_db)
+    if not directory.exists():
+        return []
+    return sorted(directory.glob(f"{live_db.stem}.*.db"), reverse=True)
+
+
+def prepare_shadow(live_db: Path, logger: logging.Logger) -> Path:
+    """
+    Crea il file shadow come copia consistente del DB live.
+
+    Usa la backup API di SQLite, così la copia è coerente anche se il DB
+    è aperto in lettura dal server.
+    """
+    shadow = shadow_path(live_db)
+    for path in (shadow, Path(f"{shadow}-wal"), Path(f"{shadow}-shm"), Path(f"{shadow}-journal")):
+        path.unlink(missing_ok=True)
+
+    live_db.parent.mkdir(parents=True, exist_ok=True)
+    target = sqlite3.connect(str(shadow))
+    if live_db.exists():
+        source = sqlite3.connect(f"file:{live_db}?mode=ro", uri=True)
+        source.backup(target)
+        source.close()
+    target.close()
+
+    logger.info(f"Shadow preparato: {shadow}")
+    return shadow
+
+
+def finalize_shadow(shadow: Path, logger: logging.Logger) -> None:
+    """Compatta lo shadow, aggiorna le statistiche del planner e lo verifica con quick_check."""
+    try:
+        write_report(finalize_database(shadow, log=logger.info))
+    except sqlite3.DatabaseError as e:
+        raise PublishError(str(e)) from e
+    logger.info("✓ VACUUM INTO, ANALYZE e quick_check completati sullo shadow")
+
+
+def verify_shadow(shadow: Path, logger: logging.Logger) -> None:
+    """Esegue tests/test_pipeline.py contro lo shadow (via DB_PATH)."""
+    if not TESTS_FILE.exists():
+        logger.warning(f"Test non trovati ({TESTS_FILE}), verifica saltata")
+        return
+
+    env = {**os.environ, "DB_PATH": str(shadow)}
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", str(TESTS_FILE), "-q", "-x", "-p", "no:cacheprovider"],
+        capture_output=True,
+        text=True,
+        cwd=str(PROJECT_ROOT),
+        env=env,
+    )
+    if result.returncode != 0:
+        raise PublishError(f"Verifica shadow fallita:\n{result.stdout[-2000:]}")
+    summary = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else "ok"
+    logger.info(f"✓ Verifica shadow: {summary}")
+
+
+def prune_generations(live_db: Path, keep: int, logger: logging.Logger) -> None:
+    """Mantiene solo le ultime `keep` generazioni."""
+    for old in list_generations(live_db)[keep:]:
+        old.unlink(missing_ok=True)
+        logger.info(f"  Rimossa generazione {old.name}")
+
+
+def swap_in(live_db: Path, new_db: Path, keep: int, logger: logging.Logger) -> Optional[Path]:
+    """
+    Sostituisce atomicamente il DB live con new_db.
+
+    Il DB live corrente viene conservato come generazione (hard link quando
+    possibile, così non viene copiato). I lettori già connessi continuano a
+    leggere la generazione precedente fino alla riapertura.
+
+    Returns:
+        Path della generazione archiviata (None se non esisteva un DB live)
+    """
+    archived = None
+    if live_db.exists() and keep > 0:
+        directory = generations_dir(live_db)
+        directory.mkdir(parents=True, exist_ok=True)
+        archived = directory / f"{live_db.stem}.{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db"
+        try:
+            os.link(live_db, archived)
+        except OSError:
+            source = sqlite3.connect(f"file:{live_db}?mode=ro", uri=True)
+            target = sqlite3.connect(str(archived))
+            source.backup(target)
+            source.close()
+            target.close()
+
+    os.replace(new_db, live_db)
+    for suffix in ("-wal", "-shm"):
+        Path(f"{live_db}{suffix}").unlink(missing_ok=True)
+
+    prune_generations(live_db, keep, logger)
+    return archived
+
+
+def publish_shadow(
+    live_db: Path,
+    logger: logging.Logger,
+    keep: int = DEFAULT_KEEP_GENERATIONS,
+    verify: bool = True,
+) -> bool:
+    """Ottimizza, verifica e pubblica lo shadow. Lo shadow resta su disco se la verifica fallisce."""
+    shadow = shadow_path(live_db)
+    if not shadow.exists():
+        logger.error(f"Shadow non trovato: {shadow}")
+        return False
+
+    try:
+        finalize_shadow(shadow, logger)
+        if verify:
+            verify_shadow(shadow, logger)
+    except (PublishError, sqlite3.Error) as e:
+        logger.error(f"✗ Pubblicazione annullata, DB live invariato: {e}")
+        return False
+
+    archived = swap_in(live_db, shadow, keep, logger)
+    logger.info(f"✓ Nuova generazione pubblicata: {live_db}")
+    if archived:
+        logger.info(f"  Generazione precedente: {archived.name}")
+    return True
+
+
+def rollback(live_db: Path, logger: logging.Logger, keep: int = DEFAULT_KEEP_GENERATIONS) -> bool:
+    """Ripristina la generazione precedente più recente."""
+    generations = list_generations(live_db)
+    if not generations:
+        logger.error("Nessuna generazione disponibile per il rollback")
+        return False
+
+    previous = generations[0]
+    # La generazione viene consumata: il DB live attuale diventa a sua volta una generazione
+    staging = shadow_path(live_db)
+    os.replace(previous, staging)
+    swap_in(live_db, staging, keep, logger)
+    logger.info(f"✓ Rollback a {previous.name}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pubblicazione atomica del database unificato")
+    parser.add_argument("--db", type=str, default=str(UNIFIED_DB), help="Path database live")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP_GENERATIONS,
+                        help=f"Generazioni precedenti da mantenere (default: {DEFAULT_KEEP_GENERATIONS})")
+    parser.add_argument("--publish", action="store_true", help="Pubblica lo shadow esistente")
+    parser.add_argument("--no-verify", action="store_true", help="Salta i test sullo shadow")
+    parser.add_argument("--rollback", action="store_true", help="Ripristina la generazione precedente")
+    parser.add_argument("--list", action="store_true", help="Elenca le generazioni disponibili")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    logger = logging.getLogger("publish_database")
+    live_db = Path(args.db)
+
+    if args.list:
+        for generation in list_generations(live_db):
+            size_mb = generation.stat().st_size / (1024 * 1024)
+            print(f"  {generation.name}  ({size_mb:.2f} MB)")
+        return
+
+    if args.rollback:
+        sys.exit(0 if rollback(live_db, logger, args.keep) else 1)
+
+    if args.publish:
+        sys.exit(0 if publish_shadow(live_db, logger, args.keep, verify=not args.no_verify) else 1)
+
+    parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
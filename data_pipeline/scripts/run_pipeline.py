@@ -249,6 +249,8 @@ Esempi:
     parser.add_argument("--skip-star", action="store_true", help="Salta star schema")
     parser.add_argument("--skip-master", action="store_true", help="Salta master geo")
     parser.add_argument("--skip-report", action="store_true", help="Salta report qualità")
+    parser.add_argument("--export-polygons", action="store_true",
+                        help="Rigenera website/src/data/nilPolygons.js (file versionato)")
     parser.add_argument("--force", action="store_true", help="Forza riscaricamento")
     parser.add_argument("--only-report", action="store_true", help="Genera solo report qualità")
     parser.add_argument("--continue-on-error", action="store_true", help="Continua anche se uno step fallisce")
@@ -314,12 +316,43 @@ Esempi:
             "skip": args.skip_star,
             "extra_args": [],
         },
+        {
+            "name": "Build Accessibility Metrics",
+            "script": "build_accessibilita.py",
+            "skip": args.skip_star,
+            "extra_args": [],
+        },
+        {
+            "name": "Build Simplified NIL Geometries",
+            "script": "build_nil_geometries.py",
+            "skip": args.skip_star,
+            "extra_args": [],
+        },
         {
             "name": "Build Master GeoDataset",
             "script": "build_master_geo.py",
             "skip": args.skip_master,
             "extra_args": [],
         },
+        {
+            "name": "Build NIL Vector Tiles",
+            "script": "build_nil_tiles.py",
+            "skip": args.skip_master,
+            "extra_args": [],
+        },
+        {
+            "name": "Export NIL TopoJSON",
+            "script": "topojson_encoder.py",
+            "skip": args.skip_master,
+            "extra_args": [],
+        },
+        {
+            "name": "Export NIL Polygons (frontend)",
+            "script": "export_nil_polygons.py",
+            # Sovrascrive un file versionato del frontend: solo su richiesta
+            "skip": args.skip_master or not args.export_polygons,
+            "extra_args": [],
+        },
         {
             "name": "Generate Quality Report",
             "script": "generate_quality_report.py",
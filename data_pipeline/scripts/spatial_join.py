@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Assegnazione spaziale dei dataset puntuali ai NIL.
+
+Molti dataset (alberi monumentali, colonnine di ricarica, biblioteche,
+botteghe storiche, ...) hanno coordinate ma solo a volte un nome NIL
+affidabile. Questo stage:
+- costruisce uno STRtree sulle geometrie di dim_nil
+- assegna in blocco id_nil a ogni punto (point-in-polygon vettoriale)
+- salva l'assegnazione in bridge_punti_nil, con cache per hash sorgente
+- ricalcola fact_servizi_punti (conteggi per NIL senza match testuale)
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Costanti
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Coppie (longitudine, latitudine) usate dai dataset Open Data Milano,
+# dopo la normalizzazione dei nomi colonna di process_core
+COORDINATE_COLUMN_PAIRS: Tuple[Tuple[str, str], ...] = (
+    ("long_x_4326", "lat_y_4326"),
+    ("longitudine", "latitudine"),
+    ("longitude", "latitude"),
+    ("lng", "lat"),
+    ("lon", "lat"),
+    ("long", "lat"),
+)
+
+# Colonne testuali "(lat, lon)"
+LOCATION_COLUMNS: Tuple[str, ...] = ("location", "geo_point_2d")
+
+# Bounding box larga del Comune di Milano (lon_min, lat_min, lon_max, lat_max)
+MILANO_BBOX = (8.9, 45.3, 9.4, 45.6)
+
+BRIDGE_TABLE = "bridge_punti_nil"
+CACHE_TABLE = "_spatial_join_cache"
+COUNTS_TABLE = "fact_servizi_punti"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Indice NIL
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class NilIndex:
+    """Geometrie NIL con indice spaziale STRtree."""
+    ids: np.ndarray
+    geometries: np.ndarray
+    tree: STRtree
+    fingerprint: str
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def load_nil_index(conn: sqlite3.Connection) -> Optional[NilIndex]:
+    """
+    Carica le geometrie di dim_nil e costruisce lo STRtree.
+
+    Returns:
+        NilIndex, oppure None se dim_nil manca o non ha geometrie valide
+    """
+    try:
+        df = pd.read_sql("SELECT id_nil, geometry FROM dim_nil ORDER BY id_nil", conn)
+    except Exception:
+        return None
+
+    df = df[df["id_nil"].notna() & df["geometry"].notna()]
+    if df.empty:
+        return None
+
+    raw = df["geometry"].astype(str).to_numpy()
+    geometries = shapely.from_geojson(raw, on_invalid="ignore")
+    valid = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+    if not valid.any():
+        return None
+
+    ids = df["id_nil"].to_numpy(dtype=np.int64)[valid]
+    geometries = geometries[valid]
+    shapely.prepare(geometries)
+
+    digest = hashlib.sha256()
+    digest.update(ids.tobytes())
+    for text in raw[valid]:
+        digest.update(text.encode("utf-8"))
+
+    return NilIndex(
+        ids=ids,
+        geometries=geometries,
+        tree=STRtree(geometries),
+        fingerprint=digest.hexdigest(),
+    )
+
+
+def assign_points(index: NilIndex, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """
+    Assegna id_nil a un array di punti (point-in-polygon vettoriale).
+
+    I punti sul confine tra due NIL vengono assegnati al NIL con id_nil minore,
+    indipendentemente dall'ordine dei risultati dello STRtree.
+
+    Returns:
+        Array float di id_nil (NaN per punti fuori da ogni NIL)
+    """
+    result = np.full(len(lon), np.nan)
+    if len(lon) == 0:
+        return result
+
+    points = shapely.points(lon, lat)
+    point_idx, tree_idx = index.tree.query(points, predicate="intersects")
+    if len(point_idx) == 0:
+        return result
+
+    # index.ids è ordinato: a parità di punto vince la posizione minore
+    order = np.lexsort((tree_idx, point_idx))
+    point_idx, tree_idx = point_idx[order], tree_idx[order]
+    first_point, first_pos = np.unique(point_idx, return_index=True)
+    result[first_point] = index.ids[tree_idx[first_pos]]
+    return result
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Lettura punti
+# ─────────────────────────────────────────────────────────────────────────────
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Ritorna i nomi colonna di una tabella."""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")').fetchall()]
+
+
+def detect_coordinate_columns(columns: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Rileva le colonne coordinate di un dataset.
+
+    Returns:
+        (col_lon, col_lat), (col_location,) per colonne "(lat, lon)", oppure None
+    """
+    lowered = {c.lower(): c for c in columns}
+    for lon_col, lat_col in COORDINATE_COLUMN_PAIRS:
+        if lon_col in lowered and lat_col in lowered:
+            return lowered[lon_col], lowered[lat_col]
+    for location_col in LOCATION_COLUMNS:
+        if location_col in lowered:
+            return (lowered[location_col],)
+    return None
+
+
+def discover_point_tables(conn: sqlite3.Connection) -> List[str]:
+    """Trova le tabelle ds_* con colonne coordinate."""
+    tables = [
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'ds\\_%' ESCAPE '\\' ORDER BY name"
+        ).fetchall()
+    ]
+    return [t for t in tables if detect_coordinate_columns(table_columns(conn, t))]
+
+
+def read_points(conn: sqlite3.Connection, table: str) -> Optional[pd.DataFrame]:
+    """
+    Legge rowid e coordinate di una tabella puntuale.
+
+    Returns:
+        DataFrame con colonne rowid, lon, lat (float, NaN se non valide),
+        oppure None se la tabella non ha coordinate
+    """
+    coords = detect_coordinate_columns(table_columns(conn, table))
+    if coords is None:
+        return None
+
+    if len(coords) == 2:
+        df = pd.read_sql(
+            f'SELECT rowid AS rowid, "{coords[0]}" AS lon, "{coords[1]}" AS lat FROM "{table}"',
+            conn,
+        )
+    else:
+        df = pd.read_sql(f'SELECT rowid AS rowid, "{coords[0]}" AS location FROM "{table}"', conn)
+        parts = df["location"].astype("string").str.extract(
+            r"(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)"
+        )
+        df = pd.DataFrame({"rowid": df["rowid"], "lat": parts[0], "lon": parts[1]})
+
+    for col in ("lon", "lat"):
+        df[col] = pd.to_numeric(
+            df[col].astype("string").str.replace(",", ".", regex=False), errors="coerce"
+        )
+
+    lon_min, lat_min, lon_max, lat_max = MILANO_BBOX
+    inside = df["lon"].between(lon_min, lon_max) & df["lat"].between(lat_min, lat_max)
+    df.loc[~inside, ["lon", "lat"]] = np.nan
+    return df
+
+
+def source_hash(points: pd.DataFrame, nil_fingerprint: str) -> str:
+    """Hash del contenuto sorgente (rowid + coordinate) e delle geometrie NIL."""
+    digest = hashlib.sha256(nil_fingerprint.encode("ascii"))
+    digest.update(points["rowid"].to_numpy(dtype=np.int64).tobytes())
+    digest.update(points["lon"].to_numpy(dtype=np.float64).tobytes())
+    digest.update(points["lat"].to_numpy(dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Persistenza
+# ─────────────────────────────────────────────────────────────────────────────
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    """Crea tabelle bridge e cache se non esistono."""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {BRIDGE_TABLE} (
+            source_table TEXT NOT NULL,
+            source_rowid INTEGER NOT NULL,
+            id_nil INTEGER,
+            PRIMARY KEY (source_table, source_rowid)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+            source_table TEXT PRIMARY KEY,
+            source_hash TEXT NOT NULL,
+            rows INTEGER,
+            assigned INTEGER,
+            updated_at TEXT
+        )
+        """
+    )
+
+
+def cached_hash(conn: sqlite3.Connection, table: str) -> Optional[str]:
+    """Ritorna l'hash sorgente salvato per una tabella."""
+    row = conn.execute(
+        f"SELECT source_hash FROM {CACHE_TABLE} WHERE source_table = ?", (table,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def load_spatial_assignments(conn: sqlite3.Connection, table: str) -> Optional[pd.Series]:
+    """
+    Carica l'assegnazione spaziale di una tabella.
+
+    Returns:
+        Series id_nil indicizzata per rowid sorgente, oppure None se assente
+    """
+    try:
+        df = pd.read_sql(
+            f"SELECT source_rowid, id_nil FROM {BRIDGE_TABLE} WHERE source_table = ? AND id_nil IS NOT NULL",
+            conn,
+            params=(table,),
+        )
+    except Exception:
+        return None
+    if df.empty:
+        return None
+    return df.set_index("source_rowid")["id_nil"]
+
+
+def rebuild_counts(conn: sqlite3.Connection) -> int:
+    """Ricalcola fact_servizi_punti dal bridge."""
+    conn.execute(f"DROP TABLE IF EXISTS {COUNTS_TABLE}")
+    conn.execute(
+        f"""
+        CREATE TABLE {COUNTS_TABLE} (
+            id_nil INTEGER NOT NULL,
+            categoria TEXT NOT NULL,
+            numero_punti INTEGER NOT NULL,
+            PRIMARY KEY (id_nil, categoria)
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO {COUNTS_TABLE} (id_nil, categoria, numero_punti)
+        SELECT id_nil, SUBSTR(source_table, 4), COUNT(*)
+        FROM {BRIDGE_TABLE}
+        WHERE id_nil IS NOT NULL
+        GROUP BY id_nil, source_table
+        """
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {COUNTS_TABLE}").fetchone()[0]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Stage
+# ─────────────────────────────────────────────────────────────────────────────
+
+def run_spatial_join(
+    conn: sqlite3.Connection,
+    tables: Optional[List[str]] = None,
+    force: bool = False,
+    index: Optional[NilIndex] = None,
+) -> Dict[str, Dict[str, object]]:
+    """
+    Assegna id_nil ai punti di tutte le tabelle puntuali.
+
+    Args:
+        conn: Connessione al DB con dim_nil già costruita
+        tables: Tabelle da elaborare (default: tutte le ds_* con coordinate)
+        force: Ignora la cache e ricalcola tutto
+        index: Indice NIL già caricato (default: costruito da dim_nil)
+
+    Returns:
+        Dizionario tabella -> {status, rows, assigned}
+    """
+    index = index or load_nil_index(conn)
+    if index is None:
+        return {}
+
+    ensure_tables(conn)
+    discovered = tables is None
+    tables = discover_point_tables(conn) if discovered else tables
+
+    results: Dict[str, Dict[str, object]] = {}
+    for table in tables:
+        points = read_points(conn, table)
+        if points is None:
+            continue
+
+        digest = source_hash(points, index.fingerprint)
+        if not force and cached_hash(conn, table) == digest:
+            results[table] = {"status": "cached", "rows": len(points), "assigned": None}
+            continue
+
+        valid = points["lon"].notna() & points["lat"].notna()
+        id_nil = np.full(len(points), np.nan)
+        id_nil[valid.to_numpy()] = assign_points(
+            index,
+            points.loc[valid, "lon"].to_numpy(),
+            points.loc[valid, "lat"].to_numpy(),
+        )
+        assigned = int(np.count_nonzero(~np.isnan(id_nil)))
+
+        conn.execute(f"DELETE FROM {BRIDGE_TABLE} WHERE source_table = ?", (table,))
+        conn.executemany(
+            f"INSERT INTO {BRIDGE_TABLE} (source_table, source_rowid, id_nil) VALUES (?, ?, ?)",
+            zip(
+                [table] * len(points),
+                points["rowid"].astype(int).tolist(),
+                [None if np.isnan(v) else int(v) for v in id_nil],
+            ),
+        )
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {CACHE_TABLE} (source_table, source_hash, rows, assigned, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (table, digest, len(points), assigned, datetime.now().isoformat()),
+        )
+        results[table] = {"status": "updated", "rows": len(points), "assigned": assigned}
+
+    # Rimuove assegnazioni di tabelle non più presenti; con nessuna tabella
+    # scoperta NOT IN () è sempre vero e svuota bridge e cache
+    if discovered:
+        placeholders = ",".join("?" for _ in tables)
+        conn.execute(f"DELETE FROM {BRIDGE_TABLE} WHERE source_table NOT IN ({placeholders})", tables)
+        conn.execute(f"DELETE FROM {CACHE_TABLE} WHERE source_table NOT IN ({placeholders})", tables)
+
+    rebuild_counts(conn)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Assegna id_nil ai dataset puntuali tramite join spaziale")
+    parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
+    parser.add_argument("--tables", nargs="+", help="Elabora solo le tabelle indicate")
+    parser.add_argument("--force", action="store_true", help="Ignora la cache e ricalcola tutto")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parent.parent
+    db_path = project_root / args.db
+
+    conn = sqlite3.connect(db_path)
+    results = run_spatial_join(conn, tables=args.tables, force=args.force)
+    conn.commit()
+    conn.close()
+
+    if not results:
+        print("Nessuna geometria NIL o nessun dataset puntuale trovato")
+        return
+
+    for table, info in results.items():
+        if info["status"] == "cached":
+            print(f"  = {table}: invariato ({info['rows']} punti, cache)")
+        else:
+            print(f"  ✓ {table}: {info['assigned']}/{info['rows']} punti assegnati")
+
+
+if __name__ == "__main__":
+    main()
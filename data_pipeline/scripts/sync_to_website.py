@@ -8,21 +8,30 @@ Questo script:
 2. Crea/aggiorna le viste e tabelle ottimizzate per le API Express
 3. Importa dati aggiuntivi da file esterni (prezzi OMI, etc.) SE ABILITATO
 4. Genera metadati sulla freschezza dei dati
+5. Materializza le viste vw_api_* in tabelle indicizzate mv_api_* SE ABILITATO
+   (altrimenti rimuove gli snapshot mv_api_* rimasti da sync precedenti)
+6. Precalcola le risposte per-NIL delle API in api_response_cache
 
 Uso:
-    python sync_to_website.py [--dry-run] [--verbose] [--force]
+    python sync_to_website.py [--dry-run] [--verbose] [--force] [--materialize]
 """
 
 from __future__ import annotations
 
 import argparse
+import csv
 import json
 import os
 import sqlite3
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from build_api_cache import CACHE_TABLE, build_api_response_cache
+from build_nil_clusters import CLUSTERS_TABLE, build_nil_clusters, load_clustering_config
+from update_nil_qualita_vita import compute_quality_of_life, refresh_from_star_schema
 
 # Load environment variables if python-dotenv is available
 try:
@@ -45,6 +54,7 @@ if not DB_PATH.is_absolute():
 
 # Feature flags from environment
 ENABLE_EXTERNAL_IMPORT = os.getenv("ENABLE_EXTERNAL_IMPORT", "false").lower() == "true"
+MATERIALIZE_API_VIEWS = os.getenv("MATERIALIZE_API_VIEWS", "false").lower() == "true"
 
 # External data sources (from original Website_Milano) - OPTIONAL
 EXTERNAL_DATA_SOURCES = {
@@ -52,14 +62,25 @@ EXTERNAL_DATA_SOURCES = {
     "api_milano_analisi": Path(os.getenv("API_MILANO_ANALISI_PATH", str(PROJECT_ROOT.parent / "Api_Milano_Analisi"))) / "output",
 }
 
+# Viste API materializzate: vista -> (tabella snapshot, colonna chiave indicizzata)
+MATERIALIZED_API_VIEWS = {
+    "vw_api_nil": ("mv_api_nil", "id_nil"),
+    "vw_api_servizi_nil": ("mv_api_servizi_nil", "id_nil"),
+    "vw_api_ambiente_nil": ("mv_api_ambiente_nil", "id_nil"),
+    "vw_api_mobilita_nil": ("mv_api_mobilita_nil", "id_nil"),
+    "vw_api_timeline_demografico": ("mv_api_timeline_demografico", "anno"),
+}
+
 
 class SyncManager:
     """Gestisce la sincronizzazione dati verso il website."""
     
-    def __init__(self, db_path: Path, dry_run: bool = False, verbose: bool = False):
+    def __init__(self, db_path: Path, dry_run: bool = False, verbose: bool = False,
+                 materialize: bool = MATERIALIZE_API_VIEWS):
         self.db_path = db_path
         self.dry_run = dry_run
         self.verbose = verbose
+        self.materialize = materialize
         self.conn: Optional[sqlite3.Connection] = None
         self.stats = {
             "tables_created": 0,
@@ -94,6 +115,13 @@ class SyncManager:
             return self.conn.cursor()
         return self.conn.execute(sql, params)
     
+    def executemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> sqlite3.Cursor:
+        """Esegue SQL su più righe in un'unica chiamata, con gestione dry-run."""
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would execute many: {sql[:100]}...")
+            return self.conn.cursor()
+        return self.conn.executemany(sql, rows)
+    
     def create_api_views(self) -> None:
         """Crea le viste ottimizzate per le API."""
         self.log("Creazione viste API...")
@@ -248,6 +276,7 @@ class SyncManager:
             ("fact_demografia", "OK", "Dati demografici"),
             ("fact_immobiliare", "OK", "Dati immobiliari"),
             ("fact_servizi", "OK", "Servizi e amenità"),
+            ("fact_accessibilita", "OK", "Distanze dai servizi"),
         ]
         
         for source, status, notes in sources:
@@ -267,6 +296,141 @@ class SyncManager:
         self.stats["tables_created"] += 1
         self.log("  ✓ Tabella data_freshness aggiornata")
     
+    def materialize_api_views(self) -> None:
+        """
+        Materializza le viste vw_api_* in tabelle mv_api_* indicizzate.
+
+        Le viste ricalcolano join e subquery a ogni richiesta; lo snapshot
+        riduce la lettura a un lookup sull'indice della chiave. Ogni refresh
+        è registrato in data_freshness con l'esito del controllo di coerenza.
+        """
+        self.log("Materializzazione viste API...")
+
+        for view_name, (table_name, key_column) in MATERIALIZED_API_VIEWS.items():
+            start = time.perf_counter()
+            try:
+                self.execute(f"DROP TABLE IF EXISTS {table_name}")
+                self.execute(f"CREATE TABLE {table_name} AS SELECT * FROM {view_name}")
+                self.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{key_column} "
+                    f"ON {table_name}({key_column})"
+                )
+            except sqlite3.Error as e:
+                # Vista non valutabile (tabelle sorgente assenti): niente snapshot
+                # obsoleto, il server ripiega sulla vista o sulla query diretta
+                self.execute(f"DROP TABLE IF EXISTS {table_name}")
+                self.log(f"  ⚠ {view_name} non materializzabile, skip: {e}")
+                continue
+
+            if self.dry_run:
+                continue
+
+            elapsed = time.perf_counter() - start
+            mismatches = self.check_materialized_view(view_name, table_name)
+            count = self.conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            status = "OK" if mismatches == 0 else "MISMATCH"
+            self.execute("""
+                INSERT OR REPLACE INTO data_freshness
+                (source_name, last_sync, record_count, status, notes)
+                VALUES (?, ?, ?, ?, ?)
+            """, (table_name, datetime.now().isoformat(), count, status,
+                  f"Snapshot di {view_name} ({elapsed:.2f}s)"))
+
+            if mismatches:
+                self.log(f"  ✗ {table_name}: {mismatches} righe diverse da {view_name}")
+                self.stats["errors"].append(f"{table_name}: {mismatches} righe non coerenti con {view_name}")
+            else:
+                self.stats["tables_created"] += 1
+                self.log(f"  ✓ {table_name}: {count} righe ({elapsed:.2f}s)")
+
+    def drop_materialized_api_views(self) -> None:
+        """
+        Rimuove gli snapshot mv_api_* quando la materializzazione è disabilitata.
+
+        Server e build_api_cache.py preferiscono mv_api_* se la tabella esiste:
+        uno snapshot non più aggiornato verrebbe servito indefinitamente.
+        """
+        for table_name, _ in MATERIALIZED_API_VIEWS.values():
+            found = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+            ).fetchone()
+            if not found:
+                continue
+            self.execute(f"DROP TABLE IF EXISTS {table_name}")
+            self.execute("DELETE FROM data_freshness WHERE source_name = ?", (table_name,))
+            self.log(f"  ✓ {table_name} rimosso (materializzazione disabilitata)")
+
+    def check_materialized_view(self, view_name: str, table_name: str) -> int:
+        """Righe presenti solo nella vista o solo nello snapshot (0 = coerenti)."""
+        view_only = self.conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT * FROM {view_name} EXCEPT SELECT * FROM {table_name})"
+        ).fetchone()[0]
+        table_only = self.conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT * FROM {table_name} EXCEPT SELECT * FROM {view_name})"
+        ).fetchone()[0]
+        # EXCEPT confronta insiemi: i duplicati si verificano sui conteggi
+        view_count = self.conn.execute(f"SELECT COUNT(*) FROM {view_name}").fetchone()[0]
+        table_count = self.conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        return view_only + table_only + abs(view_count - table_count)
+
+    def update_api_response_cache(self) -> None:
+        """Precalcola le risposte /api/nil/:id/* in api_response_cache."""
+        self.log("Precalcolo risposte API per-NIL...")
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would rebuild {CACHE_TABLE}")
+            return
+
+        try:
+            result = build_api_response_cache(self.conn)
+        except sqlite3.Error as e:
+            self.log(f"  ✗ Errore {CACHE_TABLE}: {e}")
+            self.stats["errors"].append(f"{CACHE_TABLE}: {e}")
+            return
+
+        for endpoint, reason in result["skipped"].items():
+            self.log(f"  ⚠ /api/nil/:id/{endpoint} non precalcolato: {reason}")
+        self.execute("""
+            INSERT OR REPLACE INTO data_freshness
+            (source_name, last_sync, record_count, status, notes)
+            VALUES (?, ?, ?, ?, ?)
+        """, (CACHE_TABLE, datetime.now().isoformat(), result["rows"], "OK",
+              f"{result['bytes'] / 1024:,.1f} KB, {len(result['skipped'])} endpoint non disponibili"))
+        self.stats["tables_created"] += 1
+        self.stats["rows_synced"] += result["rows"]
+        self.log(f"  ✓ {CACHE_TABLE}: {result['rows']} risposte ({result['elapsed']:.2f}s)")
+
+    def update_nil_clusters(self) -> None:
+        """Ricalcola nil_clusters se gli indicatori dello star schema sono cambiati."""
+        self.log("Clustering NIL...")
+        if self.dry_run:
+            self.log(f"[DRY-RUN] Would rebuild {CLUSTERS_TABLE}")
+            return
+
+        try:
+            result = build_nil_clusters(self.conn, load_clustering_config())
+        except (sqlite3.Error, ValueError) as e:
+            self.log(f"  ✗ Errore {CLUSTERS_TABLE}: {e}")
+            self.stats["errors"].append(f"{CLUSTERS_TABLE}: {e}")
+            return
+
+        if result["status"] == "skipped":
+            self.log(f"  ⚠ Clustering saltato: {result['reason']}")
+            return
+        if result["status"] == "cached":
+            self.log(f"  ✓ {CLUSTERS_TABLE} invariato (indicatori non cambiati)")
+            return
+
+        self.execute("""
+            INSERT OR REPLACE INTO data_freshness
+            (source_name, last_sync, record_count, status, notes)
+            VALUES (?, ?, ?, ?, ?)
+        """, (CLUSTERS_TABLE, datetime.now().isoformat(), result["n_nil"], "OK",
+              f"k={result['k']}, silhouette {result['silhouette']:.3f}"))
+        self.stats["tables_created"] += 1
+        self.stats["rows_synced"] += result["n_nil"]
+        self.log(f"  ✓ {CLUSTERS_TABLE}: {result['n_nil']} NIL in {result['k']} cluster "
+                 f"{result['sizes']}, silhouette {result['silhouette']:.3f} ({result['elapsed']:.2f}s)")
+
     def import_external_prezzi(self) -> None:
         """Importa dati prezzi dal database Website_Milano originale."""
         self.log("Importazione dati prezzi esterni...")
@@ -276,62 +440,57 @@ class SyncManager:
             self.log(f"  ⚠ Database prezzi non trovato: {source_db}")
             return
         
+        # Tabelle da importare
+        tables_to_import = [
+            "prezzi_medi_quartiere",
+            "quotazioni_immobiliari",
+            "indicatori_demografici",
+            "indice_prezzi_abitazioni",
+            "contribuenti_categorie",
+            "contribuenti_classi",
+            "popolazione_famiglie_tipologia_quartiere",
+            "trasporto_pubblico_locale",
+            "nil_qualita_vita",
+        ]
+        
+        try:
+            # Il DB sorgente viene collegato alla connessione: ogni tabella
+            # è copiata con un solo INSERT ... SELECT eseguito da SQLite
+            self.conn.execute("ATTACH DATABASE ? AS ext", (str(source_db),))
+        except sqlite3.Error as e:
+            self.log(f"  ✗ Errore importazione prezzi: {e}")
+            self.stats["errors"].append(f"import_prezzi: {e}")
+            return
+        
         try:
-            source_conn = sqlite3.connect(str(source_db))
-            source_conn.row_factory = sqlite3.Row
-            
-            # Tabelle da importare
-            tables_to_import = [
-                "prezzi_medi_quartiere",
-                "quotazioni_immobiliari",
-                "indicatori_demografici",
-                "indice_prezzi_abitazioni",
-                "contribuenti_categorie",
-                "contribuenti_classi",
-                "popolazione_famiglie_tipologia_quartiere",
-                "trasporto_pubblico_locale",
-                "nil_qualita_vita",
-                "nil_clusters",
-                "cluster_definizioni",
-            ]
-            
             for table in tables_to_import:
                 try:
-                    # Verifica esistenza tabella source
-                    source_conn.execute(f"SELECT 1 FROM {table} LIMIT 1")
-                    
-                    # Leggi schema
-                    schema = source_conn.execute(
-                        f"SELECT sql FROM sqlite_master WHERE type='table' AND name=?"
-                        , (table,)
+                    schema = self.conn.execute(
+                        "SELECT sql FROM ext.sqlite_master WHERE type='table' AND name=?",
+                        (table,)
                     ).fetchone()
+                    if not schema or not schema[0]:
+                        self.log(f"  ⚠ Tabella {table} non disponibile")
+                        continue
+                    
+                    start = time.perf_counter()
+                    self.execute(f"DROP TABLE IF EXISTS main.{table}")
+                    self.execute(schema[0])
+                    cursor = self.execute(f"INSERT INTO main.{table} SELECT * FROM ext.{table}")
+                    elapsed = time.perf_counter() - start
+                    
+                    rows = max(cursor.rowcount, 0)
+                    self.stats["rows_synced"] += rows
+                    self.log(f"  ✓ {table}: {rows} righe importate ({elapsed:.2f}s)")
                     
-                    if schema and schema[0]:
-                        # Crea tabella se non esiste
-                        self.execute(f"DROP TABLE IF EXISTS {table}")
-                        self.execute(schema[0])
-                        
-                        # Copia dati
-                        rows = source_conn.execute(f"SELECT * FROM {table}").fetchall()
-                        if rows:
-                            cols = [desc[0] for desc in source_conn.execute(f"SELECT * FROM {table} LIMIT 1").description]
-                            placeholders = ",".join(["?" for _ in cols])
-                            for row in rows:
-                                self.execute(
-                                    f"INSERT INTO {table} VALUES ({placeholders})",
-                                    tuple(row)
-                                )
-                            self.stats["rows_synced"] += len(rows)
-                            self.log(f"  ✓ {table}: {len(rows)} righe importate")
-                        
                 except sqlite3.Error as e:
                     self.log(f"  ⚠ Tabella {table} non disponibile: {e}")
             
-            source_conn.close()
-            
-        except Exception as e:
-            self.log(f"  ✗ Errore importazione prezzi: {e}")
-            self.stats["errors"].append(f"import_prezzi: {e}")
+            # DETACH richiede che non ci siano transazioni aperte sul DB collegato
+            if not self.dry_run:
+                self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE ext")
     
     def import_nil_analysis(self) -> None:
         """Importa dati analisi NIL da Api_Milano_Analisi."""
@@ -346,27 +505,32 @@ class SyncManager:
         qol_file = output_dir / "nil_con_indice_qualita_vita.csv"
         if qol_file.exists():
             try:
-                import csv
-                with open(qol_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    rows = list(reader)
-                
-                if rows:
+                start = time.perf_counter()
+                with open(qol_file, 'r', encoding='utf-8', newline='') as f:
+                    reader = csv.reader(f)
+                    cols = next(reader, None)
+                    if not cols:
+                        return
+                    
                     # Crea tabella
                     self.execute("DROP TABLE IF EXISTS nil_qol_analysis")
-                    cols = list(rows[0].keys())
                     col_defs = ", ".join([f'"{c}" TEXT' for c in cols])
                     self.execute(f"CREATE TABLE nil_qol_analysis ({col_defs})")
                     
-                    # Inserisci dati
+                    # Inserimento in blocco, leggendo il CSV in streaming. Come
+                    # DictReader: righe vuote saltate, righe corte completate con
+                    # NULL, valori oltre l'intestazione ignorati
+                    width = len(cols)
                     placeholders = ",".join(["?" for _ in cols])
-                    for row in rows:
-                        self.execute(
-                            f"INSERT INTO nil_qol_analysis VALUES ({placeholders})",
-                            tuple(row.values())
-                        )
-                    self.stats["rows_synced"] += len(rows)
-                    self.log(f"  ✓ nil_qol_analysis: {len(rows)} righe importate")
+                    cursor = self.executemany(
+                        f"INSERT INTO nil_qol_analysis VALUES ({placeholders})",
+                        ((row + [None] * width)[:width] for row in reader if row)
+                    )
+                elapsed = time.perf_counter() - start
+                
+                rows = max(cursor.rowcount, 0)
+                self.stats["rows_synced"] += rows
+                self.log(f"  ✓ nil_qol_analysis: {rows} righe importate ({elapsed:.2f}s)")
                     
             except Exception as e:
                 self.log(f"  ⚠ Errore importazione QoL: {e}")
@@ -412,49 +576,19 @@ class SyncManager:
             self.log("  ⚠ Tabella nil_qualita_vita non esiste, skip")
             return
         
-        sql = '''
-        INSERT OR REPLACE INTO nil_qualita_vita (
-            id_nil, nil, nil_norm, shape_area, shape_length, area_km2,
-            id_tempo, popolazione_totale, pct_stranieri, densita_abitanti_km2,
-            famiglie_registrate, famiglie_unipersonali,
-            nati_vivi, morti, immigrati, emigrati,
-            saldo_naturale, saldo_migratorio, saldo_totale,
-            id_tempo_imm, nuovi_fabbricati_residenziali, abitazioni_nuove,
-            superficie_utile_abitabile, volume_totale,
-            id_tempo_serv, numero_scuole, numero_mercati, indice_verde_medio
-        )
-        SELECT 
-            dn.id_nil, dn.nil, dn.nil_norm, dn.shape_area, dn.shape_length, dn.area_km2,
-            fd.id_tempo, fd.popolazione_totale, fd.pct_stranieri, fd.densita_abitanti_km2,
-            fd.famiglie_registrate_in_anagrafe, fd.famiglie_unipersonali_registrate_in_anagrafe,
-            fd.nati_vivi, fd.morti, fd.immigrati, fd.emigrati,
-            (fd.nati_vivi - fd.morti), (fd.immigrati - fd.emigrati), 
-            (fd.nati_vivi - fd.morti + fd.immigrati - fd.emigrati),
-            fi.id_tempo, fi.nuovi_fabbricati_residenziali, fi.abitazioni_nuove,
-            fi.superficie_utile_abitabile, fi.volume_totale,
-            fs.id_tempo, fs.numero_scuole, fs.numero_mercati, fs.indice_verde_medio
-        FROM dim_nil dn
-        LEFT JOIN (
-            SELECT * FROM fact_demografia WHERE id_tempo = (SELECT MAX(id_tempo) FROM fact_demografia)
-        ) fd ON dn.id_nil = fd.id_nil
-        LEFT JOIN (
-            SELECT id_nil, MAX(id_tempo) as id_tempo, 
-                   SUM(nuovi_fabbricati_residenziali) as nuovi_fabbricati_residenziali,
-                   SUM(abitazioni_nuove) as abitazioni_nuove,
-                   SUM(superficie_utile_abitabile) as superficie_utile_abitabile,
-                   SUM(volume_totale) as volume_totale
-            FROM fact_immobiliare GROUP BY id_nil
-        ) fi ON dn.id_nil = fi.id_nil
-        LEFT JOIN fact_servizi fs ON dn.id_nil = fs.id_nil
-        '''
+        if self.dry_run:
+            self.log("[DRY-RUN] Would refresh nil_qualita_vita")
+            return
         
         try:
-            self.execute(sql)
+            refresh_from_star_schema(self.conn)
             count = self.conn.execute(
                 'SELECT COUNT(*) FROM nil_qualita_vita WHERE popolazione_totale IS NOT NULL'
             ).fetchone()[0]
             self.log(f"  ✓ nil_qualita_vita aggiornato ({count} NIL con dati popolazione)")
-        except sqlite3.Error as e:
+            # INSERT OR REPLACE azzera le colonne IQV: vanno ricalcolate
+            compute_quality_of_life(self.conn, log=lambda msg: self.log(f"  {msg.strip()}"))
+        except (sqlite3.Error, ValueError) as e:
             self.log(f"  ✗ Errore aggiornamento nil_qualita_vita: {e}")
             self.stats["errors"].append(f"nil_qualita_vita: {e}")
     
@@ -525,6 +659,7 @@ class SyncManager:
         print(f"Database: {self.db_path}")
         print(f"Dry run: {self.dry_run}")
         print(f"External import: {'enabled' if ENABLE_EXTERNAL_IMPORT else 'disabled'}")
+        print(f"Materialize API views: {'enabled' if self.materialize else 'disabled'}")
         print()
         
         try:
@@ -546,9 +681,21 @@ class SyncManager:
             # Step 4: Crea tabella freshness
             self.create_data_freshness_table()
             
+            # Step 4a: Clustering NIL (solo se gli indicatori sono cambiati)
+            self.update_nil_clusters()
+            
+            # Step 4b: Materializza viste API (OPZIONALE), altrimenti niente snapshot obsoleti
+            if self.materialize:
+                self.materialize_api_views()
+            else:
+                self.drop_materialized_api_views()
+            
             # Step 5: Crea indici
             self.create_api_indexes()
             
+            # Step 5b: Precalcola le risposte API per-NIL
+            self.update_api_response_cache()
+            
             # Step 6: Genera dati frontend
             self.generate_frontend_data()
             
@@ -581,13 +728,16 @@ def main():
     parser.add_argument("--verbose", "-v", action="store_true", help="Output dettagliato")
     parser.add_argument("--force", action="store_true", help="Forza ricreazione completa")
     parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--materialize", action="store_true",
+                        help="Materializza le viste vw_api_* in tabelle mv_api_* indicizzate")
     
     args = parser.parse_args()
     
     sync = SyncManager(
         db_path=Path(args.db),
         dry_run=args.dry_run,
-        verbose=args.verbose
+        verbose=args.verbose,
+        materialize=args.materialize or MATERIALIZE_API_VIEWS
     )
     
     stats = sync.run()
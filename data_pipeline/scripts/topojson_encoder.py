@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Encoder TopoJSON per i confini NIL.
+
+I NIL adiacenti condividono quasi tutti i confini: in GeoJSON ogni bordo
+comune è scritto due volte, con coordinate float a piena precisione.
+L'encoder:
+- quantizza le coordinate su una griglia intera
+- individua i punti di giunzione e spezza gli anelli in archi
+- deduplica gli archi (anche se percorsi in senso opposto, indice ~i)
+- codifica ogni arco in delta rispetto al punto precedente
+
+Uso da CLI: scrive data_clean/nil_core.topojson e confronta la dimensione
+con l'equivalente GeoJSON.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+Point = Tuple[int, int]
+Ring = List[Point]
+
+# Risoluzione griglia di quantizzazione (punti per asse)
+DEFAULT_QUANTIZATION = 100_000
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Quantizzazione
+# ─────────────────────────────────────────────────────────────────────────────
+
+def quantize_transform(bounds: Sequence[float], quantization: int) -> Dict[str, List[float]]:
+    """Transform TopoJSON (scale, translate) per un bbox."""
+    x0, y0, x1, y1 = bounds
+    kx = (x1 - x0) / (quantization - 1) if x1 > x0 else 1.0
+    ky = (y1 - y0) / (quantization - 1) if y1 > y0 else 1.0
+    return {"scale": [kx, ky], "translate": [x0, y0]}
+
+
+def quantize_ring(coords: np.ndarray, transform: Dict[str, List[float]]) -> Ring:
+    """Quantizza un anello aperto, eliminando punti consecutivi coincidenti."""
+    (kx, ky), (x0, y0) = transform["scale"], transform["translate"]
+    q = np.column_stack([
+        np.round((coords[:, 0] - x0) / kx),
+        np.round((coords[:, 1] - y0) / ky),
+    ]).astype(np.int64)
+    # Anello aperto: l'ultimo punto ripete il primo
+    if len(q) > 1 and (q[0] == q[-1]).all():
+        q = q[:-1]
+    keep = np.ones(len(q), dtype=bool)
+    keep[1:] = (np.diff(q, axis=0) != 0).any(axis=1)
+    q = q[keep]
+    if len(q) > 1 and (q[0] == q[-1]).all():
+        q = q[:-1]
+    return [tuple(p) for p in q.tolist()]
+
+
+def polygon_rings(geometry: BaseGeometry) -> List[List[np.ndarray]]:
+    """Anelli per poligono (esterno + buchi) di un Polygon/MultiPolygon."""
+    parts = getattr(geometry, "geoms", [geometry])
+    result = []
+    for polygon in parts:
+        if polygon.is_empty or polygon.geom_type != "Polygon":
+            continue
+        rings = [np.asarray(polygon.exterior.coords)]
+        rings.extend(np.asarray(interior.coords) for interior in polygon.interiors)
+        result.append(rings)
+    return result
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Archi
+# ─────────────────────────────────────────────────────────────────────────────
+
+def find_junctions(rings: Sequence[Ring]) -> Set[Point]:
+    """
+    Punti in cui due anelli smettono di condividere il confine.
+
+    Un punto è una giunzione se compare con coppie di vicini diverse
+    in anelli diversi (o in punti diversi dello stesso anello).
+    """
+    neighbours: Dict[Point, frozenset] = {}
+    junctions: Set[Point] = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def split_ring(ring: Ring, junctions: Set[Point]) -> List[List[Point]]:
+    """Spezza un anello chiuso in archi che iniziano e finiscono in una giunzione."""
+    cut = [i for i, p in enumerate(ring) if p in junctions]
+    if not cut:
+        # Anello senza giunzioni: arco chiuso con inizio canonico (punto minimo)
+        start = ring.index(min(ring))
+        rotated = ring[start:] + ring[:start]
+        return [rotated + [rotated[0]]]
+
+    rotated = ring[cut[0]:] + ring[:cut[0]]
+    offsets = [i - cut[0] for i in cut] + [len(ring)]
+    closed = rotated + [rotated[0]]
+    return [closed[a:b + 1] for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+class ArcIndex:
+    """Registro degli archi deduplicati (indice ~i per arco percorso al contrario)."""
+
+    def __init__(self) -> None:
+        self.arcs: List[List[Point]] = []
+        self._index: Dict[Tuple[Point, ...], int] = {}
+
+    def add(self, arc: List[Point]) -> int:
+        key = tuple(arc)
+        if key in self._index:
+            return self._index[key]
+        reverse = key[::-1]
+        if reverse in self._index:
+            return ~self._index[reverse]
+        # Archi chiusi: stessa sequenza ruotata al contrario (es. buco = isola)
+        if key[0] == key[-1]:
+            body = list(reverse[:-1])
+            start = body.index(min(body))
+            rotated = tuple(body[start:] + body[:start] + [body[start]])
+            if rotated in self._index:
+                return ~self._index[rotated]
+        self._index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+
+def delta_encode(arc: Sequence[Point]) -> List[List[int]]:
+    """Primo punto assoluto, i successivi come differenza dal precedente."""
+    values = np.asarray(arc, dtype=np.int64)
+    values[1:] = np.diff(values, axis=0)
+    return values.tolist()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Encoder
+# ─────────────────────────────────────────────────────────────────────────────
+
+def encode_topology(
+    geometries: Sequence[Optional[BaseGeometry]],
+    ids: Sequence[object],
+    properties: Optional[Sequence[Dict[str, object]]] = None,
+    object_name: str = "nil",
+    quantization: int = DEFAULT_QUANTIZATION,
+) -> Dict[str, object]:
+    """
+    Codifica poligoni in una Topology TopoJSON con archi condivisi.
+
+    Args:
+        geometries: Polygon/MultiPolygon in WGS84 (None o vuoti vengono saltati)
+        ids: Identificativo per geometria
+        properties: Proprietà per geometria (opzionali)
+        object_name: Nome dell'oggetto nella topologia
+        quantization: Punti di griglia per asse
+
+    Returns:
+        Dizionario serializzabile in JSON
+    """
+    valid = [
+        i for i, g in enumerate(geometries)
+        if g is not None and not g.is_empty and g.geom_type in ("Polygon", "MultiPolygon")
+    ]
+    bounds = shapely.total_bounds([geometries[i] for i in valid]).tolist() if valid else [0, 0, 0, 0]
+    transform = quantize_transform(bounds, quantization)
+
+    # Quantizzazione di tutti gli anelli, mantenendo la struttura poligono/anello
+    quantized: Dict[int, List[List[Ring]]] = {}
+    all_rings: List[Ring] = []
+    for i in valid:
+        polygons = []
+        for rings in polygon_rings(geometries[i]):
+            q_rings = [quantize_ring(r, transform) for r in rings]
+            q_rings = [r for r in q_rings if len(r) >= 3]
+            if q_rings:
+                polygons.append(q_rings)
+                all_rings.extend(q_rings)
+        quantized[i] = polygons
+
+    junctions = find_junctions(all_rings)
+    index = ArcIndex()
+
+    objects = []
+    for i in valid:
+        polygons = [
+            [[index.add(arc) for arc in split_ring(ring, junctions)] for ring in rings]
+            for rings in quantized[i]
+        ]
+        if not polygons:
+            continue
+        geometry: Dict[str, object] = (
+            {"type": "Polygon", "arcs": polygons[0]}
+            if len(polygons) == 1
+            else {"type": "MultiPolygon", "arcs": polygons}
+        )
+        geometry["id"] = ids[i]
+        if properties is not None:
+            geometry["properties"] = properties[i]
+        objects.append(geometry)
+
+    return {
+        "type": "Topology",
+        "bbox": bounds,
+        "transform": transform,
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": objects}},
+        "arcs": [delta_encode(arc) for arc in index.arcs],
+    }
+
+
+def dumps(payload: Dict[str, object]) -> str:
+    """Serializzazione JSON compatta."""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────────────────────────────────────
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Esporta i confini NIL in TopoJSON")
+    parser.add_argument("--db", default="db/nil_core.db", help="Percorso DB (default: db/nil_core.db)")
+    parser.add_argument("--output", default="data_clean/nil_core.topojson", help="File output")
+    parser.add_argument("--quantization", type=int, default=DEFAULT_QUANTIZATION, help="Punti griglia per asse")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parent.parent
+    db_path = project_root / args.db
+    output = project_root / args.output
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id_nil, nil, geometry FROM dim_nil WHERE geometry IS NOT NULL").fetchall()
+    conn.close()
+
+    geometries = shapely.from_geojson([r[2] for r in rows], on_invalid="ignore")
+    ids = [int(r[0]) for r in rows]
+    props = [{"nil": r[1]} for r in rows]
+
+    topology = encode_topology(list(geometries), ids, props, quantization=args.quantization)
+    payload = dumps(topology)
+    output.write_text(payload, encoding="utf-8")
+
+    # Confronto con GeoJSON delle stesse geometrie e con il master esportato
+    geojson = dumps({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": i, "properties": p, "geometry": json.loads(shapely.to_geojson(g))}
+            for i, p, g in zip(ids, props, geometries)
+            if g is not None
+        ],
+    })
+    topo_kb = len(payload.encode("utf-8")) / 1024
+    geo_kb = len(geojson.encode("utf-8")) / 1024
+    print(f"  ✓ TopoJSON: {topo_kb:,.1f} KB, {len(topology['arcs'])} archi")
+    print(f"  • GeoJSON equivalente: {geo_kb:,.1f} KB ({topo_kb / geo_kb * 100:.1f}%)")
+
+    master = project_root / "data_clean" / "master_nil_core.geojson"
+    if master.exists():
+        master_kb = master.stat().st_size / 1024
+        print(f"  • master_nil_core.geojson: {master_kb:,.1f} KB ({topo_kb / master_kb * 100:.1f}%)")
+    print(f"  → {output}")
+
+
+if __name__ == "__main__":
+    main()
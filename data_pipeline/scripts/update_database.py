@@ -11,6 +11,7 @@ Uso:
     python update_database.py --check-updates    # Verifica solo se ci sono aggiornamenti
     python update_database.py --force            # Forza riscaricamento
     python update_database.py --category 10_cultura_musei  # Solo una categoria
+    python update_database.py --publish          # Aggiorna uno shadow e pubblica atomicamente
 """
 
 from __future__ import annotations
@@ -30,6 +31,9 @@ from typing import Dict, List, Optional, Tuple
 
 import requests
 
+from data_profile import table_fingerprint
+from publish_database import DEFAULT_KEEP_GENERATIONS, prepare_shadow, publish_shadow
+
 # Load environment variables if python-dotenv is available
 try:
     from dotenv import load_dotenv
@@ -175,10 +179,15 @@ def run_pipeline_step(step_name: str, script_name: str, args: List[str], logger:
         return False
 
 
-def merge_to_unified_db(logger: logging.Logger) -> bool:
+def merge_to_unified_db(logger: logging.Logger, target_db: Path = UNIFIED_DB) -> bool:
     """Sincronizza i dati dal database legacy al database unificato.
     
-    Usa INSERT OR REPLACE invece di DROP TABLE per preservare indici e viste.
+    Usa DELETE + INSERT invece di DROP TABLE per preservare indici e viste.
+    La copia avviene interamente in SQLite (INSERT INTO main.t SELECT ... FROM
+    source_db.t), una transazione per tabella. Una tabella viene saltata se
+    l'impronta (data_profile.table_fingerprint: schema, COUNT/MAX(rowid) e
+    pagine, senza leggere le righe in Python) della sorgente e quella della
+    destinazione coincidono con quelle salvate in _merge_checksums all'ultima copia.
     Se il DB legacy non esiste, salta (la pipeline potrebbe già scrivere direttamente
     su UNIFIED_DB).
     """
@@ -191,74 +200,114 @@ def merge_to_unified_db(logger: logging.Logger) -> bool:
     
     try:
         # Assicurati che la directory esista
-        UNIFIED_DB.parent.mkdir(parents=True, exist_ok=True)
+        target_db.parent.mkdir(parents=True, exist_ok=True)
         
-        # Connetti al database unificato
-        conn = sqlite3.connect(str(UNIFIED_DB))
+        # Connetti al database unificato (transazioni gestite esplicitamente)
+        conn = sqlite3.connect(str(target_db), isolation_level=None)
         
         # Attach il database sorgente
-        conn.execute(f"ATTACH DATABASE '{LEGACY_NIL_CORE_DB}' AS source_db")
+        conn.execute("ATTACH DATABASE ? AS source_db", (str(LEGACY_NIL_CORE_DB),))
+        
+        # Impronte della sorgente lette da una connessione dedicata (dbstat dello schema main)
+        source = sqlite3.connect(f"file:{LEGACY_NIL_CORE_DB}?mode=ro", uri=True)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS _merge_checksums (
+                table_name TEXT PRIMARY KEY,
+                checksum TEXT,
+                row_count INTEGER,
+                synced_at TIMESTAMP,
+                target_checksum TEXT
+            )
+        """)
+        merge_columns = {row[1] for row in conn.execute("PRAGMA main.table_info(_merge_checksums)")}
+        if "target_checksum" not in merge_columns:
+            conn.execute("ALTER TABLE _merge_checksums ADD COLUMN target_checksum TEXT")
+        checksums = {
+            row[0]: (row[1], row[2])
+            for row in conn.execute("SELECT table_name, checksum, target_checksum FROM _merge_checksums")
+        }
         
-        # Ottieni lista tabelle dal database sorgente
+        # Ottieni lista tabelle e schema dal database sorgente
         cursor = conn.execute(
-            "SELECT name FROM source_db.sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+            "SELECT name, sql FROM source_db.sqlite_master "
+            "WHERE type='table' AND name NOT LIKE 'sqlite_%' AND name != '_merge_checksums'"
         )
-        tables = [row[0] for row in cursor.fetchall()]
+        tables = cursor.fetchall()
         
         tables_synced = 0
-        for table in tables:
+        tables_unchanged = 0
+        total_rows = 0
+        total_elapsed = 0.0
+        for table, schema in tables:
+            if not schema:
+                continue
             try:
-                # Leggi schema dalla sorgente
-                cursor = conn.execute(
-                    f"SELECT sql FROM source_db.sqlite_master WHERE name='{table}' AND type='table'"
-                )
-                schema_row = cursor.fetchone()
-                
-                if not schema_row or not schema_row[0]:
-                    continue
+                start = time.perf_counter()
+                checksum = table_fingerprint(source, table)
                 
-                schema = schema_row[0]
+                table_exists = conn.execute(
+                    "SELECT COUNT(*) FROM main.sqlite_master WHERE type='table' AND name=?",
+                    (table,)
+                ).fetchone()[0] > 0
                 
-                # Verifica se la tabella esiste nel DB di destinazione
-                cursor = conn.execute(
-                    f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='{table}'"
-                )
-                table_exists = cursor.fetchone()[0] > 0
-                
-                if not table_exists:
-                    # Crea la tabella se non esiste
-                    conn.execute(schema)
+                # Sorgente invariata e destinazione non modificata dopo l'ultima copia
+                if (
+                    table_exists
+                    and table in checksums
+                    and checksums[table][0] == checksum
+                    and checksums[table][1] == table_fingerprint(conn, table)
+                ):
+                    tables_unchanged += 1
+                    tables_synced += 1
+                    logger.debug(f"  = {table}: invariata, skip")
+                    continue
                 
                 # Ottieni colonne dalla tabella sorgente
-                cursor = conn.execute(f"PRAGMA source_db.table_info({table})")
-                columns = [row[1] for row in cursor.fetchall()]
-                
+                columns = [row[1] for row in conn.execute(f'PRAGMA source_db.table_info("{table}")')]
                 if not columns:
                     continue
+                columns_str = ", ".join(f'"{c}"' for c in columns)
                 
-                # Usa INSERT OR REPLACE per preservare gli indici
-                columns_str = ", ".join(columns)
-                placeholders = ", ".join(["?" for _ in columns])
-                
-                # Leggi dati dalla sorgente
-                cursor = conn.execute(f"SELECT {columns_str} FROM source_db.{table}")
-                rows = cursor.fetchall()
-                
-                if rows:
-                    # Prima elimina i record esistenti con lo stesso ID (se c'è una chiave primaria)
-                    # Poi inserisci i nuovi dati
-                    conn.execute(f"DELETE FROM {table}")
-                    conn.executemany(
-                        f"INSERT INTO {table} ({columns_str}) VALUES ({placeholders})",
-                        rows
-                    )
+                conn.execute("BEGIN")
+                try:
+                    if not table_exists:
+                        # Crea la tabella se non esiste
+                        conn.execute(schema)
+                    conn.execute(f'DELETE FROM main."{table}"')
+                    rows = conn.execute(
+                        f'INSERT INTO main."{table}" ({columns_str}) '
+                        f'SELECT {columns_str} FROM source_db."{table}"'
+                    ).rowcount
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                # Impronta dopo il COMMIT, quando le pagine sono sul file
+                conn.execute(
+                    "INSERT OR REPLACE INTO _merge_checksums "
+                    "(table_name, checksum, row_count, synced_at, target_checksum) VALUES (?, ?, ?, ?, ?)",
+                    (table, checksum, rows, datetime.now().isoformat(), table_fingerprint(conn, table))
+                )
                 
+                elapsed = time.perf_counter() - start
+                total_rows += rows
+                total_elapsed += elapsed
                 tables_synced += 1
+                rate = rows / elapsed if elapsed > 0 else 0
+                logger.info(f"  ✓ {table}: {rows:,} righe in {elapsed:.2f}s ({rate:,.0f} righe/s)")
                     
             except Exception as e:
                 logger.warning(f"Errore sincronizzazione tabella {table}: {e}")
         
+        if total_elapsed > 0:
+            logger.info(
+                f"  Copiate {total_rows:,} righe in {total_elapsed:.2f}s "
+                f"({total_rows / total_elapsed:,.0f} righe/s), {tables_unchanged} tabelle invariate"
+            )
+        
         # Detach il database sorgente
+        source.close()
         conn.execute("DETACH DATABASE source_db")
         
         # Aggiorna timestamp di aggiornamento
@@ -283,11 +332,10 @@ def merge_to_unified_db(logger: logging.Logger) -> bool:
             "Sincronizzazione automatica da pipeline (preserve indices)"
         ))
         
-        conn.commit()
         conn.close()
         
         logger.info(f"✓ Sincronizzate {tables_synced} tabelle al database unificato")
-        logger.info(f"  Path: {UNIFIED_DB}")
+        logger.info(f"  Path: {target_db}")
         return True
         
     except Exception as e:
@@ -343,6 +391,10 @@ def main():
                        help="Salta sincronizzazione al DB unificato")
     parser.add_argument("--category", type=str,
                        help="Aggiorna solo una categoria specifica")
+    parser.add_argument("--publish", action="store_true",
+                       help="Aggiorna uno shadow DB e pubblicalo atomicamente")
+    parser.add_argument("--keep-generations", type=int, default=DEFAULT_KEEP_GENERATIONS,
+                       help=f"Generazioni precedenti da mantenere con --publish (default: {DEFAULT_KEEP_GENERATIONS})")
     parser.add_argument("--verbose", "-v", action="store_true",
                        help="Output dettagliato")
     
@@ -375,6 +427,9 @@ def main():
         # Pipeline completa
         success = True
         
+        # In modalità publish tutti gli step scrivono sullo shadow, il DB live resta intatto
+        target_db = prepare_shadow(UNIFIED_DB, logger) if args.publish else UNIFIED_DB
+        
         # Step 1: Download
         if not args.skip_download:
             download_args = []
@@ -394,7 +449,7 @@ def main():
         success = run_pipeline_step(
             "Elaborazione Dataset",
             "process_core.py",
-            ["--db", str(UNIFIED_DB)],
+            ["--db", str(target_db)],
             logger
         )
         if not success:
@@ -404,20 +459,20 @@ def main():
         run_pipeline_step(
             "Costruzione Star Schema",
             "build_star_schema.py",
-            ["--db", str(UNIFIED_DB)],
+            ["--db", str(target_db)],
             logger
         )
         
         # Step 5: Sync to unified DB (legacy migration if needed)
         if not args.skip_sync:
-            merge_to_unified_db(logger)
+            merge_to_unified_db(logger, target_db)
             
             # Esegui sync_to_website per le viste API (se abilitato)
             if ENABLE_WEBSITE_SYNC:
                 run_pipeline_step(
                     "Sincronizzazione API Views",
                     "sync_to_website.py",
-                    [],
+                    ["--db", str(target_db)],
                     logger
                 )
             else:
@@ -427,10 +482,25 @@ def main():
         run_pipeline_step(
             "Apply DB Optimizations",
             "apply_optimizations.py",
-            ["--db", str(UNIFIED_DB)],
+            ["--db", str(target_db)],
             logger
         )
         
+        # Step 6b: Compattazione e statistiche del planner (con --publish le fa publish_shadow).
+        # Sul DB live in place: il server tiene aperto il file, un rename non sarebbe visibile
+        if not args.publish:
+            run_pipeline_step(
+                "Finalizzazione Database",
+                "finalize_database.py",
+                ["--db", str(target_db), "--in-place"],
+                logger
+            )
+        
+        # Step 7: Verifica e pubblicazione atomica dello shadow
+        if args.publish and not publish_shadow(UNIFIED_DB, logger, args.keep_generations):
+            logger.error("Pubblicazione fallita, il database live non è stato modificato")
+            sys.exit(1)
+        
         # Summary
         summary = generate_summary(logger)
         summary["status"] = "success"
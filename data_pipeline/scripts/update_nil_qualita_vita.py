@@ -1,63 +1,263 @@
 #!/usr/bin/env python3
 """
 Aggiorna la tabella nil_qualita_vita con i dati dallo star schema
-e sincronizza l'indice qualità della vita da nil_qol_analysis.
+e calcola l'indice qualità della vita (IQV).
+
+L'IQV è una media pesata di componenti 0-100, ognuna normalizzata da una
+colonna di nil_qualita_vita (verde, mercati, densità invertita, saldo
+demografico). Pesi e normalizzazione sono in config/quality_of_life.json;
+il calcolo è vettoriale (NumPy) e rigira a ogni aggiornamento.
+
+Con --from-csv l'indice viene invece sincronizzato da nil_qol_analysis
+(CSV di Api_Milano_Analisi importato da sync_to_website.py).
+
+Uso:
+    python update_nil_qualita_vita.py [--db PATH] [--config PATH] [--from-csv]
 """
 
+from __future__ import annotations
+
+import argparse
+import json
 import sqlite3
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from utils import CONFIG_DIR, normalize_nil_name
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DB_PATH = PROJECT_ROOT / "db" / "milano_unified.db"
+QOL_CONFIG_PATH = CONFIG_DIR / "quality_of_life.json"
+
+NORMALIZATIONS = ("minmax", "rank")
+
+# Colonna in nil_qol_analysis (CSV, TEXT) -> colonna REAL in nil_qualita_vita
+QOL_COLUMNS = {
+    "comp_verde": "comp_verde",
+    "comp_mercati": "comp_mercati",
+    "comp_densita": "comp_densita",
+    "comp_dinamica": "comp_dinamica",
+    "IQV": "indice_qualita_vita",
+}
+
+STAR_SCHEMA_SQL = '''
+INSERT OR REPLACE INTO nil_qualita_vita (
+    id_nil, nil, nil_norm, shape_area, shape_length, area_km2,
+    id_tempo, popolazione_totale, pct_stranieri, densita_abitanti_km2,
+    famiglie_registrate, famiglie_unipersonali,
+    nati_vivi, morti, immigrati, emigrati,
+    saldo_naturale, saldo_migratorio, saldo_totale,
+    id_tempo_imm, nuovi_fabbricati_residenziali, abitazioni_nuove,
+    superficie_utile_abitabile, volume_totale,
+    id_tempo_serv, numero_scuole, numero_mercati, indice_verde_medio
+)
+SELECT 
+    dn.id_nil, dn.nil, dn.nil_norm, dn.shape_area, dn.shape_length, dn.area_km2,
+    fd.id_tempo, fd.popolazione_totale, fd.pct_stranieri, fd.densita_abitanti_km2,
+    fd.famiglie_registrate_in_anagrafe, fd.famiglie_unipersonali_registrate_in_anagrafe,
+    fd.nati_vivi, fd.morti, fd.immigrati, fd.emigrati,
+    (fd.nati_vivi - fd.morti), (fd.immigrati - fd.emigrati), 
+    (fd.nati_vivi - fd.morti + fd.immigrati - fd.emigrati),
+    fi.id_tempo, fi.nuovi_fabbricati_residenziali, fi.abitazioni_nuove,
+    fi.superficie_utile_abitabile, fi.volume_totale,
+    fs.id_tempo, fs.numero_scuole, fs.numero_mercati, fs.indice_verde_medio
+FROM dim_nil dn
+LEFT JOIN (
+    SELECT * FROM fact_demografia WHERE id_tempo = (SELECT MAX(id_tempo) FROM fact_demografia)
+) fd ON dn.id_nil = fd.id_nil
+LEFT JOIN (
+    SELECT id_nil, MAX(id_tempo) as id_tempo, 
+           SUM(nuovi_fabbricati_residenziali) as nuovi_fabbricati_residenziali,
+           SUM(abitazioni_nuove) as abitazioni_nuove,
+           SUM(superficie_utile_abitabile) as superficie_utile_abitabile,
+           SUM(volume_totale) as volume_totale
+    FROM fact_immobiliare GROUP BY id_nil
+) fi ON dn.id_nil = fi.id_nil
+LEFT JOIN fact_servizi fs ON dn.id_nil = fs.id_nil
+'''
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Configurazione IQV
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class QolComponent:
+    """Componente dell'IQV calcolata da una colonna di nil_qualita_vita."""
+    source: str
+    weight: float
+    invert: bool = False
+
+
+@dataclass
+class QualityOfLifeConfig:
+    """Pesi e normalizzazione dell'indice qualità della vita."""
+    normalization: str = "minmax"
+    components: Dict[str, QolComponent] = field(default_factory=lambda: {
+        "comp_verde": QolComponent("indice_verde_medio", 0.30),
+        "comp_mercati": QolComponent("numero_mercati", 0.20),
+        "comp_densita": QolComponent("densita_abitanti_km2", 0.25, invert=True),
+        "comp_dinamica": QolComponent("saldo_totale", 0.25),
+    })
+
+
+def load_quality_of_life_config(config_path: Optional[Path] = None) -> QualityOfLifeConfig:
+    """Carica pesi e normalizzazione IQV (default se il file non esiste)."""
+    config_path = config_path or QOL_CONFIG_PATH
+
+    if not config_path.exists():
+        return QualityOfLifeConfig()
+
+    with config_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    config = QualityOfLifeConfig()
+    config.normalization = data.get("normalization", config.normalization)
+    if "components" in data:
+        config.components = {
+            name: QolComponent(item["source"], float(item["weight"]), bool(item.get("invert", False)))
+            for name, item in data["components"].items()
+        }
+
+    if config.normalization not in NORMALIZATIONS:
+        raise ValueError(f"Normalizzazione IQV non supportata: {config.normalization} (attese: {NORMALIZATIONS})")
+    unknown = set(config.components) - set(QOL_COLUMNS.values())
+    if unknown:
+        raise ValueError(f"Componenti IQV senza colonna in nil_qualita_vita: {sorted(unknown)}")
+    if any(c.weight < 0 for c in config.components.values()) or sum(c.weight for c in config.components.values()) <= 0:
+        raise ValueError("I pesi IQV devono essere >= 0 con somma positiva")
+    return config
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Calcolo IQV
+# ─────────────────────────────────────────────────────────────────────────────
+
+def normalize_minmax(values: np.ndarray) -> np.ndarray:
+    """Scala 0-100 tra minimo e massimo (NaN restano NaN, colonna costante → 0)."""
+    low, high = np.nanmin(values), np.nanmax(values)
+    if high == low:
+        return np.where(np.isnan(values), np.nan, 0.0)
+    return (values - low) / (high - low) * 100
+
+
+def normalize_rank(values: np.ndarray) -> np.ndarray:
+    """Rango percentile 0-100, pari merito al rango medio (NaN restano NaN)."""
+    result = np.full(values.shape, np.nan)
+    valid = ~np.isnan(values)
+    if valid.sum() < 2:
+        result[valid] = 0.0
+        return result
+    unique, inverse, counts = np.unique(values[valid], return_inverse=True, return_counts=True)
+    mean_rank = np.cumsum(counts) - (counts + 1) / 2
+    result[valid] = mean_rank[inverse] / (valid.sum() - 1) * 100
+    return result
+
+
+def compute_components(
+    sources: np.ndarray, config: QualityOfLifeConfig
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calcola componenti e indice da una matrice NIL x colonne sorgente.
+
+    Args:
+        sources: Valori sorgente, una colonna per componente (ordine di config.components)
+        config: Pesi e normalizzazione
+
+    Returns:
+        (componenti 0-100, IQV); IQV è NaN se manca una componente
+    """
+    normalize = normalize_minmax if config.normalization == "minmax" else normalize_rank
+    components = np.empty(sources.shape)
+    for i, component in enumerate(config.components.values()):
+        column = normalize(sources[:, i])
+        components[:, i] = 100 - column if component.invert else column
+
+    weights = np.array([c.weight for c in config.components.values()])
+    return components, components @ (weights / weights.sum())
+
+
+def compute_quality_of_life(
+    conn: sqlite3.Connection,
+    config: Optional[QualityOfLifeConfig] = None,
+    log: Callable[[str], None] = print,
+) -> int:
+    """
+    Calcola le componenti e indice_qualita_vita dalle colonne di nil_qualita_vita.
+
+    Returns:
+        Numero di NIL aggiornati
+    """
+    config = config or load_quality_of_life_config()
+    log("\n📊 Calcolo indice qualità della vita...")
+    start = time.perf_counter()
+
+    names = list(config.components)
+    sources = ", ".join(c.source for c in config.components.values())
+    rows = conn.execute(f"SELECT id_nil, {sources} FROM nil_qualita_vita ORDER BY id_nil").fetchall()
+    if not rows:
+        log("⚠️  nil_qualita_vita vuota. Calcolo IQV saltato.")
+        return 0
+
+    matrix = np.array(rows, dtype=float)
+    ids = matrix[:, 0].astype(int)
+    components, index = compute_components(matrix[:, 1:], config)
+
+    # Le componenti non configurate vengono azzerate (NULL)
+    targets = list(QOL_COLUMNS.values())
+    values = np.full((len(ids), len(targets)), np.nan)
+    for i, name in enumerate(names):
+        values[:, targets.index(name)] = components[:, i]
+    values[:, targets.index("indice_qualita_vita")] = index
+
+    assignments = ", ".join(f"{target} = ?" for target in targets)
+    conn.executemany(
+        f"UPDATE nil_qualita_vita SET {assignments} WHERE id_nil = ?",
+        [
+            [None if np.isnan(v) else float(v) for v in row] + [int(id_nil)]
+            for row, id_nil in zip(values, ids)
+        ],
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    valid = int((~np.isnan(index)).sum())
+    log(f"   ✅ IQV calcolato per {valid}/{len(ids)} NIL ({config.normalization}, {elapsed:.1f} ms)")
+    if valid:
+        log(f"   📈 Statistiche IQV: media={np.nanmean(index):.2f}, "
+            f"min={np.nanmin(index):.2f}, max={np.nanmax(index):.2f}")
+    return valid
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Aggiornamento nil_qualita_vita
+# ─────────────────────────────────────────────────────────────────────────────
+
+def refresh_from_star_schema(conn: sqlite3.Connection) -> None:
+    """Ricarica nil_qualita_vita dai fatti più recenti dello star schema."""
+    conn.execute(STAR_SCHEMA_SQL)
 
 
-def update_nil_qualita_vita():
+def update_nil_qualita_vita(
+    db_path: Path = DB_PATH,
+    config_path: Optional[Path] = None,
+    from_csv: bool = False,
+):
     """Aggiorna nil_qualita_vita dai dati dello star schema."""
-    conn = sqlite3.connect(str(DB_PATH))
+    conn = sqlite3.connect(str(db_path))
     cur = conn.cursor()
 
     # Aggiorna nil_qualita_vita dai dati dello star schema
-    sql = '''
-    INSERT OR REPLACE INTO nil_qualita_vita (
-        id_nil, nil, nil_norm, shape_area, shape_length, area_km2,
-        id_tempo, popolazione_totale, pct_stranieri, densita_abitanti_km2,
-        famiglie_registrate, famiglie_unipersonali,
-        nati_vivi, morti, immigrati, emigrati,
-        saldo_naturale, saldo_migratorio, saldo_totale,
-        id_tempo_imm, nuovi_fabbricati_residenziali, abitazioni_nuove,
-        superficie_utile_abitabile, volume_totale,
-        id_tempo_serv, numero_scuole, numero_mercati, indice_verde_medio
-    )
-    SELECT 
-        dn.id_nil, dn.nil, dn.nil_norm, dn.shape_area, dn.shape_length, dn.area_km2,
-        fd.id_tempo, fd.popolazione_totale, fd.pct_stranieri, fd.densita_abitanti_km2,
-        fd.famiglie_registrate_in_anagrafe, fd.famiglie_unipersonali_registrate_in_anagrafe,
-        fd.nati_vivi, fd.morti, fd.immigrati, fd.emigrati,
-        (fd.nati_vivi - fd.morti), (fd.immigrati - fd.emigrati), 
-        (fd.nati_vivi - fd.morti + fd.immigrati - fd.emigrati),
-        fi.id_tempo, fi.nuovi_fabbricati_residenziali, fi.abitazioni_nuove,
-        fi.superficie_utile_abitabile, fi.volume_totale,
-        fs.id_tempo, fs.numero_scuole, fs.numero_mercati, fs.indice_verde_medio
-    FROM dim_nil dn
-    LEFT JOIN (
-        SELECT * FROM fact_demografia WHERE id_tempo = (SELECT MAX(id_tempo) FROM fact_demografia)
-    ) fd ON dn.id_nil = fd.id_nil
-    LEFT JOIN (
-        SELECT id_nil, MAX(id_tempo) as id_tempo, 
-               SUM(nuovi_fabbricati_residenziali) as nuovi_fabbricati_residenziali,
-               SUM(abitazioni_nuove) as abitazioni_nuove,
-               SUM(superficie_utile_abitabile) as superficie_utile_abitabile,
-               SUM(volume_totale) as volume_totale
-        FROM fact_immobiliare GROUP BY id_nil
-    ) fi ON dn.id_nil = fi.id_nil
-    LEFT JOIN fact_servizi fs ON dn.id_nil = fs.id_nil
-    '''
-
-    cur.execute(sql)
+    refresh_from_star_schema(conn)
     conn.commit()
     
-    # Sincronizza i dati dell'indice qualità della vita da nil_qol_analysis
-    sync_quality_of_life_index(cur)
+    # Indice qualità della vita: calcolato, o dal CSV esterno su richiesta
+    if from_csv:
+        sync_quality_of_life_index(conn)
+    else:
+        compute_quality_of_life(conn, load_quality_of_life_config(config_path))
     conn.commit()
 
     # Verifica NIL problematici
@@ -79,72 +279,81 @@ def update_nil_qualita_vita():
     print("\nAggiornamento completato!")
 
 
-def sync_quality_of_life_index(cur):
+def stage_quality_of_life(conn: sqlite3.Connection) -> int:
+    """
+    Normalizza nil_qol_analysis in temp.qol_staging, con chiave id_nil.
+
+    Il nome NIL di ogni riga viene risolto una sola volta con
+    normalize_nil_name (lo stesso resolver della pipeline) tramite la
+    tabella temp.nil_keys; i valori TEXT del CSV diventano REAL.
+    A parità di NIL vale la prima riga del CSV.
+
+    Returns:
+        Numero di NIL in staging
+    """
+    conn.create_function("normalize_nil", 1, normalize_nil_name, deterministic=True)
+
+    conn.execute("DROP TABLE IF EXISTS temp.nil_keys")
+    conn.execute("CREATE TEMP TABLE nil_keys (key TEXT PRIMARY KEY, id_nil INTEGER NOT NULL) WITHOUT ROWID")
+    conn.execute("INSERT OR IGNORE INTO temp.nil_keys SELECT normalize_nil(nil), id_nil FROM nil_qualita_vita WHERE nil IS NOT NULL")
+
+    targets = ", ".join(f"{target} REAL" for target in QOL_COLUMNS.values())
+    casts = ", ".join(f'CAST(q."{source}" AS REAL)' for source in QOL_COLUMNS)
+    conn.execute("DROP TABLE IF EXISTS temp.qol_staging")
+    conn.execute(f"CREATE TEMP TABLE qol_staging (id_nil INTEGER PRIMARY KEY, {targets})")
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.qol_staging
+        SELECT k.id_nil, {casts}
+        FROM nil_qol_analysis q
+        JOIN temp.nil_keys k ON k.key = normalize_nil(q.nil)
+        ORDER BY q.rowid
+    """)
+    return conn.execute("SELECT COUNT(*) FROM temp.qol_staging").fetchone()[0]
+
+
+def sync_quality_of_life_index(conn: sqlite3.Connection, log: Callable[[str], None] = print) -> int:
     """
     Sincronizza comp_verde, comp_mercati, comp_densita, comp_dinamica 
     e indice_qualita_vita da nil_qol_analysis a nil_qualita_vita.
+
+    Returns:
+        Numero di NIL aggiornati
     """
-    print("\n📊 Sincronizzazione indice qualità della vita...")
+    log("\n📊 Sincronizzazione indice qualità della vita...")
     
     # Verifica che nil_qol_analysis esista e abbia dati
-    check = cur.execute(
+    check = conn.execute(
         "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='nil_qol_analysis'"
     ).fetchone()[0]
     
     if check == 0:
-        print("⚠️  Tabella nil_qol_analysis non trovata. Calcolo IQV saltato.")
-        return
+        log("⚠️  Tabella nil_qol_analysis non trovata. Calcolo IQV saltato.")
+        return 0
     
     # Conta record disponibili
-    qol_count = cur.execute("SELECT COUNT(*) FROM nil_qol_analysis WHERE IQV IS NOT NULL").fetchone()[0]
-    print(f"   Record nil_qol_analysis con IQV: {qol_count}")
+    qol_count = conn.execute("SELECT COUNT(*) FROM nil_qol_analysis WHERE IQV IS NOT NULL").fetchone()[0]
+    log(f"   Record nil_qol_analysis con IQV: {qol_count}")
     
     if qol_count == 0:
-        print("⚠️  Nessun dato IQV disponibile in nil_qol_analysis.")
-        return
-    
-    # Aggiorna nil_qualita_vita con i valori da nil_qol_analysis
-    # Usa UPPER per normalizzare i nomi dei NIL
-    update_sql = '''
-    UPDATE nil_qualita_vita
-    SET 
-        comp_verde = (
-            SELECT CAST(qol.comp_verde AS REAL) 
-            FROM nil_qol_analysis qol 
-            WHERE UPPER(TRIM(qol.nil)) = UPPER(TRIM(nil_qualita_vita.nil))
-        ),
-        comp_mercati = (
-            SELECT CAST(qol.comp_mercati AS REAL) 
-            FROM nil_qol_analysis qol 
-            WHERE UPPER(TRIM(qol.nil)) = UPPER(TRIM(nil_qualita_vita.nil))
-        ),
-        comp_densita = (
-            SELECT CAST(qol.comp_densita AS REAL) 
-            FROM nil_qol_analysis qol 
-            WHERE UPPER(TRIM(qol.nil)) = UPPER(TRIM(nil_qualita_vita.nil))
-        ),
-        comp_dinamica = (
-            SELECT CAST(qol.comp_dinamica AS REAL) 
-            FROM nil_qol_analysis qol 
-            WHERE UPPER(TRIM(qol.nil)) = UPPER(TRIM(nil_qualita_vita.nil))
-        ),
-        indice_qualita_vita = (
-            SELECT CAST(qol.IQV AS REAL) 
-            FROM nil_qol_analysis qol 
-            WHERE UPPER(TRIM(qol.nil)) = UPPER(TRIM(nil_qualita_vita.nil))
-        )
-    WHERE EXISTS (
-        SELECT 1 FROM nil_qol_analysis qol 
-        WHERE UPPER(TRIM(qol.nil)) = UPPER(TRIM(nil_qualita_vita.nil))
-    )
-    '''
+        log("⚠️  Nessun dato IQV disponibile in nil_qol_analysis.")
+        return 0
     
-    cur.execute(update_sql)
-    updated = cur.rowcount
-    print(f"   ✅ Aggiornati {updated} NIL con indice qualità della vita")
+    # Un solo UPDATE ... FROM sulla chiave id_nil della staging
+    staged = stage_quality_of_life(conn)
+    assignments = ", ".join(f"{target} = s.{target}" for target in QOL_COLUMNS.values())
+    cursor = conn.execute(f"""
+        UPDATE nil_qualita_vita
+        SET {assignments}
+        FROM temp.qol_staging s
+        WHERE s.id_nil = nil_qualita_vita.id_nil
+    """)
+    updated = cursor.rowcount
+    conn.execute("DROP TABLE temp.qol_staging")
+    conn.execute("DROP TABLE temp.nil_keys")
+    log(f"   ✅ Aggiornati {updated} NIL con indice qualità della vita ({staged} in staging)")
     
     # Verifica risultato
-    result = cur.execute('''
+    result = conn.execute('''
         SELECT COUNT(*) as total,
                COUNT(indice_qualita_vita) as with_iqv,
                ROUND(AVG(indice_qualita_vita), 2) as avg_iqv,
@@ -153,18 +362,30 @@ def sync_quality_of_life_index(cur):
         FROM nil_qualita_vita
     ''').fetchone()
     
-    print(f"   📈 Statistiche IQV: media={result[2]}, min={result[3]}, max={result[4]}")
+    log(f"   📈 Statistiche IQV: media={result[2]}, min={result[3]}, max={result[4]}")
     
     # Mostra NIL che non hanno match (per debug)
-    unmatched = cur.execute('''
+    unmatched = conn.execute('''
         SELECT nil FROM nil_qualita_vita 
         WHERE indice_qualita_vita IS NULL 
         LIMIT 5
     ''').fetchall()
     
     if unmatched:
-        print(f"   ⚠️  NIL senza match IQV: {[r[0] for r in unmatched]}")
+        log(f"   ⚠️  NIL senza match IQV: {[r[0] for r in unmatched]}")
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Aggiorna nil_qualita_vita e l'indice qualità della vita")
+    parser.add_argument("--db", type=str, default=str(DB_PATH), help="Path database")
+    parser.add_argument("--config", type=str, default=str(QOL_CONFIG_PATH), help="Pesi e normalizzazione IQV")
+    parser.add_argument("--from-csv", action="store_true",
+                        help="Sincronizza l'IQV da nil_qol_analysis invece di calcolarlo")
+    args = parser.parse_args()
+
+    update_nil_qualita_vita(Path(args.db), Path(args.config), args.from_csv)
 
 
 if __name__ == "__main__":
-    update_nil_qualita_vita()
+    main()
@@ -5,17 +5,20 @@ Modulo di validazione dati per Api_Milano_Core.
 Contiene:
 - DataValidator: validatore generico per DataFrame
 - NILValidator: validatore specifico per dati NIL
-- SchemaValidator: validatore basato su schema Pydantic
+- validate_with_schema: schemi Pydantic compilati in regole colonnari
 """
 
 from __future__ import annotations
 
 import re
 from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, List, Optional, Set
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union, get_args, get_origin
 
+import numpy as np
 import pandas as pd
 
+from data_profile import DataFrameProfile, profile_dataframe
 from utils import ValidationResult, normalize_nil_name
 
 
@@ -40,12 +43,25 @@ class ValidationRule:
 class DataValidator:
     """Validatore generico per DataFrame."""
     
-    def __init__(self, df: pd.DataFrame, name: str = "dataset"):
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        name: str = "dataset",
+        profile: Optional[DataFrameProfile] = None,
+    ):
         self.df = df
         self.name = name
         self.errors: List[str] = []
         self.warnings: List[str] = []
         self.stats: Dict[str, Any] = {}
+        self._profile = profile
+    
+    @property
+    def profile(self) -> DataFrameProfile:
+        """Profilo del DataFrame (data_profile.py), calcolato una volta alla prima richiesta."""
+        if self._profile is None:
+            self._profile = profile_dataframe(self.df)
+        return self._profile
     
     def validate(self) -> ValidationResult:
         """Esegue tutte le validazioni."""
@@ -64,13 +80,14 @@ class DataValidator:
     
     def _compute_basic_stats(self) -> None:
         """Calcola statistiche base."""
+        profile = self.profile
         self.stats = {
-            "rows": len(self.df),
-            "columns": len(self.df.columns),
-            "memory_mb": self.df.memory_usage(deep=True).sum() / (1024 * 1024),
-            "null_percentage": self.df.isnull().sum().sum() / self.df.size * 100 if self.df.size > 0 else 0,
-            "duplicate_rows": self.df.duplicated().sum(),
-            "column_types": self.df.dtypes.astype(str).to_dict(),
+            "rows": profile.rows,
+            "columns": len(profile.columns),
+            "memory_mb": profile.memory_mb,
+            "null_percentage": profile.null_percentage,
+            "duplicate_rows": profile.duplicate_rows,
+            "column_types": profile.column_types,
         }
     
     def _check_empty(self) -> None:
@@ -82,7 +99,7 @@ class DataValidator:
     
     def _check_duplicates(self) -> None:
         """Verifica righe duplicate."""
-        dup_count = self.df.duplicated().sum()
+        dup_count = self.profile.duplicate_rows
         if dup_count > 0:
             dup_pct = dup_count / len(self.df) * 100
             if dup_pct > 50:
@@ -96,7 +113,7 @@ class DataValidator:
     
     def _check_null_columns(self) -> None:
         """Verifica colonne completamente nulle."""
-        null_cols = self.df.columns[self.df.isnull().all()].tolist()
+        null_cols = self.profile.all_null_columns
         if null_cols:
             self.warnings.append(
                 f"{self.name}: Colonne completamente nulle: {null_cols}"
@@ -104,14 +121,12 @@ class DataValidator:
     
     def _check_data_types(self) -> None:
         """Verifica tipi di dato sensati."""
-        for col in self.df.columns:
-            series = self.df[col]
-            
+        for col, column in self.profile.columns.items():
             # Verifica se colonna numerica ha valori anomali
-            if pd.api.types.is_numeric_dtype(series):
-                if series.notna().any():
-                    min_val = series.min()
-                    max_val = series.max()
+            if column.numeric:
+                if column.min is not None:
+                    min_val = column.min
+                    max_val = column.max
                     if abs(max_val - min_val) > 1e15:
                         self.warnings.append(
                             f"{self.name}.{col}: Range numerico molto ampio"
@@ -131,7 +146,7 @@ class DataValidator:
         if column not in self.df.columns:
             return self
         
-        dup_count = self.df[column].duplicated().sum()
+        dup_count = self.profile.duplicate_values(column)
         if dup_count > 0:
             self.warnings.append(
                 f"{self.name}.{column}: {dup_count} valori duplicati"
@@ -148,6 +163,14 @@ class DataValidator:
         if column not in self.df.columns:
             return self
         
+        # Con min/max del profilo nel range non serve riscandire la colonna
+        profiled = self.profile.columns[column]
+        if profiled.numeric and (
+            (min_val is None or profiled.min is None or profiled.min >= min_val)
+            and (max_val is None or profiled.max is None or profiled.max <= max_val)
+        ):
+            return self
+        
         series = pd.to_numeric(self.df[column], errors="coerce")
         
         if min_val is not None:
@@ -168,10 +191,10 @@ class DataValidator:
     
     def check_not_null(self, column: str, threshold: float = 0.9) -> "DataValidator":
         """Verifica colonna non troppo nulla."""
-        if column not in self.df.columns:
+        if column not in self.df.columns or self.profile.rows == 0:
             return self
         
-        not_null_pct = self.df[column].notna().mean()
+        not_null_pct = 1 - self.profile.columns[column].null_count / self.profile.rows
         if not_null_pct < threshold:
             self.errors.append(
                 f"{self.name}.{column}: Troppi null ({(1-not_null_pct)*100:.1f}%)"
@@ -197,8 +220,13 @@ class NILValidator(DataValidator):
         "BRUZZANO", "COMASINA", "PORTA GARIBALDI", "CENTRALE",
     }
     
-    def __init__(self, df: pd.DataFrame, name: str = "nil_dataset"):
-        super().__init__(df, name)
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        name: str = "nil_dataset",
+        profile: Optional[DataFrameProfile] = None,
+    ):
+        super().__init__(df, name, profile)
         self.nil_column: Optional[str] = None
         self._detect_nil_column()
     
@@ -257,7 +285,7 @@ class NILValidator(DataValidator):
         
         if "geometry" in self.df.columns or "_geometry" in self.df.columns:
             geo_col = "geometry" if "geometry" in self.df.columns else "_geometry"
-            null_geo = self.df[geo_col].isnull().sum()
+            null_geo = self.profile.columns[geo_col].null_count
             if null_geo > 0:
                 self.warnings.append(
                     f"{self.name}: {null_geo} geometrie mancanti"
@@ -270,12 +298,18 @@ class NILValidator(DataValidator):
         year_cols = [c for c in self.df.columns if "anno" in c.lower() or "year" in c.lower()]
         
         for col in year_cols:
-            years = pd.to_numeric(self.df[col], errors="coerce").dropna()
-            if years.empty:
-                continue
-            
-            min_year = int(years.min())
-            max_year = int(years.max())
+            profiled = self.profile.columns[col]
+            if profiled.numeric:
+                if profiled.min is None:
+                    continue
+                min_year = int(profiled.min)
+                max_year = int(profiled.max)
+            else:
+                years = pd.to_numeric(self.df[col], errors="coerce").dropna()
+                if years.empty:
+                    continue
+                min_year = int(years.min())
+                max_year = int(years.max())
             
             self.stats[f"{col}_range"] = f"{min_year}-{max_year}"
             
@@ -297,6 +331,11 @@ except ImportError:
     BaseModel = object
 
 
+def upper_label(cls, v: str) -> str:
+    """Normalizzazione dei nomi (quartiere, NIL): spazi esterni rimossi, maiuscolo."""
+    return v.strip().upper() if v else ""
+
+
 if PYDANTIC_AVAILABLE:
     
     class DemografiaRecord(BaseModel):
@@ -307,10 +346,7 @@ if PYDANTIC_AVAILABLE:
         stranieri: Optional[int] = Field(default=None, ge=0)
         famiglie_registrate_in_anagrafe: Optional[int] = Field(default=None, ge=0)
         
-        @field_validator("quartiere")
-        @classmethod
-        def normalize_quartiere(cls, v: str) -> str:
-            return v.strip().upper() if v else ""
+        normalize_quartiere = field_validator("quartiere")(classmethod(upper_label))
     
     class NILRecord(BaseModel):
         """Schema per record NIL base."""
@@ -320,10 +356,7 @@ if PYDANTIC_AVAILABLE:
         shape_length: Optional[float] = Field(default=None, ge=0)
         geometry: Optional[str] = None
         
-        @field_validator("nil")
-        @classmethod
-        def normalize_nil(cls, v: str) -> str:
-            return v.strip().upper() if v else ""
+        normalize_nil = field_validator("nil")(classmethod(upper_label))
     
     class ImmobiliareRecord(BaseModel):
         """Schema per record immobiliare."""
@@ -334,21 +367,160 @@ if PYDANTIC_AVAILABLE:
         volume_totale_v_p: Optional[float] = Field(default=None, ge=0)
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Validazione colonnare
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Equivalenti vettoriali dei field_validator degli schemi
+VECTORIZED_NORMALIZERS: Dict[Callable, Callable[[pd.Series], pd.Series]] = {
+    upper_label: lambda s: s.str.strip().str.upper(),
+}
+
+INT_STRING_PATTERN = r"[+-]?\d+(?:\.0*)?"
+
+# Righe non valide riportate per id nelle statistiche
+MAX_REPORTED_ROWS = 100
+
+
+@dataclass(frozen=True)
+class ColumnRule:
+    """Vincoli di un campo dello schema, verificati come maschere sulla colonna."""
+    column: str
+    kind: str  # "int" | "float" | "str"
+    required: bool
+    bounds: Tuple[Tuple[str, float], ...] = ()  # (operatore, limite): ge / gt / le / lt
+    normalizer: Optional[Callable[[pd.Series], pd.Series]] = None
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    """Regole colonnari di uno schema Pydantic."""
+    name: str
+    rules: Tuple[ColumnRule, ...]
+    unsupported: Tuple[str, ...] = ()  # field_validator senza equivalente vettoriale
+
+
+BOUND_OPERATORS = {
+    "ge": lambda values, limit: values >= limit,
+    "gt": lambda values, limit: values > limit,
+    "le": lambda values, limit: values <= limit,
+    "lt": lambda values, limit: values < limit,
+}
+
+
+@lru_cache(maxsize=None)
+def compile_schema(schema_class: type) -> CompiledSchema:
+    """
+    Traduce campi, tipi, vincoli Field(ge/gt/le/lt) e field_validator di uno
+    schema Pydantic in regole colonnari.
+    """
+    normalizers: Dict[str, Callable[[pd.Series], pd.Series]] = {}
+    unsupported: List[str] = []
+    for name, decorator in schema_class.__pydantic_decorators__.field_validators.items():
+        vectorized = VECTORIZED_NORMALIZERS.get(getattr(decorator.func, "__func__", decorator.func))
+        if vectorized is None:
+            unsupported.append(name)
+            continue
+        for column in decorator.info.fields:
+            normalizers[column] = vectorized
+
+    rules = []
+    for column, info in schema_class.model_fields.items():
+        annotation = info.annotation
+        if get_origin(annotation) is Union:
+            annotation = next(a for a in get_args(annotation) if a is not type(None))
+        kind = {int: "int", float: "float"}.get(annotation, "str")
+        bounds = tuple(
+            (op, float(getattr(constraint, op)))
+            for constraint in info.metadata
+            for op in BOUND_OPERATORS
+            if getattr(constraint, op, None) is not None
+        )
+        rules.append(ColumnRule(column, kind, info.is_required(), bounds, normalizers.get(column)))
+    return CompiledSchema(schema_class.__name__, tuple(rules), tuple(unsupported))
+
+
+def numeric_values(series: pd.Series, kind: str) -> np.ndarray:
+    """Valori numerici come li accetta Pydantic in modalità lax (stringhe numeriche e bool compresi), NaN altrimenti."""
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=float, na_value=np.nan)
+
+    is_str = string_mask(series)
+    values = pd.to_numeric(series.where(~is_str), errors="coerce").to_numpy(dtype=float, na_value=np.nan, copy=True)
+    if is_str.any():
+        text = series[is_str].str.strip()
+        if kind == "int":
+            # Per gli int Pydantic accetta solo stringhe intere ("12", "12.0"), non "1e2"
+            text = text.where(text.str.fullmatch(INT_STRING_PATTERN))
+        values[is_str] = pd.to_numeric(text, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return values
+
+
+def string_mask(series: pd.Series) -> np.ndarray:
+    """True dove il valore è una stringa."""
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return np.zeros(len(series), dtype=bool)
+    try:
+        return series.str.len().notna().to_numpy()
+    except AttributeError:
+        return np.zeros(len(series), dtype=bool)
+
+
+def rule_violations(df: pd.DataFrame, rule: ColumnRule) -> Dict[str, np.ndarray]:
+    """Maschere booleane (True = riga non valida) per ogni vincolo della regola."""
+    if rule.column not in df.columns:
+        if rule.required:
+            return {f"{rule.column}: colonna mancante": np.ones(len(df), dtype=bool)}
+        return {}
+
+    series = df[rule.column]
+    present = series.notna().to_numpy()
+    masks: Dict[str, np.ndarray] = {}
+    if rule.required:
+        masks[f"{rule.column}: null"] = ~present
+
+    if rule.kind == "str":
+        masks[f"{rule.column}: tipo str"] = present & ~string_mask(series)
+        return masks
+
+    values = numeric_values(series, rule.kind)
+    wrong_type = present & np.isnan(values)
+    if rule.kind == "int" and not pd.api.types.is_integer_dtype(series):
+        with np.errstate(invalid="ignore"):
+            wrong_type |= present & ~(np.isfinite(values) & (np.trunc(values) == values)) & ~np.isnan(values)
+    masks[f"{rule.column}: tipo {rule.kind}"] = wrong_type
+    for op, limit in rule.bounds:
+        masks[f"{rule.column}: {op} {limit:g}"] = present & ~wrong_type & ~BOUND_OPERATORS[op](values, limit)
+    return masks
+
+
+def normalize_frame(df: pd.DataFrame, schema_class: type) -> pd.DataFrame:
+    """Copia del DataFrame con le colonne normalizzate come dai field_validator dello schema."""
+    normalized = df.copy()
+    for rule in compile_schema(schema_class).rules:
+        if rule.normalizer is not None and rule.column in normalized.columns:
+            series = normalized[rule.column]
+            normalized[rule.column] = series.where(~string_mask(series), rule.normalizer(series))
+    return normalized
+
+
 def validate_with_schema(
     df: pd.DataFrame,
     schema_class: type,
-    sample_size: int = 100,
 ) -> ValidationResult:
     """
-    Valida DataFrame contro schema Pydantic.
+    Valida tutte le righe del DataFrame contro uno schema Pydantic.
+    
+    Lo schema è compilato in regole colonnari (compile_schema): tipi, null
+    e range sono maschere pandas/NumPy sull'intera colonna, senza costruire
+    un modello per riga.
     
     Args:
         df: DataFrame da validare
         schema_class: Classe Pydantic per validazione
-        sample_size: Numero di righe da campionare per validazione
     
     Returns:
-        ValidationResult con errori e statistiche
+        ValidationResult con errori, violazioni per vincolo e id delle righe non valide
     """
     if not PYDANTIC_AVAILABLE:
         return ValidationResult(
@@ -358,37 +530,42 @@ def validate_with_schema(
     
     errors: List[str] = []
     warnings: List[str] = []
+    schema = compile_schema(schema_class)
     
-    # Campiona righe se dataset grande
-    sample = df.head(sample_size) if len(df) > sample_size else df
+    violations: Dict[str, np.ndarray] = {}
+    for rule in schema.rules:
+        violations.update(rule_violations(df, rule))
     
-    valid_count = 0
-    error_samples: List[str] = []
+    invalid = np.logical_or.reduce(list(violations.values())) if violations else np.zeros(len(df), dtype=bool)
+    positions = np.flatnonzero(invalid)
+    invalid_rows = df.index[positions]
     
-    for idx, row in sample.iterrows():
-        try:
-            record = row.to_dict()
-            # Rimuovi valori NaN
-            record = {k: v for k, v in record.items() if pd.notna(v)}
-            schema_class(**record)
-            valid_count += 1
-        except Exception as e:
-            if len(error_samples) < 3:
-                error_samples.append(f"Row {idx}: {str(e)[:100]}")
+    valid_pct = (1 - len(positions) / len(df)) * 100 if len(df) else 100.0
     
-    valid_pct = valid_count / len(sample) * 100
+    error_samples = [
+        f"Row {df.index[pos]}: {', '.join(name for name, mask in violations.items() if mask[pos])}"
+        for pos in positions[:3]
+    ]
     
     if valid_pct < 90:
         errors.append(f"Solo {valid_pct:.1f}% delle righe valide secondo schema")
         errors.extend(error_samples)
     elif valid_pct < 100:
         warnings.append(f"{100-valid_pct:.1f}% delle righe non conformi allo schema")
+    if schema.unsupported:
+        warnings.append(f"{schema.name}: validator non vettorizzati, non verificati: {list(schema.unsupported)}")
     
     return ValidationResult(
         is_valid=len(errors) == 0,
         errors=errors,
         warnings=warnings,
-        stats={"valid_percentage": valid_pct, "sample_size": len(sample)},
+        stats={
+            "valid_percentage": valid_pct,
+            "rows_checked": len(df),
+            "invalid_count": len(positions),
+            "invalid_rows": invalid_rows[:MAX_REPORTED_ROWS].tolist(),
+            "violations": {name: int(mask.sum()) for name, mask in violations.items() if mask.any()},
+        },
     )
 
 
@@ -400,6 +577,7 @@ def create_validator(
     df: pd.DataFrame,
     name: str,
     validator_type: str = "auto",
+    profile: Optional[DataFrameProfile] = None,
 ) -> DataValidator:
     """
     Crea validatore appropriato per il dataset.
@@ -408,6 +586,7 @@ def create_validator(
         df: DataFrame da validare
         name: Nome dataset
         validator_type: "auto", "nil", "generic"
+        profile: Profilo già calcolato del DataFrame (evita un secondo passaggio)
     
     Returns:
         Istanza validatore appropriata
@@ -416,10 +595,10 @@ def create_validator(
         # Rileva automaticamente se è un dataset NIL
         nil_hints = ["nil", "quartiere", "zona"]
         if any(hint in name.lower() for hint in nil_hints):
-            return NILValidator(df, name)
+            return NILValidator(df, name, profile)
         if any(hint in str(df.columns).lower() for hint in nil_hints):
-            return NILValidator(df, name)
+            return NILValidator(df, name, profile)
     elif validator_type == "nil":
-        return NILValidator(df, name)
+        return NILValidator(df, name, profile)
     
-    return DataValidator(df, name)
+    return DataValidator(df, name, profile)
@@ -1,4 +1,4 @@
-import { mkdir, readFile, rm, writeFile } from 'node:fs/promises'
+import { mkdir, readdir, readFile, rm, writeFile } from 'node:fs/promises'
 import path from 'node:path'
 import { Readable, Writable } from 'node:stream'
 import { fileURLToPath } from 'node:url'
@@ -9,6 +9,12 @@ const __filename = fileURLToPath(import.meta.url)
 const __dirname = path.dirname(__filename)
 const rootDir = path.resolve(__dirname, '..')
 const outputDir = path.join(rootDir, 'website', 'public', 'data-api')
+// File esportati da questo script: quelli non più prodotti vengono rimossi
+// (i nil/:id/* li gestisce export_static_api.py con il suo .manifest.json)
+const manifestPath = path.join(outputDir, '.routes-manifest.json')
+const exported = new Set()
+// Layout di export_static_api.py: nil/<id>.json e nil/<id>/<endpoint>.json
+const nilResponsePattern = /^nil\/\d+(\/[a-z-]+)?\.json$/
 
 const quartiereNilMappingPath = path.join(rootDir, 'website', 'src', 'data', 'quartiereNilMapping_expanded.json')
 const nilMappingPath = path.join(rootDir, 'website', 'src', 'data', 'nilMapping.json')
@@ -17,11 +23,51 @@ async function readJson(filePath) {
   return JSON.parse(await readFile(filePath, 'utf8'))
 }
 
+// JSON minificato; i file invariati non vengono riscritti (i .gz/.br li genera
+// data_pipeline/scripts/export_static_api.py solo per i JSON modificati)
 async function writePayload(apiPath, payload) {
   const relativePath = apiPath.replace(/^\/api/, '')
   const filePath = path.join(outputDir, `${relativePath}.json`)
+  exported.add(`${relativePath.replace(/^\//, '')}.json`)
+  const content = `${JSON.stringify(payload)}\n`
+  const current = await readFile(filePath, 'utf8').catch(() => null)
+  if (current === content) {
+    return
+  }
   await mkdir(path.dirname(filePath), { recursive: true })
-  await writeFile(filePath, `${JSON.stringify(payload, null, 2)}\n`, 'utf8')
+  await writeFile(filePath, content, 'utf8')
+}
+
+// File esportati al giro precedente; senza manifest, tutti i JSON non per-NIL dell'albero
+async function previousExports() {
+  const manifest = await readJson(manifestPath).catch(() => null)
+  if (manifest) {
+    return manifest
+  }
+  const entries = await readdir(outputDir, { recursive: true }).catch(() => [])
+  return entries
+    .map((entry) => entry.split(path.sep).join('/'))
+    .filter((relative) => relative.endsWith('.json') && !path.basename(relative).startsWith('.'))
+    .filter((relative) => !nilResponsePattern.test(relative))
+}
+
+// Rimuove i JSON (e i fratelli .gz/.br) esportati al giro precedente ma non in questo
+async function pruneStale() {
+  const previous = await previousExports()
+  let removed = 0
+  for (const relative of previous) {
+    if (exported.has(relative)) {
+      continue
+    }
+    const filePath = path.join(outputDir, relative)
+    for (const stale of [filePath, `${filePath}.gz`, `${filePath}.br`]) {
+      await rm(stale, { force: true })
+    }
+    removed += 1
+  }
+  await mkdir(outputDir, { recursive: true })
+  await writeFile(manifestPath, JSON.stringify([...exported].sort()), 'utf8')
+  return removed
 }
 
 async function invokeGet(apiPath) {
@@ -112,8 +158,6 @@ async function fetchAndWrite(apiPath, { allowStatuses = [], fallbackPayload } =
 }
 
 async function main() {
-  await rm(outputDir, { recursive: true, force: true })
-
   const quartiereNilMapping = await readJson(quartiereNilMappingPath)
   const nilMapping = await readJson(nilMappingPath)
 
@@ -159,24 +203,15 @@ async function main() {
     await fetchAndWrite(`/api/quartieri/${encodeURIComponent(quartiereId)}/timeseries`, { allowStatuses: [404] })
   }
 
-  const nilDetailPaths = [
-    (nilId) => `/api/popolazione-quartiere/${nilId}`,
-    (nilId) => `/api/nil/${nilId}`,
-    (nilId) => `/api/nil/${nilId}/istruzione`,
-    (nilId) => `/api/nil/${nilId}/mobilita`,
-    (nilId) => `/api/nil/${nilId}/stock-abitativo`,
-    (nilId) => `/api/nil/${nilId}/investor-metrics`,
-    (nilId) => `/api/nil/${nilId}/servizi-sanitari`,
-    (nilId) => `/api/nil/${nilId}/servizi-sociali`,
-    (nilId) => `/api/nil/${nilId}/cultura`,
-    (nilId) => `/api/nil/${nilId}/commercio`,
-    (nilId) => `/api/nil/${nilId}/sicurezza`
-  ]
-
+  // Le risposte /api/nil/:id/* sono esportate da data_pipeline/scripts/export_static_api.py
+  // direttamente da api_response_cache; qui restano solo le route non precalcolate
   for (const nilId of nilIds) {
-    for (const toPath of nilDetailPaths) {
-      await fetchAndWrite(toPath(nilId), { allowStatuses: [404, 500] })
-    }
+    await fetchAndWrite(`/api/popolazione-quartiere/${nilId}`, { allowStatuses: [404, 500] })
+  }
+
+  const removed = await pruneStale()
+  if (removed > 0) {
+    console.log(`Removed ${removed} stale static API files`)
   }
 }
 
@@ -42,6 +42,31 @@ let dbStatus = {
   lastCheck: null
 }
 
+// Relazione da interrogare per ogni vista API (snapshot mv_api_* o vista vw_api_*),
+// valida finché lo schema del DB non cambia (PRAGMA schema_version)
+const apiRelations = new Map()
+let apiRelationsSchema = null
+
+// Inode del file aperto: publish_database.py pubblica una nuova generazione
+// con un rename atomico, la connessione va riaperta sul nuovo file
+let dbInode = null
+let lastInodeCheck = 0
+const INODE_CHECK_INTERVAL_MS = 1000
+
+/**
+ * mmap_size consigliato da data_pipeline/scripts/finalize_database.py
+ * (tabella _db_settings), assente nei DB non finalizzati.
+ */
+function applyDatabaseSettings(conn) {
+  const found = conn.prepare(`SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '_db_settings'`).get()
+  if (!found) return
+  const row = conn.prepare(`SELECT value FROM _db_settings WHERE name = 'mmap_size'`).get()
+  const mmapSize = row ? parseInt(row.value, 10) : NaN
+  if (Number.isFinite(mmapSize) && mmapSize > 0) {
+    conn.pragma(`mmap_size = ${mmapSize}`)
+  }
+}
+
 // Initialize database connection
 function initDatabase() {
   dbStatus.lastCheck = new Date().toISOString()
@@ -57,6 +82,10 @@ function initDatabase() {
   
   try {
     db = new Database(dbPath, { readonly: true })
+    dbInode = fs.statSync(dbPath).ino
+    applyDatabaseSettings(db)
+    apiRelations.clear()
+    apiRelationsSchema = null
     dbStatus.connected = true
     dbStatus.error = null
     console.log(`📊 Connected to unified database: ${dbPath}`)
@@ -72,6 +101,54 @@ function initDatabase() {
 // Initialize on startup
 initDatabase()
 
+/**
+ * Riapre il database se il file è stato sostituito (nuovo inode) o creato
+ * dopo l'avvio; controllo al più una volta ogni INODE_CHECK_INTERVAL_MS.
+ */
+function reopenIfReplaced() {
+  const now = Date.now()
+  if (now - lastInodeCheck < INODE_CHECK_INTERVAL_MS) return
+  lastInodeCheck = now
+
+  let inode = null
+  try {
+    inode = fs.statSync(dbPath).ino
+  } catch (err) {
+    return
+  }
+  if (dbStatus.connected && inode === dbInode) return
+
+  if (db) {
+    try {
+      db.close()
+    } catch (err) {
+      console.error('Error closing replaced database:', err.message)
+    }
+    db = null
+  }
+  console.log(`🔄 Database file changed, reopening: ${dbPath}`)
+  initDatabase()
+}
+
+/**
+ * Tabella materializzata mv_api_* creata da sync_to_website.py --materialize
+ * (lookup su indice), altrimenti la vista vw_api_* corrispondente.
+ */
+function apiRelation(view) {
+  // sync_to_website.py crea o rimuove gli snapshot mentre il server è attivo
+  const schemaVersion = db.pragma('schema_version', { simple: true })
+  if (schemaVersion !== apiRelationsSchema) {
+    apiRelations.clear()
+    apiRelationsSchema = schemaVersion
+  }
+  if (!apiRelations.has(view)) {
+    const table = view.replace(/^vw_/, 'mv_')
+    const found = db.prepare(`SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?`).get(table)
+    apiRelations.set(view, found ? table : view)
+  }
+  return apiRelations.get(view)
+}
+
 // Middleware to check database availability
 const requireDatabase = (req, res, next) => {
   if (!db || !dbStatus.connected) {
@@ -100,6 +177,11 @@ app.use((req, res, next) => {
 
 app.use(express.json())
 
+app.use('/api', (req, res, next) => {
+  reopenIfReplaced()
+  next()
+})
+
 // Health check endpoint
 app.get('/api/health', (req, res) => {
   const health = {
@@ -1466,6 +1548,38 @@ app.get('/api/nil/clusters', (req, res) => {
 // NIL SPECIFIC ENDPOINTS (must come BEFORE /api/nil/:name to avoid catch-all)
 // ============================================================================
 
+/**
+ * GET /api/nil/:id e /api/nil/:id/:endpoint
+ * Risposte precalcolate da sync_to_website.py (api_response_cache): una
+ * lettura per chiave primaria, con ETag dal contenuto (304 se invariata).
+ * Se la risposta non è in cache si prosegue con la route corrispondente.
+ */
+const serveCachedNilResponse = (req, res, next) => {
+  const { id, endpoint = '' } = req.params
+  if (!/^\d+$/.test(id)) {
+    return next()
+  }
+
+  let cached = null
+  try {
+    cached = db.prepare(`
+      SELECT etag, body FROM api_response_cache WHERE endpoint = ? AND key = ?
+    `).get(endpoint, String(parseInt(id, 10)))
+  } catch (e) {
+    // Cache non ancora generata
+  }
+
+  if (!cached) {
+    return next()
+  }
+
+  res.set('ETag', cached.etag)
+  res.type('application/json').send(cached.body)
+}
+
+app.get('/api/nil/:id', serveCachedNilResponse)
+app.get('/api/nil/:id/:endpoint', serveCachedNilResponse)
+
 /**
  * GET /api/nil/:id/servizi-sanitari
  * Dati servizi sanitari per NIL (farmacie, medici)
@@ -2099,7 +2213,7 @@ app.get('/api/nil/:id/servizi', (req, res) => {
     
     try {
       result = db.prepare(`
-        SELECT * FROM vw_api_servizi_nil WHERE id_nil = ?
+        SELECT * FROM ${apiRelation('vw_api_servizi_nil')} WHERE id_nil = ?
       `).get(nilId)
     } catch (e) {
       // Vista non esiste, prova query diretta
@@ -2127,7 +2241,19 @@ app.get('/api/nil/:id/servizi', (req, res) => {
     if (!result) {
       return res.status(404).json({ error: 'NIL not found' })
     }
-    
+
+    // Distanze dai servizi precalcolate dalla pipeline (fact_accessibilita)
+    try {
+      result.accessibilita = db.prepare(`
+        SELECT categoria, distanza_media_m, distanza_max_m, quota_entro_500m
+        FROM fact_accessibilita
+        WHERE id_nil = ?
+      `).all(nilId)
+    } catch (error) {
+      // Tabella non ancora generata: la risposta resta valida senza accessibilita
+      console.error('Error fetching NIL accessibility:', error)
+    }
+
     res.json(result)
   } catch (error) {
     console.error('Error fetching NIL services:', error)
@@ -2135,6 +2261,34 @@ app.get('/api/nil/:id/servizi', (req, res) => {
   }
 })
 
+/**
+ * GET /api/nil/:id/serie-storica
+ * Indicatori NIL per anno con variazioni anno su anno (cube_nil_anno)
+ */
+app.get('/api/nil/:id/serie-storica', (req, res) => {
+  try {
+    const nilId = parseInt(req.params.id, 10)
+
+    let rows = []
+    try {
+      rows = db.prepare(`
+        SELECT * FROM cube_nil_anno WHERE id_nil = ? ORDER BY id_tempo
+      `).all(nilId)
+    } catch (e) {
+      return res.status(404).json({ error: 'NIL time series not available' })
+    }
+
+    if (rows.length === 0) {
+      return res.status(404).json({ error: 'NIL not found' })
+    }
+
+    res.json({ id_nil: nilId, totale: rows.length, data: rows })
+  } catch (error) {
+    console.error('Error fetching NIL time series:', error)
+    res.status(500).json({ error: 'Internal server error' })
+  }
+})
+
 /**
  * GET /api/nil/:id/ambiente
  * Dati ambientali NIL (verde urbano, calore, rischio)
@@ -2148,7 +2302,7 @@ app.get('/api/nil/:id/ambiente', (req, res) => {
     
     try {
       result = db.prepare(`
-        SELECT * FROM vw_api_ambiente_nil WHERE id_nil = ?
+        SELECT * FROM ${apiRelation('vw_api_ambiente_nil')} WHERE id_nil = ?
       `).get(nilId)
     } catch (e) {
       // Vista non esiste
@@ -2276,7 +2430,7 @@ app.get('/api/timeline/demografico', (req, res) => {
     
     try {
       result = db.prepare(`
-        SELECT * FROM vw_api_timeline_demografico ORDER BY anno
+        SELECT * FROM ${apiRelation('vw_api_timeline_demografico')} ORDER BY anno
       `).all()
     } catch (e) {
       // Vista non esiste, prova query diretta
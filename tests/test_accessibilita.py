@@ -0,0 +1,149 @@
+"""
+Test per le distanze dai servizi per NIL (data_pipeline/scripts/build_accessibilita.py).
+
+Verifica:
+- Distanza fra due punti noti (Duomo - Castello Sforzesco) coerente con l'haversine
+- Servizio più vicino scelto fra più candidati; categoria senza punti → NaN
+- Media pesata per popolazione e quota entro 500 m
+- fact_accessibilita da sezioni di censimento e, in loro assenza, dalla griglia
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+shapely = pytest.importorskip("shapely")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_accessibilita import (  # noqa: E402
+    EARTH_RADIUS_M,
+    SERVICE_TABLES,
+    SEZIONI_TABLE,
+    aggregate_by_nil,
+    build_fact_accessibilita,
+    nearest_distances,
+    project_meters,
+)
+
+DUOMO = (9.1919, 45.4642)
+CASTELLO = (9.1794, 45.4705)
+
+# Due NIL affiancati di circa 780 m × 1110 m
+SQUARES = {
+    1: shapely.box(9.180, 45.460, 9.190, 45.470),
+    2: shapely.box(9.190, 45.460, 9.200, 45.470),
+}
+
+
+def haversine(a, b) -> float:
+    lon1, lat1, lon2, lat2 = map(np.radians, (*a, *b))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(h)))
+
+
+def distances(origins, targets) -> np.ndarray:
+    ox, oy = project_meters(*np.array(origins, dtype=float).T)
+    tx, ty = project_meters(*np.array(targets, dtype=float).reshape(-1, 2).T)
+    return nearest_distances(ox, oy, tx, ty)
+
+
+@pytest.fixture
+def conn():
+    """dim_nil con due NIL, farmacie (long/lat) e scuole (location "(lat, lon)")."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT, geometry TEXT)")
+    for id_nil, geom in SQUARES.items():
+        conn.execute("INSERT INTO dim_nil VALUES (?, ?, ?)", (id_nil, f"NIL {id_nil}", shapely.to_geojson(geom)))
+    conn.execute(f'CREATE TABLE "{SERVICE_TABLES["farmacie"]}" (nome TEXT, long_x_4326 REAL, lat_y_4326 REAL)')
+    conn.executemany(
+        f'INSERT INTO "{SERVICE_TABLES["farmacie"]}" VALUES (?, ?, ?)',
+        [("centro 1", 9.185, 45.465), ("centro 2", 9.195, 45.465), ("fuori", 12.5, 41.9)],
+    )
+    conn.execute(f'CREATE TABLE "{SERVICE_TABLES["scuole"]}" (nome TEXT, location TEXT)')
+    conn.execute(f'INSERT INTO "{SERVICE_TABLES["scuole"]}" VALUES (?, ?)', ("scuola", "(45.465, 9.185)"))
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_distance_known_points():
+    """Duomo - Castello: circa 1.18 km, proiezione locale entro lo 0.5% dell'haversine."""
+    expected = haversine(DUOMO, CASTELLO)
+    assert 1100 < expected < 1250
+
+    assert distances([DUOMO], [CASTELLO])[0] == pytest.approx(expected, rel=5e-3)
+    # 0.01° di latitudine ≈ 1112 m a qualsiasi longitudine
+    assert distances([(9.19, 45.46)], [(9.19, 45.47)])[0] == pytest.approx(1112, abs=2)
+
+
+def test_nearest_among_candidates():
+    result = distances([DUOMO, CASTELLO], [CASTELLO, (9.30, 45.50), DUOMO])
+    assert result == pytest.approx([0.0, 0.0], abs=1e-6)
+
+    assert np.isnan(distances([DUOMO], np.empty((0, 2)))).all()
+
+
+def test_aggregate_weighted():
+    origins = pd.DataFrame({"id_nil": [1.0, 1.0, 2.0], "peso": [3.0, 1.0, 0.0]})
+    result = aggregate_by_nil(origins, np.array([200.0, 1000.0, 300.0])).set_index("id_nil")
+
+    # (3 × 200 + 1 × 1000) / 4
+    assert result.loc[1, "distanza_media_m"] == pytest.approx(400.0)
+    assert result.loc[1, "quota_entro_500m"] == pytest.approx(75.0)
+    assert result.loc[1, "distanza_min_m"] == 200.0
+    assert result.loc[1, "distanza_max_m"] == 1000.0
+    assert result.loc[1, "n_origini"] == 2
+    # Peso nullo: nessuna media invece di una divisione per zero
+    assert np.isnan(result.loc[2, "distanza_media_m"])
+
+
+def test_fact_from_grid(conn):
+    fact = build_fact_accessibilita(conn)
+
+    assert set(fact["categoria"]) == {"farmacie", "scuole"}
+    assert (fact["fonte_origini"] == "griglia_nil").all()
+    farmacie = fact[fact["categoria"] == "farmacie"].set_index("id_nil")
+    # Una farmacia al centro di ogni NIL: nessun punto oltre la semidiagonale (~680 m)
+    assert (farmacie["distanza_max_m"] < 700).all()
+    assert (farmacie["distanza_media_m"] < 500).all()
+
+    # Una sola scuola nel NIL 1: il NIL 2 è mediamente più lontano
+    scuole = fact[fact["categoria"] == "scuole"].set_index("id_nil")
+    assert scuole.loc[2, "distanza_media_m"] > scuole.loc[1, "distanza_media_m"]
+    stored = conn.execute("SELECT COUNT(*) FROM fact_accessibilita").fetchone()[0]
+    assert stored == len(fact) == 4
+
+
+def test_fact_from_census_sections(conn):
+    """Sezione popolosa accanto alla farmacia, sezione disabitata lontana: conta solo la prima."""
+    conn.execute(f'CREATE TABLE "{SEZIONI_TABLE}" (pop_2011 INTEGER, geometry TEXT)')
+    conn.executemany(f'INSERT INTO "{SEZIONI_TABLE}" VALUES (?, ?)', [
+        (900, shapely.to_geojson(shapely.box(9.184, 45.464, 9.186, 45.466))),
+        (0, shapely.to_geojson(shapely.box(9.180, 45.468, 9.182, 45.470))),
+    ])
+
+    fact = build_fact_accessibilita(conn)
+    farmacie = fact[fact["categoria"] == "farmacie"].set_index("id_nil")
+
+    assert (fact["fonte_origini"] == "sezioni_censimento").all()
+    assert list(farmacie.index) == [1]
+    assert farmacie.loc[1, "n_origini"] == 2
+    assert farmacie.loc[1, "distanza_media_m"] == pytest.approx(0.0, abs=1.0)
+    assert farmacie.loc[1, "distanza_max_m"] > 400
+    assert farmacie.loc[1, "quota_entro_500m"] == pytest.approx(100.0)
+
+
+def test_fact_without_nil_geometries():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, geometry TEXT)")
+    assert build_fact_accessibilita(conn) is None
+    conn.close()
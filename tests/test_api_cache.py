@@ -0,0 +1,77 @@
+"""
+Test per le risposte API precalcolate (data_pipeline/scripts/build_api_cache.py).
+
+Verifica:
+- Arrotondamenti e serializzazione compatibili con la route Express
+- Costruzione di api_response_cache con ETag dal contenuto
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_api_cache import (  # noqa: E402
+    build_api_response_cache,
+    dumps,
+    js_round,
+    to_fixed,
+)
+
+
+@pytest.fixture
+def conn():
+    """DB minimale con due NIL e le tabelle della route /cultura."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?)", [(1, "DUOMO"), (2, "BRERA")])
+    conn.execute("CREATE TABLE ds_11_biblioteche_biblioteche_rionali (nil TEXT)")
+    conn.execute("INSERT INTO ds_11_biblioteche_biblioteche_rionali VALUES ('duomo')")
+    for table in (
+        "ds_11_biblioteche_biblioteche_archivi",
+        "ds_10_cultura_musei_architetture_storiche",
+        "ds_10_cultura_musei_beni_culturali_siti",
+        "ds_10_cultura_musei_beni_patrimonio_musei",
+    ):
+        conn.execute(f"CREATE TABLE {table} (id_nil)")
+    # id_nil testuale e intero, come nei dataset grezzi
+    conn.executemany(
+        "INSERT INTO ds_10_cultura_musei_architetture_storiche VALUES (?)", [("1",), (1,), (2,)]
+    )
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_js_rounding():
+    """toFixed arrotonda half-up sul valore esatto, Math.round verso +∞."""
+    assert to_fixed(2.25, 1) == 2.3
+    assert to_fixed(1.005, 2) == 1.0  # 1.005 in binario è 1.00499...
+    assert to_fixed(-2.25, 1) == -2.3
+    assert js_round(2.5) == 3
+    assert js_round(-2.5) == -2
+
+
+def test_dumps_matches_json_stringify():
+    """Float interi senza .0, NaN come null, JSON minificato."""
+    assert dumps({"a": 5.0, "b": float("nan"), "c": "città"}) == '{"a":5,"b":null,"c":"città"}'
+
+
+def test_cache_rows_and_etags(conn):
+    """Ogni NIL ha la sua risposta; endpoint senza tabelle restano fuori."""
+    stats = build_api_response_cache(conn)
+    rows = conn.execute(
+        "SELECT key, etag, body FROM api_response_cache WHERE endpoint = 'cultura' ORDER BY key"
+    ).fetchall()
+
+    assert [r[0] for r in rows] == ["1", "2"]
+    assert '"biblioteche":1,"archivi":0,"architetture":2' in rows[0][2]
+    assert rows[0][1] != rows[1][1]
+    assert "commercio" in stats["skipped"]
@@ -0,0 +1,323 @@
+"""
+Parità tra le route Express /api/nil/:id/* e le risposte precalcolate
+(data_pipeline/scripts/build_api_cache.py).
+
+Verifica:
+- Su un DB di prova ogni endpoint portato in Python produce una risposta
+  (nessun endpoint saltato) e la connessione del chiamante resta invariata
+- Per ogni NIL ed endpoint il body in api_response_cache coincide byte per
+  byte con quello della route in server/index.js (richiede node e le
+  dipendenze npm del server, altrimenti il confronto viene saltato)
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_api_cache import CACHE_TABLE, ENDPOINTS, build_api_response_cache  # noqa: E402
+from sync_to_website import SyncManager  # noqa: E402
+
+SERVER = PROJECT_ROOT / "server" / "index.js"
+MIGRATION = PROJECT_ROOT / "db" / "migrations" / "003_create_nil_analisi_view.sql"
+
+# id 4 non esiste: entrambe le implementazioni rispondono 404
+NIL_IDS = (1, 2, 3, 4)
+NILS = [
+    (1, "DUOMO", 0.95),
+    (2, "BRERA", 1.625),
+    (3, "NIGUARDA - CA' GRANDA", 3.41),
+]
+
+QUALITA_VITA_COLUMNS = (
+    "pct_stranieri", "densita_abitanti_km2", "famiglie_registrate", "famiglie_unipersonali",
+    "nati_vivi", "morti", "immigrati", "emigrati", "saldo_naturale", "saldo_migratorio", "saldo_totale",
+    "nuovi_fabbricati_residenziali", "abitazioni_nuove", "numero_scuole", "numero_mercati",
+    "indice_verde_medio", "comp_verde", "comp_mercati", "comp_densita", "comp_dinamica",
+    "indice_qualita_vita",
+)
+
+# Script node: importa l'app Express, interroga ogni route e stampa i body
+NODE_SCRIPT = """
+import { once } from 'node:events'
+import { pathToFileURL } from 'node:url'
+
+const [serverPath, endpoints, ids] = process.argv.slice(1)
+const { default: app } = await import(pathToFileURL(serverPath).href)
+const server = app.listen(0, '127.0.0.1')
+await once(server, 'listening')
+const { port } = server.address()
+
+const out = {}
+for (const endpoint of JSON.parse(endpoints)) {
+  for (const id of JSON.parse(ids)) {
+    const suffix = endpoint ? `/${endpoint}` : ''
+    const res = await fetch(`http://127.0.0.1:${port}/api/nil/${id}${suffix}`)
+    out[`${endpoint}|${id}`] = { status: res.status, body: await res.text() }
+  }
+}
+server.close()
+process.stdout.write('\\n@@PARITY@@' + JSON.stringify(out) + '\\n')
+process.exit(0)
+"""
+
+
+def node_available() -> bool:
+    """node con express e better-sqlite3 risolvibili dalla root del progetto."""
+    if shutil.which("node") is None:
+        return False
+    probe = subprocess.run(
+        ["node", "--input-type=module", "-e", "await import('express'); await import('better-sqlite3')"],
+        cwd=PROJECT_ROOT, capture_output=True,
+    )
+    return probe.returncode == 0
+
+
+def create_fixture(conn: sqlite3.Connection) -> None:
+    """Tabelle lette dalle route per-NIL, con valori che esercitano arrotondamenti e fallback."""
+    conn.executescript("""
+        CREATE TABLE dim_nil (
+            id_nil INTEGER PRIMARY KEY, nil TEXT, nil_norm TEXT,
+            shape_area REAL, shape_length REAL, area_km2 REAL, geometry TEXT
+        );
+        CREATE TABLE fact_demografia (
+            id_nil INTEGER, id_tempo INTEGER, popolazione_totale INTEGER, pct_stranieri REAL,
+            densita_abitanti_km2 REAL, famiglie_registrate_in_anagrafe INTEGER
+        );
+        CREATE TABLE fact_immobiliare (
+            id_nil INTEGER, id_tempo INTEGER, nuovi_fabbricati_residenziali INTEGER,
+            abitazioni_nuove INTEGER, superficie_utile_abitabile REAL, volume_totale REAL
+        );
+        CREATE TABLE fact_servizi (
+            id_nil INTEGER, id_tempo INTEGER, numero_scuole INTEGER,
+            numero_mercati INTEGER, indice_verde_medio REAL
+        );
+        CREATE TABLE nil_clusters (nil TEXT, cluster_id INTEGER, cluster_nome TEXT);
+        CREATE TABLE fact_accessibilita (
+            id_nil INTEGER, categoria TEXT, distanza_media_m REAL, distanza_min_m REAL,
+            distanza_max_m REAL, quota_entro_500m REAL, n_origini INTEGER, fonte_origini TEXT
+        );
+        CREATE TABLE cube_nil_anno (
+            id_nil INTEGER, id_tempo INTEGER, popolazione_totale REAL, popolazione_totale_delta REAL
+        );
+        CREATE TABLE ds_04_qualita_ambientale_esposizione_calore_urbano_nil_2024 (
+            id_nil INTEGER, NIL TEXT, value REAL
+        );
+        CREATE TABLE ds_04_qualita_ambientale_rischio_ondata_calore_nil_2024 (
+            id_nil INTEGER, NIL TEXT, value TEXT
+        );
+        CREATE TABLE ds_08_servizi_sanitari_farmacie_milano (
+            descrizione_farmacia TEXT, indirizzo TEXT, cap TEXT, NIL TEXT, id_nil
+        );
+        CREATE TABLE ds_08_servizi_sanitari_medici_medicina_generale (
+            tipomedico TEXT, attivo INTEGER, NIL TEXT, id_nil
+        );
+        CREATE TABLE ds_09_servizi_sociali_servizi_sociali_2014 (
+            area_attivita TEXT, fascia_utenza TEXT, nil, denominazione_nil TEXT
+        );
+        CREATE TABLE ds_11_biblioteche_biblioteche_rionali (nil TEXT);
+        CREATE TABLE ds_07_mobilita_trasporti_mezzi_trasporto_prevalente_nil_2011 (
+            nil TEXT, mezzi_di_trasporto_prevalente TEXT, valore INTEGER
+        );
+        CREATE TABLE ds_06_istruzione_famiglie_titolo_studio_residenti_nil_2011 (
+            nil TEXT, titolo_di_studio TEXT, valori INTEGER
+        );
+        CREATE TABLE ds_03_stock_abitativo_abitazioni_occupate_nil_2011 (
+            nil_nuclei_di_identita_locale TEXT, numero_di_residenti_1_residente TEXT,
+            "2_residenti" TEXT, "3_residenti" TEXT, "4_residenti" TEXT, "5_o_piu_residenti" TEXT,
+            una_sola_famiglia INTEGER, famiglie_coabitanti INTEGER
+        );
+        CREATE TABLE ds_03_stock_abitativo_nuovi_fabbricati_residenziali_2010_2023 (
+            nil TEXT, anno_ritiro INTEGER, numero_abitazioni INTEGER,
+            superficie_utile_abitabile REAL, volume_totale_v_p REAL
+        );
+    """)
+    for table in (
+        "ds_11_biblioteche_biblioteche_archivi",
+        "ds_10_cultura_musei_architetture_storiche",
+        "ds_10_cultura_musei_beni_culturali_siti",
+        "ds_10_cultura_musei_beni_patrimonio_musei",
+        "ds_13_economia_commercio_pubblici_esercizi",
+        "ds_13_economia_commercio_esercizi_vicinato",
+        "ds_13_economia_commercio_botteghe_storiche",
+        "ds_13_economia_commercio_coworking",
+        "ds_13_economia_commercio_media_grande_distribuzione",
+        "ds_13_economia_commercio_edicole",
+        "ds_14_sicurezza_beni_immobili_confiscati",
+    ):
+        conn.execute(f"CREATE TABLE {table} (id_nil)")
+        # id_nil testuale e intero, come nei dataset grezzi
+        conn.executemany(f"INSERT INTO {table} VALUES (?)", [("1",), (1,), (2,), ("3",)][: len(table) % 4 + 1])
+
+    columns = ", ".join(f"{c} REAL" for c in QUALITA_VITA_COLUMNS)
+    conn.execute(
+        f"CREATE TABLE nil_qualita_vita (id_nil INTEGER, nil TEXT, nil_norm TEXT, "
+        f"area_km2 REAL, popolazione_totale INTEGER, {columns})"
+    )
+
+    for id_nil, nil, area in NILS:
+        pop = 4321 * id_nil + 17
+        conn.execute(
+            "INSERT INTO dim_nil VALUES (?, ?, ?, ?, ?, ?, NULL)",
+            (id_nil, nil, nil.lower(), area * 1e6, area * 4100.5, area),
+        )
+        conn.execute("INSERT INTO fact_demografia VALUES (?, 2023, ?, ?, ?, ?)",
+                     (id_nil, pop, 12.345 * id_nil, pop / area, pop // 2))
+        conn.execute("INSERT INTO fact_immobiliare VALUES (?, 2023, ?, ?, 1520.5, 4800.25)",
+                     (id_nil, id_nil - 1, 3 * id_nil))
+        conn.execute("INSERT INTO fact_servizi VALUES (?, 2023, ?, ?, ?)",
+                     (id_nil, 2 * id_nil, id_nil % 2, 7.25 * id_nil if id_nil != 2 else None))
+        values = [
+            (id_nil * 7.15 + i * 3.3) * (-1 if i == 10 and id_nil == 2 else 1)
+            for i in range(len(QUALITA_VITA_COLUMNS))
+        ]
+        conn.execute(
+            f"INSERT INTO nil_qualita_vita VALUES ({', '.join('?' * (5 + len(values)))})",
+            (id_nil, nil, nil.lower(), area, pop, *values),
+        )
+        conn.executemany("INSERT INTO cube_nil_anno VALUES (?, ?, ?, ?)", [
+            (id_nil, 2022, pop - 40.0, None),
+            (id_nil, 2023, float(pop), 40.0),
+        ])
+        conn.executemany("INSERT INTO fact_accessibilita VALUES (?, ?, ?, ?, ?, ?, ?, 'civici')", [
+            (id_nil, "farmacie", 312.45 * id_nil, 20.0, 801.5, 0.625, 40),
+            (id_nil, "scuole", 205.0 + id_nil, 10.5, 455.0, 1.0, 40),
+        ])
+        conn.execute("INSERT INTO ds_04_qualita_ambientale_esposizione_calore_urbano_nil_2024 VALUES (?, ?, ?)",
+                     (id_nil, nil, 0.5 + id_nil / 8))
+
+    conn.executemany("INSERT INTO nil_clusters VALUES (?, ?, ?)", [
+        ("DUOMO", 0, "Centro storico"),
+        ("BRERA", 2, "Residenziale"),
+    ])
+    conn.execute("INSERT INTO ds_04_qualita_ambientale_rischio_ondata_calore_nil_2024 VALUES (1, 'DUOMO', 'Alto')")
+    conn.executemany("INSERT INTO ds_08_servizi_sanitari_farmacie_milano VALUES (?, ?, ?, ?, ?)", [
+        (f"FARMACIA {i}", f"VIA TEST {i}", "20121", "DUOMO", "1" if i % 2 else 1) for i in range(12)
+    ] + [("FARMACIA BRERA", "VIA BRERA 1", "20121", "BRERA", 2)])
+    conn.executemany("INSERT INTO ds_08_servizi_sanitari_medici_medicina_generale VALUES (?, ?, ?, ?)", [
+        ("MEDICO DI MEDICINA GENERALE", 1, "DUOMO", 1),
+        ("MEDICO DI MEDICINA GENERALE", 1, "DUOMO", "1"),
+        ("PEDIATRA DI LIBERA SCELTA", 1, "DUOMO", 1),
+        ("MEDICO DI MEDICINA GENERALE", 0, "DUOMO", 1),
+        ("PEDIATRA DI LIBERA SCELTA", 1, "BRERA", 2),
+    ])
+    conn.executemany("INSERT INTO ds_09_servizi_sociali_servizi_sociali_2014 VALUES (?, ?, ?, ?)", [
+        ("Anziani", "Over 65", "1", "Duomo"),
+        ("Anziani", "Over 65", 1, "Duomo"),
+        ("Minori", "0-17", None, "Niguarda"),
+        ("Disabili", "Adulti", 3, "NIGUARDA - CA' GRANDA"),
+    ])
+    conn.executemany("INSERT INTO ds_11_biblioteche_biblioteche_rionali VALUES (?)", [("duomo",), ("Brera",)])
+    conn.executemany("INSERT INTO ds_07_mobilita_trasporti_mezzi_trasporto_prevalente_nil_2011 VALUES (?, ?, ?)", [
+        ("DUOMO", "Mezzi pubblici", 1201),
+        ("DUOMO", "A piedi o in bicicletta", 803),
+        ("DUOMO", "Auto privata", 455),
+        ("DUOMO", "Altri mezzi", 31),
+        # Solo il fallback per prefisso trova Niguarda
+        ("NIGUARDA", "Auto privata", 2050),
+        ("NIGUARDA", "Mezzi pubblici", 1999),
+    ])
+    conn.executemany("INSERT INTO ds_06_istruzione_famiglie_titolo_studio_residenti_nil_2011 VALUES (?, ?, ?)", [
+        ("Duomo", "Titoli universitari o para-universitari", 5012),
+        ("Duomo", "Diploma di scuola secondaria superiore", 3333),
+        ("Duomo", "Minori di 6 anni", 420),
+        ("Niguarda", "Licenza di scuola media inferiore o di avviamento professionale", 2777),
+        ("Niguarda", "Nessun titolo o licenza elementare", None),
+    ])
+    conn.executemany("INSERT INTO ds_03_stock_abitativo_abitazioni_occupate_nil_2011 VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+        ("DUOMO", "1.234", "987", "345", "120", "41", 2650, 12),
+        ("NIGUARDA - CA' GRANDA", "2100", "n.d.", "800", "650", None, 5400, None),
+    ])
+    conn.executemany(
+        "INSERT INTO ds_03_stock_abitativo_nuovi_fabbricati_residenziali_2010_2023 VALUES (?, ?, ?, ?, ?)", [
+            ("DUOMO", 2015, 12, 1450.5, 5210.75),
+            ("DUOMO", 2019, 4, 380.25, 1200.0),
+            ("BRERA", 2019, 7, 610.0, 2222.5),
+        ],
+    )
+    conn.commit()
+
+
+@pytest.fixture
+def fixture_db(tmp_path):
+    """DB di prova con viste API (sync_to_website.py) e viste di analisi (migration 003)."""
+    db_path = tmp_path / "milano_unified.db"
+    conn = sqlite3.connect(str(db_path))
+    create_fixture(conn)
+    conn.executescript(MIGRATION.read_text(encoding="utf-8"))
+    conn.close()
+
+    manager = SyncManager(db_path, materialize=False)
+    manager.connect()
+    manager.create_api_views()
+    manager.conn.commit()
+    manager.close()
+    assert manager.stats["errors"] == []
+    return db_path
+
+
+def cached_bodies(db_path: Path) -> dict:
+    """Body precalcolati per (endpoint, id); la cache viene poi rimossa perché node usi le route."""
+    conn = sqlite3.connect(str(db_path))
+    stats = build_api_response_cache(conn)
+    assert stats["skipped"] == {}
+    assert conn.row_factory is None
+
+    bodies = {
+        (endpoint, int(key)): body
+        for endpoint, key, body in conn.execute(f"SELECT endpoint, key, body FROM {CACHE_TABLE}")
+    }
+    conn.execute(f"DROP TABLE {CACHE_TABLE}")
+    conn.commit()
+    conn.close()
+    return bodies
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_every_endpoint_cached(fixture_db):
+    """Ogni endpoint risponde per i NIL esistenti e per nessun altro."""
+    bodies = cached_bodies(fixture_db)
+
+    for endpoint in ENDPOINTS:
+        keys = {nil_id for (name, nil_id) in bodies if name == endpoint}
+        assert 4 not in keys, endpoint
+        assert keys, endpoint
+    assert {nil_id for (name, nil_id) in bodies if name == "mobilita"} == {1, 3}
+
+
+def test_routes_match_cache(fixture_db):
+    """I body delle route Express coincidono con quelli precalcolati."""
+    if not node_available():
+        pytest.skip("node con express e better-sqlite3 non disponibile")
+    bodies = cached_bodies(fixture_db)
+
+    result = subprocess.run(
+        ["node", "--input-type=module", "-e", NODE_SCRIPT, "--",
+         str(SERVER), json.dumps(list(ENDPOINTS)), json.dumps(NIL_IDS)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120,
+        env={**os.environ, "DB_PATH": str(fixture_db)},
+    )
+    assert result.returncode == 0, result.stderr
+    marker = result.stdout.rindex("@@PARITY@@")
+    responses = json.loads(result.stdout[marker + len("@@PARITY@@"):])
+
+    for endpoint in ENDPOINTS:
+        for nil_id in NIL_IDS:
+            response = responses[f"{endpoint}|{nil_id}"]
+            cached = bodies.get((endpoint, nil_id))
+            if cached is None:
+                assert response["status"] == 404, (endpoint, nil_id, response)
+            else:
+                assert response["status"] == 200, (endpoint, nil_id, response)
+                assert response["body"] == cached, (endpoint, nil_id)
@@ -0,0 +1,80 @@
+"""
+Test per il benchmark delle query API (data_pipeline/scripts/benchmark_queries.py).
+
+Verifica:
+- Percentili e piani di esecuzione nel report
+- Query su tabelle mancanti saltate, regressioni rilevate rispetto alla baseline
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from benchmark_queries import (  # noqa: E402
+    BenchmarkQuery,
+    compare_with_baseline,
+    percentiles,
+    run_benchmark,
+)
+
+
+@pytest.fixture
+def conn():
+    """DB con la sola dim_nil."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?)", [(i, f"NIL {i}") for i in range(1, 89)])
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_percentiles():
+    """Campioni in ns, statistiche in ms."""
+    stats = percentiles([i * 1_000_000 for i in range(1, 101)])
+    assert stats["min_ms"] == 1.0
+    assert stats["p50_ms"] == pytest.approx(50.5)
+    assert stats["p99_ms"] == pytest.approx(99.01)
+
+
+def test_run_benchmark_skips_missing_tables(conn):
+    """Le query su tabelle mancanti sono saltate; la route somma le altre."""
+    queries = [
+        BenchmarkQuery("nil", "dim_nil", "SELECT nil FROM dim_nil WHERE id_nil = ?", (1,)),
+        BenchmarkQuery("nil", "mancante", "SELECT * FROM tabella_mancante"),
+        BenchmarkQuery("nil", "nome", "SELECT COUNT(*) FROM dim_nil WHERE nil = ?",
+                       params_sql="SELECT nil FROM dim_nil WHERE id_nil = 2"),
+    ]
+    report = run_benchmark(conn, queries, repeat=5, warmup=1)
+
+    ok = {q["name"]: q for q in report["queries"] if q["status"] == "ok"}
+    assert set(ok) == {"dim_nil", "nome"}
+    assert ok["dim_nil"]["full_scans"] == ["SCAN dim_nil"]
+    assert report["routes"]["nil"]["queries"] == 2
+    assert report["routes"]["nil"]["skipped"] == ["mancante"]
+    assert report["routes"]["nil"]["p50_ms"] >= ok["dim_nil"]["p50_ms"]
+
+
+def test_compare_with_baseline():
+    """Regressione solo oltre soglia e delta minimo; piani cambiati segnalati."""
+    baseline = {
+        "routes": {"nil": {"p95_ms": 1.0}},
+        "queries": [{"route": "nil", "name": "q", "status": "ok", "p95_ms": 0.01, "plan": ["SCAN dim_nil"]}],
+    }
+    report = {
+        "routes": {"nil": {"p95_ms": 1.5}},
+        "queries": [{"route": "nil", "name": "q", "status": "ok", "p95_ms": 0.03, "plan": ["SEARCH dim_nil"]}],
+    }
+    regressions, plan_changes = compare_with_baseline(report, baseline, threshold=0.25)
+    # La query triplica ma resta sotto il delta minimo: solo la route regredisce
+    assert len(regressions) == 1 and regressions[0].startswith("route nil")
+    assert plan_changes == ["nil / q"]
+    assert compare_with_baseline(report, baseline, threshold=0.6)[0] == []
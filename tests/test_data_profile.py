@@ -0,0 +1,170 @@
+"""
+Test per il profilo colonnare (data_pipeline/scripts/data_profile.py).
+
+Verifica:
+- Statistiche di tabella e per colonna come il calcolo colonna per colonna
+- Validatore e report riusano lo stesso profilo (una scansione per tabella)
+- Profilo SQL identico a quello pandas, distinti approssimati oltre la soglia
+- Report incrementale: solo le tabelle modificate vengono riprofilate
+- Impronta sensibile a UPDATE in place anche in memoria e in WAL
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pydantic")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from data_profile import HLL_REGISTERS, profile_dataframe, profile_table, table_fingerprint  # noqa: E402
+from generate_quality_report import DataQualityReporter  # noqa: E402
+
+
+@pytest.fixture
+def dim_nil():
+    """NIL con una riga duplicata, null e una colonna tutta vuota."""
+    return pd.DataFrame({
+        "id_nil": [1, 2, 2, 3],
+        "nil": ["DUOMO", "BRERA", "BRERA", None],
+        "superficie": [1.5, np.nan, np.nan, 4.5],
+        "note": [None, None, None, None],
+    })
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_profile_dataframe(dim_nil):
+    profile = profile_dataframe(dim_nil)
+
+    assert profile.rows == 4
+    assert profile.duplicate_rows == int(dim_nil.duplicated().sum()) == 1
+    assert profile.null_percentage == dim_nil.isnull().sum().sum() / dim_nil.size * 100
+    assert profile.all_null_columns == ["note"]
+    for col in dim_nil.columns:
+        assert profile.duplicate_values(col) == int(dim_nil[col].duplicated().sum())
+
+    superficie = profile.columns["superficie"].to_dict()
+    assert superficie["null_count"] == 2 and superficie["unique_count"] == 2
+    assert (superficie["min"], superficie["max"], superficie["mean"]) == (1.5, 4.5, 3.0)
+    assert "min" not in profile.columns["nil"].to_dict()
+
+
+def test_report_scans_each_table_once(tmp_path, dim_nil, monkeypatch):
+    """Analisi e validazione di dim_nil condividono un unico profilo."""
+    db_path = tmp_path / "milano_unified.db"
+    conn = sqlite3.connect(str(db_path))
+    dim_nil.to_sql("dim_nil", conn, index=False)
+    conn.close()
+
+    scans = []
+    duplicated = pd.DataFrame.duplicated
+    monkeypatch.setattr(
+        pd.DataFrame, "duplicated",
+        lambda self, *args, **kwargs: scans.append(len(self)) or duplicated(self, *args, **kwargs),
+    )
+
+    reporter = DataQualityReporter(db_path=db_path, output_dir=tmp_path / "reports")
+    conn = sqlite3.connect(str(db_path))
+    reporter._collect_database_stats(conn)
+    reporter._analyze_tables(conn)
+    reporter._validate_data(conn)
+    conn.close()
+
+    assert scans == [4]
+    table = reporter.report_data["tables"][0]
+    validation = reporter.report_data["validation_results"][0]
+    assert table["duplicate_rows"] == validation["stats"]["duplicate_rows"] == 1
+    assert validation["table"] == "dim_nil"
+    assert [v["table"] for v in reporter.report_data["validation_results"][1:]] == [
+        "dim_tempo", "fact_demografia", "fact_immobiliare", "fact_servizi",
+    ]
+
+
+def test_profile_table_matches_pandas(dim_nil):
+    """Sotto HLL_REGISTERS valori distinti il profilo SQL coincide con quello pandas."""
+    conn = sqlite3.connect(":memory:")
+    dim_nil.to_sql("ds_nil", conn, index=False)
+
+    sql_stats = profile_table(conn, "ds_nil").table_stats("ds_nil")
+    pandas_stats = profile_dataframe(pd.read_sql("SELECT * FROM ds_nil", conn)).table_stats("ds_nil")
+
+    assert sql_stats.pop("memory_mb") == pytest.approx(pandas_stats.pop("memory_mb"))
+    for sql_col, pandas_col in zip(sql_stats.pop("columns_detail"), pandas_stats.pop("columns_detail")):
+        assert sql_col == pytest.approx(pandas_col, nan_ok=True)
+    assert sql_stats == pandas_stats
+
+
+def test_profile_table_approx_distinct():
+    """Oltre la soglia i distinti sono stimati (HyperLogLog) con errore contenuto."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE ds_big (id INTEGER, gruppo TEXT)")
+    conn.executemany(
+        "INSERT INTO ds_big VALUES (?, ?)",
+        ((i, f"G{i % 10}") for i in range(HLL_REGISTERS * 5)),
+    )
+
+    profile = profile_table(conn, "ds_big")
+
+    assert profile.columns["id"].unique_count == pytest.approx(HLL_REGISTERS * 5, rel=0.05)
+    assert profile.columns["gruppo"].unique_count == 10
+    assert profile.duplicate_rows == 0
+
+
+def test_incremental_report(tmp_path, dim_nil):
+    """Le tabelle invariate riusano profilo e validazione da _table_profile."""
+    db_path = tmp_path / "milano_unified.db"
+    conn = sqlite3.connect(str(db_path))
+    dim_nil.to_sql("dim_nil", conn, index=False)
+    dim_nil.to_sql("ds_nil", conn, index=False)
+    conn.close()
+
+    def run(**kwargs):
+        reporter = DataQualityReporter(db_path=db_path, output_dir=tmp_path / "reports", **kwargs)
+        reporter.generate_report()
+        return reporter.report_data
+
+    first = run()
+    second = run()
+    assert (first["summary"]["tables_profiled"], first["summary"]["tables_cached"]) == (2, 0)
+    assert (second["summary"]["tables_profiled"], second["summary"]["tables_cached"]) == (0, 2)
+    assert second["tables"] == first["tables"]
+    assert second["validation_results"][0] == first["validation_results"][0]
+
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("UPDATE ds_nil SET id_nil = 9 WHERE id_nil = 3")
+    conn.commit()
+    conn.close()
+
+    third = run()
+    assert (third["summary"]["tables_profiled"], third["summary"]["tables_cached"]) == (1, 1)
+    assert [run["tables_cached"] for run in third["history"]] == [0, 2, 1]
+    assert run(full=True)["summary"]["tables_profiled"] == 2
+
+
+@pytest.mark.parametrize("journal_mode", ["memory", "delete", "wal"])
+def test_fingerprint_in_place_update(tmp_path, journal_mode):
+    """Un UPDATE 5 → 6 non cambia righe né dimensioni delle pagine, ma cambia l'impronta."""
+    if journal_mode == "memory":
+        conn = sqlite3.connect(":memory:")
+    else:
+        conn = sqlite3.connect(str(tmp_path / "profile.db"))
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute("CREATE TABLE ds_nil (id_nil INTEGER, valore INTEGER)")
+    conn.executemany("INSERT INTO ds_nil VALUES (?, ?)", [(1, 5), (2, 7)])
+    conn.commit()
+
+    before = table_fingerprint(conn, "ds_nil")
+    assert table_fingerprint(conn, "ds_nil") == before
+    conn.execute("UPDATE ds_nil SET valore = 6 WHERE id_nil = 1")
+    conn.commit()
+
+    assert table_fingerprint(conn, "ds_nil") != before
+    conn.close()
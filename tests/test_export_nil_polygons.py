@@ -0,0 +1,98 @@
+"""
+Test per l'export di nilPolygons.js (data_pipeline/scripts/export_nil_polygons.py).
+
+Verifica:
+- Risoluzione ID quartiere → NIL: mapping manuale, nome identico (ID
+  normalizzato), prefisso in entrambe le direzioni, quartiere non risolto
+- Stesso risultato del ciclo di website/scripts/generate_nil_polygons.py
+- Anello principale: poligono più grande di un MultiPolygon, linee ignorate
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+shapely = pytest.importorskip("shapely")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from export_nil_polygons import MANUAL_MAPPING, NilNameIndex, main_ring, normalize_name  # noqa: E402
+
+# Ordine di dim_nil: GARIBALDI REPUBBLICA precede GARIBALDI
+NAMES = [
+    "BRERA",
+    "DUOMO",
+    "PORTA ROMANA",
+    "GARIBALDI REPUBBLICA",
+    "GARIBALDI",
+    "S. SIRO",
+    "CITTA' STUDI",
+]
+
+
+def legacy_resolve(names, qid):
+    """Ciclo di generate_nil_polygons.py (nomi NIL univoci)."""
+    by_name = {name.strip(): i for i, name in enumerate(names)}
+    by_normalized = {normalize_name(name): i for i, name in enumerate(names)}
+    if qid in MANUAL_MAPPING and MANUAL_MAPPING[qid] in by_name:
+        return by_name[MANUAL_MAPPING[qid]]
+    if normalize_name(qid) in by_normalized:
+        return by_normalized[normalize_name(qid)]
+    for nil_norm, i in by_normalized.items():
+        if qid.startswith(nil_norm) or nil_norm.startswith(qid.split('---')[0]):
+            return i
+    return None
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.parametrize("qid, expected", [
+    # Mapping manuale
+    ("pta-romana", "PORTA ROMANA"),
+    ("stadio---ippodromi", "S. SIRO"),
+    # Nome identico, anche con ID non normalizzato
+    ("brera", "BRERA"),
+    ("Brera ", "BRERA"),
+    ("citta-studi", "CITTA' STUDI"),
+    # Il quartiere inizia con un nome NIL
+    ("duomo---centro-storico", "DUOMO"),
+    # Un nome NIL inizia con la prima parte del quartiere
+    ("porta---x", "PORTA ROMANA"),
+    # Entrambe le direzioni: vince il primo NIL in ordine, non il prefisso più lungo
+    ("garibaldi---porta-nuova", "GARIBALDI REPUBBLICA"),
+    # Non risolto
+    ("quarto-oggiaro", None),
+])
+def test_resolve(qid, expected):
+    index = NilNameIndex(NAMES)
+    resolved = index.resolve(qid)
+
+    assert (NAMES[resolved] if resolved is not None else None) == expected
+    assert resolved == legacy_resolve(NAMES, qid)
+
+
+def test_resolve_matches_legacy_loop():
+    """Tutti gli ID del mapping manuale e varianti derivate dai nomi NIL."""
+    index = NilNameIndex(NAMES)
+    qids = list(MANUAL_MAPPING) + [normalize_name(n) + suffix for n in NAMES for suffix in ("", "---x", "-x")]
+    qids += [normalize_name(n)[:4] for n in NAMES] + ["", "---", "zzz"]
+
+    assert [index.resolve(q) for q in qids] == [legacy_resolve(NAMES, q) for q in qids]
+
+
+def test_main_ring_multipolygon():
+    small = shapely.box(9.10, 45.40, 9.11, 45.41)
+    large = shapely.box(9.20, 45.40, 9.25, 45.45)
+    ring = main_ring(shapely.MultiPolygon([small, large]))
+
+    assert shapely.Polygon(ring).equals(large)
+    assert ring[0] == ring[-1]
+
+    line = shapely.LineString([(9.0, 45.0), (9.5, 45.5)])
+    collection = shapely.GeometryCollection([line, shapely.MultiPolygon([small, large])])
+    assert main_ring(collection) == ring
+    assert main_ring(shapely.GeometryCollection([line])) is None
@@ -0,0 +1,157 @@
+"""
+Test per l'export statico delle API per-NIL (data_pipeline/scripts/export_static_api.py).
+
+Verifica:
+- Primo export: JSON minificati con fratelli .gz (e .br se brotli è installato)
+- Secondo export senza modifiche: nessun file scritto (manifest)
+- Riga modificata: riscritto solo il suo file; riga cancellata: JSON e fratelli rimossi
+- JSON di export-static-api.mjs compressi una volta sola, dotfile esclusi
+- Cache mancante: OperationalError senza creare la directory di output
+"""
+
+import gzip
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_api_cache import CACHE_TABLE  # noqa: E402
+from export_static_api import (  # noqa: E402
+    BROTLI_AVAILABLE,
+    MANIFEST_NAME,
+    ROUTES_MANIFEST_NAME,
+    export_static_api,
+)
+
+SUFFIXES = (".gz", ".br") if BROTLI_AVAILABLE else (".gz",)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """api_response_cache con due NIL, un endpoint e una risposta non esportata."""
+    path = tmp_path / "milano_unified.db"
+    conn = sqlite3.connect(str(path))
+    conn.execute(f"""
+        CREATE TABLE {CACHE_TABLE} (
+            endpoint TEXT NOT NULL, key TEXT NOT NULL, etag TEXT NOT NULL, body TEXT NOT NULL,
+            PRIMARY KEY (endpoint, key)
+        ) WITHOUT ROWID
+    """)
+    conn.executemany(f"INSERT INTO {CACHE_TABLE} VALUES (?, ?, ?, ?)", [
+        ("", "1", '"a1"', '{"id":1,"nil":"DUOMO"}'),
+        ("", "2", '"a2"', '{"id":2,"nil":"BRERA"}'),
+        ("cultura", "1", '"c1"', '{"musei":3}'),
+        ("non-statico", "1", '"x1"', '{}'),
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def export(db_path: Path, output: Path) -> dict:
+    return export_static_api(db_path, output, workers=1)
+
+
+def execute(path: Path, sql: str) -> None:
+    conn = sqlite3.connect(str(path))
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def snapshot(output: Path) -> dict:
+    """mtime di ogni file esportato (manifest esclusi)."""
+    return {
+        p.relative_to(output).as_posix(): p.stat().st_mtime_ns
+        for p in output.rglob("*") if p.is_file() and not p.name.startswith(".")
+    }
+
+
+def files_of(relative: str) -> list:
+    return [relative] + [relative + suffix for suffix in SUFFIXES]
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_first_export(db_path, tmp_path):
+    output = tmp_path / "data-api"
+    stats = export(db_path, output)
+
+    assert stats["written"] == 3 and stats["removed"] == 0
+    assert set(snapshot(output)) == {
+        f for r in ("nil/1.json", "nil/2.json", "nil/1/cultura.json") for f in files_of(r)
+    }
+    data = (output / "nil" / "1.json").read_bytes()
+    assert data == b'{"id":1,"nil":"DUOMO"}\n'
+    assert gzip.decompress((output / "nil" / "1.json.gz").read_bytes()) == data
+    assert (output / MANIFEST_NAME).exists()
+
+
+def test_second_export_writes_nothing(db_path, tmp_path):
+    output = tmp_path / "data-api"
+    export(db_path, output)
+    before = snapshot(output)
+
+    stats = export(db_path, output)
+
+    assert stats["written"] == 0 and stats["unchanged"] == 3
+    assert stats["removed"] == 0 and stats["compressed"] == 0
+    assert snapshot(output) == before
+
+
+def test_changed_row_rewrites_only_its_file(db_path, tmp_path):
+    output = tmp_path / "data-api"
+    export(db_path, output)
+    before = snapshot(output)
+
+    execute(db_path, f"""UPDATE {CACHE_TABLE} SET etag = '"a2b"', body = '{{"id":2,"nil":"BRERA 2"}}' WHERE key = '2' AND endpoint = ''""")
+    stats = export(db_path, output)
+
+    assert stats["written"] == 1 and stats["unchanged"] == 2
+    after = snapshot(output)
+    assert {f for f in after if after[f] != before[f]} == set(files_of("nil/2.json"))
+    assert (output / "nil" / "2.json").read_text(encoding="utf-8") == '{"id":2,"nil":"BRERA 2"}\n'
+
+
+def test_deleted_row_removes_file_and_siblings(db_path, tmp_path):
+    output = tmp_path / "data-api"
+    export(db_path, output)
+    # .br di un export precedente con brotli installato
+    (output / "nil" / "1" / "cultura.json.br").write_bytes(b"br")
+
+    execute(db_path, f"DELETE FROM {CACHE_TABLE} WHERE endpoint = 'cultura'")
+    stats = export(db_path, output)
+
+    assert stats["removed"] == 1 and stats["written"] == 0
+    assert not any((output / "nil" / "1" / f"cultura.json{s}").exists() for s in ("", ".gz", ".br"))
+    assert all((output / f).exists() for f in files_of("nil/1.json"))
+
+
+def test_foreign_json_compressed_once(db_path, tmp_path):
+    """I JSON delle route non per-NIL ricevono i fratelli compressi; i manifest no."""
+    output = tmp_path / "data-api"
+    output.mkdir()
+    (output / "quartieri.json").write_text('{"quartieri":[]}', encoding="utf-8")
+    (output / ROUTES_MANIFEST_NAME).write_text('["quartieri.json"]', encoding="utf-8")
+
+    assert export(db_path, output)["compressed"] == 1
+    assert gzip.decompress((output / "quartieri.json.gz").read_bytes()) == b'{"quartieri":[]}'
+    assert not (output / (ROUTES_MANIFEST_NAME + ".gz")).exists()
+
+    assert export(db_path, output)["compressed"] == 0
+
+
+def test_missing_cache(tmp_path):
+    db_path = tmp_path / "vuoto.db"
+    sqlite3.connect(str(db_path)).close()
+    output = tmp_path / "data-api"
+
+    with pytest.raises(sqlite3.OperationalError):
+        export(db_path, output)
+    assert not output.exists()
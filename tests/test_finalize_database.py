@@ -0,0 +1,83 @@
+"""
+Test per la finalizzazione del database (data_pipeline/scripts/finalize_database.py).
+
+Verifica:
+- mmap_size consigliato arrotondato al MiB e limitato
+- VACUUM INTO con il page_size richiesto, pagine libere recuperate
+- sqlite_stat1 popolata, _db_settings scritta, nessun file temporaneo residuo
+- In place: stesso inode, risultato visibile alle connessioni già aperte
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from finalize_database import MAX_MMAP_SIZE, finalize_database, recommended_mmap_size  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """DB su file con dim_nil indicizzata e metà di una tabella cancellata (pagine libere)."""
+    path = tmp_path / "milano_unified.db"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.execute("CREATE INDEX idx_dim_nil_id ON dim_nil(id_nil)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?)", [(i, f"NIL {i}") for i in range(1, 89)])
+    conn.execute("CREATE TABLE scarti (payload TEXT)")
+    conn.executemany("INSERT INTO scarti VALUES (?)", [("x" * 500,) for _ in range(2000)])
+    conn.commit()
+    conn.execute("DELETE FROM scarti WHERE rowid > 1000")
+    conn.commit()
+    conn.close()
+    return path
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_recommended_mmap_size():
+    assert recommended_mmap_size(1) == 1024 * 1024
+    assert recommended_mmap_size(3 * 1024 * 1024 + 1) == 4 * 1024 * 1024
+    assert recommended_mmap_size(10 * 1024 ** 3) == MAX_MMAP_SIZE
+
+
+def test_finalize_database(db_path):
+    """Il file finalizzato è compatto, con statistiche del planner e mmap_size consigliato."""
+    report = finalize_database(db_path, page_size=8192, log=lambda message: None)
+
+    assert report["before"]["freelist_pages"] > 0
+    assert report["after"]["size_bytes"] < report["before"]["size_bytes"]
+    assert report["after"]["page_size"] == 8192
+    assert report["after"]["stats"]["sqlite_stat1"] > 0
+
+    conn = sqlite3.connect(str(db_path))
+    assert conn.execute("PRAGMA page_size").fetchone()[0] == 8192
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM dim_nil").fetchone()[0] == 88
+    mmap_size = conn.execute("SELECT value FROM _db_settings WHERE name = 'mmap_size'").fetchone()[0]
+    assert int(mmap_size) == report["after"]["mmap_size"]
+    conn.close()
+
+    assert sorted(p.name for p in db_path.parent.iterdir()) == ["milano_unified.db"]
+
+
+def test_finalize_in_place(db_path):
+    """Sul DB live il file resta lo stesso: una connessione già aperta vede il risultato."""
+    reader = sqlite3.connect(str(db_path))
+    inode = db_path.stat().st_ino
+
+    report = finalize_database(db_path, page_size=8192, log=lambda message: None, in_place=True)
+
+    assert db_path.stat().st_ino == inode
+    assert report["after"]["page_size"] == 8192
+    assert report["after"]["size_bytes"] < report["before"]["size_bytes"]
+    assert reader.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert reader.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    reader.close()
+    assert sorted(p.name for p in db_path.parent.iterdir()) == ["milano_unified.db"]
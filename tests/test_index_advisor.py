@@ -0,0 +1,119 @@
+"""
+Test per l'index advisor (data_pipeline/scripts/index_advisor.py).
+
+Verifica:
+- Ruolo delle colonne (uguaglianza, range, ordinamento, espressioni)
+- Candidati solo per le tabelle lette per intero, esclusi gli indici esistenti
+- Indici accettati solo se usati dal piano e con guadagno misurato; DB originale intatto
+- Indice chiave sostituito dalla variante coprente scartato (nome esatto nel piano)
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from benchmark_queries import BenchmarkQuery  # noqa: E402
+from index_advisor import (  # noqa: E402
+    IndexCandidate,
+    advise_indexes,
+    classify_columns,
+    plan_uses,
+    propose_candidates,
+    prune_superseded,
+    render_migration,
+)
+
+SERIE = BenchmarkQuery("timeseries/compare", "serie", """
+    SELECT Quartiere, Semestre, Prezzo_Acquisto_Medio_EUR_mq
+    FROM prezzi_medi_quartiere
+    WHERE Quartiere = ?
+    ORDER BY Semestre ASC
+""", ("Q 7",))
+
+
+@pytest.fixture
+def conn():
+    """DB con prezzi_medi_quartiere (200 quartieri x 20 semestri) e dim_nil indicizzata."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE prezzi_medi_quartiere (Quartiere TEXT, Semestre TEXT, Prezzo_Acquisto_Medio_EUR_mq REAL)"
+    )
+    conn.executemany(
+        "INSERT INTO prezzi_medi_quartiere VALUES (?, ?, ?)",
+        [(f"Q {q}", f"{2014 + s // 2}-H{s % 2 + 1}", 3000.0 + q + s) for q in range(200) for s in range(20)],
+    )
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.execute("CREATE INDEX idx_dim_nil_id ON dim_nil(id_nil)")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_classify_columns():
+    """Uguaglianze, range, ORDER BY / MAX ed espressioni UPPER(col) = ?."""
+    roles = classify_columns(
+        "SELECT a FROM t WHERE a = ? AND b > ? AND UPPER(c) = UPPER(?) AND d <> 1 "
+        "AND e = (SELECT MAX(f) FROM t) ORDER BY g DESC",
+        ["a", "b", "c", "d", "e", "f", "g"],
+    )
+    assert roles["equality"] == ["a", "e"]
+    assert roles["range"] == ["b"]
+    assert roles["order"] == ["f", "g"]
+    assert roles["expressions"] == ['UPPER("c")']
+
+
+def test_propose_candidates(conn):
+    """Chiave uguaglianza → ordinamento e variante coprente; nessun candidato se già indicizzata."""
+    candidates = propose_candidates(conn, SERIE, SERIE.params)
+    assert candidates[:2] == [
+        IndexCandidate("prezzi_medi_quartiere", ('"Quartiere"', '"Semestre"')),
+        IndexCandidate("prezzi_medi_quartiere", ('"Quartiere"', '"Semestre"', '"Prezzo_Acquisto_Medio_EUR_mq"')),
+    ]
+    indexed = BenchmarkQuery("nil", "dim_nil", "SELECT nil FROM dim_nil WHERE id_nil = ?", (1,))
+    assert propose_candidates(conn, indexed, indexed.params) == []
+
+
+def test_advise_indexes(conn):
+    """Il candidato per la serie ripaga; la migrazione lo contiene e il DB resta senza indici nuovi."""
+    report = advise_indexes(conn, [SERIE], repeat=10, warmup=1)
+
+    assert report["issues"][0]["scans"] == ["prezzi_medi_quartiere"]
+    accepted = [entry["index"] for entry in report["accepted"]]
+    assert accepted and all(name.startswith("idx_adv_prezzi_medi_quartiere_quartiere") for name in accepted)
+    assert all(entry["gain"] >= 0.10 and entry["used_by_plan"] for entry in report["accepted"])
+
+    migration = render_migration(report)
+    assert all(f'CREATE INDEX IF NOT EXISTS "{name}"' in migration for name in accepted)
+    assert conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_adv_%'"
+    ).fetchone()[0] == 0
+
+
+def test_prune_superseded_by_covering(conn):
+    """Il piano usa solo il coprente idx_..._semestre_prezzo: l'indice chiave, suo prefisso, viene rimosso."""
+    key = IndexCandidate("prezzi_medi_quartiere", ('"Quartiere"', '"Semestre"'))
+    covering = IndexCandidate("prezzi_medi_quartiere", ('"Quartiere"', '"Semestre"', '"Prezzo_Acquisto_Medio_EUR_mq"'))
+    assert covering.name.startswith(key.name)
+    for candidate in (key, covering):
+        conn.execute(candidate.sql)
+    conn.execute("ANALYZE")
+    results = [{"index": c.name, "accepted": True} for c in (key, covering)]
+
+    prune_superseded(conn, results, [SERIE])
+
+    assert results[0] == {"index": key.name, "accepted": False, "superseded": True}
+    assert results[1] == {"index": covering.name, "accepted": True}
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert key.name not in indexes and covering.name in indexes
+
+    step = f"SEARCH prezzi_medi_quartiere USING COVERING INDEX {covering.name} (Quartiere=?)"
+    assert plan_uses([step], covering.name) and not plan_uses([step], key.name)
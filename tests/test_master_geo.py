@@ -0,0 +1,221 @@
+"""
+Test per il master NIL e il cubo NIL×anno (data_pipeline/scripts/build_master_geo.py).
+
+Verifica:
+- Duplicati NIL×anno: conteggi e densità sommati, rapporti mediati o
+  ricalcolati, colonne testuali mai concatenate
+- read_dim_nil/join_latest_facts equivalenti alla lettura riga per riga e
+  ai merge in catena; NIL duplicati nell'ultimo anno aggregati
+- GeoParquet con row group piccoli e bbox di copertura, FlatGeobuf con indice
+  spaziale (richiede pyarrow)
+- Cubo salvato nel DB (chiave NIL×anno) e come Parquet partizionato per anno
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+gpd = pytest.importorskip("geopandas")
+from shapely.geometry import box, shape  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_master_geo import (  # noqa: E402
+    CUBE_TABLE,
+    PARQUET_ROW_GROUP_SIZE,
+    PYARROW_AVAILABLE,
+    build_nil_year_cube,
+    join_latest_facts,
+    latest_snapshot,
+    read_dim_nil,
+    write_columnar_outputs,
+    write_nil_year_cube,
+)
+
+requires_pyarrow = pytest.mark.skipif(not PYARROW_AVAILABLE, reason="pyarrow non installato")
+
+
+@pytest.fixture
+def fact_demografia():
+    """NIL 1 nel 2021 compare due volte (due quartieri sullo stesso NIL)."""
+    return pd.DataFrame({
+        "id_nil": [1, 1, 1, 2],
+        "id_tempo": [2020, 2021, 2021, 2021],
+        "popolazione_totale": [1000, 3000, 1000, 500],
+        "pct_stranieri": [10.0, 20.0, 40.0, 5.0],
+        "densita_abitanti_km2": [2000.0, 6000.0, 2000.0, 250.0],
+        "nati_vivi": [10, 30, np.nan, 4],
+        "fonte": ["a", "b", "c", "d"],
+    })
+
+
+@pytest.fixture
+def dim_nil_db(tmp_path):
+    """dim_nil con geometrie valide, GeoJSON non valido e NULL."""
+    square = {"type": "Polygon", "coordinates": [[[9.1, 45.4], [9.2, 45.4], [9.2, 45.5], [9.1, 45.4]]]}
+    conn = sqlite3.connect(str(tmp_path / "nil.db"))
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT, geometry TEXT)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?, ?)", [
+        (1, "DUOMO", json.dumps(square)),
+        (2, "BRERA", json.dumps({"type": "Point", "coordinates": [9.18, 45.47]})),
+        (3, "GUASTO", "{non json"),
+        (4, "VUOTO", None),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def parse_geometry(value):
+    """Lettura riga per riga precedente alla versione vettoriale."""
+    if value is None:
+        return None
+    try:
+        payload = json.loads(value)
+        return shape(payload) if payload else None
+    except Exception:
+        return None
+
+
+def legacy_master(conn, facts):
+    """dim_nil + ultimo anno di ogni fact table con merge in catena."""
+    dim_nil = pd.read_sql("SELECT * FROM dim_nil", conn)
+    dim_nil["geometry"] = dim_nil["geometry"].apply(parse_geometry)
+    gdf = gpd.GeoDataFrame(dim_nil, geometry="geometry", crs="EPSG:4326")
+    for fact, suffix in zip(facts, ("_demo", "_imm", "_serv")):
+        fact = latest_snapshot(fact)
+        if not fact.empty:
+            gdf = gdf.merge(fact, on="id_nil", how="left", suffixes=("", suffix))
+    return gdf
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_cube_duplicate_nil_year(fact_demografia):
+    fact_servizi = pd.DataFrame({
+        "id_nil": [1, 1],
+        "id_tempo": [2021, 2021],
+        "numero_scuole": [2, 3],
+        "indice_verde_medio": [4.0, 8.0],
+    })
+
+    cube = build_nil_year_cube([fact_demografia, fact_servizi]).set_index(["id_nil", "id_tempo"])
+    row = cube.loc[(1, 2021)]
+
+    assert len(cube) == 3
+    assert row["popolazione_totale"] == 4000
+    assert row["nati_vivi"] == 30
+    assert row["numero_scuole"] == 5
+    # (20% di 3000 + 40% di 1000) / 4000
+    assert row["pct_stranieri"] == pytest.approx(25.0)
+    # Stessa area del NIL: 4000 abitanti ⇒ densità sommata (6000 + 2000)
+    assert row["densita_abitanti_km2"] == pytest.approx(8000.0)
+    assert row["indice_verde_medio"] == pytest.approx(6.0)
+    assert np.isnan(row["fonte"])
+
+    # Le variazioni partono dai valori aggregati
+    assert row["popolazione_totale_delta"] == 3000
+    assert row["pct_stranieri_delta"] == pytest.approx(15.0)
+    assert cube.loc[(2, 2021), "pct_stranieri"] == 5.0
+
+
+def test_master_matches_row_by_row(dim_nil_db):
+    facts = [
+        pd.DataFrame({
+            "id_nil": [1, 2, 1],
+            "id_tempo": [2021, 2021, 2020],
+            "nil": ["duomo", "brera", "duomo"],
+            "popolazione_totale": [3000, 500, 2900],
+        }),
+        pd.DataFrame({"id_nil": [2], "id_tempo": [2022], "prezzo_medio_mq": [5400.0]}),
+        pd.DataFrame({"id_nil": [1, 3], "id_tempo": [2021, 2021], "numero_scuole": [4, 1]}),
+    ]
+
+    expected = legacy_master(dim_nil_db, facts)
+    result = join_latest_facts(read_dim_nil(dim_nil_db), facts)
+
+    assert list(result.columns) == list(expected.columns)
+    assert "nil_demo" in result.columns and "id_tempo_imm" in result.columns
+    pd.testing.assert_frame_equal(
+        pd.DataFrame(result.drop(columns="geometry")),
+        pd.DataFrame(expected.drop(columns="geometry")),
+    )
+    assert [g.wkt if g is not None else None for g in result.geometry] == \
+        [g.wkt if g is not None else None for g in expected.geometry]
+
+
+def test_master_duplicate_nil_aggregated(dim_nil_db, fact_demografia, capsys):
+    gdf = join_latest_facts(read_dim_nil(dim_nil_db), [fact_demografia]).set_index("id_nil")
+
+    assert len(gdf) == 4
+    assert gdf.loc[1, "popolazione_totale"] == 4000
+    assert gdf.loc[1, "pct_stranieri"] == pytest.approx(25.0)
+    assert gdf.loc[1, "densita_abitanti_km2"] == pytest.approx(8000.0)
+    assert gdf.loc[2, "popolazione_totale"] == 500
+    assert "1 righe duplicate" in capsys.readouterr().out
+
+
+@requires_pyarrow
+def test_columnar_outputs(tmp_path):
+    """40 NIL su una griglia: row group da PARQUET_ROW_GROUP_SIZE con statistiche bbox, .fgb indicizzato."""
+    import pyarrow.parquet as pq
+    pyogrio = pytest.importorskip("pyogrio")
+
+    gdf = gpd.GeoDataFrame(
+        {"id_nil": range(1, 41), "popolazione_totale": range(100, 140)},
+        geometry=[box(9.10 + (i % 8) * 0.02, 45.40 + (i // 8) * 0.02, 9.11 + (i % 8) * 0.02, 45.41 + (i // 8) * 0.02) for i in range(40)],
+        crs="EPSG:4326",
+    )
+    parquet_path, fgb_path = write_columnar_outputs(gdf, tmp_path)
+
+    parquet = pq.ParquetFile(parquet_path)
+    assert parquet.metadata.num_rows == 40
+    assert parquet.metadata.num_row_groups == -(-40 // PARQUET_ROW_GROUP_SIZE)
+    geo = json.loads(parquet.schema_arrow.metadata[b"geo"])
+    assert geo["columns"]["geometry"]["covering"]["bbox"]["xmin"] == ["bbox", "xmin"]
+
+    paths = [parquet.schema.column(i).path for i in range(parquet.metadata.num_columns)]
+    xmin, xmax = paths.index("bbox.xmin"), paths.index("bbox.xmax")
+    for g in range(parquet.metadata.num_row_groups):
+        group = parquet.metadata.row_group(g)
+        assert group.column(xmin).statistics.has_min_max
+        assert group.column(xmin).statistics.min <= group.column(xmax).statistics.max
+    # Ordinamento di Hilbert: il primo row group non copre tutta la griglia
+    first = parquet.metadata.row_group(0)
+    assert first.column(xmax).statistics.max - first.column(xmin).statistics.min < gdf.total_bounds[2] - gdf.total_bounds[0]
+
+    info = pyogrio.read_info(fgb_path)
+    assert info["features"] == 40
+    assert info["capabilities"]["fast_spatial_filter"]
+
+
+def test_nil_year_cube_written(tmp_path, fact_demografia):
+    cube = build_nil_year_cube([fact_demografia])
+    conn = sqlite3.connect(str(tmp_path / "nil.db"))
+    write_nil_year_cube(conn, cube, tmp_path)
+
+    rows = conn.execute(f"SELECT id_nil, id_tempo, popolazione_totale FROM {CUBE_TABLE} ORDER BY 1, 2").fetchall()
+    assert rows == [(1, 2020, 1000.0), (1, 2021, 4000.0), (2, 2021, 500.0)]
+    pk = [r[1] for r in conn.execute(f"PRAGMA table_info({CUBE_TABLE})").fetchall() if r[5]]
+    assert pk == ["id_nil", "id_tempo"]
+    assert f"idx_{CUBE_TABLE}_tempo" in {r[1] for r in conn.execute(f"PRAGMA index_list({CUBE_TABLE})")}
+
+    # Rieseguito: la tabella viene ricreata, non duplicata
+    write_nil_year_cube(conn, cube, tmp_path)
+    assert conn.execute(f"SELECT COUNT(*) FROM {CUBE_TABLE}").fetchone()[0] == 3
+    conn.close()
+
+    if PYARROW_AVAILABLE:
+        partitions = sorted(p.name for p in (tmp_path / CUBE_TABLE).iterdir())
+        assert partitions == ["anno=2020", "anno=2021"]
+        parquet = pd.read_parquet(tmp_path / CUBE_TABLE / "anno=2021")
+        assert len(parquet) == 2
+        assert parquet["popolazione_totale"].dtype == np.float32
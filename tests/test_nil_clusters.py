@@ -0,0 +1,184 @@
+"""
+Test per il clustering NIL (data_pipeline/scripts/build_nil_clusters.py).
+
+Verifica:
+- Silhouette e rinumerazione stabile dei cluster
+- Popolamento di nil_clusters e ricalcolo solo se gli indicatori cambiano
+- Configurazione con parametri sconosciuti rifiutata con ValueError
+- Nessun cluster vuoto con punti coincidenti; definizioni oltre k rimosse
+- NIL duplicato nell'ultimo anno aggregato in una sola riga
+- Scrittura fallita: assegnazione e definizioni precedenti intatte
+- Primo run: definizioni della migration sostituite da nomi dal centroide,
+  nomi assegnati in seguito conservati
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_nil_clusters import (  # noqa: E402
+    ClusteringConfig,
+    align_labels,
+    build_nil_clusters,
+    ensure_tables,
+    kmeans,
+    load_clustering_config,
+    load_features,
+    silhouette_samples,
+)
+
+
+@pytest.fixture
+def conn():
+    """Star schema minimale: due gruppi ben separati di NIL."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.execute("""
+        CREATE TABLE fact_demografia (
+            id_tempo INTEGER, id_nil INTEGER, densita_abitanti_km2 REAL, pct_stranieri REAL,
+            popolazione_totale INTEGER, famiglie_unipersonali_registrate_in_anagrafe INTEGER,
+            nati_vivi INTEGER, morti INTEGER, immigrati INTEGER, emigrati INTEGER
+        )
+    """)
+    conn.execute(
+        "CREATE TABLE fact_servizi (id_nil INTEGER, id_tempo INTEGER, "
+        "numero_scuole INTEGER, numero_mercati INTEGER, indice_verde_medio REAL)"
+    )
+    for i in range(1, 9):
+        dense = i <= 4
+        conn.execute("INSERT INTO dim_nil VALUES (?, ?)", (i, f"NIL {i}"))
+        conn.execute(
+            "INSERT INTO fact_demografia VALUES (2024, ?, ?, ?, 10000, ?, 100, 90, 500, 480)",
+            (i, 15000 + i if dense else 3000 + i, 20.0, 5000 if dense else 1000),
+        )
+        # Verde e scuole su anni diversi, come dopo l'outer merge di build_star_schema
+        conn.execute("INSERT INTO fact_servizi VALUES (?, 2024, NULL, 1, ?)", (i, 4.0 if dense else 12.0))
+        conn.execute("INSERT INTO fact_servizi VALUES (?, 2020, 3, NULL, NULL)", (i,))
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_silhouette_separated_clusters():
+    """Due gruppi compatti e lontani hanno silhouette vicina a 1."""
+    points = np.array([[0.0, 0.0], [0.0, 0.1], [10.0, 10.0], [10.0, 10.1]])
+    scores = silhouette_samples(points, np.array([0, 0, 1, 1]))
+    assert scores.min() > 0.99
+
+
+def test_align_labels_keeps_previous_ids():
+    """Gli id seguono l'assegnazione precedente; senza, l'ordine è per dimensione."""
+    labels = np.array([1, 1, 1, 0, 0])
+    assert align_labels(labels, np.array([0, 0, 0, 1, 1]), 2).tolist() == [0, 0, 0, 1, 1]
+    assert align_labels(labels, np.array([1, 1, 1, 0, 0]), 2).tolist() == [1, 1, 1, 0, 0]
+    assert align_labels(np.array([0, 1, 1, 1, 0]), np.full(5, -1), 2).tolist() == [1, 0, 0, 0, 1]
+
+
+def test_build_and_cache(conn):
+    """Assegnazioni, centroidi e statistiche; secondo run senza modifiche in cache."""
+    config = ClusteringConfig(k=2)
+    stats = build_nil_clusters(conn, config)
+
+    assert stats["status"] == "updated"
+    assert stats["sizes"] == [4, 4]
+    assert stats["silhouette"] > 0.9
+    clusters = dict(conn.execute("SELECT nil, cluster_id FROM nil_clusters").fetchall())
+    assert len({clusters[f"NIL {i}"] for i in range(1, 5)}) == 1
+    assert clusters["NIL 1"] != clusters["NIL 8"]
+    assert conn.execute("SELECT COUNT(*) FROM cluster_centroidi").fetchone()[0] == 2 * len(config.features)
+
+    assert build_nil_clusters(conn, config)["status"] == "cached"
+    conn.execute("UPDATE fact_demografia SET pct_stranieri = 35.0 WHERE id_nil = 8")
+    assert build_nil_clusters(conn, config)["status"] == "updated"
+
+
+def test_config_unknown_keys(tmp_path):
+    path = tmp_path / "clustering.json"
+    path.write_text(json.dumps({"k": 3, "clusters": 5}), encoding="utf-8")
+    with pytest.raises(ValueError, match="clusters"):
+        load_clustering_config(path)
+
+
+def test_kmeans_no_empty_cluster():
+    """Due soli valori distinti per tre cluster: nessun cluster vuoto, centri e inerzia finiti."""
+    points = np.array([[0.0, 0.0]] * 4 + [[1.0, 1.0]] * 4)
+    labels, centers, inertia = kmeans(points, 3, seed=0, n_init=3)
+
+    assert sorted(np.bincount(labels, minlength=3) > 0) == [True, True, True]
+    assert np.isfinite(centers).all() and np.isfinite(inertia)
+
+
+def test_shrinking_k_drops_definitions(conn):
+    """Passando da 3 a 2 cluster le definizioni e le statistiche del cluster 2 spariscono."""
+    build_nil_clusters(conn, ClusteringConfig(k=3))
+    build_nil_clusters(conn, ClusteringConfig(k=2))
+
+    assert [r[0] for r in conn.execute("SELECT cluster_id FROM cluster_definizioni ORDER BY 1")] == [0, 1]
+    assert [r[0] for r in conn.execute("SELECT cluster_id FROM cluster_statistiche ORDER BY 1")] == [0, 1]
+
+
+def test_duplicate_nil_year_aggregated(conn):
+    """NIL 1 compare due volte nel 2024: una riga in nil_clusters, conteggi sommati."""
+    conn.execute("UPDATE fact_demografia SET densita_abitanti_km2 = 10000, popolazione_totale = 6000 WHERE id_nil = 1")
+    conn.execute(
+        "INSERT INTO fact_demografia VALUES (2024, 1, 5000, 50.0, 3000, 2500, 50, 40, 200, 190)"
+    )
+    ids, names, raw = load_features(conn, ["densita_abitanti_km2", "pct_stranieri", "popolazione_totale", "saldo_totale"])
+    assert names.count("NIL 1") == 1
+    # (20% di 6000 + 50% di 3000) / 9000; saldo 30 + 20
+    assert raw[0].tolist() == pytest.approx([15000.0, 30.0, 9000.0, 50.0])
+
+    assert build_nil_clusters(conn, ClusteringConfig(k=2))["status"] == "updated"
+    assert conn.execute("SELECT COUNT(*) FROM nil_clusters WHERE nil = 'NIL 1'").fetchone()[0] == 1
+
+
+def test_failed_write_keeps_previous(conn):
+    build_nil_clusters(conn, ClusteringConfig(k=2))
+    conn.commit()
+    before = conn.execute("SELECT nil, cluster_id FROM nil_clusters ORDER BY nil").fetchall()
+
+    # Nome NIL ripetuto in dim_nil: l'INSERT viola UNIQUE(nil)
+    conn.execute("INSERT INTO dim_nil VALUES (9, 'NIL 1')")
+    conn.execute("INSERT INTO fact_demografia VALUES (2024, 9, 3000, 20.0, 10000, 1000, 100, 90, 500, 480)")
+    with pytest.raises(sqlite3.IntegrityError):
+        build_nil_clusters(conn, ClusteringConfig(k=3))
+
+    assert conn.execute("SELECT nil, cluster_id FROM nil_clusters ORDER BY nil").fetchall() == before
+    assert [r[0] for r in conn.execute("SELECT cluster_id FROM cluster_definizioni ORDER BY 1")] == [0, 1]
+
+
+def test_first_run_names_from_centroids(conn):
+    """Le definizioni semantiche della migration 002 non etichettano cluster arbitrari."""
+    config = ClusteringConfig(k=2, features=["densita_abitanti_km2", "saldo_totale"])
+    ensure_tables(conn)
+    conn.executemany(
+        "INSERT OR REPLACE INTO cluster_definizioni VALUES (?, ?, ?, ?)",
+        [(0, "Residenziale Benestante", "Zone residenziali", "#4CAF50"), (1, "Urbano Denso", "Alta densità", "#FF9800")],
+    )
+
+    build_nil_clusters(conn, config)
+
+    definitions = dict(conn.execute("SELECT cluster_id, nome FROM cluster_definizioni").fetchall())
+    dense = conn.execute("SELECT cluster_id FROM nil_clusters WHERE nil = 'NIL 1'").fetchone()[0]
+    assert definitions[dense].startswith(f"Cluster {dense}: ")
+    assert "densità ↑" in definitions[dense] and "densità ↓" in definitions[1 - dense]
+    descrizione = conn.execute("SELECT descrizione FROM cluster_definizioni WHERE cluster_id = ?", (dense,)).fetchone()[0]
+    assert descrizione.startswith("Profilo del centroide")
+    assert conn.execute("SELECT colore FROM cluster_definizioni WHERE cluster_id = 0").fetchone()[0] == "#4CAF50"
+    assert {r[0] for r in conn.execute("SELECT cluster_nome FROM nil_clusters")} == set(definitions.values())
+
+    # Con un'assegnazione precedente i nomi (anche modificati a mano) restano
+    conn.execute("UPDATE cluster_definizioni SET nome = 'Centro' WHERE cluster_id = ?", (dense,))
+    conn.execute("UPDATE fact_demografia SET pct_stranieri = 35.0 WHERE id_nil = 8")
+    build_nil_clusters(conn, config)
+    assert conn.execute("SELECT nome FROM cluster_definizioni WHERE cluster_id = ?", (dense,)).fetchone()[0] == "Centro"
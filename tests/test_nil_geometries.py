@@ -0,0 +1,108 @@
+"""
+Test per le geometrie NIL semplificate (data_pipeline/scripts/build_nil_geometries.py).
+
+Verifica:
+- Parti poligonali estratte da GeometryCollection (linee e punti scartati)
+- dim_nil_geometry con soli Polygon/MultiPolygon anche quando make_valid
+  restituisce una GeometryCollection
+- Confini condivisi semplificati una volta sola; ripiego per geometria
+  segnalato con un avviso
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas")
+shapely = pytest.importorskip("shapely")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_nil_geometries import LEVELS, TABLE, build_dim_nil_geometry, polygonal, simplify_coverage  # noqa: E402
+
+SQUARE = shapely.box(9.180, 45.460, 9.190, 45.470)
+
+# Quadrato con uno spigolo pendente: make_valid lo trasforma in POLYGON + LINESTRING
+SPIKED = {
+    "type": "Polygon",
+    "coordinates": [[
+        [9.19, 45.46], [9.20, 45.46], [9.20, 45.47], [9.19, 45.47],
+        [9.19, 45.46], [9.185, 45.455], [9.19, 45.46],
+    ]],
+}
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, geometry TEXT)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?)", [
+        (1, shapely.to_geojson(SQUARE)),
+        (2, json.dumps(SPIKED)),
+    ])
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_polygonal():
+    other = shapely.box(9.20, 45.46, 9.21, 45.47)
+    line = shapely.LineString([(9.18, 45.46), (9.17, 45.46)])
+    geometries = np.array([
+        shapely.GeometryCollection([SQUARE, line]),
+        shapely.GeometryCollection([SQUARE, shapely.GeometryCollection([other, shapely.Point(9.1, 45.4)])]),
+        shapely.GeometryCollection([line]),
+        SQUARE,
+        None,
+    ], dtype=object)
+
+    result = polygonal(geometries)
+
+    assert result[0].equals(SQUARE)
+    assert result[1].geom_type == "MultiPolygon" and result[1].equals(shapely.union(SQUARE, other))
+    assert result[2].geom_type == "Polygon" and result[2].is_empty
+    assert result[3] is SQUARE
+    assert result[4] is None
+    # L'array di ingresso non viene modificato
+    assert geometries[0].geom_type == "GeometryCollection"
+
+
+def test_dim_nil_geometry_polygonal(conn):
+    assert shapely.make_valid(shapely.from_geojson(json.dumps(SPIKED))).geom_type == "GeometryCollection"
+
+    build_dim_nil_geometry(conn)
+
+    rows = conn.execute(f"SELECT id_nil, level, geom FROM {TABLE}").fetchall()
+    assert len(rows) == 2 * len(LEVELS)
+    for id_nil, level, geom in rows:
+        geometry = shapely.from_geojson(geom)
+        assert geometry.geom_type in ("Polygon", "MultiPolygon"), (id_nil, level)
+        assert not geometry.is_empty
+        assert geometry.area == pytest.approx(SQUARE.area, rel=0.05)
+
+
+def test_simplify_coverage_fallback_warns(capsys):
+    # Confine condiviso con molti vertici intermedi
+    border = [(9.19, 45.46 + i * 0.0001 + (0.00001 if i % 2 else 0)) for i in range(101)]
+    left = shapely.Polygon([(9.18, 45.47), (9.18, 45.46)] + border)
+    right = shapely.Polygon(border + [(9.20, 45.47), (9.20, 45.46)])
+
+    if hasattr(shapely, "coverage_simplify"):
+        result = simplify_coverage(np.array([left, right]), 0.0005)
+        assert capsys.readouterr().out == ""
+        assert shapely.coverage_is_valid(result)
+        assert result[0].intersection(result[1]).length == pytest.approx(0.01, rel=1e-6)
+
+    # Poligoni sovrapposti: coverage non valida, semplificazione per geometria
+    overlapping = np.array([left, shapely.box(9.185, 45.46, 9.20, 45.47)])
+    result = simplify_coverage(overlapping, 0.0005)
+    assert "confini condivisi non preservati" in capsys.readouterr().out
+    assert all(result[i].is_valid and not result[i].is_empty for i in range(2))
@@ -0,0 +1,130 @@
+"""
+Test per le vector tile dei NIL (data_pipeline/scripts/build_nil_tiles.py).
+
+Verifica:
+- Tile XYZ che coprono un bbox e loro bounds Web Mercator
+- Tipi dei campi nei metadati (Number, Boolean, String) dai valori effettivi
+- NIL assente da un livello semplificato: ricade sulla geometria completa
+- Piramide completa su un DB di prova (richiede mapbox-vector-tile)
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("geopandas")
+shapely = pytest.importorskip("shapely")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_nil_tiles import (  # noqa: E402
+    MVT_AVAILABLE,
+    DirectoryWriter,
+    build_metadata,
+    build_tiles,
+    field_types,
+    load_level_geometries,
+    tile_bounds,
+    tiles_for_bounds,
+    to_web_mercator,
+)
+
+# Due NIL affiancati in centro a Milano
+SQUARES = {
+    1: shapely.box(9.180, 45.460, 9.190, 45.470),
+    2: shapely.box(9.190, 45.460, 9.200, 45.470),
+}
+
+
+@pytest.fixture
+def conn():
+    """dim_nil con geometrie GeoJSON, fact tables e un livello semplificato senza il NIL 2."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT, area_km2 REAL, geometry TEXT)")
+    for id_nil, geom in SQUARES.items():
+        conn.execute(
+            "INSERT INTO dim_nil VALUES (?, ?, ?, ?)",
+            (id_nil, f"NIL {id_nil}", 0.5 * id_nil, shapely.to_geojson(geom)),
+        )
+    conn.execute("CREATE TABLE fact_demografia (id_nil INTEGER, id_tempo INTEGER, popolazione_totale INTEGER)")
+    conn.executemany("INSERT INTO fact_demografia VALUES (?, 2023, ?)", [(1, 1200), (2, 3400)])
+    conn.execute("CREATE TABLE fact_immobiliare (id_nil INTEGER, id_tempo INTEGER, abitazioni_nuove INTEGER)")
+    conn.execute("CREATE TABLE fact_servizi (id_nil INTEGER, id_tempo INTEGER, numero_scuole INTEGER)")
+    conn.execute("CREATE TABLE dim_nil_geometry (id_nil INTEGER, level TEXT, geom TEXT)")
+    conn.execute(
+        "INSERT INTO dim_nil_geometry VALUES (1, 'low', ?)",
+        (shapely.to_geojson(SQUARES[1].buffer(-0.001)),),
+    )
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_tiles_cover_bounds():
+    """Ogni punto del bbox cade in una delle tile restituite."""
+    bounds = (9.18, 45.46, 9.20, 45.47)
+    keys = list(tiles_for_bounds(bounds, 14))
+    assert all(z == 14 for z, _, _ in keys)
+
+    corners = to_web_mercator(np.array(shapely.points([(9.18, 45.46), (9.20, 45.47), (9.19, 45.465)])))
+    for corner in corners:
+        assert any(shapely.box(*tile_bounds(*key)).covers(corner) for key in keys)
+
+
+def test_metadata_field_types():
+    props = [
+        {"nil": "DUOMO", "popolazione_totale": 1200, "pct_stranieri": 12.5, "centro": True},
+        {"nil": "BRERA", "popolazione_totale": 3400, "centro": False, "codice": 7},
+        {"codice": "A7"},
+    ]
+    fields = field_types(props)
+    assert fields == {
+        "centro": "Boolean",
+        "codice": "String",
+        "nil": "String",
+        "pct_stranieri": "Number",
+        "popolazione_totale": "Number",
+    }
+
+    metadata = build_metadata((9.18, 45.46, 9.20, 45.47), fields, 10, 16)
+    layer = json.loads(metadata["json"])["vector_layers"][0]
+    assert layer["fields"] == fields
+    assert (metadata["minzoom"], metadata["maxzoom"]) == ("10", "16")
+
+
+def test_level_falls_back_to_full_geometry(conn):
+    ids = np.array([1, 2])
+    full = np.array(list(SQUARES.values()), dtype=object)
+
+    levels = load_level_geometries(conn, ids, full)
+
+    assert set(levels) == {"low"}
+    assert levels["low"][0].equals(SQUARES[1].buffer(-0.001))
+    assert levels["low"][1] is full[1]
+
+
+@pytest.mark.skipif(not MVT_AVAILABLE, reason="mapbox-vector-tile non installato")
+def test_build_tiles(conn, tmp_path):
+    """Tile z10–z11 con entrambi i NIL anche al livello 'low', metadati tipizzati."""
+    import mapbox_vector_tile
+
+    output = tmp_path / "tiles"
+    counts = build_tiles(conn, DirectoryWriter(output), min_zoom=10, max_zoom=11, workers=1)
+
+    assert counts[10] >= 1 and counts[11] >= 1
+    tile = next((output / "10").rglob("*.pbf"))
+    layer = mapbox_vector_tile.decode(tile.read_bytes())["nil"]
+    assert sorted(f["id"] for f in layer["features"]) == [1, 2]
+    assert {f["properties"]["popolazione_totale"] for f in layer["features"]} == {1200, 3400}
+
+    fields = json.loads(json.loads((output / "metadata.json").read_text())["json"])["vector_layers"][0]["fields"]
+    assert fields["popolazione_totale"] == "Number"
+    assert fields["nil"] == "String"
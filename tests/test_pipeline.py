@@ -171,6 +171,25 @@ def test_nil_ids_are_unique(db_connection):
     assert len(duplicates) == 0, f"ID NIL duplicati: {[d[0] for d in duplicates]}"
 
 
+@pytest.mark.integration
+def test_materialized_api_views_match(db_tables, db_views, db_connection):
+    """Verifica che gli snapshot mv_api_* coincidano con le viste vw_api_*."""
+    pairs = [(t, "vw_" + t[3:]) for t in db_tables if t.startswith("mv_api_")]
+    pairs = [(t, v) for t, v in pairs if v in db_views]
+    if not pairs:
+        pytest.skip("Nessuna vista API materializzata")
+
+    for table, view in pairs:
+        diff = db_connection.execute(f"""
+            SELECT COUNT(*) FROM (
+                SELECT * FROM (SELECT * FROM {view} EXCEPT SELECT * FROM {table})
+                UNION ALL
+                SELECT * FROM (SELECT * FROM {table} EXCEPT SELECT * FROM {view})
+            )
+        """).fetchone()[0]
+        assert diff == 0, f"{table}: {diff} righe diverse da {view}"
+
+
 # ============================================================================
 # INDEX TESTS
 # ============================================================================
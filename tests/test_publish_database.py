@@ -0,0 +1,139 @@
+"""
+Test per la pubblicazione atomica del database (data_pipeline/scripts/publish_database.py).
+
+Verifica:
+- Shadow copiato dal live, pubblicato con rename e live precedente archiviato
+- Verifica fallita: live intatto (stesso file, stesso contenuto), shadow conservato
+- Rollback alla generazione precedente, il live corrente diventa a sua volta generazione
+- Generazioni oltre keep rimosse
+"""
+
+import logging
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+import publish_database  # noqa: E402
+from publish_database import (  # noqa: E402
+    list_generations,
+    prepare_shadow,
+    publish_shadow,
+    rollback,
+    shadow_path,
+)
+
+logger = logging.getLogger("test_publish_database")
+
+# Test di verifica eseguito in un sottoprocesso contro lo shadow (DB_PATH)
+VERIFY_TEST = '''
+import os
+import sqlite3
+
+
+def test_dim_nil_present():
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    assert conn.execute("SELECT COUNT(*) FROM dim_nil").fetchone()[0] > 0
+'''
+
+
+@pytest.fixture
+def live_db(tmp_path, monkeypatch):
+    """DB live alla generazione 1; report di finalize non scritto nel repository."""
+    path = tmp_path / "db" / "milano_unified.db"
+    path.parent.mkdir()
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?)", [(1, "DUOMO"), (2, "BRERA")])
+    conn.execute("CREATE TABLE generazione (n INTEGER)")
+    conn.execute("INSERT INTO generazione VALUES (1)")
+    conn.commit()
+    conn.close()
+
+    tests_file = tmp_path / "test_shadow.py"
+    tests_file.write_text(VERIFY_TEST, encoding="utf-8")
+    monkeypatch.setattr(publish_database, "TESTS_FILE", tests_file)
+    monkeypatch.setattr(publish_database, "write_report", lambda report: None)
+    return path
+
+
+def generation(path: Path) -> int:
+    conn = sqlite3.connect(str(path))
+    try:
+        return conn.execute("SELECT n FROM generazione").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def build_shadow(live_db: Path, n: int, sql: str = "") -> Path:
+    """Shadow copiato dal live e portato alla generazione n."""
+    shadow = prepare_shadow(live_db, logger)
+    conn = sqlite3.connect(str(shadow))
+    conn.execute("UPDATE generazione SET n = ?", (n,))
+    if sql:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+    return shadow
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_publish(live_db):
+    shadow = build_shadow(live_db, 2)
+    assert generation(shadow) == 2 and generation(live_db) == 1
+
+    assert publish_shadow(live_db, logger)
+
+    assert generation(live_db) == 2
+    assert not shadow.exists()
+    generations = list_generations(live_db)
+    assert len(generations) == 1 and generation(generations[0]) == 1
+
+
+def test_failed_verification_keeps_live(live_db, caplog):
+    inode = live_db.stat().st_ino
+    shadow = build_shadow(live_db, 2, "DELETE FROM dim_nil")
+
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        assert not publish_shadow(live_db, logger)
+
+    assert "Verifica shadow fallita" in caplog.text
+    assert live_db.stat().st_ino == inode
+    assert generation(live_db) == 1
+    assert list_generations(live_db) == []
+    # Lo shadow resta per l'analisi
+    assert shadow.exists() and generation(shadow) == 2
+
+
+def test_rollback_restores_previous(live_db):
+    for n in (2, 3):
+        build_shadow(live_db, n)
+        assert publish_shadow(live_db, logger, verify=False)
+    assert [generation(g) for g in list_generations(live_db)] == [2, 1]
+
+    assert rollback(live_db, logger)
+
+    assert generation(live_db) == 2
+    assert sorted(generation(g) for g in list_generations(live_db)) == [1, 3]
+    assert not shadow_path(live_db).exists()
+
+
+def test_rollback_without_generations(live_db):
+    assert not rollback(live_db, logger)
+    assert generation(live_db) == 1
+
+
+def test_prune_generations(live_db):
+    for n in (2, 3, 4):
+        build_shadow(live_db, n)
+        assert publish_shadow(live_db, logger, keep=1, verify=False)
+
+    generations = list_generations(live_db)
+    assert len(generations) == 1 and generation(generations[0]) == 3
@@ -0,0 +1,120 @@
+"""
+Test per il calcolo dell'indice qualità della vita (data_pipeline/scripts/update_nil_qualita_vita.py).
+
+Verifica:
+- Normalizzazione min-max e per rango, con componenti invertite
+- Scrittura di componenti e IQV come REAL in nil_qualita_vita
+- Sincronizzazione da nil_qol_analysis: match per nome normalizzato
+  (normalize_nil), prima riga vincente sui nomi duplicati, NIL senza
+  match lasciati intatti
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from update_nil_qualita_vita import (  # noqa: E402
+    QualityOfLifeConfig,
+    compute_quality_of_life,
+    load_quality_of_life_config,
+    normalize_rank,
+    sync_quality_of_life_index,
+)
+
+
+@pytest.fixture
+def conn():
+    """nil_qualita_vita con tre NIL e le colonne sorgente dell'IQV."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE nil_qualita_vita (
+            id_nil INTEGER PRIMARY KEY, nil TEXT,
+            numero_mercati INTEGER, indice_verde_medio REAL,
+            densita_abitanti_km2 REAL, saldo_totale INTEGER,
+            comp_verde REAL, comp_mercati REAL, comp_densita REAL, comp_dinamica REAL,
+            indice_qualita_vita REAL
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO nil_qualita_vita (id_nil, nil, numero_mercati, indice_verde_medio, "
+        "densita_abitanti_km2, saldo_totale) VALUES (?, ?, ?, ?, ?, ?)",
+        [(1, "DUOMO", 0, 2.0, 10000, -100), (2, "BRERA", 5, 12.0, 0, 100), (3, "ADRIANO", 1, 7.0, 5000, None)],
+    )
+    yield conn
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_default_config_matches_file():
+    """Il file di configurazione riproduce i pesi di default."""
+    assert load_quality_of_life_config() == QualityOfLifeConfig()
+
+
+def test_minmax_index(conn):
+    """Componenti 0-100, densità invertita, IQV come media pesata."""
+    assert compute_quality_of_life(conn, log=lambda msg: None) == 2
+    rows = conn.execute(
+        "SELECT comp_verde, comp_mercati, comp_densita, comp_dinamica, indice_qualita_vita, "
+        "typeof(indice_qualita_vita) FROM nil_qualita_vita ORDER BY id_nil"
+    ).fetchall()
+
+    assert rows[0] == (0.0, 0.0, 0.0, 0.0, 0.0, "real")
+    assert rows[1] == (100.0, 100.0, 100.0, 100.0, 100.0, "real")
+    # Saldo mancante: componente e indice restano NULL
+    assert rows[2][:4] == (50.0, 20.0, 50.0, None)
+    assert rows[2][4] is None
+
+
+def test_rank_normalization_ties():
+    """I pari merito ricevono il rango medio."""
+    values = np.array([3.0, 1.0, 3.0, np.nan, 2.0])
+    result = normalize_rank(values)
+    assert result[[0, 1, 2, 4]].tolist() == pytest.approx([83.333, 0.0, 83.333, 33.333], abs=1e-3)
+    assert np.isnan(result[3])
+
+
+def test_sync_from_csv(conn):
+    """UPDATE ... FROM sulla staging con chiave id_nil."""
+    conn.execute("INSERT INTO nil_qualita_vita (id_nil, nil) VALUES (4, 'MAGENTA - S. VITTORE')")
+    conn.execute("UPDATE nil_qualita_vita SET comp_verde = 42.0, indice_qualita_vita = 42.0 WHERE id_nil = 3")
+    conn.execute("""
+        CREATE TABLE nil_qol_analysis (
+            nil TEXT, comp_verde TEXT, comp_mercati TEXT, comp_densita TEXT, comp_dinamica TEXT, IQV TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO nil_qol_analysis VALUES (?, ?, ?, ?, ?, ?)", [
+        # Maiuscole e spazi diversi
+        (" duomo ", "10", "20", "30", "40", "25"),
+        # Nome duplicato: vale la prima riga
+        ("Brera", "1", "2", "3", "4", "2.5"),
+        ("BRERA", "9", "9", "9", "9", "9"),
+        # Punto senza spazio
+        ("Magenta - S.Vittore", "50.5", "50", "50", "50", "50.125"),
+        # Nessun NIL corrispondente
+        ("QUARTO OGGIARO", "0", "0", "0", "0", "0"),
+    ])
+
+    assert sync_quality_of_life_index(conn, log=lambda msg: None) == 3
+
+    rows = conn.execute(
+        "SELECT id_nil, comp_verde, comp_mercati, comp_densita, comp_dinamica, indice_qualita_vita, "
+        "typeof(indice_qualita_vita) FROM nil_qualita_vita ORDER BY id_nil"
+    ).fetchall()
+    assert rows == [
+        (1, 10.0, 20.0, 30.0, 40.0, 25.0, "real"),
+        (2, 1.0, 2.0, 3.0, 4.0, 2.5, "real"),
+        # ADRIANO non compare nel CSV: valori precedenti intatti
+        (3, 42.0, None, None, None, 42.0, "real"),
+        (4, 50.5, 50.0, 50.0, 50.0, 50.125, "real"),
+    ]
+    # Tabelle temporanee rimosse
+    assert conn.execute("SELECT COUNT(*) FROM temp.sqlite_master").fetchone()[0] == 0
@@ -0,0 +1,85 @@
+"""
+Test per la validazione colonnare degli schemi (data_pipeline/scripts/validators.py).
+
+Verifica:
+- Stesso esito di Pydantic riga per riga, su tutte le righe
+- Id delle righe non valide e conteggi per vincolo
+- Colonne obbligatorie mancanti e normalizzazione dei nomi
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pydantic")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from validators import (  # noqa: E402
+    DemografiaRecord,
+    NILRecord,
+    normalize_frame,
+    validate_with_schema,
+)
+
+
+@pytest.fixture
+def demografia():
+    """Righe demografiche con tipi misti, null e valori fuori range (indice da 100)."""
+    df = pd.DataFrame({
+        "quartiere": [" duomo ", "Brera", None, 12, "Isola", "Sarpi", "Loreto", ""],
+        "anno": [2020, "2021", 2022, 2023, 1850, 2020.5, " 2019 ", True],
+        "totale": [100, np.nan, 5, "7", -1, 3, "x", 2.0],
+        "stranieri": [1, 2, 3, 4, 5, 6, 7, 8],
+    })
+    df.index = df.index + 100
+    return df
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_matches_pydantic_row_by_row(demografia):
+    """Le righe non valide sono esattamente quelle che Pydantic rifiuta."""
+    expected = []
+    for idx, row in demografia.iterrows():
+        try:
+            DemografiaRecord(**{k: v for k, v in row.to_dict().items() if pd.notna(v)})
+        except ValueError:
+            expected.append(idx)
+
+    result = validate_with_schema(demografia, DemografiaRecord)
+
+    assert result.stats["invalid_rows"] == expected == [102, 103, 104, 105, 106, 107]
+    assert result.stats["rows_checked"] == len(demografia)
+    assert result.stats["violations"] == {
+        "quartiere: null": 1,
+        "quartiere: tipo str": 1,
+        "anno: tipo int": 1,
+        "anno: ge 1900": 2,  # 1850 e True (= 1, come per Pydantic)
+        "totale: tipo int": 1,
+        "totale: ge 0": 1,
+    }
+    assert not result.is_valid
+    assert result.errors[1] == "Row 102: quartiere: null"
+
+
+def test_missing_required_column():
+    """Una colonna obbligatoria assente invalida tutte le righe."""
+    df = pd.DataFrame({"nil": ["DUOMO", "BRERA"], "shape_area": [1.0, np.nan]})
+    result = validate_with_schema(df, NILRecord)
+    assert result.stats["violations"] == {"id_nil: colonna mancante": 2}
+    assert result.stats["valid_percentage"] == 0
+
+
+def test_normalize_frame(demografia):
+    """Solo le stringhe vengono normalizzate, come dal field_validator."""
+    normalized = normalize_frame(demografia, DemografiaRecord)
+    assert normalized["quartiere"].tolist()[:2] == ["DUOMO", "BRERA"]
+    assert normalized.loc[103, "quartiere"] == 12
+    assert demografia.loc[100, "quartiere"] == " duomo "
@@ -0,0 +1,126 @@
+"""
+Test per l'assegnazione spaziale dei punti ai NIL (data_pipeline/scripts/spatial_join.py).
+
+Verifica:
+- Punto sul confine fra due NIL assegnato in modo deterministico
+- Righe senza coordinate risolte col match testuale (resolve_id_nil)
+- Secondo passaggio servito dalla cache; modifica della sorgente ricalcolata
+- Assegnazioni di tabelle sparite rimosse, anche quando non resta nessuna tabella
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+shapely = pytest.importorskip("shapely")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from build_star_schema import normalize_nil, resolve_id_nil  # noqa: E402
+from spatial_join import (  # noqa: E402
+    BRIDGE_TABLE,
+    CACHE_TABLE,
+    assign_points,
+    load_nil_index,
+    run_spatial_join,
+)
+
+# Due NIL affiancati: il confine è la longitudine 9.19
+SQUARES = {
+    1: shapely.box(9.180, 45.460, 9.190, 45.470),
+    2: shapely.box(9.190, 45.460, 9.200, 45.470),
+}
+NAMES = {1: "BRERA", 2: "DUOMO"}
+MERCATI = "ds_05_servizi_essenziali_mercati_comunali_coperti"
+
+
+@pytest.fixture
+def conn():
+    """dim_nil con due NIL e mercati con nome NIL, alcuni senza coordinate."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT, geometry TEXT)")
+    for id_nil, geom in SQUARES.items():
+        conn.execute("INSERT INTO dim_nil VALUES (?, ?, ?)", (id_nil, NAMES[id_nil], shapely.to_geojson(geom)))
+    conn.execute(f"CREATE TABLE {MERCATI} (nil TEXT, long_x_4326 TEXT, lat_y_4326 TEXT)")
+    conn.executemany(f"INSERT INTO {MERCATI} VALUES (?, ?, ?)", [
+        # Nome testuale sbagliato: vince la geometria
+        ("DUOMO", "9.185", "45.465"),
+        # Coordinate con la virgola decimale
+        ("BRERA", "9,195", "45,465"),
+        # Senza coordinate: resta il match testuale
+        ("Duomo", None, None),
+        # Fuori da Milano: scartato, match testuale
+        ("Brera", "12.5", "41.9"),
+    ])
+    yield conn
+    conn.close()
+
+
+def bridge(conn) -> dict:
+    rows = conn.execute(f"SELECT source_table, source_rowid, id_nil FROM {BRIDGE_TABLE}").fetchall()
+    return {(table, rowid): id_nil for table, rowid, id_nil in rows}
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_boundary_point(conn):
+    """Il confine appartiene a entrambi i NIL: vince sempre l'id_nil minore."""
+    index = load_nil_index(conn)
+    lon = np.array([9.19, 9.19, 9.185, 9.30])
+    lat = np.array([45.465, 45.46, 45.465, 45.465])
+
+    result = assign_points(index, lon, lat)
+
+    assert result[:3].tolist() == [1.0, 1.0, 1.0]
+    assert np.isnan(result[3])
+    # Stesso risultato con i NIL caricati nell'ordine inverso nel DB
+    conn.execute("DELETE FROM dim_nil")
+    for id_nil in (2, 1):
+        conn.execute("INSERT INTO dim_nil VALUES (?, ?, ?)", (id_nil, NAMES[id_nil], shapely.to_geojson(SQUARES[id_nil])))
+    assert assign_points(load_nil_index(conn), lon, lat)[:3].tolist() == [1.0, 1.0, 1.0]
+
+
+def test_resolve_spatial_then_text(conn):
+    run_spatial_join(conn)
+    dim_nil = pd.DataFrame({"id_nil": list(NAMES), "nil_norm": [normalize_nil(n) for n in NAMES.values()]})
+    df = pd.read_sql(f"SELECT rowid AS _rowid, nil FROM {MERCATI}", conn)
+
+    result = resolve_id_nil(conn, MERCATI, df, dim_nil).set_index("_rowid")
+
+    assert result["id_nil"].to_dict() == {1: 1, 2: 2, 3: 2, 4: 1}
+
+
+def test_cache_hit_and_invalidation(conn):
+    first = run_spatial_join(conn)
+    assert first[MERCATI] == {"status": "updated", "rows": 4, "assigned": 2}
+
+    assert run_spatial_join(conn)[MERCATI]["status"] == "cached"
+
+    conn.execute(f"UPDATE {MERCATI} SET long_x_4326 = '9.195' WHERE rowid = 1")
+    assert run_spatial_join(conn)[MERCATI]["status"] == "updated"
+    assert bridge(conn)[(MERCATI, 1)] == 2
+
+
+def test_stale_tables_removed(conn):
+    conn.execute("CREATE TABLE ds_99_altro (lon REAL, lat REAL)")
+    conn.execute("INSERT INTO ds_99_altro VALUES (9.185, 45.465)")
+    run_spatial_join(conn)
+    assert {table for table, _ in bridge(conn)} == {MERCATI, "ds_99_altro"}
+
+    conn.execute("DROP TABLE ds_99_altro")
+    run_spatial_join(conn)
+    assert {table for table, _ in bridge(conn)} == {MERCATI}
+
+    # Nessuna tabella puntuale rimasta: bridge e cache vuoti
+    conn.execute(f"DROP TABLE {MERCATI}")
+    assert run_spatial_join(conn) == {}
+    assert bridge(conn) == {}
+    assert conn.execute(f"SELECT COUNT(*) FROM {CACHE_TABLE}").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM fact_servizi_punti").fetchone()[0] == 0
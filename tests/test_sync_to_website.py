@@ -0,0 +1,104 @@
+"""
+Test per le viste API materializzate (data_pipeline/scripts/sync_to_website.py).
+
+Verifica:
+- Snapshot mv_api_* creato e indicizzato, riga OK in data_freshness
+- Viste non valutabili saltate senza lasciare snapshot
+- Sorgente e snapshot divergenti: il controllo di coerenza li segnala
+  (MISMATCH in data_freshness)
+- Materializzazione disabilitata: mv_api_* e righe di data_freshness rimossi
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from sync_to_website import SyncManager  # noqa: E402
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """SyncManager su un DB in memoria con due viste API valutabili."""
+    manager = SyncManager(tmp_path / "milano_unified.db", materialize=True)
+    manager.conn = sqlite3.connect(":memory:")
+    manager.conn.row_factory = sqlite3.Row
+    manager.conn.executescript("""
+        CREATE TABLE dim_nil (id_nil INTEGER PRIMARY KEY, nil TEXT);
+        INSERT INTO dim_nil VALUES (1, 'DUOMO'), (2, 'BRERA');
+        CREATE TABLE fact_demografia (id_nil INTEGER, anno INTEGER, popolazione_totale INTEGER);
+        INSERT INTO fact_demografia VALUES (1, 2023, 100), (2, 2023, 200), (1, 2024, 110);
+        CREATE VIEW vw_api_nil AS
+            SELECT dn.id_nil, dn.nil AS nil_name, fd.popolazione_totale
+            FROM dim_nil dn JOIN fact_demografia fd ON fd.id_nil = dn.id_nil AND fd.anno = 2024;
+        CREATE VIEW vw_api_timeline_demografico AS
+            SELECT anno, SUM(popolazione_totale) AS popolazione FROM fact_demografia GROUP BY anno;
+    """)
+    manager.create_data_freshness_table()
+    yield manager
+    manager.close()
+
+
+def freshness(manager) -> dict:
+    rows = manager.conn.execute(
+        "SELECT source_name, record_count, status FROM data_freshness WHERE source_name LIKE 'mv_api_%'"
+    ).fetchall()
+    return {name: (count, status) for name, count, status in rows}
+
+
+def tables(manager) -> set:
+    rows = manager.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'mv_api_%'")
+    return {row[0] for row in rows}
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_materialize(manager):
+    manager.materialize_api_views()
+
+    assert tables(manager) == {"mv_api_nil", "mv_api_timeline_demografico"}
+    assert freshness(manager) == {"mv_api_nil": (1, "OK"), "mv_api_timeline_demografico": (2, "OK")}
+    assert manager.stats["errors"] == []
+    assert [tuple(r) for r in manager.conn.execute("SELECT * FROM mv_api_nil")] == [(1, "DUOMO", 110)]
+    plan = manager.conn.execute("EXPLAIN QUERY PLAN SELECT * FROM mv_api_nil WHERE id_nil = 1").fetchall()
+    assert any("idx_mv_api_nil_id_nil" in row[3] for row in plan)
+
+
+def test_mismatch_detected(manager):
+    manager.materialize_api_views()
+    assert manager.check_materialized_view("vw_api_nil", "mv_api_nil") == 0
+
+    # Duplicati nello snapshot: EXCEPT non li vede, i conteggi sì
+    manager.conn.execute("INSERT INTO mv_api_timeline_demografico SELECT * FROM mv_api_timeline_demografico")
+    assert manager.check_materialized_view("vw_api_timeline_demografico", "mv_api_timeline_demografico") == 2
+    # La sorgente cambia dopo lo snapshot: una riga solo nella vista, una solo nello snapshot
+    manager.conn.execute("UPDATE fact_demografia SET popolazione_totale = 120 WHERE id_nil = 1 AND anno = 2024")
+    assert manager.check_materialized_view("vw_api_nil", "mv_api_nil") == 2
+
+    # Vista non deterministica: snapshot e vista divergono già al refresh
+    manager.conn.execute("DROP VIEW vw_api_nil")
+    manager.conn.execute("CREATE VIEW vw_api_nil AS SELECT id_nil, random() AS rumore FROM dim_nil")
+    manager.materialize_api_views()
+
+    assert freshness(manager)["mv_api_nil"] == (2, "MISMATCH")
+    assert manager.stats["errors"] == ["mv_api_nil: 4 righe non coerenti con vw_api_nil"]
+
+
+def test_drop_when_disabled(manager):
+    manager.materialize_api_views()
+    assert freshness(manager)
+
+    manager.materialize = False
+    manager.drop_materialized_api_views()
+
+    assert tables(manager) == set()
+    assert freshness(manager) == {}
+    # Le viste restano: il server ripiega su vw_api_*
+    views = {row[0] for row in manager.conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+    assert {"vw_api_nil", "vw_api_timeline_demografico"} <= views
@@ -0,0 +1,81 @@
+"""
+Test per l'encoder TopoJSON della pipeline (data_pipeline/scripts/topojson_encoder.py).
+
+Verifica:
+- Deduplicazione dei confini condivisi
+- Ricostruzione delle geometrie dagli archi delta-encoded
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+shapely = pytest.importorskip("shapely")
+from shapely.geometry import MultiPolygon, Polygon, box
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+from topojson_encoder import encode_topology  # noqa: E402
+
+
+def decode_ring(topology, arc_ids):
+    """Ricostruisce un anello (coordinate reali) da una lista di indici arco."""
+    (kx, ky), (x0, y0) = topology["transform"]["scale"], topology["transform"]["translate"]
+    points = []
+    for arc_id in arc_ids:
+        x = y = 0
+        arc = []
+        for dx, dy in topology["arcs"][arc_id if arc_id >= 0 else ~arc_id]:
+            x, y = x + dx, y + dy
+            arc.append((x * kx + x0, y * ky + y0))
+        if arc_id < 0:
+            arc.reverse()
+        points.extend(arc if not points else arc[1:])
+    return points
+
+
+def decode_geometry(topology, geometry):
+    if geometry["type"] == "Polygon":
+        parts = [geometry["arcs"]]
+    else:
+        parts = geometry["arcs"]
+    polygons = [
+        Polygon(decode_ring(topology, rings[0]), [decode_ring(topology, r) for r in rings[1:]])
+        for rings in parts
+    ]
+    return polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_shared_border_stored_once():
+    """Due quadrati adiacenti: il lato comune è un solo arco usato in versi opposti."""
+    left = box(9.10, 45.40, 9.20, 45.50)
+    right = box(9.20, 45.40, 9.30, 45.50)
+    topology = encode_topology([left, right], ids=[1, 2])
+
+    arcs_left, arcs_right = (
+        set(g["arcs"][0]) for g in topology["objects"]["nil"]["geometries"]
+    )
+    shared = {a if a >= 0 else ~a for a in arcs_left} & {a if a >= 0 else ~a for a in arcs_right}
+    assert len(shared) == 1
+    assert len(topology["arcs"]) == 3
+
+
+def test_roundtrip_preserves_geometries():
+    """Le geometrie decodificate coincidono con l'originale entro la quantizzazione."""
+    hole = Polygon(box(9.0, 45.0, 9.4, 45.4).exterior, [box(9.1, 45.1, 9.2, 45.2).exterior])
+    island = MultiPolygon([box(9.1, 45.1, 9.2, 45.2), box(9.5, 45.0, 9.6, 45.1)])
+    topology = encode_topology([hole, island, None], ids=[1, 2, 3], properties=[{}, {}, {}])
+
+    geometries = topology["objects"]["nil"]["geometries"]
+    assert [g["id"] for g in geometries] == [1, 2]
+    step = max(topology["transform"]["scale"])
+    for original, encoded in zip([hole, island], geometries):
+        decoded = decode_geometry(topology, encoded)
+        assert decoded.is_valid
+        assert decoded.hausdorff_distance(original) <= step
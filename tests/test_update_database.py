@@ -0,0 +1,95 @@
+"""
+Test per il merge nel database unificato (data_pipeline/scripts/update_database.py).
+
+Verifica:
+- Tabelle invariate saltate al merge successivo
+- Modifica in place nella sorgente (stesse righe, stessa dimensione) ricopiata
+- Modifica della destinazione dopo la copia rilevata e ripristinata
+"""
+
+import logging
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("requests")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "data_pipeline" / "scripts"))
+
+import update_database  # noqa: E402
+
+
+@pytest.fixture
+def merge(tmp_path, monkeypatch, caplog):
+    """Sorgente legacy con due tabelle; restituisce (sorgente, destinazione, merge → tabelle copiate)."""
+    source = tmp_path / "nil_core.db"
+    target = tmp_path / "milano_unified.db"
+    conn = sqlite3.connect(str(source))
+    conn.execute("CREATE TABLE dim_nil (id_nil INTEGER, nil TEXT)")
+    conn.executemany("INSERT INTO dim_nil VALUES (?, ?)", [(1, "DUOMO"), (2, "BRERA")])
+    conn.execute("CREATE TABLE fact_servizi (id_nil INTEGER, numero_scuole INTEGER)")
+    conn.executemany("INSERT INTO fact_servizi VALUES (?, ?)", [(1, 5), (2, 3)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(update_database, "LEGACY_NIL_CORE_DB", source)
+
+    logger = logging.getLogger("test_update_database")
+    caplog.set_level(logging.DEBUG, logger=logger.name)
+
+    def run():
+        caplog.clear()
+        assert update_database.merge_to_unified_db(logger, target)
+        # "  ✓ <tabella>: N righe in ..." per ogni tabella copiata
+        copied = [r.getMessage().split() for r in caplog.records]
+        return sorted(m[1].rstrip(":") for m in copied if m[0] == "✓" and "righe" in m)
+
+    return source, target, run
+
+
+def execute(path: Path, sql: str) -> None:
+    conn = sqlite3.connect(str(path))
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def test_merge_skips_unchanged_tables(merge):
+    source, target, run = merge
+
+    assert run() == ["dim_nil", "fact_servizi"]
+    assert run() == []
+
+
+def test_merge_copies_in_place_update(merge):
+    """Stesso COUNT, stesso MAX(rowid) e stessa dimensione del file: la tabella va ricopiata."""
+    source, target, run = merge
+    run()
+
+    size = source.stat().st_size
+    execute(source, "UPDATE fact_servizi SET numero_scuole = 6 WHERE id_nil = 1")
+    assert source.stat().st_size == size
+
+    assert run() == ["fact_servizi"]
+    conn = sqlite3.connect(str(target))
+    assert conn.execute("SELECT numero_scuole FROM fact_servizi WHERE id_nil = 1").fetchone()[0] == 6
+    conn.close()
+
+
+def test_merge_restores_modified_target(merge):
+    """Una destinazione modificata dopo la copia non viene considerata invariata."""
+    source, target, run = merge
+    run()
+
+    execute(target, "UPDATE dim_nil SET nil = 'BRERA 2' WHERE id_nil = 2")
+
+    assert run() == ["dim_nil"]
+    conn = sqlite3.connect(str(target))
+    assert conn.execute("SELECT nil FROM dim_nil WHERE id_nil = 2").fetchone()[0] == "BRERA"
+    conn.close()